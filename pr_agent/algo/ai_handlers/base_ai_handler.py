@@ -1,5 +1,23 @@
+import asyncio
+import weakref
 from abc import ABC, abstractmethod
 
+from pr_agent.config_loader import get_settings
+
+_llm_limiters = weakref.WeakKeyDictionary()
+
+
+def get_llm_limiter() -> asyncio.Semaphore:
+    """
+    Bounds the number of LLM calls in flight (`config.max_concurrent_llm_calls`), e.g. when several tools run
+    concurrently on the same PR. AI handlers hold it around each call to the model. One semaphore per event loop.
+    """
+    loop = asyncio.get_running_loop()
+    limiter = _llm_limiters.get(loop)
+    if limiter is None:
+        limiter = _llm_limiters[loop] = asyncio.Semaphore(max(1, int(get_settings().get("CONFIG.MAX_CONCURRENT_LLM_CALLS", 4))))
+    return limiter
+
 
 class BaseAiHandler(ABC):
     """
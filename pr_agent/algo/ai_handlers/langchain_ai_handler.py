@@ -14,7 +14,8 @@ from langchain_core.runnables import Runnable
 from tenacity import (retry, retry_if_exception_type,
                       retry_if_not_exception_type, stop_after_attempt)
 
-from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
+from pr_agent.algo.ai_handlers.base_ai_handler import (BaseAiHandler,
+                                                       get_llm_limiter)
 from pr_agent.config_loader import get_settings
 from pr_agent.log import get_logger
 
@@ -88,15 +89,17 @@ class LangChainOpenAIHandler(BaseAiHandler):
             # Handle parameters based on LLM type
             if isinstance(llm, (ChatOpenAI, AzureChatOpenAI)):
                 # OpenAI models support all parameters
-                resp = await llm.ainvoke(
-                    input=messages,
-                    model=model,
-                    temperature=temperature
-                )
+                async with get_llm_limiter():
+                    resp = await llm.ainvoke(
+                        input=messages,
+                        model=model,
+                        temperature=temperature
+                    )
             else:
                 # Other LLMs (like Gemini) only support input parameter
                 get_logger().info(f"Using simplified ainvoke for {type(llm)}")
-                resp = await llm.ainvoke(input=messages)
+                async with get_llm_limiter():
+                    resp = await llm.ainvoke(input=messages)
 
             finish_reason = "completed"
             return resp.content, finish_reason
@@ -13,7 +13,8 @@ from pr_agent.algo import (CLAUDE_EXTENDED_THINKING_MODELS,
                            STREAMING_REQUIRED_MODELS,
                            SUPPORT_REASONING_EFFORT_MODELS,
                            USER_MESSAGE_ONLY_MODELS)
-from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
+from pr_agent.algo.ai_handlers.base_ai_handler import (BaseAiHandler,
+                                                       get_llm_limiter)
 from pr_agent.algo.ai_handlers.litellm_helpers import (
     MockResponse, _handle_streaming_response,
     _process_litellm_extra_body)
@@ -326,13 +327,15 @@ class LiteLLMAIHandler(BaseAiHandler):
         if model in self.streaming_required_models:
             kwargs["stream"] = True
             get_logger().info(f"Using streaming mode for model {model}")
-            response = await acompletion(**kwargs)
-            resp, finish_reason = await _handle_streaming_response(response)
+            async with get_llm_limiter():
+                response = await acompletion(**kwargs)
+                resp, finish_reason = await _handle_streaming_response(response)
             # Create MockResponse for streaming since we don't have the full response object
             mock_response = MockResponse(resp, finish_reason)
             return resp, finish_reason, mock_response
         else:
-            response = await acompletion(**kwargs)
+            async with get_llm_limiter():
+                response = await acompletion(**kwargs)
             if response is None or len(response["choices"]) == 0:
                 raise openai.APIError
             return (response["choices"][0]['message']['content'],
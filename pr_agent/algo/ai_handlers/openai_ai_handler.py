@@ -5,7 +5,8 @@ from openai import AsyncOpenAI
 from tenacity import (retry, retry_if_exception_type,
                       retry_if_not_exception_type, stop_after_attempt)
 
-from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
+from pr_agent.algo.ai_handlers.base_ai_handler import (BaseAiHandler,
+                                                       get_llm_limiter)
 from pr_agent.config_loader import get_settings
 from pr_agent.log import get_logger
 
@@ -51,11 +52,12 @@ class OpenAIHandler(BaseAiHandler):
             get_logger().info("User: ", user)
             messages = [{"role": "system", "content": system}, {"role": "user", "content": user}]
             client = AsyncOpenAI()
-            chat_completion = await client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=temperature,
-            )
+            async with get_llm_limiter():
+                chat_completion = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                )
             resp = chat_completion.choices[0].message.content
             finish_reason = chat_completion.choices[0].finish_reason
             usage = chat_completion.usage
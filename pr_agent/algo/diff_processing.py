@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import traceback
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 from pr_agent.algo.git_patch_processing import (
     decouple_and_convert_to_hunks_with_lines_numbers, extend_patch,
@@ -24,7 +24,12 @@ def pr_generate_extended_diff(pr_languages: list,
                               token_handler: TokenHandler,
                               add_line_numbers_to_hunks: bool,
                               patch_extra_lines_before: int = 0,
-                              patch_extra_lines_after: int = 0) -> Tuple[list, int, list]:
+                              patch_extra_lines_after: int = 0,
+                              extended_patches: dict = None) -> Tuple[list, int, list]:
+    """
+    `extended_patches` optionally holds patches already extended by `extend_file_patch` (filename -> result),
+    e.g. while the files were still being fetched.
+    """
     total_tokens = token_handler.prompt_tokens  # initial tokens
     patches_extended = []
     patches_extended_tokens = []
@@ -32,32 +37,14 @@ def pr_generate_extended_diff(pr_languages: list,
 
     for lang in pr_languages:
         for file in lang['files']:
-            original_file_content_str = file.base_file
-            new_file_content_str = file.head_file
-            patch = file.patch
-            if not patch:
-                continue
-
-            # extend each patch with extra lines of context
-            extended_patch = extend_patch(original_file_content_str, patch,
-                                          patch_extra_lines_before, patch_extra_lines_after, file.filename,
-                                          new_file_str=new_file_content_str)
-            if not extended_patch:
-                get_logger().warning(f"Failed to extend patch for file: {file.filename}")
-                continue
-
-            if add_line_numbers_to_hunks:
-                full_extended_patch = decouple_and_convert_to_hunks_with_lines_numbers(extended_patch, file)
+            if extended_patches is not None and file.filename in extended_patches:
+                extended = extended_patches[file.filename]
             else:
-                extended_patch = extended_patch.replace('\n@@ ', '\n\n@@ ') # add extra line before each hunk
-                full_extended_patch = f"\n\n## File: '{file.filename.strip()}'\n\n{extended_patch.strip()}\n"
-
-            # add AI-summary metadata to the patch
-            if file.ai_file_summary and enable_ai_metadata:
-                full_extended_patch = add_ai_summary_top_patch(file, full_extended_patch)
-
-            patch_tokens = token_handler.count_tokens(full_extended_patch)
-            file.tokens = patch_tokens
+                extended = extend_file_patch(file, token_handler, add_line_numbers_to_hunks, patch_extra_lines_before,
+                                             patch_extra_lines_after, enable_ai_metadata)
+            if extended is None:
+                continue
+            full_extended_patch, patch_tokens = extended
             total_tokens += patch_tokens
             patches_extended_tokens.append(patch_tokens)
             patches_extended.append(full_extended_patch)
@@ -65,6 +52,42 @@ def pr_generate_extended_diff(pr_languages: list,
     return patches_extended, total_tokens, patches_extended_tokens
 
 
+def extend_file_patch(file, token_handler: TokenHandler, add_line_numbers_to_hunks: bool,
+                      patch_extra_lines_before: int = 0, patch_extra_lines_after: int = 0,
+                      enable_ai_metadata: bool = False) -> Optional[Tuple[str, int]]:
+    """
+    Returns the patch of `file` extended with extra lines of context, and its number of tokens,
+    or None when the file has no patch.
+    """
+    original_file_content_str = file.base_file
+    new_file_content_str = file.head_file
+    patch = file.patch
+    if not patch:
+        return None
+
+    # extend each patch with extra lines of context
+    extended_patch = extend_patch(original_file_content_str, patch,
+                                  patch_extra_lines_before, patch_extra_lines_after, file.filename,
+                                  new_file_str=new_file_content_str)
+    if not extended_patch:
+        get_logger().warning(f"Failed to extend patch for file: {file.filename}")
+        return None
+
+    if add_line_numbers_to_hunks:
+        full_extended_patch = decouple_and_convert_to_hunks_with_lines_numbers(extended_patch, file)
+    else:
+        extended_patch = extended_patch.replace('\n@@ ', '\n\n@@ ') # add extra line before each hunk
+        full_extended_patch = f"\n\n## File: '{file.filename.strip()}'\n\n{extended_patch.strip()}\n"
+
+    # add AI-summary metadata to the patch
+    if file.ai_file_summary and enable_ai_metadata:
+        full_extended_patch = add_ai_summary_top_patch(file, full_extended_patch)
+
+    patch_tokens = token_handler.count_tokens(full_extended_patch)
+    file.tokens = patch_tokens
+    return full_extended_patch, patch_tokens
+
+
 def pr_generate_compressed_diff(top_langs: list, token_handler: TokenHandler, model: str,
                                 convert_hunks_to_line_numbers: bool,
                                 large_pr_handling: bool) -> Tuple[list, list, list, list, dict, list]:
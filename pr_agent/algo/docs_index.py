@@ -0,0 +1,270 @@
+import hashlib
+import json
+import math
+import os
+import re
+import subprocess
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from pr_agent.algo.review_cache import git_blob_sha
+from pr_agent.log import get_logger
+
+DEFAULT_INDEX_DIR = os.path.join(Path.home(), ".cache", "pr-agent", "docs-index")
+INDEX_FORMAT_VERSION = 1
+MAX_SECTION_LEN = 5000
+
+RE_TOKEN = re.compile(r"[a-z0-9_]+")
+RE_MD_HEADING = re.compile(r"^(#{1,6})\s+(.*\S)\s*$")
+RST_SECTION_CHARS = set('!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~')
+# the indexes loaded by this process, by path: (file modification time, index)
+_loaded_indexes: Dict[str, tuple] = {}
+
+STOP_WORDS = {"a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i", "if",
+              "in", "is", "it", "of", "on", "or", "that", "the", "this", "to", "was", "what", "when", "where", "which",
+              "with", "you"}
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in RE_TOKEN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def split_into_sections(text: str, ext: str) -> List[dict]:
+    """
+    Splits a (cleaned) documentation file into its sections. Each section has its heading, the headings leading to
+    it ('Guide > Install > Linux') and its text, including the heading line(s).
+    Text before the first heading is a section with an empty heading.
+    """
+    lines = text.split('\n')
+    starts = []  # (line index of the section start, heading level, heading)
+    if ext in ['.md', '.mdx']:
+        in_code_block = False
+        for i, line in enumerate(lines):
+            if line.lstrip().startswith('```'):
+                in_code_block = not in_code_block
+                continue
+            match = None if in_code_block else RE_MD_HEADING.match(line)
+            if match:
+                starts.append((i, len(match.group(1)), match.group(2).strip('# ')))
+    elif ext == '.rst':
+        levels = []  # underline characters, by order of appearance
+        for i in range(1, len(lines)):
+            line, title = lines[i].rstrip(), lines[i - 1].rstrip()
+            if (line and line[0] in RST_SECTION_CHARS and all(c == line[0] for c in line) and title.strip()
+                    and len(title) <= len(line)):
+                if line[0] not in levels:
+                    levels.append(line[0])
+                starts.append((i - 1, levels.index(line[0]) + 1, title.strip()))
+
+    sections = []
+    if not starts or starts[0][0] > 0:
+        starts.insert(0, (0, 0, ""))
+    heading_stack = []  # (level, heading)
+    for (start, level, heading), next_start in zip(starts, [start for start, _, _ in starts[1:]] + [len(lines)]):
+        section_text = '\n'.join(lines[start:next_start]).strip()
+        if heading:
+            heading_stack = [(stack_level, stack_heading) for stack_level, stack_heading in heading_stack
+                             if stack_level < level] + [(level, heading)]
+        if not re.search(r'[a-zA-Z]', section_text):
+            continue
+        sections.append({"heading": heading,
+                         "headings": " > ".join(stack_heading for _, stack_heading in heading_stack),
+                         "text": section_text[:MAX_SECTION_LEN]})
+    return sections
+
+
+def get_head_commit(repo_path: str) -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=repo_path, check=True, capture_output=True,
+                              text=True, timeout=30).stdout.strip() or None
+    except Exception as e:
+        get_logger().debug(f"Could not get the HEAD commit of {repo_path}, error: {e}")
+        return None
+
+
+def get_file_blob_shas(repo_path: str, files: List[str]) -> Dict[str, str]:
+    """
+    The git blob sha of each of `files` (absolute paths in the checkout at `repo_path`), from the git index when
+    available - without reading the files - and hashed from the file content otherwise.
+    """
+    index_shas = {}
+    try:
+        output = subprocess.run(["git", "ls-files", "-s", "-z"], cwd=repo_path, check=True, capture_output=True,
+                                timeout=60).stdout.decode("utf-8", errors="replace")
+        for entry in output.split('\0'):
+            if '\t' in entry:
+                info, path = entry.split('\t', 1)
+                index_shas[os.path.join(repo_path, path)] = info.split()[1]
+    except Exception as e:
+        get_logger().debug(f"Could not list the blobs of {repo_path}, hashing the files instead, error: {e}")
+    blob_shas = {}
+    for file in files:
+        if file in index_shas:
+            blob_shas[file] = index_shas[file]
+            continue
+        try:
+            with open(file, 'r', encoding='utf-8') as f:
+                blob_shas[file] = git_blob_sha(f.read())
+        except Exception as e:
+            get_logger().warning(f"Error while reading the file {file}: {e}")
+    return blob_shas
+
+
+class DocsIndex:
+    """
+    A persistent index of a documentation tree at a given commit: the cleaned sections of every file, with their
+    heading metadata, and a BM25 inverted index over them.
+
+    The index is stored as a single JSON file per (repo, documentation settings). On a new commit, `update` only
+    loads the files whose blob changed; the sections and postings of the other files are kept.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.commit = None
+        self.files = {}  # file path -> {"sha": blob sha, "sections": [section id]}
+        self.sections = []  # section id -> {"file", "heading", "headings", "text", "length"}, None once removed
+        self.postings = {}  # term -> {section id: term frequency}
+        self.total_length = 0
+        self.num_sections = 0
+
+    @staticmethod
+    def get_index_path(index_dir: str, repo_url: str, docs_settings: dict) -> str:
+        key = json.dumps([repo_url, docs_settings], sort_keys=True, default=str)
+        return os.path.join(index_dir, hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + ".json")
+
+    @classmethod
+    def load(cls, path: str) -> "DocsIndex":
+        """
+        Loads the index stored at `path`, or returns an empty index (to be stored at `path`) if there is none.
+        """
+        index = cls(path)
+        if not os.path.isfile(path):
+            return index
+        try:
+            mtime = os.path.getmtime(path)
+            if path in _loaded_indexes and _loaded_indexes[path][0] == mtime:
+                return _loaded_indexes[path][1]
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") != INDEX_FORMAT_VERSION:
+                return index
+            index.commit = data["commit"]
+            index.files = data["files"]
+            index.sections = data["sections"]
+            # JSON object keys are strings
+            index.postings = {term: {int(section_id): count for section_id, count in term_postings.items()}
+                              for term, term_postings in data["postings"].items()}
+            index.total_length = data["total_length"]
+            index.num_sections = sum(1 for section in index.sections if section is not None)
+            _loaded_indexes[path] = (mtime, index)
+        except Exception as e:
+            get_logger().warning(f"Failed to load the docs index {path}, rebuilding it, error: {e}")
+            index = cls(path)
+        return index
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"version": INDEX_FORMAT_VERSION, "commit": self.commit, "files": self.files,
+                           "sections": self.sections, "postings": self.postings,
+                           "total_length": self.total_length}, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)  # readers never see a partial index
+            _loaded_indexes[self.path] = (os.path.getmtime(self.path), self)
+        except Exception as e:
+            get_logger().warning(f"Failed to save the docs index {self.path}, error: {e}")
+
+    def _remove_file(self, file_path: str):
+        for section_id in self.files.pop(file_path)["sections"]:
+            section = self.sections[section_id]
+            self.sections[section_id] = None
+            self.num_sections -= 1
+            self.total_length -= section["length"]
+            for term in set(tokenize(section["headings"] + "\n" + section["text"])):
+                term_postings = self.postings.get(term)
+                if term_postings is not None:
+                    term_postings.pop(section_id, None)
+                    if not term_postings:
+                        del self.postings[term]
+
+    def _add_file(self, file_path: str, sha: str, sections: List[dict]):
+        section_ids = []
+        for section in sections:
+            section_id = len(self.sections)
+            # the headings leading to a section are part of its text for ranking
+            terms = tokenize(section["headings"] + "\n" + section["text"])
+            self.sections.append(dict(section, file=file_path, length=len(terms)))
+            self.num_sections += 1
+            self.total_length += len(terms)
+            for term, count in Counter(terms).items():
+                self.postings.setdefault(term, {})[section_id] = count
+            section_ids.append(section_id)
+        self.files[file_path] = {"sha": sha, "sections": section_ids}
+
+    def _compact(self):
+        """
+        Renumbers the sections, dropping the ids of removed ones.
+        """
+        new_ids = {}
+        for section_id, section in enumerate(self.sections):
+            if section is not None:
+                new_ids[section_id] = len(new_ids)
+        self.sections = [section for section in self.sections if section is not None]
+        for file in self.files.values():
+            file["sections"] = [new_ids[section_id] for section_id in file["sections"]]
+        self.postings = {term: {new_ids[section_id]: count for section_id, count in term_postings.items()}
+                         for term, term_postings in self.postings.items()}
+
+    def update(self, commit: Optional[str], file_shas: Dict[str, str],
+               load_sections: Callable[[str], Optional[List[dict]]]) -> int:
+        """
+        Brings the index to `commit`, whose documentation files are `file_shas` (file path -> blob sha).
+        `load_sections` returns the sections of a file (see `split_into_sections`), and is only called for new and
+        changed files. Returns the number of files loaded.
+        """
+        for file_path in [file_path for file_path in self.files
+                          if file_shas.get(file_path) != self.files[file_path]["sha"]]:
+            self._remove_file(file_path)
+        num_loaded = 0
+        for file_path, sha in file_shas.items():
+            if file_path in self.files:
+                continue
+            num_loaded += 1
+            try:
+                sections = load_sections(file_path) or []
+            except Exception as e:
+                get_logger().warning(f"Error while loading the sections of {file_path}: {e}")
+                sections = []
+            self._add_file(file_path, sha, sections)
+        if len(self.sections) > 2 * self.num_sections:
+            self._compact()
+        self.commit = commit
+        return num_loaded
+
+    def search(self, query: str, top_k: int = 10) -> List[dict]:
+        """
+        The `top_k` sections ranked by BM25 relevance to `query`, most relevant first.
+        """
+        if not self.num_sections:
+            return []
+        avg_length = self.total_length / self.num_sections or 1
+        scores = {}
+        for term, query_count in Counter(tokenize(query)).items():
+            term_postings = self.postings.get(term)
+            if not term_postings:
+                continue
+            idf = math.log(1 + (self.num_sections - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+            for section_id, count in term_postings.items():
+                length_norm = self.K1 * (1 - self.B + self.B * self.sections[section_id]["length"] / avg_length)
+                scores[section_id] = (scores.get(section_id, 0)
+                                      + query_count * idf * count * (self.K1 + 1) / (count + length_norm))
+        ranked_ids = sorted(scores, key=lambda section_id: (-scores[section_id], section_id))[:top_k]
+        return [dict(self.sections[section_id], score=scores[section_id]) for section_id in ranked_ids]
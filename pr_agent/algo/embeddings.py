@@ -0,0 +1,287 @@
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import re
+from abc import ABC, abstractmethod
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+DEFAULT_CACHE_DIR = os.path.join(Path.home(), ".cache", "pr-agent", "embeddings")
+DEFAULT_EMBEDDING_MODEL = "text-embedding-ada-002"
+HASHING_MODEL = "hashing"  # "hashing" or "hashing-<dimension>"
+DEFAULT_HASHING_DIMENSION = 384
+# the dimension of the vectors of the known models, others are probed
+EMBEDDING_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+RE_WORD = re.compile(r"\w+")
+DIGEST_SIZE = 32  # sha256
+
+_embedding_services: Dict[str, "EmbeddingService"] = {}
+
+
+class Embedder(ABC):
+    """
+    Turns texts into vectors. `model` identifies the vectors (e.g. in caches), and a request embeds at most
+    `max_batch_size` texts of at most `max_batch_tokens` tokens in total (no limit if None).
+    """
+
+    model: str
+    max_batch_size: int = 2048
+    max_batch_tokens: Optional[int] = None
+
+    @property
+    @abstractmethod
+    def dimension(self) -> int:
+        pass
+
+    @abstractmethod
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        pass
+
+
+class OpenAIEmbedder(Embedder):
+    max_batch_size = 2048
+    max_batch_tokens = 300_000  # per request
+
+    def __init__(self, model: str = DEFAULT_EMBEDDING_MODEL):
+        self.model = model
+        self._dimension = EMBEDDING_DIMENSIONS.get(model)
+        self._client = None
+
+    @property
+    def dimension(self) -> int:
+        if self._dimension is None:
+            self._dimension = len(self.embed_batch(["dimension"])[0])
+        return self._dimension
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        if self._client is None:
+            import openai
+            self._client = openai.OpenAI(api_key=get_settings().openai.key)
+        res = self._client.embeddings.create(input=texts, model=self.model)
+        return [record.embedding for record in sorted(res.data, key=lambda record: record.index)]
+
+
+@lru_cache(maxsize=1 << 16)
+def _feature_bucket(feature: str, dimension: int) -> int:
+    """
+    The bucket of a feature, with its sign in the lowest bit.
+    """
+    h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+    return (h >> 1) % dimension * 2 + (h & 1)
+
+
+class HashingEmbedder(Embedder):
+    """
+    A deterministic local embedder, without a model or a service: the words and word pairs of a text are hashed
+    into signed buckets ("feature hashing"), and the vector is normalized. Texts that share words get similar
+    vectors - enough to test and benchmark the similarity tools offline.
+    """
+
+    max_batch_size = 1024
+
+    def __init__(self, dimension: int = DEFAULT_HASHING_DIMENSION):
+        self._dimension = dimension
+        self.model = f"{HASHING_MODEL}-{dimension}"
+
+    @property
+    def dimension(self) -> int:
+        return self._dimension
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self._dimension
+        words = RE_WORD.findall(text.lower())
+        features = [(word, 1.0) for word in words] + [(f"{a} {b}", 0.5) for a, b in zip(words, words[1:])]
+        for feature, weight in features:
+            bucket = _feature_bucket(feature, self._dimension)
+            vector[bucket >> 1] += weight if bucket & 1 else -weight
+        norm = math.sqrt(sum(value * value for value in vector))
+        return [value / norm for value in vector] if norm else vector
+
+
+def get_embedder(model: str) -> Embedder:
+    if model == HASHING_MODEL or model.startswith(f"{HASHING_MODEL}-"):
+        dimension = model[len(HASHING_MODEL) + 1:]
+        return HashingEmbedder(int(dimension) if dimension else DEFAULT_HASHING_DIMENSION)
+    return OpenAIEmbedder(model)
+
+
+class EmbeddingCache:
+    """
+    The vectors of a model by text hash, in an append-only file of fixed-size records (the sha256 digest of the
+    text, then the float32 vector), memory-mapped on reads. Only the digests are indexed in memory.
+    Writers take a file lock, and a partial record left by a crashed writer is ignored, then overwritten.
+    """
+
+    def __init__(self, cache_dir: str, model: str, dimension: int):
+        self.dimension = dimension
+        self.record_size = DIGEST_SIZE + 4 * dimension
+        model_key = hashlib.sha256(model.encode("utf-8")).hexdigest()[:32]
+        self.path = os.path.join(os.path.expanduser(cache_dir), f"{model_key}-{dimension}.bin")
+        self._offsets = {}  # digest -> offset of its record
+        self._indexed_size = 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    def _refresh(self):
+        """
+        Indexes the records appended (by any process) since the last call.
+        """
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return
+        size -= size % self.record_size
+        if size <= self._indexed_size:
+            return
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for offset in range(self._indexed_size, size, self.record_size):
+                self._offsets.setdefault(data[offset:offset + DIGEST_SIZE], offset)
+        self._indexed_size = size
+
+    def get_many(self, digests) -> Dict[bytes, List[float]]:
+        self._refresh()
+        found = [digest for digest in digests if digest in self._offsets]
+        if not found:
+            return {}
+        vectors = {}
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for digest in found:
+                offset = self._offsets[digest] + DIGEST_SIZE
+                vectors[digest] = array("f", data[offset:offset + 4 * self.dimension]).tolist()
+        return vectors
+
+    def put_many(self, vectors: Dict[bytes, List[float]]):
+        if not vectors:
+            return
+        with open(self.path, "ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                records = [digest + array("f", vector).tobytes() for digest, vector in vectors.items()
+                           if digest not in self._offsets and len(vector) == self.dimension]
+                size = os.fstat(f.fileno()).st_size
+                committed_size = size - size % self.record_size
+                f.truncate(committed_size)
+                f.write(b"".join(records))
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        self._refresh()
+
+
+class EmbeddingService:
+    """
+    Embeds texts with an `Embedder`: the texts are deduplicated and looked up in the cache (by model and text hash),
+    and the others are split into batches of at most `max_batch_size` texts and `max_batch_tokens` tokens, embedded
+    by up to `max_concurrency` concurrent requests.
+    A batch that fails is embedded text by text, and a text that fails gets a zero vector, which is not cached.
+    """
+
+    def __init__(self, embedder: Embedder, cache_dir: Optional[str] = None, max_batch_size: int = None,
+                 max_batch_tokens: int = None, max_concurrency: int = 4):
+        self.embedder = embedder
+        self.cache = EmbeddingCache(cache_dir, embedder.model, embedder.dimension) if cache_dir else None
+        self.max_batch_size = min(max_batch_size or embedder.max_batch_size, embedder.max_batch_size)
+        self.max_batch_tokens = min(filter(None, [max_batch_tokens, embedder.max_batch_tokens]), default=None)
+        self.max_concurrency = max(1, max_concurrency)
+
+    @property
+    def model(self) -> str:
+        return self.embedder.model
+
+    @property
+    def dimension(self) -> int:
+        return self.embedder.dimension
+
+    def _make_batches(self, texts: List[str]) -> List[List[str]]:
+        if self.max_batch_tokens:
+            from pr_agent.algo.token_handler import TokenEncoder
+            encoder = TokenEncoder.get_token_encoder()
+            tokens = [len(encoder.encode(text, disallowed_special=())) for text in texts]
+        else:
+            tokens = [0] * len(texts)
+        batches, batch, batch_tokens = [], [], 0
+        for text, text_tokens in zip(texts, tokens):
+            if batch and (len(batch) >= self.max_batch_size or
+                          (self.max_batch_tokens and batch_tokens + text_tokens > self.max_batch_tokens)):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += text_tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _embed_batch(self, texts: List[str]) -> List[Optional[List[float]]]:
+        try:
+            return self.embedder.embed_batch(texts)
+        except Exception as e:
+            get_logger().warning(f"Failed to embed a batch of {len(texts)} texts, embedding them one by one",
+                                 artifact={"error": str(e)})
+        vectors = []
+        for text in texts:
+            try:
+                vectors.append(self.embedder.embed_batch([text])[0])
+            except Exception as e:
+                get_logger().error(f"Failed to embed a text with {self.model}", artifact={"error": str(e)})
+                vectors.append(None)
+        return vectors
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        digests = [hashlib.sha256(text.encode("utf-8")).digest() for text in texts]
+        vectors = self.cache.get_many(set(digests)) if self.cache else {}
+        missing = {}  # digest -> text, once per text
+        for digest, text in zip(digests, texts):
+            if digest not in vectors:
+                missing.setdefault(digest, text)
+        if missing:
+            batches = self._make_batches(list(missing.values()))
+            if len(batches) == 1 or self.max_concurrency == 1:
+                results = [self._embed_batch(batch) for batch in batches]
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as executor:
+                    results = list(executor.map(self._embed_batch, batches))
+            # as float32, like the cached vectors
+            new_vectors = {digest: array("f", vector).tolist()
+                           for digest, vector in zip(missing, (v for result in results for v in result))
+                           if vector is not None}
+            if self.cache:
+                self.cache.put_many(new_vectors)
+            vectors.update(new_vectors)
+            get_logger().debug(f"Embedded {len(missing)} texts with {self.model} in {len(batches)} batches",
+                               artifact={"cached": len(texts) - len(missing), "failed": len(missing) - len(new_vectors)})
+        return [vectors.get(digest) or [0.0] * self.dimension for digest in digests]
+
+
+def get_embedding_service(model: str = None) -> EmbeddingService:
+    """
+    The embedding service of `model` (default: `pr_similar_issue.embedding_model`), configured by the
+    `pr_similar_issue.embedding_*` settings. One service per model and process.
+    """
+    settings = get_settings()
+    model = model or settings.get("PR_SIMILAR_ISSUE.EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL) or DEFAULT_EMBEDDING_MODEL
+    if model not in _embedding_services:
+        cache_dir = None
+        if settings.get("PR_SIMILAR_ISSUE.CACHE_EMBEDDINGS", True):
+            cache_dir = settings.get("PR_SIMILAR_ISSUE.EMBEDDING_CACHE_PATH", DEFAULT_CACHE_DIR) or DEFAULT_CACHE_DIR
+        _embedding_services[model] = EmbeddingService(
+            get_embedder(model), cache_dir=cache_dir,
+            max_batch_size=int(settings.get("PR_SIMILAR_ISSUE.EMBEDDING_BATCH_SIZE", 512)),
+            max_batch_tokens=int(settings.get("PR_SIMILAR_ISSUE.EMBEDDING_BATCH_TOKENS", 100_000)),
+            max_concurrency=int(settings.get("PR_SIMILAR_ISSUE.EMBEDDING_CONCURRENCY", 4)))
+    return _embedding_services[model]
@@ -30,53 +30,70 @@ def is_valid_file(filename:str, bad_extensions=None) -> bool:
     return filename.split('.')[-1] not in bad_extensions
 
 
-def sort_files_by_main_languages(languages: Dict, files: list):
+class LanguageSorter:
     """
-    Sort files by their main language, put the files that are in the main language first and the rest files after
+    Incremental version of `sort_files_by_main_languages`: files are added one at a time, e.g. as their content
+    arrives from the git provider, and `get_sorted_files` returns the same grouping as sorting them all at once.
     """
-    # sort languages by their size
-    languages_sorted_list = [k for k, v in sorted(languages.items(), key=lambda item: item[1], reverse=True)]
-    # languages_sorted = sorted(languages, key=lambda x: x[1], reverse=True)
-    # get all extensions for the languages
-    main_extensions = []
-    language_extension_map_org = get_settings().language_extension_map_org
-    language_extension_map = {k.lower(): v for k, v in language_extension_map_org.items()}
-    for language in languages_sorted_list:
-        if language.lower() in language_extension_map:
-            main_extensions.append(language_extension_map[language.lower()])
-        else:
-            main_extensions.append([])
-
-    # filter out files bad extensions
-    files_filtered = filter_bad_extensions(files)
-
-    # sort files by their extension, put the files that are in the main extension first
-    # and the rest files after, map languages_sorted to their respective files
-    files_sorted = []
-    rest_files = {}
-
-    # if no languages detected, put all files in the "Other" category
-    if not languages:
-        files_sorted = [({"language": "Other", "files": list(files_filtered)})]
+
+    def __init__(self, languages: Dict):
+        self.languages = languages
+        # sort languages by their size
+        self.languages_sorted_list = [k for k, v in sorted(languages.items(), key=lambda item: item[1], reverse=True)]
+        # get all extensions for the languages
+        self.main_extensions = []
+        language_extension_map_org = get_settings().language_extension_map_org
+        language_extension_map = {k.lower(): v for k, v in language_extension_map_org.items()}
+        for language in self.languages_sorted_list:
+            if language.lower() in language_extension_map:
+                self.main_extensions.append(language_extension_map[language.lower()])
+            else:
+                self.main_extensions.append([])
+        self.main_extensions_flat = set()
+        for ext in self.main_extensions:
+            self.main_extensions_flat.update(ext)
+        self.bad_extensions = list(get_settings().bad_extensions.default)
+        if get_settings().config.use_extra_bad_extensions:
+            self.bad_extensions += get_settings().bad_extensions.extra
+        self.files_by_language = [[] for _ in self.languages_sorted_list]
+        self.rest_files = {}
+        self.all_files = []
+
+    def add(self, file) -> bool:
+        """
+        Adds a file, returning False when it is filtered out (bad extension).
+        """
+        if file.filename is None or not is_valid_file(file.filename, self.bad_extensions):
+            return False
+        if not self.languages:
+            self.all_files.append(file)
+            return True
+        extension_str = f".{file.filename.split('.')[-1]}"
+        for extensions, files in zip(self.main_extensions, self.files_by_language):  # noqa: B905
+            if extension_str in extensions:
+                files.append(file)
+        if extension_str not in self.main_extensions_flat and file.filename not in self.rest_files:
+            self.rest_files[file.filename] = file
+        return True
+
+    def get_sorted_files(self) -> list:
+        # if no languages detected, put all files in the "Other" category
+        if not self.languages:
+            return [{"language": "Other", "files": list(self.all_files)}]
+        files_sorted = [{"language": lang, "files": list(files)}
+                        for lang, files in zip(self.languages_sorted_list, self.files_by_language) if files]  # noqa: B905
+        files_sorted.append({"language": "Other", "files": list(self.rest_files.values())})
         return files_sorted
 
-    main_extensions_flat = []
-    for ext in main_extensions:
-        main_extensions_flat.extend(ext)
 
-    for extensions, lang in zip(main_extensions, languages_sorted_list):  # noqa: B905
-        tmp = []
-        for file in files_filtered:
-            extension_str = f".{file.filename.split('.')[-1]}"
-            if extension_str in extensions:
-                tmp.append(file)
-            else:
-                if (file.filename not in rest_files) and (extension_str not in main_extensions_flat):
-                    rest_files[file.filename] = file
-        if len(tmp) > 0:
-            files_sorted.append({"language": lang, "files": tmp})
-    files_sorted.append({"language": "Other", "files": list(rest_files.values())})
-    return files_sorted
+def sort_files_by_main_languages(languages: Dict, files: list):
+    """
+    Sort files by their main language, put the files that are in the main language first and the rest files after
+    """
+    sorter = LanguageSorter(languages)
+    for file in files:
+        sorter.add(file)
+    return sorter.get_sorted_files()
 
 
 def set_file_languages(diff_files) -> List[FilePatchInfo]:
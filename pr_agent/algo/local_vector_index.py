@@ -0,0 +1,355 @@
+import fcntl
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+# pr_agent.log must not be the first to import the settings (circular import)
+from pr_agent.config_loader import get_settings  # noqa: F401
+from pr_agent.log import get_logger
+
+DEFAULT_INDEX_DIR = os.path.join(Path.home(), ".cache", "pr-agent", "vector-index")
+INDEX_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+SEARCH_CHUNK_ROWS = 65536  # rows scored at once by the exact search, to bound the memory of a scan
+DEFAULT_ANN_THRESHOLD = 100_000
+IVF_REBUILD_FRACTION = 0.2  # rebuild the approximate index once this fraction of the rows is not in it
+
+
+class LocalVectorIndex:
+    """
+    A dependency-light vector index stored in a local directory, for cosine similarity search.
+
+    - The vectors are a float32 matrix (normalized rows) in a raw file, memory-mapped for search.
+    - The ids and metadata of the rows are a JSON lines sidecar, with the byte offset of every line in a second
+      raw file, so that only the metadata of the results is read.
+    - The manifest holds the committed number of rows and the names of the files. Rows are only appended: the new
+      rows are written past the committed ones and become visible when the manifest is replaced (atomically), so
+      readers never see a partial update, and a crashed writer leaves only bytes that the next one truncates.
+    - Updating a row (`add(..., upsert=True)`) appends its new version: the old row stays in the files, listed in a
+      raw file of superseded rows that search skips. The manifest also holds the `properties` of the index, small
+      values (like the watermark of the indexed data) that are committed along with the rows.
+    - Search is exact (a chunked scan with `argpartition`), or - once the index has `ann_threshold` rows - approximate
+      with an inverted file (IVF): the rows are clustered by k-means, and a query only scans the rows of the
+      `nprobe` clusters closest to it, plus the rows appended since the clusters were built.
+    Writers take a file lock, so a single index can be shared by several processes.
+    """
+
+    def __init__(self, path: str, ann_threshold: int = DEFAULT_ANN_THRESHOLD):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.ann_threshold = ann_threshold
+        self.manifest = {}
+        self._vectors = None  # memory map of the committed rows
+        self._offsets = None
+        self._ivf = None
+        self._rows = None  # id -> row of its current version, loaded on demand
+        self._superseded = None  # mask of the superseded rows
+        os.makedirs(self.path, exist_ok=True)
+        self._load_manifest()
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self.manifest.get("dim")
+
+    def __len__(self) -> int:
+        return self.manifest.get("count", 0)
+
+    def __contains__(self, row_id: str) -> bool:
+        return row_id in self._get_rows()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @contextmanager
+    def _lock(self):
+        with open(self._file(".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_manifest(self):
+        try:
+            with open(self._file(MANIFEST_FILE), "r") as f:
+                manifest = json.load(f)
+            if manifest.get("version") != INDEX_FORMAT_VERSION:
+                get_logger().warning(f"Ignoring the vector index {self.path} of an unsupported format version")
+                manifest = {}
+        except FileNotFoundError:
+            manifest = {}
+        if manifest != self.manifest:
+            self.manifest = manifest
+            self._vectors = self._offsets = self._ivf = self._rows = self._superseded = None
+
+    def _write_manifest(self, manifest: dict):
+        tmp_path = self._file(f"{MANIFEST_FILE}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._file(MANIFEST_FILE))
+        self._load_manifest()
+
+    def _get_vectors(self) -> np.ndarray:
+        if self._vectors is None:
+            self._vectors = np.memmap(self._file(self.manifest["vectors"]), dtype=np.float32, mode="r",
+                                      shape=(len(self), self.dim))
+        return self._vectors
+
+    def _get_offsets(self) -> np.ndarray:
+        if self._offsets is None:
+            self._offsets = np.memmap(self._file(self.manifest["offsets"]), dtype=np.int64, mode="r",
+                                      shape=(len(self) + 1,))
+        return self._offsets
+
+    def _get_ivf(self) -> Optional[dict]:
+        if self._ivf is None and self.manifest.get("ivf"):
+            with np.load(self._file(self.manifest["ivf"])) as data:
+                self._ivf = {name: data[name] for name in data.files}
+        return self._ivf
+
+    def _get_rows(self) -> dict:
+        if self._rows is None:
+            # later versions of an id override the earlier ones
+            self._rows = {row["id"]: i for i, row in enumerate(self._read_metadata(0, len(self)))}
+        return self._rows
+
+    def _get_superseded(self) -> Optional[np.ndarray]:
+        if self._superseded is None and self.manifest.get("superseded_count"):
+            rows = np.fromfile(self._file(self.manifest["superseded"]), dtype=np.int64,
+                               count=self.manifest["superseded_count"])
+            self._superseded = np.zeros(len(self), dtype=bool)
+            self._superseded[rows] = True
+        return self._superseded
+
+    def _read_metadata(self, start: int, end: int) -> List[dict]:
+        if start >= end:
+            return []
+        offsets = self._get_offsets()
+        with open(self._file(self.manifest["metadata"]), "rb") as f:
+            f.seek(int(offsets[start]))
+            data = f.read(int(offsets[end] - offsets[start]))
+        return [json.loads(line) for line in data.decode("utf-8").splitlines()]
+
+    def _read_rows_metadata(self, rows) -> List[dict]:
+        offsets = self._get_offsets()
+        rows_metadata = []
+        with open(self._file(self.manifest["metadata"]), "rb") as f:
+            for row in rows:
+                f.seek(int(offsets[row]))
+                rows_metadata.append(json.loads(f.read(int(offsets[row + 1] - offsets[row]))))
+        return rows_metadata
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1)
+
+    def add(self, ids: List[str], vectors, metadata: List[dict] = None, overwrite: bool = False,
+            upsert: bool = False) -> int:
+        """
+        Appends rows to the index, skipping ids that are already in it - or replacing them, with `upsert`. With
+        `overwrite`, the index is replaced by the given rows instead. Returns the number of rows added.
+        """
+        if not ids:
+            return 0
+        vectors = self._normalize(np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1))
+        metadata = metadata if metadata is not None else [{}] * len(ids)
+        with self._lock():
+            self._load_manifest()
+            if overwrite or not self.dim:
+                old_files = [self.manifest.get(name) for name in ("vectors", "offsets", "metadata", "ivf", "superseded")]
+                generation = uuid.uuid4().hex[:12]
+                manifest = {"version": INDEX_FORMAT_VERSION, "dim": int(vectors.shape[1]), "count": 0,
+                            "vectors": f"vectors-{generation}.f32", "offsets": f"offsets-{generation}.i64",
+                            "metadata": f"metadata-{generation}.jsonl", "metadata_size": 0, "ivf": None, "ivf_count": 0,
+                            "superseded": f"superseded-{generation}.i64", "superseded_count": 0,
+                            "properties": {} if overwrite else self.manifest.get("properties", {})}
+                with open(self._file(manifest["offsets"]), "wb") as f:
+                    f.write(np.zeros(1, dtype=np.int64).tobytes())
+                existing_rows = {}
+            else:
+                old_files = []
+                manifest = dict(self.manifest)
+                # indexes written before rows could be replaced have no superseded rows file
+                manifest.setdefault("superseded", f"superseded-{uuid.uuid4().hex[:12]}.i64")
+                manifest.setdefault("superseded_count", 0)
+                existing_rows = dict(self._get_rows())
+            if vectors.shape[1] != manifest["dim"]:
+                raise ValueError(f"Expected vectors of dimension {manifest['dim']}, got {vectors.shape[1]}")
+
+            count = manifest["count"]
+            rows, superseded = [], []
+            for i, row_id in enumerate(ids):
+                if row_id in existing_rows:
+                    if not upsert:
+                        continue
+                    superseded.append(existing_rows[row_id])
+                existing_rows[row_id] = count + len(rows)
+                rows.append(i)
+            if not rows:
+                return 0
+            lines = [(json.dumps({"id": ids[i], "metadata": metadata[i]}) + "\n").encode("utf-8") for i in rows]
+            offsets = manifest["metadata_size"] + np.cumsum([len(line) for line in lines], dtype=np.int64)
+
+            # append past the committed rows, dropping what a crashed writer may have left there
+            self._append(manifest["vectors"], count * manifest["dim"] * 4, vectors[rows].tobytes())
+            self._append(manifest["metadata"], manifest["metadata_size"], b"".join(lines))
+            self._append(manifest["offsets"], (count + 1) * 8, offsets.tobytes())
+            if superseded:
+                self._append(manifest["superseded"], manifest["superseded_count"] * 8,
+                             np.asarray(superseded, dtype=np.int64).tobytes())
+            manifest["count"] = count + len(rows)
+            manifest["metadata_size"] = int(offsets[-1]) if len(offsets) else manifest["metadata_size"]
+            manifest["superseded_count"] += len(superseded)
+            self._write_manifest(manifest)
+            self._rows = existing_rows
+
+            if len(self) >= self.ann_threshold and (len(self) - manifest["ivf_count"]) > IVF_REBUILD_FRACTION * len(self):
+                self._build_ivf_locked()
+            for old_file in old_files:
+                if old_file and os.path.exists(self._file(old_file)):  # no superseded rows file until a row is replaced
+                    os.remove(self._file(old_file))
+        return len(rows)
+
+    def get_metadata(self, ids: List[str]) -> dict:
+        """
+        The metadata of the current version of each of `ids` that is in the index, by id.
+        """
+        self._load_manifest()
+        rows = self._get_rows()
+        found = sorted(rows[row_id] for row_id in set(ids) if row_id in rows)
+        if not found:
+            return {}
+        return {row["id"]: row["metadata"] for row in self._read_rows_metadata(found)}
+
+    def get_property(self, name: str, default=None):
+        self._load_manifest()
+        return self.manifest.get("properties", {}).get(name, default)
+
+    def set_properties(self, **properties):
+        with self._lock():
+            self._load_manifest()
+            manifest = dict(self.manifest or {"version": INDEX_FORMAT_VERSION, "count": 0})
+            manifest["properties"] = {**manifest.get("properties", {}), **properties}
+            self._write_manifest(manifest)
+
+    def clear(self):
+        """
+        Removes all the rows and properties of the index.
+        """
+        with self._lock():
+            self._load_manifest()
+            old_files = [self.manifest.get(name) for name in ("vectors", "offsets", "metadata", "ivf", "superseded")]
+            self._write_manifest({"version": INDEX_FORMAT_VERSION, "count": 0, "properties": {}})
+            for old_file in old_files:
+                if old_file and os.path.exists(self._file(old_file)):
+                    os.remove(self._file(old_file))
+
+    def _append(self, name: str, committed_size: int, data: bytes):
+        with open(self._file(name), "ab") as f:
+            f.truncate(committed_size)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def build_ivf(self, nlist: int = None, iterations: int = 10, seed: int = 0):
+        """
+        (Re)builds the approximate index over all the rows. Search uses it from then on.
+        """
+        with self._lock():
+            self._load_manifest()
+            self._build_ivf_locked(nlist, iterations, seed)
+
+    def _build_ivf_locked(self, nlist: int = None, iterations: int = 10, seed: int = 0):
+        vectors = self._get_vectors()
+        count = len(self)
+        nlist = max(1, min(nlist or int(np.sqrt(count)), count))
+        rng = np.random.default_rng(seed)
+        # spherical k-means on a sample of the rows
+        sample = np.array(vectors[np.sort(rng.choice(count, size=min(count, 64 * nlist), replace=False))])
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(iterations):
+            assignment = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]  # keep the centroids of empty clusters
+            centroids = self._normalize(sums)
+        assignment = np.concatenate([self._assign(np.asarray(vectors[start:start + SEARCH_CHUNK_ROWS]), centroids)
+                                     for start in range(0, count, SEARCH_CHUNK_ROWS)])
+        order = np.argsort(assignment, kind="stable").astype(np.int64)
+        list_offsets = np.searchsorted(assignment[order], np.arange(nlist + 1)).astype(np.int64)
+
+        name = f"ivf-{uuid.uuid4().hex[:12]}.npz"
+        np.savez(self._file(name), centroids=centroids.astype(np.float32), order=order, list_offsets=list_offsets)
+        old_ivf = self.manifest.get("ivf")
+        self._write_manifest(dict(self.manifest, ivf=name, ivf_count=count))
+        if old_ivf:
+            os.remove(self._file(old_ivf))
+        get_logger().debug(f"Built the approximate vector index of {self.path}",
+                           artifact={"rows": count, "lists": nlist})
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ centroids.T, axis=1)
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, top_k: int) -> np.ndarray:
+        if len(scores) > top_k:
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            top = np.arange(len(scores))
+        return top[np.argsort(-scores[top], kind="stable")]
+
+    def search(self, query, top_k: int = 5, exact: bool = None, nprobe: int = None) -> List[dict]:
+        """
+        The `top_k` rows most similar to `query` (cosine similarity), best first, as {"id", "score", "metadata"}.
+        The search is approximate when the approximate index exists, unless `exact` is set.
+        """
+        self._load_manifest()
+        if not len(self):
+            return []
+        query = self._normalize(np.asarray(query, dtype=np.float32).reshape(-1))
+        vectors = self._get_vectors()
+        ivf = None if exact else self._get_ivf()
+        if ivf is None:
+            rows, scores = self._search_exact(vectors, query, top_k)
+        else:
+            rows, scores = self._search_ivf(vectors, ivf, query, top_k, nprobe)
+        return [{"id": row["id"], "score": float(score), "metadata": row["metadata"]}
+                for row, score in zip(self._read_rows_metadata(rows), scores)]
+
+    def _search_exact(self, vectors: np.ndarray, query: np.ndarray, top_k: int):
+        superseded = self._get_superseded()
+        candidate_rows, candidate_scores = [], []
+        for start in range(0, len(vectors), SEARCH_CHUNK_ROWS):
+            scores = vectors[start:start + SEARCH_CHUNK_ROWS] @ query
+            if superseded is not None:
+                scores[superseded[start:start + SEARCH_CHUNK_ROWS]] = -np.inf
+            top = self._top_k(scores, top_k)
+            candidate_rows.append(top + start)
+            candidate_scores.append(scores[top])
+        rows, scores = np.concatenate(candidate_rows), np.concatenate(candidate_scores)
+        top = self._top_k(scores, top_k)
+        top = top[np.isfinite(scores[top])]
+        return rows[top], scores[top]
+
+    def _search_ivf(self, vectors: np.ndarray, ivf: dict, query: np.ndarray, top_k: int, nprobe: int = None):
+        centroids, order, list_offsets = ivf["centroids"], ivf["order"], ivf["list_offsets"]
+        nprobe = min(nprobe or max(1, len(centroids) // 16), len(centroids))
+        probed_lists = self._top_k(centroids @ query, nprobe)
+        ivf_count = self.manifest["ivf_count"]
+        rows = np.sort(np.concatenate([order[list_offsets[i]:list_offsets[i + 1]] for i in probed_lists] +
+                                      [np.arange(ivf_count, len(self), dtype=np.int64)]))  # sorted rows read faster
+        superseded = self._get_superseded()
+        if superseded is not None:
+            rows = rows[~superseded[rows]]
+        scores = vectors[rows] @ query
+        top = self._top_k(scores, top_k)
+        return rows[top], scores[top]
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+_current_session: ContextVar[Optional["PRAnalysisSession"]] = ContextVar("pr_analysis_session", default=None)
+
+
+class PRAnalysisSession:
+    """
+    Artifacts shared by the tools that run on the same PR and head commit, e.g. the auto commands of a new PR
+    (`/describe`, `/review` and `/improve`): languages, changed files, diff files, files sorted by language, extended
+    patches with their token counts, and linked tickets.
+    Each artifact is computed once, on first use, by whichever tool needs it first. Tools keep their own provider;
+    only its read-only calls are served from the session (see `attach`), and incremental providers bypass it.
+    """
+
+    SHARED_PROVIDER_CALLS = ("get_languages", "get_files", "get_diff_files")
+
+    def __init__(self, pr_url: str, head_sha: Optional[str] = None):
+        self.pr_url = pr_url
+        self.head_sha = head_sha
+        self._artifacts = {}
+        self._lock = threading.RLock()
+
+    @property
+    def key(self) -> tuple:
+        return self.pr_url, self.head_sha
+
+    def has(self, name: Hashable) -> bool:
+        return name in self._artifacts
+
+    def get(self, name: Hashable, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            if name not in self._artifacts:
+                self._artifacts[name] = compute()
+            return self._artifacts[name]
+
+    async def get_async(self, name: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Like `get`, for artifacts computed by a coroutine: tools asking while it runs wait for the same result.
+        A failed computation is not kept, the next tool asking runs it again.
+        """
+        with self._lock:
+            if name not in self._artifacts:
+                self._artifacts[name] = asyncio.ensure_future(compute())
+            future = self._artifacts[name]
+        try:
+            return await future
+        except Exception:
+            with self._lock:
+                if self._artifacts.get(name) is future:
+                    del self._artifacts[name]
+            raise
+
+    def attach(self, git_provider):
+        """
+        Serves the read-only calls of `git_provider` (`SHARED_PROVIDER_CALLS`) from the session.
+        """
+        for name in self.SHARED_PROVIDER_CALLS:
+            fetch = getattr(git_provider, name, None)
+            if fetch is not None:
+                setattr(git_provider, name, partial(self._shared_provider_call, git_provider, name, fetch))
+        git_provider.analysis_session = self
+        return git_provider
+
+    def _shared_provider_call(self, git_provider, name: str, fetch: Callable, *args, **kwargs):
+        if args or kwargs or is_incremental(git_provider):
+            return fetch(*args, **kwargs)
+        result = self.get(name, fetch)
+        if name == "get_diff_files" and hasattr(git_provider, "diff_files"):
+            git_provider.diff_files = result  # some provider methods read the cached attribute directly
+        return result
+
+
+def is_incremental(git_provider) -> bool:
+    return bool(getattr(getattr(git_provider, "incremental", None), "is_incremental", False))
+
+
+@contextmanager
+def pr_analysis_session(pr_url: str, head_sha: Optional[str] = None):
+    """
+    Opens a session for the tools run in this context (including tasks started from it) on `pr_url`.
+    """
+    session = PRAnalysisSession(pr_url, head_sha)
+    token = _current_session.set(session)
+    try:
+        yield session
+    finally:
+        _current_session.reset(token)
+
+
+def get_current_session(pr_url: str) -> Optional[PRAnalysisSession]:
+    session = _current_session.get()
+    return session if session is not None and session.pr_url == pr_url else None
+
+
+def get_analysis_session(git_provider) -> Optional[PRAnalysisSession]:
+    """
+    The session serving `git_provider`, or None when its artifacts cannot be shared.
+    """
+    session = getattr(git_provider, "analysis_session", None)
+    if not isinstance(session, PRAnalysisSession) or is_incremental(git_provider):
+        return None
+    return session
+
+
+def get_shared_artifact(git_provider, name: Hashable, compute: Callable[[], Any]) -> Any:
+    session = get_analysis_session(git_provider)
+    return session.get(name, compute) if session else compute()
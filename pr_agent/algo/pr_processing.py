@@ -1,7 +1,10 @@
 from __future__ import annotations
 
+import contextvars
+import queue
+import threading
 import traceback
-from typing import Callable, List, Tuple
+from typing import Callable, Iterator, List, Tuple
 
 from github import RateLimitExceededException
 
@@ -10,11 +13,18 @@ from pr_agent.algo.diff_processing import (ADDED_FILES_, DELETED_FILES_,
                                            MORE_MODIFIED_FILES_,
                                            OUTPUT_BUFFER_TOKENS_HARD_THRESHOLD,
                                            OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD,
+                                           add_ai_summary_top_patch,
+                                           extend_file_patch,
                                            pr_generate_compressed_diff,
                                            pr_generate_extended_diff)
-from pr_agent.algo.language_handler import sort_files_by_main_languages
+from pr_agent.algo.git_patch_processing import (
+    decouple_and_convert_to_hunks_with_lines_numbers, handle_patch_deletions)
+from pr_agent.algo.language_handler import (LanguageSorter,
+                                            sort_files_by_main_languages)
+from pr_agent.algo.pr_analysis_session import (get_analysis_session,
+                                               get_shared_artifact)
 from pr_agent.algo.token_handler import TokenHandler
-from pr_agent.algo.types import EDIT_TYPE
+from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
 from pr_agent.algo.utils import (ModelType, clip_tokens, get_max_tokens,
                                  get_model)
 from pr_agent.config_loader import get_settings
@@ -34,7 +44,11 @@ def get_pr_diff(git_provider: GitProvider, token_handler: TokenHandler,
                 add_line_numbers_to_hunks: bool = False,
                 disable_extra_lines: bool = False,
                 large_pr_handling=False,
-                return_remaining_files=False):
+                return_remaining_files=False,
+                files: List[FilePatchInfo] = None):
+    """
+    `files`: the diff files to include, instead of all the diff files of the PR.
+    """
     if disable_extra_lines:
         PATCH_EXTRA_LINES_BEFORE = 0
         PATCH_EXTRA_LINES_AFTER = 0
@@ -47,14 +61,24 @@ def get_pr_diff(git_provider: GitProvider, token_handler: TokenHandler,
         PATCH_EXTRA_LINES_BEFORE = cap_and_log_extra_lines(PATCH_EXTRA_LINES_BEFORE, "before")
         PATCH_EXTRA_LINES_AFTER = cap_and_log_extra_lines(PATCH_EXTRA_LINES_AFTER, "after")
 
+    extended_patches = None
     try:
-        diff_files = git_provider.get_diff_files()
+        if files is not None:
+            diff_files = files
+        elif _should_pipeline_diff_files(git_provider):
+            diff_files, pr_languages, extended_patches = _get_diff_files_pipelined(
+                git_provider, token_handler, add_line_numbers_to_hunks, PATCH_EXTRA_LINES_BEFORE, PATCH_EXTRA_LINES_AFTER)
+        else:
+            diff_files = git_provider.get_diff_files()
     except RateLimitExceededException as e:
         get_logger().error(f"Rate limit exceeded for git provider API. original message {e}")
         raise
 
     # get pr languages
-    pr_languages = sort_files_by_main_languages(git_provider.get_languages(), diff_files)
+    if files is not None:
+        pr_languages = sort_files_by_main_languages(git_provider.get_languages(), diff_files)
+    elif extended_patches is None:
+        pr_languages = get_shared_artifact(git_provider, "pr_languages", lambda: sort_files_by_main_languages(git_provider.get_languages(), diff_files))
     if pr_languages:
         try:
             get_logger().info(f"PR main language: {pr_languages[0]['language']}")
@@ -62,9 +86,20 @@ def get_pr_diff(git_provider: GitProvider, token_handler: TokenHandler,
             pass
 
     # generate a standard diff string, with patch extension
-    patches_extended, total_tokens, patches_extended_tokens = pr_generate_extended_diff(
+    generate_extended_diff = lambda: pr_generate_extended_diff(
         pr_languages, token_handler, add_line_numbers_to_hunks,
-        patch_extra_lines_before=PATCH_EXTRA_LINES_BEFORE, patch_extra_lines_after=PATCH_EXTRA_LINES_AFTER)
+        patch_extra_lines_before=PATCH_EXTRA_LINES_BEFORE, patch_extra_lines_after=PATCH_EXTRA_LINES_AFTER,
+        extended_patches=extended_patches)
+    if get_settings().get("config.enable_ai_metadata", False) or files is not None:
+        # AI summaries are attached to the files by some tools only, and a subset of the files is specific to the
+        # tool: the patches cannot be shared
+        patches_extended, total_tokens, patches_extended_tokens = generate_extended_diff()
+    else:
+        # the patches do not depend on the prompt of the tool, only the total token count does
+        extended_diff_key = ("extended_diff", get_settings().config.model, add_line_numbers_to_hunks,
+                             PATCH_EXTRA_LINES_BEFORE, PATCH_EXTRA_LINES_AFTER)
+        patches_extended, _, patches_extended_tokens = get_shared_artifact(git_provider, extended_diff_key, generate_extended_diff)
+        total_tokens = token_handler.prompt_tokens + sum(patches_extended_tokens)
 
     # if we are under the limit, return the full diff
     if total_tokens + OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD < get_max_tokens(model):
@@ -139,6 +174,71 @@ def get_pr_diff(git_provider: GitProvider, token_handler: TokenHandler,
         return final_diff, remaining_files_list
 
 
+def _should_pipeline_diff_files(git_provider: GitProvider) -> bool:
+    if not get_settings().get("config.pipeline_diff_files", True):
+        return False
+    # only providers that fetch the file contents one by one have something to overlap
+    if getattr(type(git_provider), "iter_diff_files", None) in (None, GitProvider.iter_diff_files):
+        return False
+    if getattr(git_provider, "diff_files", None):
+        return False
+    session = get_analysis_session(git_provider)
+    return session is None or not session.has("get_diff_files")
+
+
+def _iter_prefetched(iterator: Iterator) -> Iterator:
+    """
+    Iterates `iterator` in a background thread, so that the next items are fetched while the current one is
+    processed. Errors of the iterator are raised to the consumer.
+    """
+    items = queue.Queue()
+    done = object()
+
+    def produce():
+        try:
+            for item in iterator:
+                items.put((item, None))
+            items.put((done, None))
+        except BaseException as e:
+            items.put((done, e))
+
+    # the thread runs in a copy of the current context, so that the request context (e.g. its cached settings
+    # and logging context) is visible to the provider
+    threading.Thread(target=contextvars.copy_context().run, args=(produce,), daemon=True).start()
+    while True:
+        item, error = items.get()
+        if error is not None:
+            raise error
+        if item is done:
+            return
+        yield item
+
+
+def _get_diff_files_pipelined(git_provider: GitProvider, token_handler: TokenHandler, add_line_numbers_to_hunks: bool,
+                              patch_extra_lines_before: int, patch_extra_lines_after: int) -> Tuple[list, list, dict]:
+    """
+    Sorts the diff files by language, and extends their patches and counts their tokens, as the files arrive from
+    the provider, while the next ones are still being fetched. Once the last file is in, only it remains to be processed.
+    Returns (diff_files, pr_languages, extended_patches), see `pr_generate_extended_diff`.
+    """
+    sorter = LanguageSorter(git_provider.get_languages())
+    enable_ai_metadata = get_settings().get("config.enable_ai_metadata", False)
+    diff_files = []
+    extended_patches = {}
+    for file in _iter_prefetched(git_provider.iter_diff_files()):
+        diff_files.append(file)
+        if sorter.add(file):
+            extended_patches[file.filename] = extend_file_patch(file, token_handler, add_line_numbers_to_hunks,
+                                                                patch_extra_lines_before, patch_extra_lines_after,
+                                                                enable_ai_metadata)
+    sorted_files = sorter.get_sorted_files()
+    session = get_analysis_session(git_provider)
+    if session:
+        diff_files = session.get("get_diff_files", lambda: diff_files)
+        sorted_files = session.get("pr_languages", lambda: sorted_files)
+    return diff_files, sorted_files, extended_patches
+
+
 def get_pr_diff_multiple_patchs(git_provider: GitProvider, token_handler: TokenHandler, model: str,
                 add_line_numbers_to_hunks: bool = False, disable_extra_lines: bool = False):
     try:
@@ -148,7 +248,7 @@ def get_pr_diff_multiple_patchs(git_provider: GitProvider, token_handler: TokenH
         raise
 
     # get pr languages
-    pr_languages = sort_files_by_main_languages(git_provider.get_languages(), diff_files)
+    pr_languages = get_shared_artifact(git_provider, "pr_languages", lambda: sort_files_by_main_languages(git_provider.get_languages(), diff_files))
     if pr_languages:
         try:
             get_logger().info(f"PR main language: {pr_languages[0]['language']}")
@@ -221,7 +321,8 @@ def get_pr_multi_diffs(git_provider: GitProvider,
                        token_handler: TokenHandler,
                        model: str,
                        max_calls: int = 5,
-                       add_line_numbers: bool = True) -> List[str]:
+                       add_line_numbers: bool = True,
+                       balance_chunks: bool = False) -> List[str]:
     """
     Retrieves the diff files from a Git provider, sorts them by main language, and generates patches for each file.
     The patches are split into multiple groups based on the maximum number of tokens allowed for the given model.
@@ -231,6 +332,8 @@ def get_pr_multi_diffs(git_provider: GitProvider,
         token_handler (TokenHandler): An object that handles tokens in the context of a pull request.
         model (str): The name of the model.
         max_calls (int, optional): The maximum number of calls to retrieve diff files. Defaults to 5.
+        balance_chunks (bool, optional): Balance the tokens between the groups (see `balance_patches_across_chunks`),
+            for groups that are processed in parallel. Defaults to False.
 
     Returns:
         List[str]: A list of final diff strings, split into multiple groups based on the maximum number of tokens allowed for the given model.
@@ -245,7 +348,7 @@ def get_pr_multi_diffs(git_provider: GitProvider,
         raise
 
     # Sort files by main language
-    pr_languages = sort_files_by_main_languages(git_provider.get_languages(), diff_files)
+    pr_languages = get_shared_artifact(git_provider, "pr_languages", lambda: sort_files_by_main_languages(git_provider.get_languages(), diff_files))
 
     # Get the maximum number of extra lines before and after the patch
     if get_settings().config.get("token_economy_mode", False):
@@ -274,7 +377,7 @@ def get_pr_multi_diffs(git_provider: GitProvider,
         sorted_files.extend(sorted(lang['files'], key=lambda x: x.tokens, reverse=True))
 
     patches = []
-    final_diff_list = []
+    chunks = []  # each chunk is a list of (patch, tokens)
     total_tokens = token_handler.prompt_tokens
     call_number = 1
     for file in sorted_files:
@@ -326,8 +429,7 @@ def get_pr_multi_diffs(git_provider: GitProvider,
                 continue
 
         if patch and (total_tokens + new_patch_tokens > get_max_tokens(model) - OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD):
-            final_diff = "\n".join(patches)
-            final_diff_list.append(final_diff)
+            chunks.append(patches)
             patches = []
             total_tokens = token_handler.prompt_tokens
             call_number += 1
@@ -339,19 +441,55 @@ def get_pr_multi_diffs(git_provider: GitProvider,
                 get_logger().info(f"Call number: {call_number}")
 
         if patch:
-            patches.append(patch)
+            patches.append((patch, new_patch_tokens))
             total_tokens += new_patch_tokens
             if get_settings().config.verbosity_level >= 2:
                 get_logger().info(f"Tokens: {total_tokens}, last filename: {file.filename}")
 
     # Add the last chunk
     if patches:
-        final_diff = "\n".join(patches)
-        final_diff_list.append(final_diff.strip())
+        chunks.append(patches)
+
+    if balance_chunks and len(chunks) > 1:
+        chunks = balance_patches_across_chunks(
+            chunks, get_max_tokens(model) - OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD - token_handler.prompt_tokens)
 
+    final_diff_list = ["\n".join(patch for patch, _ in chunk) for chunk in chunks]
+    if final_diff_list:
+        final_diff_list[-1] = final_diff_list[-1].strip()
     return final_diff_list
 
 
+def balance_patches_across_chunks(chunks: List[List[Tuple[str, int]]], max_chunk_tokens: int) -> List[List[Tuple[str, int]]]:
+    """
+    Redistributes patches between chunks of (patch, tokens) so that the largest chunk is as small as possible.
+    Filling the chunks one after the other leaves the last one almost empty, while the duration of parallel calls
+    is set by the largest one.
+    Uses longest-processing-time-first bin packing: the largest patches are placed first, each into the least loaded
+    chunk that can still hold it. Patches are never split, keep their relative order inside a chunk, and the number
+    of chunks does not change. The original chunks are returned when they cannot be improved.
+    """
+    items = [(index, patch, tokens) for index, (patch, tokens) in enumerate(patch for chunk in chunks for patch in chunk)]
+    loads = [0] * len(chunks)
+    packed = [[] for _ in chunks]
+    for index, patch, tokens in sorted(items, key=lambda item: item[2], reverse=True):
+        candidates = [i for i in range(len(chunks)) if loads[i] + tokens <= max_chunk_tokens]
+        if not candidates:
+            return chunks  # the original chunks are a valid packing, keep them
+        target = min(candidates, key=lambda i: loads[i])
+        loads[target] += tokens
+        packed[target].append((index, patch, tokens))
+
+    original_max_load = max(sum(tokens for _, tokens in chunk) for chunk in chunks)
+    if max(loads) >= original_max_load or not all(packed):
+        return chunks
+    # keep the priority order of the patches (main language first), inside and across chunks
+    packed.sort(key=lambda chunk: min(index for index, _, _ in chunk))
+    balanced = [[(patch, tokens) for _, patch, tokens in sorted(chunk)] for chunk in packed]
+    get_logger().info(f"Balanced {len(chunks)} chunks, largest chunk: {original_max_load} -> {max(loads)} tokens")
+    return balanced
+
+
 def add_ai_metadata_to_diff_files(git_provider, pr_description_files):
     """
     Adds AI metadata to the diff files based on the PR description files (FilePatchInfo.ai_file_summary).
@@ -0,0 +1,116 @@
+import copy
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from pr_agent.algo.types import FilePatchInfo
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+from pr_agent.servers.utils import DefaultDictWithTimeout
+
+_review_cache = None
+
+
+def get_review_cache() -> DefaultDictWithTimeout:
+    global _review_cache
+    if _review_cache is None:
+        _review_cache = DefaultDictWithTimeout(ttl=get_settings().get("PR_REVIEWER.FILE_FINDINGS_CACHE_TTL", 7 * 24 * 60 * 60))
+    return _review_cache
+
+
+def git_blob_sha(content: str) -> str:
+    """
+    The sha of `content` as a git blob, as git computes it.
+    """
+    data = (content or "").encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def get_prompt_version(model: str, prompts: List[str], sections: List[str]) -> str:
+    """
+    Identifies everything that shapes the output of a tool for a file besides its content: the prompts (setting
+    names), the configuration sections and the model.
+    """
+    settings = get_settings()
+    version = json.dumps([[dict(settings.get(prompt, {})) for prompt in prompts],
+                          [dict(settings.get(section, {})) for section in sections], model],
+                         sort_keys=True, default=str)
+    return hashlib.sha1(version.encode("utf-8")).hexdigest()
+
+
+def get_review_prompt_version(model: str) -> str:
+    return get_prompt_version(model, ["pr_review_prompt"], ["pr_reviewer"])
+
+
+class FileResultCache:
+    """
+    Results of a tool per file version, valid as long as the base and head blobs of the file, the repo and the
+    prompt version (see `get_prompt_version`) are unchanged.
+    """
+
+    def __init__(self, name: str, repo: str, prompt_version: str, cache: DefaultDictWithTimeout = None):
+        self.name = name
+        self.repo = repo
+        self.prompt_version = prompt_version
+        self.cache = cache if cache is not None else get_review_cache()
+
+    def file_key(self, file: FilePatchInfo) -> tuple:
+        return (self.name, self.repo, file.filename.strip(), git_blob_sha(file.base_file), git_blob_sha(file.head_file),
+                self.prompt_version)
+
+    def get(self, file: FilePatchInfo) -> Any:
+        key = self.file_key(file)
+        return copy.deepcopy(self.cache[key]) if key in self.cache else None
+
+    def set(self, file: FilePatchInfo, value: Any):
+        self.cache[self.file_key(file)] = copy.deepcopy(value)
+
+
+class ReviewFileCache(FileResultCache):
+    """
+    The findings ('key_issues_to_review') of previous reviews, per file version: on a new push only the files whose
+    blob pair changed are reviewed again.
+    The rest of the last review of the PR (effort, security concerns, ...) is kept as well, for pushes that change
+    no file.
+    """
+
+    def __init__(self, repo: str, pr_url: str, prompt_version: str, cache: DefaultDictWithTimeout = None):
+        super().__init__("review_findings", repo, prompt_version, cache)
+        self.pr_url = pr_url
+
+    @property
+    def review_key(self) -> tuple:
+        return "review", self.pr_url, self.prompt_version
+
+    def split_files(self, diff_files: List[FilePatchInfo]) -> Tuple[List[FilePatchInfo], Dict[str, list]]:
+        """
+        Returns the files to review, and the cached findings of the other files, by filename.
+        """
+        changed_files = []
+        cached_findings = {}
+        for file in diff_files:
+            findings = self.get(file)
+            if findings is None:
+                changed_files.append(file)
+            else:
+                cached_findings[file.filename.strip()] = findings
+        return changed_files, cached_findings
+
+    def store_findings(self, reviewed_files: List[FilePatchInfo], key_issues: list):
+        findings_by_file = {file.filename.strip(): [] for file in reviewed_files}
+        for issue in key_issues:
+            filename = str(issue.get("relevant_file", "")).strip()
+            if filename in findings_by_file:
+                findings_by_file[filename].append(issue)
+        for file in reviewed_files:
+            self.set(file, findings_by_file[file.filename.strip()])
+
+    def get_review(self) -> Optional[dict]:
+        if self.review_key not in self.cache:
+            return None
+        return copy.deepcopy(self.cache[self.review_key])
+
+    def store_review(self, review: dict):
+        review = {key: value for key, value in review.items() if key != "key_issues_to_review"}
+        self.cache[self.review_key] = copy.deepcopy(review)
+        get_logger().debug(f"Cached the review of {self.pr_url}")
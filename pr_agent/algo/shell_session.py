@@ -0,0 +1,186 @@
+import os
+import re
+import selectors
+import shlex
+import shutil
+import signal
+import subprocess
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+DEFAULT_COMMAND_TIMEOUT = 60  # seconds
+DEFAULT_MAX_OUTPUT_BYTES = 100_000  # per stream and command
+# environment variables not passed to the shell
+RE_SECRET_ENV_NAME = re.compile(r"KEY|TOKEN|SECRET|PASSWORD|PASSWD|CREDENTIAL|PRIVATE", re.IGNORECASE)
+
+
+@dataclass
+class CommandResult:
+    stdout: str
+    stderr: str
+    returncode: int
+    truncated: bool = False
+
+
+class _Capture:
+    """
+    The output of a command on one stream, up to the marker line that ends it. Keeps at most `max_bytes`.
+    """
+
+    def __init__(self, marker: bytes, max_bytes: int):
+        self.marker = b"\n" + marker
+        self.max_bytes = max_bytes
+        self.data = bytearray()
+        self.size = 0
+        self.pending = b""  # the end of the output read so far, which may be the start of the marker line
+        self.status = b""  # the rest of the marker line
+        self.done = False
+
+    def _keep(self, chunk: bytes):
+        self.size += len(chunk)
+        if len(self.data) < self.max_bytes:
+            self.data += chunk[:self.max_bytes - len(self.data)]
+
+    def feed(self, chunk: bytes):
+        buffer = self.pending + chunk
+        index = buffer.find(self.marker)
+        if index >= 0:
+            self._keep(buffer[:index])
+            end = buffer.find(b"\n", index + len(self.marker))
+            if end < 0:  # the end of the marker line is still to come
+                self.pending = buffer[index:]
+            else:
+                self.pending, self.status, self.done = b"", buffer[index + len(self.marker):end].strip(), True
+            return
+        cut = max(0, len(buffer) - len(self.marker) + 1)
+        self._keep(buffer[:cut])
+        self.pending = buffer[cut:]
+
+    def text(self) -> str:
+        text = bytes(self.data).decode("utf-8", errors="replace")
+        if self.size > self.max_bytes:
+            text += f"\n...(output truncated, {self.size} bytes > {self.max_bytes} bytes)"
+        return text
+
+
+def _sandbox_env() -> dict:
+    env = {name: value for name, value in os.environ.items() if not RE_SECRET_ENV_NAME.search(name)}
+    env.update(TERM="dumb", PAGER="cat", GIT_PAGER="cat", GIT_TERMINAL_PROMPT="0")
+    return env
+
+
+class ShellSession:
+    """
+    A long-lived shell for the commands of an agent run, so that the working directory, the environment variables
+    and an activated virtualenv carry over from one command to the next, without starting a shell per command.
+
+    The shell reads the commands from a pipe. Each command is evaluated with its stdin closed, then the shell prints
+    a marker line with a random token on stdout (with the exit code) and on stderr, which ends the command output.
+    A command gets `timeout` seconds, and at most `max_output_bytes` of each stream are kept.
+    The shell runs in its own process group, without the environment variables that look like secrets. A command
+    that times out kills the group, and the next command starts a new shell; so does a shell that exited.
+    `close()` ends the shell and the processes it started.
+    """
+
+    def __init__(self, cwd: Optional[str] = None, timeout: Optional[float] = None,
+                 max_output_bytes: Optional[int] = None):
+        self.cwd = cwd
+        self.timeout = timeout or get_settings().get("PR_CODE_AGENT.SHELL_TIMEOUT", DEFAULT_COMMAND_TIMEOUT)
+        self.max_output_bytes = max_output_bytes or get_settings().get("PR_CODE_AGENT.SHELL_MAX_OUTPUT_BYTES",
+                                                                       DEFAULT_MAX_OUTPUT_BYTES)
+        self._process: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def _start(self):
+        self.close()
+        bash = shutil.which("bash")
+        self._process = subprocess.Popen([bash, "--noprofile", "--norc"] if bash else ["/bin/sh"],
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                         cwd=self.cwd, env=_sandbox_env(), start_new_session=True, bufsize=0)
+        get_logger().debug(f"Started a shell session, pid {self._process.pid}")
+
+    def run(self, command: str, timeout: Optional[float] = None) -> CommandResult:
+        """
+        Runs `command` in the shell. Raises subprocess.TimeoutExpired when it takes longer than the timeout.
+        """
+        timeout = timeout or self.timeout
+        with self._lock:
+            if not self.is_alive():
+                self._start()
+            marker = f"__PR_AGENT_END_{uuid.uuid4().hex}__"
+            script = (f"eval {shlex.quote(command)} < /dev/null\n"
+                      f"__status=$?; printf '\\n{marker} %d\\n' \"$__status\"; printf '\\n{marker}\\n' >&2\n")
+            stdout = _Capture(marker.encode(), self.max_output_bytes)
+            stderr = _Capture(marker.encode(), self.max_output_bytes)
+            try:
+                self._process.stdin.write(script.encode("utf-8"))
+                self._process.stdin.flush()
+            except OSError:  # the shell exited
+                pass
+            if not self._read(stdout, stderr, time.monotonic() + timeout):
+                self._kill()
+                raise subprocess.TimeoutExpired(command, timeout, output=stdout.text(), stderr=stderr.text())
+            if stdout.done:
+                returncode = int(stdout.status)
+            else:  # the command exited the shell
+                returncode = self._process.wait()
+            return CommandResult(stdout.text(), stderr.text(), returncode,
+                                 truncated=max(stdout.size, stderr.size) > self.max_output_bytes)
+
+    def _read(self, stdout: _Capture, stderr: _Capture, deadline: float) -> bool:
+        """
+        Reads the output of the command until both markers (or the end of the streams). False on timeout.
+        """
+        with selectors.DefaultSelector() as selector:
+            selector.register(self._process.stdout, selectors.EVENT_READ, stdout)
+            selector.register(self._process.stderr, selectors.EVENT_READ, stderr)
+            while selector.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                for key, _ in selector.select(remaining):
+                    chunk = os.read(key.fd, 65536)
+                    if chunk:
+                        key.data.feed(chunk)
+                    if not chunk or key.data.done:
+                        selector.unregister(key.fileobj)
+        return True
+
+    def _kill(self):
+        try:
+            os.killpg(self._process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        self._process.wait()
+        for stream in (self._process.stdin, self._process.stdout, self._process.stderr):
+            stream.close()
+        self._process = None
+
+    def close(self):
+        """
+        Ends the shell, and the processes it left running.
+        """
+        if self._process is None:
+            return
+        try:
+            self._process.stdin.write(b"exit\n")
+            self._process.stdin.flush()
+            self._process.wait(timeout=1)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        self._kill()
@@ -0,0 +1,204 @@
+import os
+import re
+import re._parser as sre_parse
+from array import array
+from typing import Callable, Dict, List, Optional, Tuple
+
+# pr_agent.log must not be the first to import the settings (circular import)
+from pr_agent.config_loader import get_settings  # noqa: F401
+from pr_agent.log import get_logger
+
+MAX_INDEXED_FILE_SIZE = 1 << 20  # larger files are not searched
+MAX_SEARCH_RESULTS = 200
+_REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, sre_parse.POSSESSIVE_REPEAT)
+
+
+def trigrams(text: str) -> set:
+    return set(map("".join, zip(text, text[1:], text[2:])))
+
+
+def required_literals(pattern: str, flags: int = 0) -> List[str]:
+    """
+    Literal strings that every match of the regex `pattern` contains: the runs of literal characters of its top-level
+    sequence, and of the groups and the repeated (at least once) items in it. Alternations and character classes
+    end a run. Empty when nothing is required, e.g. for a top-level alternation, and for case-insensitive patterns.
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except Exception:
+        return []
+    if parsed.state.flags & re.IGNORECASE:
+        return []
+    literals, run = [], []
+
+    def end_run():
+        if run:
+            literals.append("".join(run))
+            run.clear()
+
+    def walk(items):
+        for op, av in items:
+            if op is sre_parse.LITERAL:
+                run.append(chr(av))
+            elif op is sre_parse.SUBPATTERN and not av[1] & re.IGNORECASE:
+                walk(av[-1])
+            elif op in _REPEATS and av[0] >= 1:
+                end_run()
+                walk(av[2])
+                end_run()
+            elif op is not sre_parse.AT:  # anchors match no character
+                end_run()
+
+    walk(parsed)
+    end_run()
+    return literals
+
+
+def _is_under(path: str, directory: str) -> bool:
+    """Whether the (normalized, relative) `path` is in `directory`, the key of a listing."""
+    directory = os.path.normpath(directory)
+    if directory == ".":
+        return not os.path.isabs(path) and not path.startswith("..")
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+class WorkspaceIndex:
+    """
+    An index of the files an agent works on, for the duration of a run:
+    - the contents read from the git provider, by (ref, path),
+    - the file listing,
+    - a trigram index of the local working tree under `root`, answering substring and regex searches in-process.
+      It is built on the first search, and updated as the agent edits and deletes files.
+    Regex searches read only the files that contain every trigram of the literals the regex requires.
+    Call `invalidate_local()` when the working tree may have changed otherwise (e.g. after a shell command).
+    """
+
+    def __init__(self, root: str = "."):
+        self.root = root
+        self._contents: Dict[Tuple[str, str], str] = {}
+        self._listings: Dict[str, List[str]] = {}
+        self._postings: Optional[Dict[str, array]] = None  # trigram -> ids of the files containing it
+        self._files: List[Optional[Tuple[str, str]]] = []  # id -> (path, content), None when replaced
+        self._file_ids: Dict[str, int] = {}  # path -> id
+
+    # contents
+    def read(self, ref: str, path: str, load: Callable[[], str]) -> str:
+        """The content of `path` at `ref`, loaded once. Empty contents (a missing file, a failed read) aren't cached."""
+        key = (ref, os.path.normpath(path))
+        if key in self._contents:
+            return self._contents[key]
+        content = load()
+        if content:
+            self._contents[key] = content
+        return content
+
+    def write(self, path: str, content: str, ref: Optional[str] = None):
+        """Records an edit: of the file at `ref`, and of the working tree."""
+        path = os.path.normpath(path)
+        if ref is not None:
+            self._contents[(ref, path)] = content
+        for key, listing in self._listings.items():
+            if _is_under(path, key) and not any(os.path.normpath(listed) == path for listed in listing):
+                listing.append(path)
+        if self._postings is not None:
+            self._index_file(path, content)
+
+    def delete(self, path: str, ref: Optional[str] = None):
+        path = os.path.normpath(path)
+        if ref is not None:
+            self._contents.pop((ref, path), None)
+        for listing in self._listings.values():
+            listing[:] = [listed for listed in listing if os.path.normpath(listed) != path]
+        if self._postings is not None:
+            self._unindex_file(path)
+
+    # listing
+    def list_files(self, key: str, load: Callable[[], List[str]]) -> List[str]:
+        """The files under the directory `key`, listed once. Edits and deletions update the listings they belong to."""
+        if key not in self._listings:
+            self._listings[key] = list(load())
+        return self._listings[key]
+
+    def invalidate_local(self):
+        self._listings.clear()
+        self._postings, self._files, self._file_ids = None, [], {}
+
+    # search
+    def _index_file(self, path: str, content: str):
+        self._unindex_file(path)
+        file_id = len(self._files)
+        self._files.append((path, content))
+        self._file_ids[path] = file_id
+        for trigram in trigrams(content):
+            postings = self._postings.get(trigram)
+            if postings is None:
+                postings = self._postings[trigram] = array("I")
+            postings.append(file_id)
+
+    def _unindex_file(self, path: str):
+        # the postings of the old id are left in place, the search skips it
+        file_id = self._file_ids.pop(path, None)
+        if file_id is not None:
+            self._files[file_id] = None
+
+    def _build(self):
+        self._postings, self._files, self._file_ids = {}, [], {}
+        for dir_path, dir_names, file_names in os.walk(self.root):
+            dir_names[:] = sorted(name for name in dir_names if not name.startswith("."))
+            for file_name in sorted(file_names):
+                full_path = os.path.join(dir_path, file_name)
+                try:
+                    if os.path.getsize(full_path) > MAX_INDEXED_FILE_SIZE:
+                        continue
+                    with open(full_path, "rb") as f:
+                        data = f.read()
+                except OSError as e:
+                    get_logger().debug(f"Failed to index {full_path}: {e}")
+                    continue
+                if b"\0" in data[:8192]:  # binary
+                    continue
+                self._index_file(os.path.relpath(full_path, self.root), data.decode("utf-8", errors="replace"))
+        get_logger().debug(f"Indexed {len(self._file_ids)} files of {self.root}",
+                           artifact={"trigrams": len(self._postings)})
+
+    def _candidates(self, literals: List[str]) -> List[int]:
+        query_trigrams = set().union(*(trigrams(literal) for literal in literals))
+        if not query_trigrams:
+            return [file_id for file_id, file in enumerate(self._files) if file is not None]
+        postings = sorted((self._postings.get(trigram, ()) for trigram in query_trigrams), key=len)
+        candidates = set(postings[0])
+        for file_ids in postings[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(file_ids)
+        return [file_id for file_id in candidates if self._files[file_id] is not None]
+
+    def search(self, pattern: str, regex: bool = True, flags: int = 0,
+               max_results: int = MAX_SEARCH_RESULTS) -> List[Tuple[str, int, str]]:
+        """
+        The lines of the working tree matching `pattern` (a regex, or a substring), as (path, line number, line),
+        by path. An invalid regex is searched as a substring.
+        """
+        if regex:
+            try:
+                compiled = re.compile(pattern, flags)
+            except re.error:
+                regex = False
+        if not regex:
+            compiled = re.compile(re.escape(pattern), flags)
+        if self._postings is None:
+            self._build()
+        literals = required_literals(compiled.pattern, flags)
+        # a file without a match of the pattern (with ^ and $ at line boundaries) has no matching line
+        in_file = None if "\\A" in compiled.pattern or "\\Z" in compiled.pattern else \
+            re.compile(compiled.pattern, compiled.flags | re.MULTILINE)
+        results = []
+        for path, content in sorted(self._files[file_id] for file_id in self._candidates(literals)):
+            if in_file and not in_file.search(content):
+                continue
+            for line_number, line in enumerate(content.split("\n"), 1):
+                if compiled.search(line):
+                    results.append((path, line_number, line))
+                    if len(results) >= max_results:
+                        return results
+        return results
@@ -1,4 +1,5 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Optional, Tuple
 from urllib.parse import urlparse
 
@@ -273,62 +274,26 @@ class AzureDevopsProvider(GitProvider):
                     pass
 
             invalid_files_names = []
+            valid_files = []
             for file in diffs:
                 if not is_valid_file(file):
                     invalid_files_names.append(file)
                     continue
-
-                version = GitVersionDescriptor(
-                    version=head_sha.commit_id, version_type="commit"
-                )
-                try:
-                    new_file_content_str = self.azure_devops_client.get_item(
-                        repository_id=self.repo_slug,
-                        path=file,
-                        project=self.workspace_slug,
-                        version_descriptor=version,
-                        download=False,
-                        include_content=True,
-                    )
-
-                    new_file_content_str = new_file_content_str.content
-                except Exception as error:
-                    get_logger().error(f"Failed to retrieve new file content of {file} at version {version}", error=error)
-                    # get_logger().error(
-                    #     "Failed to retrieve new file content of %s at version %s. Error: %s",
-                    #     file,
-                    #     version,
-                    #     str(error),
-                    # )
-                    new_file_content_str = ""
-
-                edit_type = EDIT_TYPE.MODIFIED
-                if diff_types[file] == "add":
-                    edit_type = EDIT_TYPE.ADDED
-                elif diff_types[file] == "delete":
-                    edit_type = EDIT_TYPE.DELETED
-                elif "rename" in diff_types[file]: # diff_type can be `rename` | `edit, rename`
-                    edit_type = EDIT_TYPE.RENAMED
-
-                version = GitVersionDescriptor(
-                    version=base_sha.commit_id, version_type="commit"
-                )
-                if edit_type == EDIT_TYPE.ADDED or edit_type == EDIT_TYPE.RENAMED:
-                    original_file_content_str = ""
-                else:
-                    try:
-                        original_file_content_str = self.azure_devops_client.get_item(
-                            repository_id=self.repo_slug,
-                            path=file,
-                            project=self.workspace_slug,
-                            version_descriptor=version,
-                            download=False,
-                            include_content=True,
-                        )
-                        original_file_content_str = original_file_content_str.content
-                    except Exception as error:
-                        get_logger().error(f"Failed to retrieve original file content of {file} at version {version}", error=error)
-                        original_file_content_str = ""
+                valid_files.append((file, self._get_edit_type(diff_types[file])))
+
+            # fetch head and base versions concurrently, only for files that survived the filters above
+            head_version = GitVersionDescriptor(version=head_sha.commit_id, version_type="commit")
+            base_version = GitVersionDescriptor(version=base_sha.commit_id, version_type="commit")
+            fetch_requests = []
+            for file, edit_type in valid_files:
+                fetch_requests.append((file, head_version, "new"))
+                if edit_type not in (EDIT_TYPE.ADDED, EDIT_TYPE.RENAMED):
+                    fetch_requests.append((file, base_version, "original"))
+            contents = self._get_items_content(fetch_requests)
+
+            for file, edit_type in valid_files:
+                new_file_content_str = contents.get((file, "new"), "")
+                original_file_content_str = contents.get((file, "original"), "")
 
                 patch = load_large_diff(
                     file, new_file_content_str, original_file_content_str, show_warning=False
@@ -358,6 +323,52 @@ class AzureDevopsProvider(GitProvider):
             get_logger().exception(f"Failed to get diff files, error: {e}")
             return []
 
+    @staticmethod
+    def _get_edit_type(diff_type: str) -> EDIT_TYPE:
+        if diff_type == "add":
+            return EDIT_TYPE.ADDED
+        elif diff_type == "delete":
+            return EDIT_TYPE.DELETED
+        elif "rename" in diff_type:  # diff_type can be `rename` | `edit, rename`
+            return EDIT_TYPE.RENAMED
+        return EDIT_TYPE.MODIFIED
+
+    def _get_item_content(self, file: str, version: GitVersionDescriptor, side: str) -> str:
+        try:
+            item = self.azure_devops_client.get_item(
+                repository_id=self.repo_slug,
+                path=file,
+                project=self.workspace_slug,
+                version_descriptor=version,
+                download=False,
+                include_content=True,
+            )
+            return item.content
+        except Exception as error:
+            get_logger().error(f"Failed to retrieve {side} file content of {file} at version {version}", error=error)
+            return ""
+
+    def _get_items_content(self, fetch_requests: list[tuple[str, GitVersionDescriptor, str]]) -> dict:
+        """
+        Fetches file contents for (file, version, side) requests using a bounded thread pool.
+        All requests go through the same git client, so they share its connection pool.
+        Returns a dict mapping (file, side) to the content string ("" on failure).
+        """
+        if not fetch_requests:
+            return {}
+        max_workers = get_settings().azure_devops.get("max_concurrent_item_fetches", 8)
+        try:
+            max_workers = max(1, min(int(max_workers), len(fetch_requests)))
+        except (TypeError, ValueError):
+            max_workers = 1
+        if max_workers == 1:
+            return {(file, side): self._get_item_content(file, version, side)
+                    for file, version, side in fetch_requests}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {(file, side): executor.submit(self._get_item_content, file, version, side)
+                       for file, version, side in fetch_requests}
+            return {key: future.result() for key, future in futures.items()}
+
     def publish_comment(self, pr_comment: str, is_temporary: bool = False, thread_context=None) -> Comment:
         if is_temporary and not get_settings().config.publish_output_progress:
             get_logger().debug(f"Skipping publish_comment for temporary comment: {pr_comment}")
@@ -607,6 +618,13 @@ class AzureDevopsProvider(GitProvider):
         azure_devops_connection = Connection(base_url=org, creds=credentials)
         azure_devops_client = azure_devops_connection.clients.get_git_client()
         azure_devops_board_client = azure_devops_connection.clients.get_work_item_tracking_client()
+        for client in (azure_devops_client, azure_devops_board_client):
+            # keep the underlying requests session (and its connection pool) open between calls,
+            # instead of opening a new session for every request
+            try:
+                client.config.keep_alive = True
+            except Exception:
+                pass
 
         return azure_devops_client, azure_devops_board_client
 
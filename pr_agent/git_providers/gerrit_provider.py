@@ -14,6 +14,8 @@ from git import Repo
 
 from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
 from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.git_mirror_cache import (GitMirrorCache,
+                                                     get_git_mirror_cache)
 from pr_agent.git_providers.git_provider import GitProvider
 from pr_agent.git_providers.local_git_provider import PullRequestMimic
 from pr_agent.log import get_logger
@@ -103,12 +105,30 @@ def prepare_repo(url: urllib3.util.Url, project, refspec):
     repo_url = (f"{url.scheme}://{url.auth}@{url.host}:{url.port}/{project}")
 
     directory = pathlib.Path(mkdtemp())
+    mirror_cache = get_git_mirror_cache()
+    if mirror_cache:
+        prepare_repo_from_mirror(mirror_cache, repo_url, refspec, directory)
+        return directory
     clone(repo_url, directory)
     fetch(repo_url, refspec, cwd=directory)
     checkout(cwd=directory)
     return directory
 
 
+def prepare_repo_from_mirror(mirror_cache: GitMirrorCache, repo_url, refspec, directory):
+    """
+    Same layout as a fresh clone + fetch of the refspec: the default branch exists locally,
+    and the refspec is checked out (detached) in `directory`.
+    """
+    get_logger().info("Fetching %s %s into mirror cache", repo_url, refspec)
+    symref = _call('git', 'ls-remote', '--symref', repo_url, 'HEAD').split('\t', 1)[0]
+    default_branch = 'master'
+    if symref.startswith('ref: refs/heads/'):
+        default_branch = symref.removeprefix('ref: refs/heads/').strip()
+    mirror_cache.set_branch(repo_url, default_branch, mirror_cache.fetch(repo_url, 'HEAD'))
+    mirror_cache.checkout(repo_url, str(directory), ref=refspec, depth=2)
+
+
 def adopt_to_gerrit_message(message):
     lines = message.splitlines()
     buf = []
@@ -0,0 +1,235 @@
+import fcntl
+import hashlib
+import os
+import shutil
+import subprocess
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.git_utils_ssl import get_git_ssl_env
+from pr_agent.log import get_logger
+
+DEFAULT_CACHE_DIR = os.path.join(Path.home(), ".cache", "pr-agent", "git-mirrors")
+DEFAULT_MAX_SIZE_MB = 2048
+LAST_USED_MARKER = "pr-agent-last-used"
+
+
+def _strip_credentials(remote_url: str) -> str:
+    """
+    Removes user info (tokens, passwords) from a remote url, so that rotating tokens map to the same mirror
+    and no secret ends up in a directory name or log line.
+    """
+    try:
+        parts = urlsplit(remote_url)
+        if parts.scheme and "@" in parts.netloc:
+            return urlunsplit((parts.scheme, parts.netloc.rsplit("@", 1)[1], parts.path, parts.query, parts.fragment))
+    except Exception:
+        pass
+    return remote_url
+
+
+class GitMirrorCache:
+    """
+    A local cache of bare repositories, one per remote url, shared across clone-based flows.
+
+    Instead of cloning a remote on every invocation, only the requested refs are fetched into a persistent bare
+    mirror. Callers then get a `git worktree` checkout of the fetched commit, or read blobs directly with
+    `git cat-file --batch`. Every mirror is guarded by a file lock, so concurrent workers (threads or processes)
+    can share the cache. Mirrors are evicted least-recently-used first once the cache exceeds `max_size_bytes`.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_size_bytes: int = DEFAULT_MAX_SIZE_MB * 1024 * 1024):
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.max_size_bytes = max_size_bytes
+        self._env = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def mirror_path(self, remote_url: str) -> str:
+        key = hashlib.sha256(_strip_credentials(remote_url).encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.cache_dir, key + ".git")
+
+    @contextmanager
+    def _lock(self, mirror_path: str, blocking: bool = True):
+        with open(mirror_path + ".lock", "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _get_env(self) -> dict[str, str]:
+        if self._env is None:
+            try:
+                self._env = get_git_ssl_env()
+            except Exception as e:
+                get_logger().exception("Failed to prepare SSL environment for git operations, falling back to default env",
+                                       artifact={"error": e})
+                self._env = os.environ.copy()
+            self._env["GIT_TERMINAL_PROMPT"] = "0"
+        return self._env
+
+    def _run_git(self, *args, cwd: str = None, timeout: int = None, input: bytes = None) -> bytes:
+        res = subprocess.run(["git", *args], cwd=cwd, env=self._get_env(), input=input, check=True,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+        return res.stdout
+
+    def _git(self, *args, cwd: str = None, timeout: int = None) -> str:
+        return self._run_git(*args, cwd=cwd, timeout=timeout).decode("utf-8", errors="replace").strip()
+
+    def _touch(self, mirror_path: str):
+        Path(mirror_path, LAST_USED_MARKER).touch()
+
+    def _fetch_locked(self, mirror_path: str, remote_url: str, ref: str, depth: Optional[int],
+                      timeout: int = None) -> str:
+        if not os.path.isdir(mirror_path):
+            self._git("init", "--bare", "--quiet", mirror_path, timeout=timeout)
+        # drop metadata of worktrees whose folders were already removed
+        self._git("worktree", "prune", cwd=mirror_path, timeout=timeout)
+        depth_args = ["--depth", str(depth)] if depth else []
+        self._git("fetch", "--quiet", "--no-tags", *depth_args, remote_url, ref, cwd=mirror_path, timeout=timeout)
+        sha = self._git("rev-parse", "FETCH_HEAD^{commit}", cwd=mirror_path, timeout=timeout)
+        self._touch(mirror_path)
+        return sha
+
+    def fetch(self, remote_url: str, ref: str = "HEAD", depth: Optional[int] = 1, timeout: int = None) -> str:
+        """
+        Fetches a single ref of `remote_url` into its mirror, and returns the fetched commit sha.
+        """
+        mirror_path = self.mirror_path(remote_url)
+        with self._lock(mirror_path):
+            sha = self._fetch_locked(mirror_path, remote_url, ref, depth, timeout)
+        self.evict()
+        return sha
+
+    def checkout(self, remote_url: str, dest_folder: str, ref: str = "HEAD", depth: Optional[int] = 1,
+                 timeout: int = None) -> str:
+        """
+        Fetches `ref` into the mirror and checks it out, detached, as a worktree at `dest_folder` (which must not
+        exist or be empty). The worktree can be removed with a plain folder delete - its metadata is pruned on the
+        next fetch. Returns the checked out commit sha.
+        """
+        mirror_path = self.mirror_path(remote_url)
+        with self._lock(mirror_path):
+            sha = self._fetch_locked(mirror_path, remote_url, ref, depth, timeout)
+            self._git("worktree", "add", "--quiet", "--detach", os.path.abspath(dest_folder), sha,
+                      cwd=mirror_path, timeout=timeout)
+        self.evict()
+        return sha
+
+    def set_branch(self, remote_url: str, branch: str, sha: str):
+        """
+        Points a local branch of the mirror at `sha`. Branches are shared by all worktrees of the mirror.
+        """
+        mirror_path = self.mirror_path(remote_url)
+        with self._lock(mirror_path):
+            self._git("update-ref", f"refs/heads/{branch}", sha, cwd=mirror_path)
+
+    def read_blobs(self, remote_url: str, commit: str, paths: list[str]) -> dict[str, Optional[bytes]]:
+        """
+        Reads the content of `paths` at `commit` from the mirror using a single `git cat-file --batch` process.
+        Paths which do not exist at that commit are mapped to None.
+        """
+        if not paths:
+            return {}
+        mirror_path = self.mirror_path(remote_url)
+        request = "".join(f"{commit}:{path}\n" for path in paths).encode("utf-8")
+        with self._lock(mirror_path):
+            output = self._run_git("cat-file", "--batch", cwd=mirror_path, input=request)
+            self._touch(mirror_path)
+        return _parse_cat_file_batch_output(output, paths)
+
+    def _mirrors_by_last_use(self) -> list[tuple[float, int, str]]:
+        mirrors = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if not name.endswith(".git") or not os.path.isdir(path):
+                continue
+            try:
+                last_used = os.path.getmtime(os.path.join(path, LAST_USED_MARKER))
+            except OSError:
+                last_used = 0
+            mirrors.append((last_used, _dir_size(path), path))
+        return sorted(mirrors)
+
+    def evict(self) -> list[str]:
+        """
+        Removes least recently used mirrors until the cache fits in `max_size_bytes`.
+        Mirrors that are locked, or that still have live worktrees, are skipped.
+        Returns the paths of the evicted mirrors.
+        """
+        evicted = []
+        try:
+            mirrors = self._mirrors_by_last_use()
+            total_size = sum(size for _, size, _ in mirrors)
+            for _, size, path in mirrors:
+                if total_size <= self.max_size_bytes:
+                    break
+                with self._lock(path, blocking=False) as acquired:
+                    if not acquired:
+                        continue
+                    self._git("worktree", "prune", cwd=path)
+                    worktrees_dir = os.path.join(path, "worktrees")
+                    if os.path.isdir(worktrees_dir) and os.listdir(worktrees_dir):
+                        continue
+                    shutil.rmtree(path, ignore_errors=True)
+                    total_size -= size
+                    evicted.append(path)
+                    get_logger().debug(f"Evicted git mirror {path} from cache", artifact={"size": size})
+        except Exception as e:
+            get_logger().warning(f"Failed to evict git mirrors from cache, error: {e}")
+        return evicted
+
+
+def _parse_cat_file_batch_output(output: bytes, paths: list[str]) -> dict[str, Optional[bytes]]:
+    blobs = {}
+    pos = 0
+    for path in paths:
+        header_end = output.index(b"\n", pos)
+        header = output[pos:header_end].split()
+        pos = header_end + 1
+        if len(header) < 3 or header[1] != b"blob":
+            # "<object> missing" or a tree
+            blobs[path] = None
+            if len(header) >= 3:
+                pos += int(header[2]) + 1
+            continue
+        size = int(header[2])
+        blobs[path] = output[pos:pos + size]
+        pos += size + 1  # content is followed by a newline
+    return blobs
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                pass
+    return total
+
+
+_git_mirror_cache: Optional[GitMirrorCache] = None
+
+
+def get_git_mirror_cache() -> Optional[GitMirrorCache]:
+    """
+    Returns the process-wide mirror cache, or None if `git_mirror_cache.enabled` is off.
+    """
+    global _git_mirror_cache
+    if not get_settings().get("GIT_MIRROR_CACHE.ENABLED", False):
+        return None
+    cache_dir = get_settings().get("GIT_MIRROR_CACHE.PATH", DEFAULT_CACHE_DIR) or DEFAULT_CACHE_DIR
+    max_size_bytes = int(get_settings().get("GIT_MIRROR_CACHE.MAX_SIZE_MB", DEFAULT_MAX_SIZE_MB)) * 1024 * 1024
+    if (_git_mirror_cache is None or _git_mirror_cache.cache_dir != os.path.abspath(os.path.expanduser(cache_dir))
+            or _git_mirror_cache.max_size_bytes != max_size_bytes):
+        _git_mirror_cache = GitMirrorCache(cache_dir, max_size_bytes)
+    return _git_mirror_cache
@@ -3,11 +3,12 @@ import os
 import shutil
 import subprocess
 from abc import ABC, abstractmethod
-from typing import Optional, Tuple
+from typing import Dict, Iterator, Optional, Tuple
 
 from pr_agent.algo.types import FilePatchInfo
 from pr_agent.algo.utils import Range, process_description
 from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.git_mirror_cache import get_git_mirror_cache
 from pr_agent.git_providers.git_utils_ssl import get_git_ssl_env
 from pr_agent.log import get_logger
 
@@ -89,7 +90,12 @@ class GitProvider(ABC):
         try:
             if remove_dest_folder and os.path.exists(dest_folder) and os.path.isdir(dest_folder):
                 shutil.rmtree(dest_folder)
-            self._clone_inner(clone_url, dest_folder, operation_timeout_in_seconds)
+            mirror_cache = get_git_mirror_cache()
+            if mirror_cache:
+                # fetch into the persistent mirror, and hand out a worktree instead of a fresh clone
+                mirror_cache.checkout(clone_url, dest_folder, timeout=operation_timeout_in_seconds)
+            else:
+                self._clone_inner(clone_url, dest_folder, operation_timeout_in_seconds)
             returned_obj = GitProvider.ScopedClonedRepo(dest_folder)
         except Exception as e:
             get_logger().exception(f"Clone failed: Could not clone url.",
@@ -97,6 +103,25 @@ class GitProvider(ABC):
         finally:
             return returned_obj
 
+    # Resolves the commit of a ref (by default, the default branch that `clone` checks out) of a remote repository
+    # without cloning it. Returns None when it cannot be resolved.
+    def get_remote_commit(self, repo_url: str, ref: str = "HEAD",
+                          operation_timeout_in_seconds: int=CLONE_TIMEOUT_SEC) -> str|None:
+        remote_url = self._prepare_clone_url_with_token(repo_url)
+        if not remote_url:
+            return None
+        try:
+            ssl_env = get_git_ssl_env()
+        except Exception:
+            ssl_env = os.environ.copy()
+        try:
+            output = subprocess.run(["git", "ls-remote", remote_url, ref], env=ssl_env, check=True,
+                                    capture_output=True, text=True, timeout=operation_timeout_in_seconds).stdout
+            return output.split()[0] if output.strip() else None
+        except Exception as e:
+            get_logger().debug(f"Could not resolve {ref} of the remote repository", artifact={"error": str(e)})
+            return None
+
     @abstractmethod
     def get_files(self) -> list:
         pass
@@ -105,6 +130,13 @@ class GitProvider(ABC):
     def get_diff_files(self) -> list[FilePatchInfo]:
         pass
 
+    def iter_diff_files(self) -> Iterator[FilePatchInfo]:
+        """
+        Yields the diff files as their content arrives. Providers that fetch the contents file by file override it,
+        so that the diff can be processed while the next files are fetched (see `get_pr_diff`).
+        """
+        yield from self.get_diff_files()
+
     def get_incremental_commits(self, is_incremental):
         pass
 
@@ -241,29 +273,37 @@ class GitProvider(ABC):
                                    final_update_message=True):
         return self.publish_comment(pr_comment)
 
+    def get_persistent_comment(self, initial_header: str):
+        """
+        Returns the existing comment that starts with `initial_header`, or None.
+        """
+        for comment in self.get_issue_comments():
+            if comment.body.startswith(initial_header):
+                return comment
+        return None
+
     def publish_persistent_comment_full(self, pr_comment: str,
                                    initial_header: str,
                                    update_header: bool = True,
                                    name='review',
                                    final_update_message=True):
         try:
-            prev_comments = list(self.get_issue_comments())
-            for comment in prev_comments:
-                if comment.body.startswith(initial_header):
-                    latest_commit_url = self.get_latest_commit_url()
-                    comment_url = self.get_comment_url(comment)
-                    if update_header:
-                        updated_header = f"{initial_header}\n\n#### ({name.capitalize()} updated until commit {latest_commit_url})\n"
-                        pr_comment_updated = pr_comment.replace(initial_header, updated_header)
-                    else:
-                        pr_comment_updated = pr_comment
-                    get_logger().info(f"Persistent mode - updating comment {comment_url} to latest {name} message")
-                    # response = self.mr.notes.update(comment.id, {'body': pr_comment_updated})
-                    self.edit_comment(comment, pr_comment_updated)
-                    if final_update_message:
-                        return self.publish_comment(
-                            f"**[Persistent {name}]({comment_url})** updated to latest commit {latest_commit_url}")
-                    return comment
+            comment = self.get_persistent_comment(initial_header)
+            if comment:
+                latest_commit_url = self.get_latest_commit_url()
+                comment_url = self.get_comment_url(comment)
+                if update_header:
+                    updated_header = f"{initial_header}\n\n#### ({name.capitalize()} updated until commit {latest_commit_url})\n"
+                    pr_comment_updated = pr_comment.replace(initial_header, updated_header)
+                else:
+                    pr_comment_updated = pr_comment
+                get_logger().info(f"Persistent mode - updating comment {comment_url} to latest {name} message")
+                # response = self.mr.notes.update(comment.id, {'body': pr_comment_updated})
+                self.edit_comment(comment, pr_comment_updated)
+                if final_update_message:
+                    return self.publish_comment(
+                        f"**[Persistent {name}]({comment_url})** updated to latest commit {latest_commit_url}")
+                return comment
         except Exception as e:
             get_logger().exception(f"Failed to update persistent review, error: {e}")
             pass
@@ -342,6 +382,20 @@ class GitProvider(ABC):
         get_logger().warning(f"Delete file not implemented for {self.__class__.__name__}")
         raise NotImplementedError(f"Delete file not implemented for {self.__class__.__name__}")
 
+    def commit_files(self, branch: str, files: Dict[str, Optional[str]], message: str = "Update files") -> None:
+        """
+        Commits `files` (path -> content, or None to delete the file) to `branch`.
+        Providers without an API to commit several files at once commit them one by one.
+        """
+        for file_path, contents in files.items():
+            if contents is not None:
+                self.create_or_update_pr_file(file_path, branch, contents, message)
+                continue
+            try:
+                self.delete_file(file_path, branch, message)
+            except Exception as e:  # e.g. a file created and deleted before the commit
+                get_logger().warning(f"Failed to delete file {file_path}: {e}")
+
     def get_num_of_files(self):
         try:
             return len(self.get_diff_files())
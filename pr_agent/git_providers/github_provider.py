@@ -7,12 +7,12 @@ import re
 import time
 import traceback
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import Dict, Iterator, Optional, Tuple
 from urllib.parse import urlparse
 
 from github import AppAuthentication, Auth, Github, GithubException
+from github.Commit import Commit
 from github.Issue import Issue
-from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 from starlette_context import context
 
 from ..algo.file_filter import filter_ignored
@@ -24,11 +24,11 @@ from ..algo.utils import (PRReviewHeader, Range, clip_tokens,
                           load_large_diff, set_file_languages)
 from ..config_loader import get_settings
 from ..log import get_logger
-from ..servers.utils import RateLimitExceeded
 from .git_provider import (MAX_FILES_ALLOWED_FULL, FilePatchInfo, GitProvider,
                            IncrementalPR)
+from .retry_policy import RetryPolicy
 from pr_agent.git_providers.github_utils.url_parser import GithubURLParser
-from pr_agent.git_providers.github_utils.diff_handler import get_github_diff_files
+from pr_agent.git_providers.github_utils.diff_handler import get_github_diff_files, iter_github_diff_files
 
 from pr_agent.git_providers.github_utils.label_handler import GithubLabelHandler
 from pr_agent.git_providers.github_utils.reaction_handler import GithubReactionHandler
@@ -36,6 +36,8 @@ from pr_agent.git_providers.github_utils.file_handler import GithubFileHandler
 from pr_agent.git_providers.github_utils.pr_interaction import GithubPRInteraction
 from pr_agent.git_providers.github_utils.graphql_handler import GithubGraphQLHandler
 from pr_agent.git_providers.github_utils.comment_handler import GithubCommentHandler
+from pr_agent.git_providers.github_utils.rate_limit_tracker import GithubRateLimitTracker, get_rate_limit_tracker
+from pr_agent.git_providers.github_utils.etag_cache import get_etag_cache
 
 class GithubProvider(GitProvider):
     def __init__(self, pr_url: Optional[str] = None):
@@ -48,6 +50,8 @@ class GithubProvider(GitProvider):
         self.github_client = self._get_github_client()
         self.repo = None; self.pr_num = None; self.pr = None; self.issue_main = None; self.github_user_id = None
         self.diff_files = None; self.git_files = None; self.incremental = IncrementalPR(False)
+        self._pr_commits = None; self._last_commit_id = None
+        self._retry_policy = None; self.file_content_checkpoint = {}
 
         # Initialize Handlers
         self.label_handler = GithubLabelHandler(self)
@@ -59,11 +63,35 @@ class GithubProvider(GitProvider):
 
         if pr_url and 'pull' in pr_url:
             self.set_pr(pr_url)
-            self.pr_commits = list(self.pr.get_commits())
-            self.last_commit_id = self.pr_commits[-1]
             self.pr_url = self.get_pr_url()
         elif pr_url and 'issue' in pr_url: self.issue_main = self._get_issue_handle(pr_url)
-        else: self.pr_commits = None
+
+    # Commits are loaded lazily: most commands never need the full (paginated) commit list
+    @property
+    def pr_commits(self):
+        if self._pr_commits is None and self.pr is not None: self._pr_commits = list(self.pr.get_commits())
+        return self._pr_commits
+
+    @pr_commits.setter
+    def pr_commits(self, value): self._pr_commits = value
+
+    @property
+    def last_commit_id(self):
+        if self._last_commit_id is None and self.pr is not None:
+            if self._pr_commits: self._last_commit_id = self._pr_commits[-1]
+            else:
+                # a lazy Commit built from the PR head sha - no request is made until a missing attribute (e.g. html_url) is read
+                head_sha = self.pr.head.sha
+                self._last_commit_id = Commit(self.pr._requester, {}, {"sha": head_sha, "url": f"{self._get_repo().url}/commits/{head_sha}"}, completed=False)
+        return self._last_commit_id
+
+    @last_commit_id.setter
+    def last_commit_id(self, value): self._last_commit_id = value
+
+    @property
+    def retry_policy(self) -> RetryPolicy:
+        if self._retry_policy is None: self._retry_policy = RetryPolicy.from_settings("github")
+        return self._retry_policy
 
     # Delegates
     def publish_labels(self, pr_types): self.label_handler.publish_labels(pr_types)
@@ -74,6 +102,7 @@ class GithubProvider(GitProvider):
     def get_pr_file_content(self, file_path: str, branch: str) -> str: return self.file_handler.get_pr_file_content(file_path, branch)
     def create_or_update_pr_file(self, file_path: str, branch: str, contents="", message="") -> None: self.file_handler.create_or_update_pr_file(file_path, branch, contents, message)
     def delete_file(self, file_path: str, branch: str, message: str = "Delete file") -> None: self.file_handler.delete_file(file_path, branch, message)
+    def commit_files(self, branch: str, files: Dict[str, Optional[str]], message: str = "Update files") -> None: self.file_handler.commit_files(branch, files, message)
     def _get_pr_file_content(self, file: FilePatchInfo, sha: str) -> str: return self.file_handler.get_file_content_from_obj(file, sha)
     def publish_description(self, pr_title: str, pr_body: str): self.pr_interaction.publish_description(pr_title, pr_body)
     def get_title(self): return self.pr_interaction.get_title()
@@ -83,6 +112,8 @@ class GithubProvider(GitProvider):
     def get_commit_messages(self): return self.pr_interaction.get_commit_messages()
     def auto_approve(self) -> bool: return self.pr_interaction.auto_approve()
     def fetch_sub_issues(self, issue_url): return self.graphql_handler.fetch_sub_issues(issue_url)
+    def fetch_issues(self, issue_urls: list[str]): return self.graphql_handler.fetch_issues(issue_urls)
+    def _parse_issue_url(self, issue_url: str): return GithubURLParser.parse_issue_url(issue_url)
 
     # Comment Delegates
     def publish_persistent_comment(self, pr_comment: str, initial_header: str, update_header: bool = True, name='review', final_update_message=True): self.comment_handler.publish_persistent_comment(pr_comment, initial_header, update_header, name, final_update_message)
@@ -155,9 +186,9 @@ class GithubProvider(GitProvider):
     def set_pr(self, pr_url: str):
         self.repo, self.pr_num = GithubURLParser.parse_pr_url(pr_url)
         self.pr = self._get_pr()
+        self._pr_commits = None; self._last_commit_id = None; self.file_content_checkpoint = {}
 
     def _get_incremental_commits(self):
-        if not self.pr_commits: self.pr_commits = list(self.pr.get_commits())
         self.previous_review = self.get_previous_review(full=True, incremental=True)
         if self.previous_review:
             self.incremental.commits_range = self.get_commit_range()
@@ -180,12 +211,12 @@ class GithubProvider(GitProvider):
 
     def get_previous_review(self, *, full: bool, incremental: bool):
         if not (full or incremental): raise ValueError("At least one of full or incremental must be True")
-        if not getattr(self, "comments", None): self.comments = list(self.pr.get_issue_comments())
         prefixes = []
         if full: prefixes.append(PRReviewHeader.REGULAR.value)
         if incremental: prefixes.append(PRReviewHeader.INCREMENTAL.value)
-        for index in range(len(self.comments) - 1, -1, -1):
-            if any(self.comments[index].body.startswith(prefix) for prefix in prefixes): return self.comments[index]
+        return self.comment_handler.find_issue_comment(prefixes)
+
+    def get_persistent_comment(self, initial_header: str): return self.comment_handler.find_issue_comment([initial_header])
 
     def get_files(self):
         if self.incremental.is_incremental and self.unreviewed_files_set: return self.unreviewed_files_set.values()
@@ -198,8 +229,10 @@ class GithubProvider(GitProvider):
         try: return self.git_files.totalCount if hasattr(self.git_files, "totalCount") else len(self.git_files)
         except Exception: return -1
 
-    @retry(retry=retry_if_exception_type(RateLimitExceeded), stop=stop_after_attempt(get_settings().github.ratelimit_retries), wait=wait_exponential(multiplier=2, min=2, max=60))
-    def get_diff_files(self) -> list[FilePatchInfo]: return get_github_diff_files(self)
+    # the only retry level: file versions fetched before a failure are checkpointed and not re-fetched,
+    # and an attempt that fetched new versions starts a new count of attempts
+    def get_diff_files(self) -> list[FilePatchInfo]: return self.retry_policy.call(get_github_diff_files, self, progress=lambda: len(self.file_content_checkpoint))
+    def iter_diff_files(self) -> Iterator[FilePatchInfo]: return self.retry_policy.iterate(iter_github_diff_files, self, key=lambda file: file.filename, progress=lambda: len(self.file_content_checkpoint))
 
     def get_latest_commit_url(self) -> str: return self.last_commit_id.html_url
     def get_comment_url(self, comment) -> str: return comment.html_url
@@ -226,8 +259,17 @@ class GithubProvider(GitProvider):
         self.deployment_type = get_settings().get("GITHUB.DEPLOYMENT_TYPE", "user")
         if self.deployment_type == 'app':
             auth = AppAuthentication(app_id=get_settings().github.app_id, private_key=get_settings().github.private_key, installation_id=self.installation_id)
-        else: auth = Auth.Token(get_settings().github.user_token)
-        return Github(auth=auth, base_url=self.base_url)
+            self.rate_limit_key = GithubRateLimitTracker.get_key(installation_id=self.installation_id)
+        else:
+            auth = Auth.Token(get_settings().github.user_token)
+            self.rate_limit_key = GithubRateLimitTracker.get_key(token=get_settings().github.user_token)
+        github_client = Github(auth=auth, base_url=self.base_url)
+        get_rate_limit_tracker().install(github_client, self.rate_limit_key)
+        etag_cache = get_etag_cache()
+        if etag_cache: etag_cache.install(github_client, self.rate_limit_key)
+        return github_client
+
+    def is_close_to_rate_limit(self) -> bool: return get_rate_limit_tracker().is_low(self.rate_limit_key)
 
     def _get_repo(self):
         if not (hasattr(self, 'repo_obj') and hasattr(self.repo_obj, 'full_name') and self.repo_obj.full_name == self.repo):
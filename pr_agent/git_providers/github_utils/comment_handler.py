@@ -3,11 +3,19 @@ import re
 import time
 import difflib
 from github import GithubException
+from github.IssueComment import IssueComment
+from github.PullRequestComment import PullRequestComment
 from pr_agent.log import get_logger
 from pr_agent.config_loader import get_settings
 from pr_agent.algo.utils import find_line_number_of_relevant_line_in_file
 from pr_agent.algo.git_patch_processing import extract_hunk_headers
 from pr_agent.algo.language_handler import set_file_languages
+from pr_agent.git_providers.github_utils.comment_index import (GithubCommentIndex,
+                                                               get_comment_index,
+                                                               get_review_thread_index,
+                                                               iter_comments_newest_first)
+
+RE_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@[ ]?(.*)")
 
 def create_inline_comment(body: str, relevant_file: str, relevant_line_in_file: str, diff_files, absolute_position: int = None, max_comment_chars=65000):
     body = body[:max_comment_chars]
@@ -44,7 +52,6 @@ def try_fix_invalid_inline_comments(invalid_comments: list[dict]) -> list[dict]:
 
 def validate_comments_inside_hunks(code_suggestions, diff_files):
     code_suggestions_copy = copy.deepcopy(code_suggestions)
-    RE_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@[ ]?(.*)")
     diff_files = set_file_languages(diff_files)
     for suggestion in code_suggestions_copy:
         try:
@@ -105,6 +112,56 @@ def validate_comments_inside_hunks(code_suggestions, diff_files):
             get_logger().error(f"Failed to process patch for committable comment, error: {e}")
     return code_suggestions_copy
 
+def get_commentable_lines(patch: str) -> dict:
+    """
+    Returns the lines of a patch that GitHub accepts review comments on: new-file line numbers (RIGHT side),
+    old-file line numbers (LEFT side), the hunk each line belongs to, and the number of diff positions.
+    """
+    right, left = {}, {}
+    num_positions = 0
+    hunk_index = -1
+    old_line = new_line = 0
+    for position, line in enumerate(patch.splitlines()):
+        if line.startswith('@@'):
+            match = RE_HUNK_HEADER.match(line)
+            if not match: continue
+            hunk_index += 1
+            old_line, new_line = int(match.group(1)), int(match.group(3))
+        elif hunk_index >= 0:
+            num_positions = position
+            if line.startswith('+'):
+                right[new_line] = hunk_index; new_line += 1
+            elif line.startswith('-'):
+                left[old_line] = hunk_index; old_line += 1
+            elif not line.startswith('\\'):
+                right[new_line] = hunk_index; left[old_line] = hunk_index
+                new_line += 1; old_line += 1
+    return {"RIGHT": right, "LEFT": left, "num_positions": num_positions}
+
+def is_comment_inside_diff(comment: dict, commentable_lines_by_file: dict):
+    """
+    Checks an inline comment against the PR diff hunks.
+    Returns False when the comment certainly falls outside the diff, and None when it cannot be decided locally.
+    """
+    if not comment or not comment.get("path"):
+        return False
+    if comment["path"] not in commentable_lines_by_file:
+        return False if commentable_lines_by_file else None  # a file that is not part of the PR
+    lines = commentable_lines_by_file[comment["path"]]
+    if lines is None:
+        return None  # no patch for this file (e.g. a very large file)
+    if comment.get("position") is not None:
+        return 1 <= comment["position"] <= lines["num_positions"]
+    if comment.get("line") is None:
+        return None
+    end_hunk = lines[comment.get("side", "RIGHT")].get(comment["line"])
+    if end_hunk is None:
+        return False
+    if comment.get("start_line") is not None:
+        # a multi-line comment must start and end in the same hunk
+        return lines[comment.get("start_side", "RIGHT")].get(comment["start_line"]) == end_hunk
+    return True
+
 def publish_code_suggestions(provider, code_suggestions: list) -> bool:
     post_parameters_list = []
     diff_files = provider.get_diff_files()
@@ -147,10 +204,36 @@ class GithubCommentHandler:
         response = self.provider.pr.create_issue_comment(pr_comment)
         if hasattr(response, "user") and hasattr(response.user, "login"): self.provider.github_user_id = response.user.login
         response.is_temporary = is_temporary
+        try: get_comment_index().record_comment(self._get_comment_index_key(), pr_comment, response.id)
+        except Exception: pass
         if not hasattr(self.provider.pr, 'comments_list'): self.provider.pr.comments_list = []
         self.provider.pr.comments_list.append(response)
         return response
 
+    def _get_comment_index_key(self) -> str: return GithubCommentIndex.get_pr_key(self.provider.repo, self.provider.pr_num)
+
+    def find_issue_comment(self, markers: list[str]):
+        """
+        Returns the newest issue comment on the PR whose body starts with one of `markers`, or None.
+        An indexed comment is fetched directly by id. Otherwise comments are paginated newest first, up to the first match.
+        """
+        index, pr_key, markers = get_comment_index(), self._get_comment_index_key(), tuple(markers)
+        comment_id = index.get(pr_key, markers)
+        if comment_id:
+            try:
+                comment = self.provider.pr.get_issue_comment(comment_id)
+                if any(comment.body.startswith(marker) for marker in markers): return comment
+            except Exception as e: get_logger().debug(f"Indexed comment {comment_id} is not available anymore: {e}")
+            index.forget_comment(pr_key, comment_id)
+        requester = self.provider.pr._requester
+        url = f"{self.provider.base_url}/repos/{self.provider.repo}/issues/{self.provider.pr_num}/comments"
+        for headers, data in iter_comments_newest_first(requester, url):
+            if any((data.get("body") or "").startswith(marker) for marker in markers):
+                index.set(pr_key, markers, data["id"])
+                return IssueComment(requester, headers, data, completed=True)
+        index.set(pr_key, markers, None)  # published comments carrying the markers will be recorded from now on
+        return None
+
     def publish_inline_comment(self, body: str, relevant_file: str, relevant_line_in_file: str, original_suggestion=None):
         self.publish_inline_comments([create_inline_comment(self.provider.limit_output_characters(body, self.provider.max_comment_chars), relevant_file, relevant_line_in_file, self.provider.diff_files, None, self.provider.max_comment_chars)])
 
@@ -173,22 +256,53 @@ class GithubCommentHandler:
                 try: self.publish_inline_comments([comment], disable_fallback=True)
                 except: pass
 
-    def _verify_code_comment(self, comment: dict):
+    def _verify_code_comment(self, comment: dict): return self._verify_code_comments_batch([comment])
+
+    def _verify_code_comments_batch(self, comments: list[dict]):
         try:
-            data = self.provider.pr._requester.requestJsonAndCheck("POST", f"{self.provider.pr.url}/reviews", input=dict(commit_id=self.provider.last_commit_id.sha, comments=[comment]))[1]
+            data = self.provider.pr._requester.requestJsonAndCheck("POST", f"{self.provider.pr.url}/reviews", input=dict(commit_id=self.provider.last_commit_id.sha, comments=comments))[1]
             try: self.provider.pr._requester.requestJsonAndCheck("DELETE", f"{self.provider.pr.url}/reviews/{data['id']}")
             except: pass
             return True, None
         except Exception as e: return False, e
 
+    def _get_commentable_lines_by_file(self) -> dict:
+        try: diff_files = self.provider.diff_files or self.provider.get_diff_files()
+        except Exception: return {}
+        return {f.filename: get_commentable_lines(f.patch) if f.patch else None for f in diff_files or []}
+
+    def _pace_verification(self):
+        # verification requests are only spaced out when the rate limit budget runs low
+        try: close_to_rate_limit = self.provider.is_close_to_rate_limit()
+        except Exception: close_to_rate_limit = False
+        if close_to_rate_limit is True: time.sleep(1)
+
     def _verify_code_comments(self, comments: list[dict]) -> tuple[list[dict], list[tuple[dict, Exception]]]:
-        verified, invalid = [], []
+        """
+        Comments outside the PR diff hunks (the usual cause of a 422) are rejected locally.
+        The rest are verified with draft reviews: a batch that fails is split in halves until the invalid comments are isolated.
+        """
+        verified, invalid, ambiguous = [], [], []
+        commentable_lines_by_file = self._get_commentable_lines_by_file()
         for comment in comments:
-            time.sleep(1)
-            is_verified, e = self._verify_code_comment(comment)
-            verified.append(comment) if is_verified else invalid.append((comment, e))
+            if is_comment_inside_diff(comment, commentable_lines_by_file) is False:
+                invalid.append((comment, ValueError(f"Comment on {comment.get('path')} is outside the PR diff hunks")))
+            else: ambiguous.append(comment)
+        self._bisect_verify_code_comments(ambiguous, verified, invalid)
+        get_logger().info(f"Verified inline comments: {len(verified)} valid, {len(invalid)} invalid")
         return verified, invalid
 
+    def _bisect_verify_code_comments(self, comments: list[dict], verified: list, invalid: list):
+        if not comments: return
+        self._pace_verification()
+        is_verified, e = self._verify_code_comments_batch(comments)
+        if is_verified: verified.extend(comments)
+        elif len(comments) == 1 or getattr(e, "status", None) != 422: invalid.extend((comment, e) for comment in comments)
+        else:
+            middle = len(comments) // 2
+            self._bisect_verify_code_comments(comments[:middle], verified, invalid)
+            self._bisect_verify_code_comments(comments[middle:], verified, invalid)
+
     def publish_code_suggestions(self, code_suggestions: list) -> bool: return publish_code_suggestions(self.provider, code_suggestions)
 
     def edit_comment(self, comment, body: str):
@@ -209,13 +323,26 @@ class GithubCommentHandler:
 
     def publish_file_comments(self, file_comments: list) -> bool:
         try:
-            existing_comments = self.provider.pr._requester.requestJsonAndCheck("GET", f"{self.provider.pr.url}/comments")[1]
+            index, pr_key = get_comment_index(), self._get_comment_index_key()
+            requester = self.provider.pr._requester
+            existing_ids = {comment['path']: index.get(pr_key, (f"file:{comment['path']}",)) for comment in file_comments}
+            if not all(existing_ids.values()):
+                same_creator = lambda c: (get_settings().get("GITHUB.APP_NAME", "").lower() in c['user']['login'].lower()) if self.provider.deployment_type == 'app' else (self.provider.github_user_id == c['user']['login'])
+                for _, c in iter_comments_newest_first(requester, f"{self.provider.pr.url}/comments"):
+                    if c.get('subject_type') == 'file' and c['path'] in existing_ids and not existing_ids[c['path']] and same_creator(c):
+                        existing_ids[c['path']] = c['id']
+                        index.set(pr_key, (f"file:{c['path']}",), c['id'])
+                        if all(existing_ids.values()): break
             for comment in file_comments:
                 comment.update({'commit_id': self.provider.last_commit_id.sha, 'body': self.provider.limit_output_characters(comment['body'], self.provider.max_comment_chars)})
-                same_creator = lambda c: (get_settings().get("GITHUB.APP_NAME", "").lower() in c['user']['login'].lower()) if self.provider.deployment_type == 'app' else (self.provider.github_user_id == c['user']['login'])
-                found = next((c for c in existing_comments if c['subject_type'] == 'file' and comment['path'] == c['path'] and same_creator(c)), None)
-                if found: self.provider.pr._requester.requestJsonAndCheck("PATCH", f"{self.provider.base_url}/repos/{self.provider.repo}/pulls/comments/{found['id']}", input={"body": comment['body']})
-                else: self.provider.pr._requester.requestJsonAndCheck("POST", f"{self.provider.pr.url}/comments", input=comment)
+                comment_id = existing_ids.get(comment['path'])
+                if comment_id:
+                    try:
+                        requester.requestJsonAndCheck("PATCH", f"{self.provider.base_url}/repos/{self.provider.repo}/pulls/comments/{comment_id}", input={"body": comment['body']})
+                        continue
+                    except Exception: index.forget_comment(pr_key, comment_id)  # e.g. deleted since it was indexed
+                data = requester.requestJsonAndCheck("POST", f"{self.provider.pr.url}/comments", input=comment)[1]
+                index.set(pr_key, (f"file:{comment['path']}",), data['id'])
             return True
         except Exception: return False
 
@@ -227,11 +354,27 @@ class GithubCommentHandler:
         try: comment.delete()
         except Exception: pass
 
+    def _list_review_comments(self, since: str = None, per_page: int = 100):
+        """
+        Yields the raw review comments of the PR, oldest update first, updated since `since` if given.
+        """
+        parameters = {"per_page": per_page, "sort": "updated", "direction": "asc"}
+        if since: parameters["since"] = since
+        url, page = f"{self.provider.pr.url}/comments", 1
+        while True:
+            headers, data = self.provider.pr._requester.requestJsonAndCheck("GET", url, parameters={**parameters, "page": page})
+            yield from data or []
+            if len(data or []) < per_page or 'rel="next"' not in headers.get("link", ""): return
+            page += 1
+
     def get_review_thread_comments(self, comment_id: int) -> list[dict]:
+        """
+        The comments of the review thread of `comment_id`, from the shared thread index, which only lists the review
+        comments updated since its last lookup.
+        """
         try:
-            all_comments = list(self.provider.pr.get_comments())
-            target = next((c for c in all_comments if c.id == comment_id), None)
-            if not target: return []
-            root_id = target.raw_data.get("in_reply_to_id", target.id)
-            return [c for c in all_comments if c.id == root_id or c.raw_data.get("in_reply_to_id") == root_id]
-        except Exception: return []
+            thread = get_review_thread_index().get_thread(self._get_comment_index_key(), int(comment_id), self._list_review_comments)
+            return [PullRequestComment(self.provider.pr._requester, {}, data, completed=True) for data in thread]
+        except Exception as e:
+            get_logger().debug(f"Failed to get the review thread of comment {comment_id}: {e}")
+            return []
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import re
+import threading
+from typing import Callable, Iterable, Iterator, Optional
+from urllib.parse import parse_qs, urlparse
+
+from pr_agent.config_loader import get_settings
+from pr_agent.servers.utils import DefaultDictWithTimeout
+
+RE_LAST_PAGE_LINK = re.compile(r'<([^>]+)>;\s*rel="last"')
+
+
+class GithubCommentIndex:
+    """
+    Per-PR index from comment markers (e.g. a persistent comment header, or `file:<path>` for file-level review
+    comments) to the id of the newest comment starting with one of them. Lets the provider fetch or edit that
+    comment directly, instead of listing every comment on the PR.
+    Keys are tuples of markers. A key mapped to None was looked up, and no comment carried it at that time.
+    The index is shared by all providers in the process, kept up to date by comment webhooks, and entries expire
+    after `github.comment_index_ttl` seconds.
+    """
+
+    def __init__(self, ttl: int = 24 * 60 * 60):
+        self._index = DefaultDictWithTimeout(dict, ttl=ttl)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_pr_key(repo: str, pr_num) -> str:
+        return f"{repo}#{pr_num}"
+
+    def get(self, pr_key: str, markers: tuple) -> Optional[int]:
+        with self._lock:
+            return self._index[pr_key].get(markers)
+
+    def set(self, pr_key: str, markers: tuple, comment_id: Optional[int]) -> None:
+        with self._lock:
+            self._index[pr_key][markers] = comment_id
+
+    def record_comment(self, pr_key: str, body: str, comment_id: int) -> None:
+        """
+        A comment was created or edited. It becomes the indexed comment of every key whose markers it starts with,
+        unless a newer comment is indexed already (GitHub comment ids only grow).
+        Keys pointing at it are dropped if it no longer starts with their markers.
+        """
+        with self._lock:
+            entries = self._index[pr_key]
+            for markers, indexed_id in list(entries.items()):
+                if body and any(body.startswith(marker) for marker in markers):
+                    if indexed_id is None or comment_id >= indexed_id:
+                        entries[markers] = comment_id
+                elif indexed_id == comment_id:
+                    del entries[markers]
+
+    def forget_comment(self, pr_key: str, comment_id: int) -> None:
+        with self._lock:
+            entries = self._index[pr_key]
+            for markers in [markers for markers, indexed_id in entries.items() if indexed_id == comment_id]:
+                del entries[markers]
+
+
+def iter_comments_newest_first(requester, url: str, per_page: int = 100) -> Iterator[tuple[dict, dict]]:
+    """
+    Yields (headers, raw comment) pairs of a GitHub comment listing, newest first, so callers can stop early.
+    GitHub lists comments oldest first: the first page is requested first to learn the number of pages,
+    and is scanned last without requesting it again.
+    """
+    headers, first_page = requester.requestJsonAndCheck("GET", url, parameters={"per_page": per_page})
+    match = RE_LAST_PAGE_LINK.search(headers.get("link", ""))
+    last_page = int(parse_qs(urlparse(match.group(1)).query).get("page", ["1"])[0]) if match else 1
+    for page in range(last_page, 1, -1):
+        page_headers, data = requester.requestJsonAndCheck("GET", url, parameters={"per_page": per_page, "page": page})
+        for comment in reversed(data or []):
+            yield page_headers, comment
+    for comment in reversed(first_page or []):
+        yield headers, comment
+
+
+class GithubReviewThreadIndex:
+    """
+    Per-PR cache of the review comments of a PR (raw payloads, by id), with a cursor: the latest `updated_at` among
+    them. Looking up a thread only lists the review comments created or edited since the cursor (usually just the
+    comment being answered), instead of every review comment of the PR.
+    Deleted comments are dropped by comment webhooks; entries expire after `github.review_thread_index_ttl` seconds.
+    """
+
+    def __init__(self, ttl: int = 24 * 60 * 60):
+        self._index = DefaultDictWithTimeout(ttl=ttl)  # pr key -> {"cursor": updated_at, "comments": {id: comment}}
+        self._lock = threading.Lock()
+
+    def get_thread(self, pr_key: str, comment_id: int,
+                   list_comments: Callable[[Optional[str]], Iterable[dict]]) -> list[dict]:
+        """
+        The comments of the review thread of `comment_id`, oldest first, or [] if there is no such comment.
+        `list_comments(since)` lists the review comments of the PR updated since a cursor (all of them if None).
+        """
+        with self._lock:
+            entry = self._index.get(pr_key)
+            cursor = entry["cursor"] if entry else None
+            comments = dict(entry["comments"]) if entry else {}
+        for comment in list_comments(cursor):
+            comments[comment["id"]] = comment
+            if comment.get("updated_at") and (cursor is None or comment["updated_at"] > cursor):
+                cursor = comment["updated_at"]
+        with self._lock:
+            self._index[pr_key] = {"cursor": cursor, "comments": comments}
+        target = comments.get(comment_id)
+        if not target:
+            return []
+        root_id = target.get("in_reply_to_id") or target["id"]  # replies point at the first comment of the thread
+        return sorted((comment for comment in comments.values()
+                       if comment["id"] == root_id or comment.get("in_reply_to_id") == root_id),
+                      key=lambda comment: comment["id"])
+
+    def record_comment(self, pr_key: str, comment: dict) -> None:
+        with self._lock:
+            entry = self._index.get(pr_key)
+            if entry:
+                entry["comments"][comment["id"]] = comment
+
+    def forget_comment(self, pr_key: str, comment_id: int) -> None:
+        with self._lock:
+            entry = self._index.get(pr_key)
+            if entry:
+                entry["comments"].pop(comment_id, None)
+
+
+_comment_index = None
+_review_thread_index = None
+
+
+def get_comment_index() -> GithubCommentIndex:
+    global _comment_index
+    if _comment_index is None:
+        _comment_index = GithubCommentIndex(ttl=get_settings().get("GITHUB.COMMENT_INDEX_TTL", 24 * 60 * 60))
+    return _comment_index
+
+
+def get_review_thread_index() -> GithubReviewThreadIndex:
+    global _review_thread_index
+    if _review_thread_index is None:
+        _review_thread_index = GithubReviewThreadIndex(
+            ttl=get_settings().get("GITHUB.REVIEW_THREAD_INDEX_TTL", 24 * 60 * 60))
+    return _review_thread_index
@@ -1,36 +1,55 @@
 from __future__ import annotations
 import traceback
-from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+from typing import Iterator
+
 from starlette_context import context
 
 from pr_agent.algo.file_filter import filter_ignored
 from pr_agent.algo.language_handler import is_valid_file
 from pr_agent.algo.types import EDIT_TYPE
 from pr_agent.algo.utils import load_large_diff
-from pr_agent.config_loader import get_settings
 from pr_agent.git_providers.git_provider import MAX_FILES_ALLOWED_FULL, FilePatchInfo
 from pr_agent.log import get_logger
-from pr_agent.servers.utils import RateLimitExceeded
 
 
-@retry(retry=retry_if_exception_type(RateLimitExceeded),
-       stop=stop_after_attempt(get_settings().github.ratelimit_retries),
-       wait=wait_exponential(multiplier=2, min=2, max=60))
+def _get_file_content(provider, file, sha: str) -> str:
+    """
+    Fetches a file version, raising transient errors to the caller. Fetched versions are checkpointed on the provider,
+    so when the whole listing is retried, only the versions that failed are requested again.
+    """
+    key = (file.filename, sha)
+    checkpoint = provider.file_content_checkpoint
+    if key not in checkpoint:
+        checkpoint[key] = provider.file_handler.get_pr_file_content(file.filename, sha, raise_retryable=True)
+    return checkpoint[key]
+
+
 def get_github_diff_files(provider) -> list[FilePatchInfo]:
     """
     Retrieves the list of files that have been modified, added, deleted, or renamed in a pull request in GitHub,
     along with their content and patch information.
+    Retrying is left to the caller (see `GithubProvider.get_diff_files`).
+    """
+    return list(iter_github_diff_files(provider))
+
+
+def iter_github_diff_files(provider) -> Iterator[FilePatchInfo]:
+    """
+    Same as `get_github_diff_files`, yielding each file as soon as its content has been fetched.
+    The list is cached on the provider once every file has been yielded.
     """
     try:
         try:
             diff_files = context.get("diff_files", None)
             if diff_files:
-                return diff_files
+                yield from diff_files
+                return
         except Exception:
             pass
 
         if provider.diff_files:
-            return provider.diff_files
+            yield from provider.diff_files
+            return
 
         # filter files using [ignore] patterns
         files_original = provider.get_files()
@@ -59,6 +78,8 @@ def get_github_diff_files(provider) -> list[FilePatchInfo]:
             compare = repo.compare(pr.base.sha, pr.head.sha) # communication with GitHub
             merge_base_commit = compare.merge_base_commit
         except Exception as e:
+            if provider.retry_policy.is_retryable(e):
+                raise
             get_logger().error(f"Failed to get merge base commit: {e}")
             merge_base_commit = pr.base
         if merge_base_commit.sha != pr.base.sha:
@@ -71,6 +92,11 @@ def get_github_diff_files(provider) -> list[FilePatchInfo]:
                 invalid_files_names.append(file.filename)
                 continue
 
+            # the budget is tracked passively from response headers, so checking it costs no request
+            if not is_close_to_rate_limit and provider.is_close_to_rate_limit():
+                is_close_to_rate_limit = True
+                get_logger().warning("Close to the GitHub rate limit, will avoid loading full content for rest of files")
+
             patch = file.patch
             if is_close_to_rate_limit:
                 new_file_content_str = ""
@@ -87,17 +113,17 @@ def get_github_diff_files(provider) -> list[FilePatchInfo]:
                 if avoid_load:
                     new_file_content_str = ""
                 else:
-                    new_file_content_str = provider._get_pr_file_content(file, provider.pr.head.sha)  # communication with GitHub
+                    new_file_content_str = _get_file_content(provider, file, provider.pr.head.sha)  # communication with GitHub
 
                 if provider.incremental.is_incremental and provider.unreviewed_files_set:
-                    original_file_content_str = provider._get_pr_file_content(file, provider.incremental.last_seen_commit_sha)
+                    original_file_content_str = _get_file_content(provider, file, provider.incremental.last_seen_commit_sha)
                     patch = load_large_diff(file.filename, new_file_content_str, original_file_content_str)
                     provider.unreviewed_files_set[file.filename] = patch
                 else:
                     if avoid_load:
                         original_file_content_str = ""
                     else:
-                        original_file_content_str = provider._get_pr_file_content(file, merge_base_commit.sha)
+                        original_file_content_str = _get_file_content(provider, file, merge_base_commit.sha)
                         # original_file_content_str = self._get_pr_file_content(file, self.pr.base.sha)
                     if not patch:
                         patch = load_large_diff(file.filename, new_file_content_str, original_file_content_str)
@@ -129,18 +155,19 @@ def get_github_diff_files(provider) -> list[FilePatchInfo]:
                                                            num_plus_lines=num_plus_lines,
                                                            num_minus_lines=num_minus_lines,)
             diff_files.append(file_patch_canonical_structure)
+            yield file_patch_canonical_structure
         if invalid_files_names:
             get_logger().info(f"Filtered out files with invalid extensions: {invalid_files_names}")
 
         provider.diff_files = diff_files
+        provider.file_content_checkpoint.clear()
         try:
             context["diff_files"] = diff_files
         except Exception:
             pass
 
-        return diff_files
-
     except Exception as e:
-        get_logger().error(f"Failing to get diff files: {e}",
-                           artifact={"traceback": traceback.format_exc()})
-        raise RateLimitExceeded("Rate limit exceeded for GitHub API.") from e
+        # the error text is kept out of the message: it may contain braces (e.g. a JSON body), which loguru would format
+        get_logger().error("Failing to get diff files",
+                           artifact={"error": str(e), "traceback": traceback.format_exc()})
+        raise
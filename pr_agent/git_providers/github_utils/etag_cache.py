@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+
+class GithubETagCache:
+    """
+    Conditional request cache for GitHub REST GET calls.
+
+    Responses carrying an ETag are stored as (url, etag, headers, body). The next GET of the same URL is sent with
+    `If-None-Match`; GitHub answers 304 without counting it against the primary rate limit, and the stored body is
+    served instead. Entries live in a bounded in-memory LRU, optionally backed by a sqlite file shared across
+    processes and restarts.
+    Entries are scoped per installation/token (the same key as the rate limit tracker), so repositories visible to
+    one installation are never served to another.
+    """
+
+    def __init__(self, max_entries: int = 1000, sqlite_path: Optional[str] = None, max_body_bytes: int = 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_body_bytes = max_body_bytes
+        self.hits = 0  # a cached entry was found, and the request was sent conditionally
+        self.not_modified = 0  # the server answered 304, the cached body was served
+        self.misses = 0  # nothing cached for the url
+        self._entries: OrderedDict[str, tuple[str, dict, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if sqlite_path:
+            try:
+                self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+                self._db.execute("CREATE TABLE IF NOT EXISTS etag_cache "
+                                 "(key TEXT PRIMARY KEY, etag TEXT, headers TEXT, body TEXT)")
+                self._db.commit()
+            except sqlite3.Error as e:
+                get_logger().warning(f"Failed to open the GitHub ETag cache database {sqlite_path}: {e}")
+                self._db = None
+
+    @property
+    def stats(self) -> dict:
+        return {"hits": self.hits, "not_modified": self.not_modified, "misses": self.misses,
+                "entries": len(self._entries)}
+
+    @staticmethod
+    def _get_key(scope: str, url: str, headers: dict) -> str:
+        # the Accept header selects the representation (e.g. raw diff vs. json)
+        return hashlib.sha256(f"{scope}\n{headers.get('Accept', '')}\n{url}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[tuple[str, dict, str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+            if self._db is None:
+                return None
+            row = self._db.execute("SELECT etag, headers, body FROM etag_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        entry = (row[0], json.loads(row[1]), row[2])
+        self._put_memory(key, entry)
+        return entry
+
+    def put(self, key: str, etag: str, headers: dict, body: str) -> None:
+        if body is not None and len(body) > self.max_body_bytes:
+            return
+        entry = (etag, dict(headers), body)
+        self._put_memory(key, entry)
+        if self._db is not None:
+            with self._lock:
+                try:
+                    self._db.execute("INSERT OR REPLACE INTO etag_cache VALUES (?, ?, ?, ?)",
+                                     (key, etag, json.dumps(entry[1]), body))
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    get_logger().debug(f"Failed to store a GitHub ETag cache entry: {e}")
+
+    def _put_memory(self, key: str, entry: tuple[str, dict, str]) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def install(self, github_client, scope: str) -> None:
+        """
+        Wraps the raw request method of a PyGithub client's requester with conditional GET handling.
+        """
+        requester = getattr(github_client, "_Github__requester", None)
+        original = getattr(requester, "_Requester__requestRaw", None)
+        if original is None:
+            return
+
+        def request_raw(cnx, verb, url, request_headers, input):
+            if verb != "GET":
+                return original(cnx, verb, url, request_headers, input)
+            key = self._get_key(scope, url, request_headers)
+            entry = self.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                request_headers = {**request_headers, "If-None-Match": entry[0]}
+            status, response_headers, output = original(cnx, verb, url, request_headers, input)
+            if status == 304 and entry is not None:
+                self.not_modified += 1
+                # keep fresh rate limit headers, serve the cached body
+                return 200, {**entry[1], **response_headers}, entry[2]
+            if status == 200 and response_headers.get("etag"):
+                self.put(key, response_headers["etag"], response_headers, output)
+            return status, response_headers, output
+
+        requester._Requester__requestRaw = request_raw
+
+
+_etag_cache = None
+
+
+def get_etag_cache() -> Optional[GithubETagCache]:
+    """
+    Returns the process-wide ETag cache, or None when it is disabled (`github.etag_cache_enabled`).
+    """
+    global _etag_cache
+    if not get_settings().get("GITHUB.ETAG_CACHE_ENABLED", False):
+        return None
+    if _etag_cache is None:
+        _etag_cache = GithubETagCache(max_entries=int(get_settings().get("GITHUB.ETAG_CACHE_MAX_ENTRIES", 1000)),
+                                      sqlite_path=get_settings().get("GITHUB.ETAG_CACHE_SQLITE_PATH", "") or None)
+    return _etag_cache
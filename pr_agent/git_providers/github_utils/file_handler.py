@@ -1,18 +1,67 @@
+from typing import Dict, Optional
+
+from github import InputGitTreeElement, UnknownObjectException
+
 from pr_agent.log import get_logger
 from pr_agent.git_providers.git_provider import FilePatchInfo
 
+
+def commit_files_to_branch(repo, branch: str, files: Dict[str, Optional[str]], message: str) -> Optional[str]:
+    """
+    Commits `files` (path -> content, or None to delete the file) to `branch` as a single commit, with the Git
+    trees API: the branch head and its tree are read, then a tree and a commit are created and the branch is
+    moved to it - six requests whatever the number of files, instead of a read and a commit per file.
+    Returns the sha of the new commit, or None when the files leave the tree unchanged.
+    """
+    ref = repo.get_git_ref(f"heads/{branch}")
+    base_commit = repo.get_git_commit(ref.object.sha)
+    base_tree = repo.get_git_tree(base_commit.tree.sha, recursive=True)
+    modes = {element.path: element.mode for element in base_tree.tree if element.type == "blob"}
+    elements = []
+    for file_path, contents in files.items():
+        if contents is not None:
+            elements.append(InputGitTreeElement(file_path, modes.get(file_path, "100644"), "blob", content=contents))
+        elif file_path in modes or (base_tree.raw_data.get("truncated") and _exists(repo, file_path, base_commit.sha)):
+            elements.append(InputGitTreeElement(file_path, "100644", "blob", sha=None))
+    if not elements:
+        return None
+    tree = repo.create_git_tree(elements, base_commit.tree)
+    if tree.sha == base_commit.tree.sha:
+        return None
+    commit = repo.create_git_commit(message, tree, [base_commit])
+    ref.edit(commit.sha)
+    return commit.sha
+
+
+def _exists(repo, file_path: str, ref: str) -> bool:
+    try:
+        repo.get_contents(file_path, ref=ref)
+        return True
+    except UnknownObjectException:
+        return False
+
+
 class GithubFileHandler:
     def __init__(self, provider):
         self.provider = provider
 
-    def get_pr_file_content(self, file_path: str, branch: str) -> str:
+    def get_pr_file_content(self, file_path: str, branch: str, raise_retryable: bool = False) -> str:
+        """
+        Returns the file content at `branch`, or "" when it cannot be read.
+        With `raise_retryable`, transient errors (per the provider retry policy) are raised instead,
+        so the caller can retry them rather than silently working with an empty file.
+        """
         try:
             file_content_str = str(
                 self.provider._get_repo()
                 .get_contents(file_path, ref=branch)
                 .decoded_content.decode()
             )
-        except Exception:
+        except UnknownObjectException:
+            file_content_str = ""
+        except Exception as e:
+            if raise_retryable and self.provider.retry_policy.is_retryable(e):
+                raise
             file_content_str = ""
         return file_content_str
 
@@ -45,5 +94,13 @@ class GithubFileHandler:
             get_logger().error(f"Failed to delete file {file_path}: {e}")
             raise
 
+    def commit_files(self, branch: str, files: Dict[str, Optional[str]], message: str = "Update files") -> None:
+        try:
+            sha = commit_files_to_branch(self.provider._get_repo(), branch, files, message)
+            get_logger().info(f"Committed {len(files)} files to {branch}", artifact={"sha": sha})
+        except Exception as e:
+            get_logger().error(f"Failed to commit {len(files)} files to {branch}: {e}")
+            raise
+
     def get_file_content_from_obj(self, file: FilePatchInfo, sha: str) -> str:
         return self.get_pr_file_content(file.filename, sha)
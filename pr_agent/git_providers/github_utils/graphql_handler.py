@@ -1,10 +1,87 @@
 import json
+from typing import Optional
+
+from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.github_utils.url_parser import GithubURLParser
 from pr_agent.log import get_logger
+from pr_agent.servers.utils import DefaultDictWithTimeout
+
+ISSUE_FIELDS = "number title body url updatedAt labels(first: 20) { nodes { name } }"
+MAX_SUB_ISSUES = 10
+
+# ticket payloads shared across requests: (scope, repo, number) -> issue payload, valid while its `updatedAt` matches
+_issue_cache = None
+
+
+def get_issue_cache() -> DefaultDictWithTimeout:
+    global _issue_cache
+    if _issue_cache is None:
+        _issue_cache = DefaultDictWithTimeout(ttl=get_settings().get("GITHUB.TICKET_CACHE_TTL", 24 * 60 * 60))
+    return _issue_cache
+
 
 class GithubGraphQLHandler:
     def __init__(self, provider):
         self.provider = provider
 
+    def _query(self, query: str) -> Optional[dict]:
+        """
+        Runs a GraphQL query, returning its `data`, or None when the query failed as a whole.
+        """
+        status, headers, body = self.provider.github_client._Github__requester.requestJson("POST", "/graphql", input={"query": query})
+        response_json = json.loads(body) if body else {}
+        if response_json.get("errors"):
+            get_logger().warning("GraphQL query returned errors", artifact={"errors": response_json["errors"]})
+        return response_json.get("data")
+
+    @staticmethod
+    def _build_issues_query(issues: list[tuple[str, int]], fields: str) -> str:
+        # one aliased `repository.issue` lookup per issue, all in a single round trip
+        lookups = []
+        for i, (repo_name, number) in enumerate(issues):
+            owner, name = repo_name.split("/")
+            lookups.append(f'i{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{ issue(number: {int(number)}) {{ {fields} }} }}')
+        return "query {\n" + "\n".join(lookups) + "\n}"
+
+    def fetch_issues(self, issue_urls: list[str]) -> Optional[dict]:
+        """
+        Fetches issues, with their labels and sub-issues, in a single aliased GraphQL query.
+        Payloads are cached across requests, keyed by (repo, number) and validated against `updatedAt`: when every
+        issue is cached, one lightweight query checks them, and only changed issues are fetched again.
+        Returns {issue_url: payload} (issues that could not be resolved are left out), or None when the query failed.
+        """
+        issues = {url: GithubURLParser.parse_issue_url(url) for url in issue_urls}
+        if not issues:
+            return {}
+        cache = get_issue_cache()
+        scope = getattr(self.provider, "rate_limit_key", "")
+        cache_key = lambda repo_name, number: (scope, repo_name, int(number))
+        to_fetch = list(issues)
+        if all(cache_key(*issue) in cache for issue in issues.values()):
+            stamps = self._query(self._build_issues_query(list(issues.values()), f"updatedAt subIssues(first: {MAX_SUB_ISSUES}) {{ nodes {{ updatedAt }} }}"))
+            if stamps is None:
+                return None
+            to_fetch = []
+            for i, (url, issue) in enumerate(issues.items()):
+                stamp = ((stamps.get(f"i{i}") or {}).get("issue")) or {}
+                cached = cache[cache_key(*issue)]
+                sub_stamps = [node.get("updatedAt") for node in (stamp.get("subIssues") or {}).get("nodes", [])]
+                if stamp.get("updatedAt") != cached["updatedAt"] or sub_stamps != [sub["updatedAt"] for sub in cached["sub_issues"]]:
+                    to_fetch.append(url)
+        if to_fetch:
+            fields = f"{ISSUE_FIELDS} subIssues(first: {MAX_SUB_ISSUES}) {{ nodes {{ {ISSUE_FIELDS} }} }}"
+            data = self._query(self._build_issues_query([issues[url] for url in to_fetch], fields))
+            if data is None:
+                return None
+            for i, url in enumerate(to_fetch):
+                issue = (data.get(f"i{i}") or {}).get("issue")
+                if not issue:
+                    get_logger().warning(f"Issue not found for {url}")
+                    continue
+                issue["sub_issues"] = (issue.pop("subIssues", None) or {}).get("nodes", [])
+                cache[cache_key(*issues[url])] = issue
+        return {url: cache[cache_key(*issue)] for url, issue in issues.items() if cache_key(*issue) in cache}
+
     def fetch_sub_issues(self, issue_url):
         """
         Fetch sub-issues linked to the given GitHub issue URL using GraphQL via PyGitHub.
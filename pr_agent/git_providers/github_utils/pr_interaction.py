@@ -31,7 +31,7 @@ class GithubPRInteraction:
         """
         max_tokens = get_settings().get("CONFIG.MAX_COMMITS_TOKENS", None)
         try:
-            commit_list = self.provider.pr.get_commits()
+            commit_list = self.provider.pr_commits
             commit_messages = [commit.commit.message for commit in commit_list]
             commit_messages_str = "\n".join([f"{i + 1}. {message}" for i, message in enumerate(commit_messages)])
         except Exception:
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+
+@dataclass
+class RateLimitState:
+    remaining: int
+    limit: int
+    reset: float  # epoch seconds
+    updated_at: float
+
+
+class GithubRateLimitTracker:
+    """
+    Passively tracks the GitHub rate limit budget from the `X-RateLimit-*` headers of every API response,
+    instead of spending an extra `/rate_limit` request to ask for it.
+    Budgets are kept per key (an installation or a token) and per resource (core, graphql, search, ...).
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self._states: dict[str, dict[str, RateLimitState]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(installation_id=None, token: Optional[str] = None) -> str:
+        if installation_id:
+            return f"installation:{installation_id}"
+        if token:
+            # never keep the token itself
+            return f"token:{hashlib.sha256(token.encode()).hexdigest()[:16]}"
+        return "anonymous"
+
+    def update(self, key: str, headers: dict) -> None:
+        headers = {str(k).lower(): v for k, v in headers.items()}
+        try:
+            remaining = int(float(headers["x-ratelimit-remaining"]))
+            limit = int(float(headers["x-ratelimit-limit"]))
+            reset = float(headers.get("x-ratelimit-reset", 0))
+        except (KeyError, TypeError, ValueError):
+            return
+        resource = headers.get("x-ratelimit-resource", "core")
+        with self._lock:
+            self._states.setdefault(key, {})[resource] = RateLimitState(remaining, limit, reset, self.clock())
+
+    def get_state(self, key: str, resource: str = "core") -> Optional[RateLimitState]:
+        state = self._states.get(key, {}).get(resource)
+        if state is not None and self.clock() >= state.reset:
+            return None  # the window was reset since the last response, the budget is full again
+        return state
+
+    def is_low(self, key: str, resource: str = "core", threshold: Optional[float] = None) -> bool:
+        state = self.get_state(key, resource)
+        if state is None or state.limit <= 0:
+            return False
+        if threshold is None:
+            threshold = get_settings().get("GITHUB.RATE_LIMIT_THRESHOLD", 0.1)
+        return state.remaining < state.limit * threshold
+
+    def seconds_until_reset(self, key: str, resource: str = "core") -> float:
+        state = self.get_state(key, resource)
+        return max(0.0, state.reset - self.clock()) if state else 0.0
+
+    async def wait_for_budget(self, key: str, max_wait: float, resource: str = "core",
+                              sleep: Callable = asyncio.sleep) -> bool:
+        """
+        Defers the caller until the budget of `key` is reset, if it is low.
+        Returns False (without waiting) when the reset is more than `max_wait` seconds away.
+        """
+        if not self.is_low(key, resource):
+            return True
+        wait = self.seconds_until_reset(key, resource)
+        if wait > max_wait:
+            get_logger().warning(f"GitHub rate limit budget of {key} is low, and resets in {wait:.0f}s")
+            return False
+        get_logger().info(f"GitHub rate limit budget of {key} is low, deferring for {wait:.0f}s")
+        await sleep(wait + 1)
+        return True
+
+    def install(self, github_client, key: str) -> None:
+        """
+        Hooks the tracker into the requester of a PyGithub client.
+        PyGithub calls `DEBUG_ON_RESPONSE` with the (lower-cased) headers of every response.
+        """
+        requester = getattr(github_client, "_Github__requester", None)
+        original = getattr(requester, "DEBUG_ON_RESPONSE", None)
+        if original is None:
+            return
+
+        def on_response(status, headers, data):
+            try:
+                self.update(key, headers)
+            except Exception as e:
+                get_logger().debug(f"Failed to track GitHub rate limit: {e}")
+            return original(status, headers, data)
+
+        requester.DEBUG_ON_RESPONSE = on_response
+
+
+_rate_limit_tracker = GithubRateLimitTracker()
+
+
+def get_rate_limit_tracker() -> GithubRateLimitTracker:
+    return _rate_limit_tracker
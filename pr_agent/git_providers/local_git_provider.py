@@ -1,6 +1,8 @@
+import subprocess
+import threading
 from collections import Counter
 from pathlib import Path
-from typing import List
+from typing import Callable, Iterator, List, Union
 
 from git import Repo
 
@@ -15,9 +17,63 @@ class PullRequestMimic:
     This class mimics the PullRequest class from the PyGithub library for the LocalGitProvider.
     """
 
-    def __init__(self, title: str, diff_files: List[FilePatchInfo]):
+    def __init__(self, title: str, diff_files: Union[List[FilePatchInfo], Callable[[], List[FilePatchInfo]]]):
         self.title = title
-        self.diff_files = diff_files
+        # a callable is only evaluated on first access, so that constructing the mimic does not compute the diff
+        self._diff_files = diff_files
+
+    @property
+    def diff_files(self) -> List[FilePatchInfo]:
+        if callable(self._diff_files):
+            self._diff_files = self._diff_files()
+        return self._diff_files
+
+
+class GitCatFileBatch:
+    """
+    A single long-lived `git cat-file --batch` process, used to read blobs by sha without spawning a process
+    (or building GitPython objects) per blob.
+    """
+
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self._process = None
+        self._lock = threading.Lock()
+
+    def _get_process(self) -> subprocess.Popen:
+        if self._process is None or self._process.poll() is not None:
+            self._process = subprocess.Popen(["git", "cat-file", "--batch"], cwd=self.repo_path,
+                                             stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                             stderr=subprocess.DEVNULL)
+        return self._process
+
+    def read(self, sha: str) -> bytes:
+        with self._lock:
+            process = self._get_process()
+            process.stdin.write(sha.encode("ascii") + b"\n")
+            process.stdin.flush()
+            header = process.stdout.readline().split()
+            if len(header) < 3:  # "<sha> missing"
+                raise KeyError(f"Object {sha} not found in {self.repo_path}")
+            size = int(header[2])
+            data = process.stdout.read(size)
+            process.stdout.read(1)  # trailing newline
+            return data
+
+    def close(self):
+        with self._lock:
+            if self._process is not None:
+                if self._process.poll() is None:
+                    self._process.stdin.close()
+                    self._process.wait()
+                self._process.stdout.close()
+                self._process = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
 
 
 class LocalGitProvider(GitProvider):
@@ -38,7 +94,11 @@ class LocalGitProvider(GitProvider):
         self.target_branch_name = target_branch_name
         self._prepare_repo()
         self.diff_files = None
-        self.pr = PullRequestMimic(self.get_pr_title(), self.get_diff_files())
+        self._diff_files_key = None
+        self._merge_base_cache = {}
+        self._diff_index_cache = {}
+        self._blob_reader = GitCatFileBatch(self.repo_path)
+        self.pr = PullRequestMimic(self.get_pr_title(), self.get_diff_files)
         self.description_path = get_settings().get('local.description_path') \
             if get_settings().get('local.description_path') is not None else self.repo_path / 'description.md'
         self.review_path = get_settings().get('local.review_path') \
@@ -62,22 +122,42 @@ class LocalGitProvider(GitProvider):
             return False
         return True
 
-    def get_diff_files(self) -> list[FilePatchInfo]:
-        diffs = self.repo.head.commit.diff(
-            self.repo.merge_base(self.repo.head, self.repo.branches[self.target_branch_name]),
-            create_patch=True,
-            R=True
-        )
-        diff_files = []
-        for diff_item in diffs:
-            if diff_item.a_blob is not None:
-                original_file_content_str = diff_item.a_blob.data_stream.read().decode('utf-8')
-            else:
-                original_file_content_str = ""  # empty file
-            if diff_item.b_blob is not None:
-                new_file_content_str = diff_item.b_blob.data_stream.read().decode('utf-8')
-            else:
-                new_file_content_str = ""  # empty file
+    def _get_merge_base(self, base_sha: str, head_sha: str):
+        key = (base_sha, head_sha)
+        if key not in self._merge_base_cache:
+            self._merge_base_cache[key] = self.repo.merge_base(head_sha, base_sha)
+        return self._merge_base_cache[key]
+
+    def _get_diff_key(self) -> tuple[str, str]:
+        return self.repo.branches[self.target_branch_name].commit.hexsha, self.repo.head.commit.hexsha
+
+    def _get_diff_index(self):
+        """
+        Returns the diff index (with patches) between HEAD and its merge base with the target branch,
+        cached per (target branch commit, head commit) pair.
+        """
+        key = self._get_diff_key()
+        base_sha, head_sha = key
+        if key not in self._diff_index_cache:
+            self._diff_index_cache[key] = self.repo.head.commit.diff(
+                self._get_merge_base(base_sha, head_sha),
+                create_patch=True,
+                R=True
+            )
+        return self._diff_index_cache[key]
+
+    def _read_blob(self, blob) -> str:
+        if blob is None:
+            return ""  # empty file
+        return self._blob_reader.read(blob.hexsha).decode('utf-8')
+
+    def iter_diff_files(self) -> Iterator[FilePatchInfo]:
+        """
+        Lazily yields a FilePatchInfo per changed file, reading the blob contents only when the file is reached.
+        """
+        for diff_item in self._get_diff_index():
+            original_file_content_str = self._read_blob(diff_item.a_blob)
+            new_file_content_str = self._read_blob(diff_item.b_blob)
             edit_type = EDIT_TYPE.MODIFIED
             if diff_item.new_file:
                 edit_type = EDIT_TYPE.ADDED
@@ -85,28 +165,27 @@ class LocalGitProvider(GitProvider):
                 edit_type = EDIT_TYPE.DELETED
             elif diff_item.renamed_file:
                 edit_type = EDIT_TYPE.RENAMED
-            diff_files.append(
-                FilePatchInfo(original_file_content_str,
-                              new_file_content_str,
-                              diff_item.diff.decode('utf-8'),
-                              diff_item.b_path,
-                              edit_type=edit_type,
-                              old_filename=None if diff_item.a_path == diff_item.b_path else diff_item.a_path
-                              )
-            )
-        self.diff_files = diff_files
-        return diff_files
+            yield FilePatchInfo(original_file_content_str,
+                                new_file_content_str,
+                                diff_item.diff.decode('utf-8'),
+                                diff_item.b_path,
+                                edit_type=edit_type,
+                                old_filename=None if diff_item.a_path == diff_item.b_path else diff_item.a_path
+                                )
+
+    def get_diff_files(self) -> list[FilePatchInfo]:
+        key = self._get_diff_key()
+        if self.diff_files is None or self._diff_files_key != key:
+            self.diff_files = list(self.iter_diff_files())
+            self._diff_files_key = key
+        return self.diff_files
 
     def get_files(self) -> List[str]:
         """
         Returns a list of files with changes in the diff.
         """
-        diff_index = self.repo.head.commit.diff(
-            self.repo.merge_base(self.repo.head, self.repo.branches[self.target_branch_name]),
-            R=True
-        )
         # Get the list of changed files
-        diff_files = [item.a_path for item in diff_index]
+        diff_files = [item.a_path for item in self._get_diff_index()]
         return diff_files
 
     def publish_description(self, pr_title: str, pr_body: str):
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Hashable, Iterable, Iterator, Optional
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RetryPolicy:
+    """
+    Shared retry/backoff policy for git provider API calls.
+
+    Waits grow exponentially with jitter, unless the server says how long to wait: a `Retry-After` header,
+    or `X-RateLimit-Reset` once `X-RateLimit-Remaining` hit 0. When the server asks for a longer wait than
+    `max_delay`, the policy gives up immediately instead of blocking the worker.
+    """
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                 sleep: Callable[[float], None] = time.sleep, clock: Callable[[], float] = time.time,
+                 rng: Optional[random.Random] = None):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self.clock = clock
+        self.rng = rng or random.Random()
+
+    @classmethod
+    def from_settings(cls, section: str = "github", **kwargs) -> RetryPolicy:
+        settings = get_settings()
+        try:
+            max_attempts = int(settings.get(f"{section}.ratelimit_retries", 5))
+            base_delay = float(settings.get(f"{section}.retry_base_delay", 1.0))
+            max_delay = float(settings.get(f"{section}.retry_max_delay", 60.0))
+        except (TypeError, ValueError):
+            max_attempts, base_delay, max_delay = 5, 1.0, 60.0
+        return cls(max_attempts=max_attempts, base_delay=base_delay, max_delay=max_delay, **kwargs)
+
+    @staticmethod
+    def _get_status_and_headers(error: Exception) -> tuple[Optional[int], dict]:
+        # PyGithub exceptions expose `status` and `headers`, requests' HTTPError exposes `response`
+        response = getattr(error, "response", None)
+        status = getattr(error, "status", None)
+        if status is None:
+            status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+        headers = getattr(error, "headers", None)
+        if headers is None:
+            headers = getattr(response, "headers", None)
+        try:
+            headers = {str(k).lower(): v for k, v in (headers or {}).items()}
+        except Exception:
+            headers = {}
+        return (status if isinstance(status, int) else None), headers
+
+    def is_retryable(self, error: Exception) -> bool:
+        if isinstance(error, (ConnectionError, TimeoutError)):
+            return True
+        try:
+            import requests
+            if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+                return True
+        except ImportError:
+            pass
+        status, headers = self._get_status_and_headers(error)
+        if status in RETRYABLE_STATUS_CODES:
+            return True
+        # GitHub answers an exhausted (primary or secondary) rate limit with 403
+        return status == 403 and ("retry-after" in headers or headers.get("x-ratelimit-remaining") == "0")
+
+    def get_server_delay(self, error: Exception) -> Optional[float]:
+        """
+        Returns the wait requested by the server in seconds, or None when the response has no such hint.
+        """
+        _, headers = self._get_status_and_headers(error)
+        retry_after = headers.get("retry-after")
+        if retry_after is not None:
+            try:
+                return max(0.0, float(retry_after))
+            except (TypeError, ValueError):
+                try:
+                    return max(0.0, parsedate_to_datetime(retry_after).timestamp() - self.clock())
+                except Exception:
+                    pass
+        if headers.get("x-ratelimit-remaining") == "0" and headers.get("x-ratelimit-reset") is not None:
+            try:
+                return max(0.0, float(headers["x-ratelimit-reset"]) - self.clock())
+            except (TypeError, ValueError):
+                pass
+        return None
+
+    def get_delay(self, attempt: int, error: Optional[Exception] = None) -> float:
+        """
+        Returns the wait before retry number `attempt` (starting at 1).
+        """
+        server_delay = self.get_server_delay(error) if error is not None else None
+        if server_delay is not None:
+            return server_delay
+        # "equal jitter": half of the exponential wait is kept, the other half is randomized
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay / 2 + self.rng.uniform(0, delay / 2)
+
+    def _get_retry_delay(self, attempt: int, error: Exception, name: str) -> Optional[float]:
+        # the wait before retrying after `error`, or None when the policy gives up
+        if attempt >= self.max_attempts or not self.is_retryable(error):
+            return None
+        delay = self.get_delay(attempt, error)
+        if delay > self.max_delay:
+            get_logger().warning(f"Server requested a {delay:.0f}s wait, giving up instead of retrying")
+            return None
+        get_logger().info(f"Retrying {name} in {delay:.1f}s (attempt {attempt}/{self.max_attempts}): {error}")
+        return delay
+
+    def call(self, func: Callable, *args, progress: Optional[Callable[[], Any]] = None, **kwargs):
+        """
+        Calls `func`, retrying retryable errors. The last error is re-raised once the policy gives up.
+        With `progress`, an attempt that changed its value (e.g. the size of a checkpoint) starts a new count of
+        attempts, so that a long job failing now and then is not abandoned as long as it moves forward.
+        """
+        attempt = 0
+        last_progress = progress() if progress else None
+        while True:
+            attempt += 1
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if progress and progress() != last_progress:
+                    attempt, last_progress = 1, progress()
+                delay = self._get_retry_delay(attempt, e, getattr(func, '__name__', 'call'))
+                if delay is None:
+                    raise
+                self.sleep(delay)
+
+    def iterate(self, func: Callable[..., Iterable], *args, key: Callable[[Any], Hashable] = lambda item: item,
+                progress: Optional[Callable[[], Any]] = None, **kwargs) -> Iterator:
+        """
+        Like `call`, for a function returning an iterable: a retried iteration starts over, and the items
+        already yielded (identified by `key`) are skipped. Yielding new items counts as progress.
+        """
+        yielded = set()
+        attempt = 0
+        last_progress = (0, progress() if progress else None)
+        while True:
+            attempt += 1
+            try:
+                for item in func(*args, **kwargs):
+                    item_key = key(item)
+                    if item_key not in yielded:
+                        yielded.add(item_key)
+                        yield item
+                return
+            except Exception as e:
+                current_progress = (len(yielded), progress() if progress else None)
+                if current_progress != last_progress:
+                    attempt, last_progress = 1, current_progress
+                delay = self._get_retry_delay(attempt, e, getattr(func, '__name__', 'iterate'))
+                if delay is None:
+                    raise
+                self.sleep(delay)
@@ -1,4 +1,5 @@
 import json
+from pr_agent.config_loader import get_settings
 from pr_agent.jules.planner import Planner
 from pr_agent.jules.tools import JulesTools
 from pr_agent.jules.state import State
@@ -11,7 +12,7 @@ class JulesAgent:
     Strictly optimized for Clean Code and < 150 LOC.
     """
     def __init__(self, git_provider):
-        self.tools = JulesTools(git_provider)
+        self.tools = JulesTools(git_provider, stage_edits=get_settings().get("pr_code_agent.batch_commits", True))
         self.planner = Planner()
         self.logger = get_logger()
 
@@ -23,25 +24,35 @@ class JulesAgent:
 
         plan = await self.planner.create_plan(task, state.get_context())
 
-        i = 0
-        while i < len(plan.steps):
-            step = plan.steps[i]
-            self.logger.info(f"Step {i+1}/{len(plan.steps)}: {step.description}")
-
-            result = await self._execute_step(step, state)
-            state.add_history(step.description, step.command, result)
+        commit_err = None
+        try:
+            i = 0
+            while i < len(plan.steps):
+                step = plan.steps[i]
+                self.logger.info(f"Step {i+1}/{len(plan.steps)}: {step.description}")
 
-            # Simple Reflection: Check for errors
-            if "Error" in result:
-                self.logger.warning(f"Step failed: {result}. Refining plan...")
-                plan = await self.planner.refine_plan(plan, result)
-                # Retry current step index (ensure within bounds)
-                i = min(i, len(plan.steps) - 1)
-                if i < 0: i = 0
-                continue
+                result = await self._execute_step(step, state)
+                state.add_history(step.description, step.command, result)
 
-            i += 1
+                # Simple Reflection: Check for errors
+                if "Error" in result:
+                    self.logger.warning(f"Step failed: {result}. Refining plan...")
+                    plan = await self.planner.refine_plan(plan, result)
+                    # Retry current step index (ensure within bounds)
+                    i = min(i, len(plan.steps) - 1)
+                    if i < 0: i = 0
+                    continue
 
+                i += 1
+        finally:
+            self.tools.shell.close()
+            try:
+                self.tools.commit_staged(f"Jules: {task}")
+            except Exception as e:
+                self.logger.error(f"Failed to commit the edits: {e}")
+                commit_err = e
+        if commit_err is not None:
+            return f"Task Completed, but the edits were not committed: {commit_err}"
         return "Task Completed"
 
     async def _execute_step(self, step, state) -> str:
@@ -57,6 +57,13 @@ class GitHubFileHandler:
             self.logger.error(f"Failed to write file {file_path}: {e}")
             raise e
 
+    def commit_files(self, repo_obj, files, message, branch):
+        """Commits files (path -> content, None to delete) as a single commit."""
+        if not repo_obj: raise ValueError("Repo object required")
+        from pr_agent.git_providers.github_utils.file_handler import commit_files_to_branch
+        sha = commit_files_to_branch(repo_obj, branch, files, message)
+        self.logger.info(f"Committed {len(files)} files on branch {branch}: {sha}")
+
     def delete_file(self, repo_obj, file_path, message, branch):
         """Deletes a file."""
         if not repo_obj: raise ValueError("Repo object required")
@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from github import Github, Auth
 from pr_agent.config_loader import get_settings
 from pr_agent.jules.git.provider import GitProvider
@@ -43,6 +43,10 @@ class GitHubProvider(GitProvider):
         repo = self.pr_handler.get_repo()
         self.file_handler.delete_file(repo, file_path, message, branch)
 
+    def commit_files(self, files: Dict[str, Optional[str]], message: str, branch: str) -> None:
+        repo = self.pr_handler.get_repo()
+        self.file_handler.commit_files(repo, files, message, branch)
+
     def create_pr(self, title: str, body: str, source_branch: str, target_branch: str) -> str:
         repo = self.pr_handler.get_repo()
         return self.pr_handler.create_pr(repo, title, body, source_branch, target_branch)
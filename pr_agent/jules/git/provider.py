@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 class GitProvider(ABC):
     """
@@ -38,6 +38,14 @@ class GitProvider(ABC):
         """Deletes a file from the repository."""
         pass
 
+    def commit_files(self, files: Dict[str, Optional[str]], message: str, branch: str) -> None:
+        """Commits files (path -> content, None to delete), one by one unless the provider can batch them."""
+        for file_path, content in files.items():
+            if content is None:
+                self.delete_file(file_path, message, branch)
+            else:
+                self.create_or_update_file(file_path, content, message, branch)
+
     @abstractmethod
     def create_pr(self, title: str, body: str, source_branch: str, target_branch: str) -> str:
         """Creates a new Pull Request."""
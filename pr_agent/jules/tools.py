@@ -1,28 +1,38 @@
 import os
 import subprocess
-from typing import Optional
+from pr_agent.algo.shell_session import ShellSession
+from pr_agent.algo.workspace_index import WorkspaceIndex
 from pr_agent.jules.git.provider import GitProvider
 from pr_agent.log import get_logger
+from pr_agent.tools.code_agent.staging import StagedEdits
 
 class JulesTools:
     """
     Tools for Jules Agent.
     Handles File System and Execution.
+    With `stage_edits`, edits are staged and committed at once by `commit_staged`, else pushed one by one.
+    Listings and remote reads are cached, and searches answered in-process, by the `workspace` index.
+    Commands run in a persistent `shell`, closed at the end of the task.
     Strictly optimized for Clean Code and < 150 LOC.
     """
-    def __init__(self, git_provider: GitProvider):
+    def __init__(self, git_provider: GitProvider, stage_edits: bool = True):
         self.git = git_provider
         self.logger = get_logger()
+        self.staged = StagedEdits() if stage_edits else None
+        self.workspace = WorkspaceIndex()
+        self.shell = ShellSession()
+
+    def _list_files(self, path: str) -> list:
+        cmd = ["git", "ls-files"] if os.path.exists(".git") else ["find", path, "-maxdepth", "4", "-not", "-path", "*/.*"]
+        res = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
+        if res.returncode != 0:
+            raise RuntimeError("Error listing files.")
+        return res.stdout.strip().split('\n')
 
     async def list_files(self, path: str = ".") -> str:
         """Lists files in the repository."""
-        cmd = ["git", "ls-files"] if os.path.exists(".git") else ["find", path, "-maxdepth", "4", "-not", "-path", "*/.*"]
         try:
-            res = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-            if res.returncode == 0:
-                files = res.stdout.strip().split('\n')
-                return "\n".join(files[:1000])
-            return "Error listing files."
+            return "\n".join(self.workspace.list_files(path, lambda: self._list_files(path))[:1000])
         except Exception as e:
             return str(e)
 
@@ -32,7 +42,10 @@ class JulesTools:
             if os.path.exists(file_path):
                 with open(file_path, "r", errors='replace') as f:
                     return f.read()
-            return self.git.get_file_content(file_path)
+            if self.staged is not None and file_path in self.staged:
+                content = self.staged.get(file_path)
+                return content if content is not None else f"Error: {file_path} was deleted"
+            return self.workspace.read("", file_path, lambda: self.git.get_file_content(file_path))
         except Exception as e:
             return f"Error reading {file_path}: {e}"
 
@@ -43,9 +56,11 @@ class JulesTools:
                 os.makedirs(os.path.dirname(file_path), exist_ok=True)
             with open(file_path, "w") as f:
                 f.write(content)
-
-            branch = self.git.get_current_branch()
-            self.git.create_or_update_file(file_path, content, "Jules update", branch)
+            if self.staged is not None:
+                self.staged.stage(file_path, content)
+            else:
+                self.git.create_or_update_file(file_path, content, "Jules update", self.git.get_current_branch())
+            self.workspace.write(file_path, content)
             return f"Successfully edited {file_path}"
         except Exception as e:
             return f"Error editing {file_path}: {e}"
@@ -55,28 +70,37 @@ class JulesTools:
         try:
             if os.path.exists(file_path):
                 os.remove(file_path)
-
-            branch = self.git.get_current_branch()
-            self.git.delete_file(file_path, "Jules delete", branch)
+            if self.staged is not None:
+                self.staged.stage(file_path, None)
+            else:
+                self.git.delete_file(file_path, "Jules delete", self.git.get_current_branch())
+            self.workspace.delete(file_path)
             return f"Successfully deleted {file_path}"
         except Exception as e:
             return f"Error deleting {file_path}: {e}"
 
+    def commit_staged(self, message: str = "Jules update") -> int:
+        """Commits the staged edits to the current branch as one commit. They stay staged if the commit fails."""
+        if not self.staged:
+            return 0
+        self.git.commit_files(dict(self.staged.files), message, self.git.get_current_branch())
+        committed = len(self.staged)
+        self.staged.files.clear()
+        return committed
+
     async def run_command(self, command: str) -> str:
         """Runs a bash command."""
+        self.workspace.invalidate_local()  # the command may change the working tree
         try:
-            # nosec B602: shell=True required for agent flexibility
-            res = subprocess.run(command, shell=True, capture_output=True, text=True, timeout=60) # nosec B602
+            res = self.shell.run(command)
             return f"Stdout: {res.stdout}\nStderr: {res.stderr}"
         except Exception as e:
             return f"Execution Error: {e}"
 
     async def search_files(self, pattern: str) -> str:
-        """Searches for a pattern in files."""
+        """Searches for a pattern (a regex, or a substring) in files, like `grep -r pattern .`."""
         try:
-            # nosec B602: grep is safe here
-            cmd = f"grep -r \"{pattern}\" . --exclude-dir=.*" # nosec B602
-            res = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=10) # nosec B602
-            return res.stdout[:2000] if res.stdout else "No matches found."
+            output = "\n".join(f"./{path}:{line}" for path, _, line in self.workspace.search(pattern))
+            return output[:2000] if output else "No matches found."
         except Exception as e:
             return f"Search Error: {e}"
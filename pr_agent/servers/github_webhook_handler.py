@@ -1,3 +1,4 @@
+import asyncio
 import asyncio.locks
 import os
 import re
@@ -5,10 +6,15 @@ import uuid
 from typing import Any, Dict, Tuple
 
 from pr_agent.agent.pr_agent import PRAgent
+from pr_agent.algo.pr_analysis_session import pr_analysis_session
 from pr_agent.algo.utils import update_settings_from_args
 from pr_agent.config_loader import get_settings
 from pr_agent.git_providers import (get_git_provider,
                                     get_git_provider_with_context)
+from pr_agent.git_providers.github_utils.comment_index import (
+    GithubCommentIndex, get_comment_index, get_review_thread_index)
+from pr_agent.git_providers.github_utils.rate_limit_tracker import (
+    GithubRateLimitTracker, get_rate_limit_tracker)
 from pr_agent.git_providers.utils import apply_repo_settings
 from pr_agent.identity_providers import get_identity_provider
 from pr_agent.identity_providers.identity_provider import Eligibility
@@ -42,6 +48,7 @@ async def handle_request(body: Dict[str, Any], event: str):
         return {}
     agent = PRAgent()
     log_context, sender, sender_id, sender_type = get_log_context(body, event, action, build_number)
+    update_comment_index(body, event, action)  # also for comments of the bot itself
 
     # logic to ignore PRs opened by bot, PRs with specific titles, labels, source branches, or target branches
     if is_bot_user(sender, sender_type) and 'check_run' not in body:
@@ -215,6 +222,29 @@ def handle_closed_pr(body, event, action, log_context):
     get_logger().info("PR-Agent statistics for closed PR", analytics=True, pr_statistics=pr_statistics, **log_context)
 
 
+def update_comment_index(body: Dict[str, Any], event: str, action: str):
+    """
+    Keeps the shared indexes of PR comments (see GithubCommentIndex and GithubReviewThreadIndex) in line with
+    comment webhooks.
+    """
+    if event not in ("issue_comment", "pull_request_review_comment") or "comment" not in body:
+        return
+    try:
+        pr_num = (body.get("issue") or body.get("pull_request") or {}).get("number")
+        pr_key = GithubCommentIndex.get_pr_key(body["repository"]["full_name"], pr_num)
+        comment = body["comment"]
+        if action == "deleted":
+            get_comment_index().forget_comment(pr_key, comment["id"])
+            if event == "pull_request_review_comment":
+                get_review_thread_index().forget_comment(pr_key, comment["id"])
+        elif event == "issue_comment" and action in ("created", "edited"):
+            get_comment_index().record_comment(pr_key, comment.get("body", ""), comment["id"])
+        elif action in ("created", "edited"):
+            get_review_thread_index().record_comment(pr_key, comment)
+    except Exception as e:
+        get_logger().debug(f"Failed to update the comment index: {e}")
+
+
 def get_log_context(body, event, action, build_number):
     sender = ""
     sender_id = ""
@@ -352,12 +382,39 @@ async def _perform_auto_commands_github(commands_conf: str, agent: PRAgent, body
     if not commands:
         get_logger().info(f"New PR, but no auto commands configured")
         return
+    # automatic commands can wait: defer them while the installation is close to its rate limit
+    installation_id = body.get("installation", {}).get("id")
+    if installation_id:
+        rate_limit_key = GithubRateLimitTracker.get_key(installation_id=installation_id)
+        max_defer_seconds = get_settings().get("GITHUB_APP.RATE_LIMIT_MAX_DEFER_SECONDS", 300)
+        if not await get_rate_limit_tracker().wait_for_budget(rate_limit_key, max_defer_seconds):
+            get_logger().warning(f"Skipping auto commands for {api_url=}, GitHub rate limit budget is exhausted")
+            return
     get_settings().set("config.is_auto_command", True)
-    for command in commands:
+    head_sha = body.get("pull_request", {}).get("head", {}).get("sha")
+    await _run_auto_commands_github(commands_conf, commands, agent, api_url, head_sha)
+
+
+async def _run_auto_commands_github(commands_conf: str, commands: list, agent: PRAgent, api_url: str, head_sha: str = None):
+    """
+    Runs the auto commands of a PR in one analysis session, so that they fetch and compute the shared PR artifacts
+    (languages, diff files, patches, tickets) once. With `github_app.run_auto_commands_concurrently`, the commands
+    run at the same time, and their LLM calls are bounded by `config.max_concurrent_llm_calls`.
+    """
+    def prepare_command(command: str) -> str:
         split_command = command.split(" ")
         command = split_command[0]
         args = split_command[1:]
         other_args = update_settings_from_args(args)
         new_command = ' '.join([command] + other_args)
         get_logger().info(f"{commands_conf}. Performing auto command '{new_command}', for {api_url=}")
-        await agent.handle_request(api_url, new_command)
+        return new_command
+
+    with pr_analysis_session(api_url, head_sha):
+        if get_settings().get("GITHUB_APP.RUN_AUTO_COMMANDS_CONCURRENTLY", False):
+            # the arguments of all the commands are applied before they start
+            new_commands = [prepare_command(command) for command in commands]
+            await asyncio.gather(*(agent.handle_request(api_url, command) for command in new_commands))
+        else:
+            for command in commands:
+                await agent.handle_request(api_url, prepare_command(command))
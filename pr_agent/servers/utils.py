@@ -64,11 +64,14 @@ class DefaultDictWithTimeout(defaultdict):
         if self.__ttl is None:
             return
         request_time = self.__time()
-        if request_time - self.__last_refresh > self.__refresh_interval:
+        if request_time - self.__last_refresh < self.__refresh_interval:
             return
         to_delete = [key for key, key_time in self.__key_times.items() if request_time - key_time > self.__ttl]
         for key in to_delete:
-            del self[key]
+            if key in self:
+                del self[key]
+            else:  # looked up, but never set
+                del self.__key_times[key]
         self.__last_refresh = request_time
 
     def __getitem__(self, __key):
@@ -77,8 +80,15 @@ class DefaultDictWithTimeout(defaultdict):
         self.__refresh()
         return super().__getitem__(__key)
 
+    def get(self, __key, __default=None):
+        self.__refresh()
+        if __key not in self:
+            return __default
+        return self[__key]
+
     def __setitem__(self, __key, __value):
         self.__key_times[__key] = self.__time()
+        self.__refresh()
         return super().__setitem__(__key, __value)
 
     def __delitem__(self, __key):
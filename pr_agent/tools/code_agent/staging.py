@@ -0,0 +1,35 @@
+from typing import Dict, Optional
+
+from pr_agent.git_providers.git_provider import GitProvider
+from pr_agent.log import get_logger
+
+
+class StagedEdits:
+    """
+    The edits of an agent run, held in memory and committed together at the end of the run.
+    Maps a file path to its new content, or to None when the file is deleted.
+    """
+    def __init__(self):
+        self.files: Dict[str, Optional[str]] = {}
+
+    def __contains__(self, file_path):
+        return file_path in self.files
+
+    def __len__(self):
+        return len(self.files)
+
+    def get(self, file_path) -> Optional[str]:
+        return self.files.get(file_path)
+
+    def stage(self, file_path, content: Optional[str]):
+        self.files[file_path] = content
+
+    def commit(self, git_provider: GitProvider, branch: str, message: str) -> int:
+        """Commits the staged edits to `branch` and clears them. Returns the number of committed files."""
+        if not self.files:
+            return 0
+        files = dict(self.files)
+        git_provider.commit_files(branch, files, message)
+        self.files.clear()
+        get_logger().info(f"Committed {len(files)} staged files to {branch}", artifact={"files": list(files)})
+        return len(files)
@@ -1,10 +1,12 @@
 import os
-import subprocess
+from pr_agent.algo.shell_session import ShellSession
+from pr_agent.algo.workspace_index import WorkspaceIndex
 from pr_agent.config_loader import get_settings
 from pr_agent.log import get_logger
 from pr_agent.git_providers.git_provider import GitProvider
 from pr_agent.tools.code_agent.diff_utils import apply_git_merge_diff
-from pr_agent.tools.code_agent.utils import fetch_url_content
+from pr_agent.tools.code_agent.staging import StagedEdits
+from pr_agent.tools.code_agent.utils import fetch_url_content, list_local_files
 
 TOKEN_ECONOMY_MAX_FILE_CHARS = 10000
 
@@ -12,10 +14,15 @@ class AgentTools:
     """
     Tool implementation for the PRCodeAgent.
     Handles file operations, git interactions, and system commands.
+    With `stage_edits`, edits are staged and committed at once by `commit_staged_edits`.
+    File contents and listings are cached for the run in `workspace`, and commands run in a persistent `shell`.
     """
-    def __init__(self, git_provider: GitProvider):
+    def __init__(self, git_provider: GitProvider, stage_edits: bool = False):
         self.git_provider = git_provider
         self.plan = []
+        self.staged_edits = StagedEdits() if stage_edits else None
+        self.workspace = WorkspaceIndex()
+        self.shell = ShellSession()
 
     def _get_filenames(self):
         files = self.git_provider.get_files()
@@ -23,18 +30,16 @@ class AgentTools:
 
     async def list_files(self, path="."):
         """Lists files in the repository."""
-        try:
-            cmd = ["git", "ls-files", path] if os.path.exists(".git") else ["find", path, "-maxdepth", "4", "-not", "-path", "*/.*"]
-            res = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-            if res.returncode == 0 and res.stdout:
-                return res.stdout[:5000] # Limit output
-        except Exception as e:
-            get_logger().warning(f"Error listing files locally: {e}")
-        return "\n".join(self._get_filenames())
+        files = self.workspace.list_files(path, lambda: list_local_files(path) or self._get_filenames())
+        return "\n".join(files)[:5000]  # Limit output
 
     async def read_file(self, file_path):
         """Reads file content from the PR branch."""
-        content = self.git_provider.get_pr_file_content(file_path, self.git_provider.get_pr_branch())
+        if self.staged_edits is not None and file_path in self.staged_edits:
+            content = self.staged_edits.get(file_path) or ""
+        else:
+            branch = self.git_provider.get_pr_branch()
+            content = self.workspace.read(branch, file_path, lambda: self.git_provider.get_pr_file_content(file_path, branch))
         if get_settings().config.get("token_economy_mode", False):
             limit = TOKEN_ECONOMY_MAX_FILE_CHARS
             if len(content) > limit:
@@ -43,9 +48,12 @@ class AgentTools:
 
     async def edit_file(self, file_path, content):
         """Edits or creates a file in the PR branch."""
-        self.git_provider.create_or_update_pr_file(
-            file_path, self.git_provider.get_pr_branch(), content, "Agent edit"
-        )
+        branch = self.git_provider.get_pr_branch()
+        if self.staged_edits is not None:
+            self.staged_edits.stage(file_path, content)
+        else:
+            self.git_provider.create_or_update_pr_file(file_path, branch, content, "Agent edit")
+        self.workspace.write(file_path, content, ref=branch)  # the branch content, once staged edits are committed
         local_err = ""
         if os.path.exists(file_path) or os.path.exists(".git"):
             try:
@@ -66,8 +74,13 @@ class AgentTools:
 
     async def delete_file(self, file_path):
         """Deletes a file from the PR branch."""
+        branch = self.git_provider.get_pr_branch()
         try:
-            self.git_provider.delete_file(file_path, self.git_provider.get_pr_branch(), "Agent deleted file")
+            if self.staged_edits is not None:
+                self.staged_edits.stage(file_path, None)
+            else:
+                self.git_provider.delete_file(file_path, branch, "Agent deleted file")
+            self.workspace.delete(file_path, ref=branch)
         except Exception as e:
             return f"Error deleting {file_path} from remote: {e}"
         local_err = ""
@@ -79,6 +92,12 @@ class AgentTools:
                 local_err = f" (Local delete failed: {e})"
         return f"Deleted {file_path}{local_err}"
 
+    def commit_staged_edits(self, message="Agent edit") -> int:
+        """Commits the staged edits to the PR branch as one commit."""
+        if not self.staged_edits:
+            return 0
+        return self.staged_edits.commit(self.git_provider, self.git_provider.get_pr_branch(), message)
+
     async def rename_file(self, filepath, new_filepath):
         """Renames a file."""
         content = await self.read_file(filepath)
@@ -95,8 +114,9 @@ class AgentTools:
 
     async def run_in_bash_session(self, command):
         """Runs a bash command."""
+        self.workspace.invalidate_local()  # the command may change the working tree
         try:
-            res = subprocess.run(command, shell=True, capture_output=True, text=True, timeout=60)  # nosec B602
+            res = self.shell.run(command)
             return f"Stdout: {res.stdout}\nStderr: {res.stderr}"
         except Exception as e:
             return f"Error: {e}"
@@ -1,5 +1,7 @@
 import json
+import os
 import re
+import subprocess
 import aiohttp
 import html2text
 from pr_agent.log import get_logger
@@ -37,3 +39,16 @@ async def fetch_url_content(url: str, timeout_sec: int = 10, max_chars: int = 10
                 return h.handle(html)[:max_chars]
     except Exception as e:
         return f"Error viewing website: {e}"
+
+def list_local_files(path: str = "."):
+    """
+    Lists the files of the local checkout (`git ls-files`, or `find` outside of a git repository), or None.
+    """
+    try:
+        cmd = ["git", "ls-files", path] if os.path.exists(".git") else ["find", path, "-maxdepth", "4", "-not", "-path", "*/.*"]
+        res = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
+        if res.returncode == 0 and res.stdout:
+            return res.stdout.splitlines()
+    except Exception as e:
+        get_logger().warning(f"Error listing files locally: {e}")
+    return None
@@ -31,7 +31,7 @@ class PRCodeAgent:
         self.ai_handler = ai_handler()
         self.args = args or []
         self.max_steps = get_settings().get("pr_code_agent.max_steps", 15)
-        self.tools = AgentTools(self.git_provider)
+        self.tools = AgentTools(self.git_provider, stage_edits=get_settings().get("pr_code_agent.batch_commits", True))
         self.registry = ToolRegistry(self.git_provider)
         self._register_tools()
         self.prompts = PromptGenerator(self.registry.get_tool_definitions())
@@ -61,34 +61,44 @@ class PRCodeAgent:
         task = " ".join(self.args) if self.args else "Perform task."
         history = []
         img_path = None
-        for i in range(self.max_steps):
-            sys_p = self.prompts.build_system_prompt()
-            usr_p = self.prompts.build_user_prompt(task, history)
-            resp = await self.ai_handler.chat_completion(
-                model=get_settings().config.model, system=sys_p, user=usr_p, img_path=img_path
-            )
-            action = parse_llm_response(resp[0])
-            if not action:
-                get_logger().warning("Failed to parse action from response")
+        finish_msg, commit_err = None, ""
+        try:
+            for i in range(self.max_steps):
+                sys_p = self.prompts.build_system_prompt()
+                usr_p = self.prompts.build_user_prompt(task, history)
+                resp = await self.ai_handler.chat_completion(
+                    model=get_settings().config.model, system=sys_p, user=usr_p, img_path=img_path
+                )
+                action = parse_llm_response(resp[0])
+                if not action:
+                    get_logger().warning("Failed to parse action from response")
+                    history.append({
+                        "action": "system_error",
+                        "args": {},
+                        "result": "Invalid JSON response. Please respond in valid JSON format."
+                    })
+                    continue
+
+                res = await self.registry.execute(action.get("action"), action.get("args", {}))
                 history.append({
-                    "action": "system_error",
-                    "args": {},
-                    "result": "Invalid JSON response. Please respond in valid JSON format."
+                    "action": action.get("action"),
+                    "args": action.get("args", {}),
+                    "result": str(res)
                 })
-                continue
-
-            res = await self.registry.execute(action.get("action"), action.get("args", {}))
-            history.append({
-                "action": action.get("action"),
-                "args": action.get("args", {}),
-                "result": str(res)
-            })
 
-            img_path = None
-            if action.get("action") == "view_image":
-                img_path = action.get("args", {}).get("url")
+                img_path = None
+                if action.get("action") == "view_image":
+                    img_path = action.get("args", {}).get("url")
 
-            if action.get("action") == "finish":
-                msg = action.get("args", {}).get("message", "Done")
-                self.git_provider.publish_comment(f"Task Done: {msg}")
-                break
+                if action.get("action") == "finish":
+                    finish_msg = action.get("args", {}).get("message", "Done")
+                    break
+        finally:
+            self.tools.shell.close()
+            try:
+                self.tools.commit_staged_edits()
+            except Exception as e:
+                get_logger().error(f"Failed to commit the agent edits: {e}")
+                commit_err = f"\n\nFailed to commit the edits: {e}"
+        if finish_msg is not None:
+            self.git_provider.publish_comment(f"Task Done: {finish_msg}{commit_err}")
@@ -11,6 +11,7 @@ from pr_agent.algo.utils import clip_tokens, get_max_tokens, get_model, load_yam
 from pr_agent.config_loader import get_settings
 from pr_agent.log import get_logger
 from pr_agent.tools.pr_code_suggestions_utils.helpers import remove_line_numbers
+from pr_agent.tools.pr_code_suggestions_utils.reflection_handler import ReflectionBatcher
 
 
 class PredictionHandler:
@@ -36,7 +37,8 @@ class PredictionHandler:
         data = self.core.prediction
         return data
 
-    async def get_prediction(self, model: str, patches_diff: str, patches_diff_no_line_number: str) -> dict:
+    async def get_prediction(self, model: str, patches_diff: str, patches_diff_no_line_number: str,
+                             self_reflect: bool = True) -> dict:
         variables = copy.deepcopy(self.core.vars)
         variables["diff"] = patches_diff  # update diff
         variables["diff_no_line_numbers"] = patches_diff_no_line_number  # update diff
@@ -53,6 +55,13 @@ class PredictionHandler:
         data = self.core._prepare_pr_code_suggestions(response)
 
         # self-reflect on suggestions (mandatory, since line numbers are generated now here)
+        if self_reflect:
+            await self.core.reflection_handler.score_suggestions(data, patches_diff,
+                                                                 model=self.get_reflection_model(model))
+
+        return data
+
+    def get_reflection_model(self, model: str) -> str:
         model_reflect_with_reasoning = get_model('model_reasoning')
         fallbacks = get_settings().config.fallback_models
         if model_reflect_with_reasoning == get_settings().config.model and model != get_settings().config.model and fallbacks and model == \
@@ -60,28 +69,48 @@ class PredictionHandler:
             # we are using a fallback model (should not happen on regular conditions)
             get_logger().warning(f"Using the same model for self-reflection as the one used for suggestions")
             model_reflect_with_reasoning = model
+        return model_reflect_with_reasoning
 
-        # We access self_reflect_on_suggestions from the core, which will use ReflectionHandler
-        response_reflect = await self.core.reflection_handler.self_reflect_on_suggestions(data["code_suggestions"],
-                                                                  patches_diff, model=model_reflect_with_reasoning)
-        if response_reflect:
-            await self.core.reflection_handler.analyze_self_reflection_response(data, response_reflect)
-        else:
-            # get_logger().error(f"Could not self-reflect on suggestions. using default score 7")
-            for i, suggestion in enumerate(data["code_suggestions"]):
-                suggestion["score"] = 7
-                suggestion["score_why"] = ""
+    async def get_predictions_with_batched_reflection(self, model: str) -> List[dict]:
+        """
+        Predicts the suggestions of each chunk without self-reflection, and self-reflects on the suggestions of all
+        the chunks in as few calls as possible (see `ReflectionBatcher`), starting as the predictions arrive.
+        """
+        chunks = list(zip(self.core.patches_diff_list, self.core.patches_diff_list_no_line_numbers))
 
-        return data
+        async def predict(i: int):
+            return i, await self.get_prediction(model, *chunks[i], self_reflect=False)
+
+        if get_settings().pr_code_suggestions.parallel_calls:
+            predictions = asyncio.as_completed([predict(i) for i in range(len(chunks))])
+        else:
+            predictions = (predict(i) for i in range(len(chunks)))
+
+        batcher = ReflectionBatcher(self.core.reflection_handler, self.get_reflection_model(model))
+        prediction_list = [None] * len(chunks)
+        try:
+            for prediction in predictions:
+                i, data = await prediction
+                prediction_list[i] = data
+                batcher.add(data["code_suggestions"], chunks[i][0])
+        except Exception:
+            batcher.cancel()
+            raise
+        await batcher.wait()
+        return prediction_list
 
     async def prepare_prediction_main(self, model: str) -> dict:
+        # chunks processed in parallel take as long as the largest one, so balance them
+        balance_chunks = bool(get_settings().pr_code_suggestions.parallel_calls and
+                              get_settings().get("pr_code_suggestions.balance_parallel_chunks", True))
         # get PR diff
         if get_settings().pr_code_suggestions.decouple_hunks:
             self.core.patches_diff_list = get_pr_multi_diffs(self.core.git_provider,
                                                         self.core.token_handler,
                                                         model,
                                                         max_calls=get_settings().pr_code_suggestions.max_number_of_calls,
-                                                        add_line_numbers=True)  # decouple hunk with line numbers
+                                                        add_line_numbers=True,
+                                                        balance_chunks=balance_chunks)  # decouple hunk with line numbers
             self.core.patches_diff_list_no_line_numbers = remove_line_numbers(self.core.patches_diff_list)  # decouple hunk
 
         else:
@@ -90,7 +119,8 @@ class PredictionHandler:
                                                                         self.core.token_handler,
                                                                         model,
                                                                         max_calls=get_settings().pr_code_suggestions.max_number_of_calls,
-                                                                        add_line_numbers=False)
+                                                                        add_line_numbers=False,
+                                                                        balance_chunks=balance_chunks)
             self.core.patches_diff_list = await self.convert_to_decoupled_with_line_numbers(
                 self.core.patches_diff_list_no_line_numbers, model)
             if not self.core.patches_diff_list:
@@ -99,14 +129,18 @@ class PredictionHandler:
                                                             self.core.token_handler,
                                                             model,
                                                             max_calls=get_settings().pr_code_suggestions.max_number_of_calls,
-                                                            add_line_numbers=True)  # decouple hunk with line numbers
+                                                            add_line_numbers=True,
+                                                            balance_chunks=balance_chunks)  # decouple hunk with line numbers
 
         if self.core.patches_diff_list:
             get_logger().info(f"Number of PR chunk calls: {len(self.core.patches_diff_list)}")
             get_logger().debug(f"PR diff:", artifact=self.core.patches_diff_list)
 
+            if get_settings().get("pr_code_suggestions.batch_self_reflection", False):
+                prediction_list = await self.get_predictions_with_batched_reflection(model)
+                self.core.prediction_list = prediction_list
             # parallelize calls to AI:
-            if get_settings().pr_code_suggestions.parallel_calls:
+            elif get_settings().pr_code_suggestions.parallel_calls:
                 prediction_list = await asyncio.gather(
                     *[self.get_prediction(model, patches_diff, patches_diff_no_line_numbers) for
                       patches_diff, patches_diff_no_line_numbers in
@@ -1,12 +1,18 @@
+import asyncio
+import hashlib
+import re
 from typing import Dict, List
 
 from jinja2 import Environment, StrictUndefined
 
-from pr_agent.algo.utils import load_yaml
+from pr_agent.algo.diff_processing import OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD
+from pr_agent.algo.utils import get_max_tokens, load_yaml
 from pr_agent.config_loader import get_settings
 from pr_agent.log import get_logger
 from pr_agent.tools.pr_code_suggestions_utils.helpers import validate_one_liner_suggestion_not_repeating_code
 
+RE_FILE_SECTION = re.compile(r"^## File:? '(.+?)'", re.MULTILINE)
+
 
 class ReflectionHandler:
     def __init__(self, core):
@@ -56,6 +62,20 @@ class ReflectionHandler:
             return ""
         return response_reflect
 
+    async def score_suggestions(self, data: Dict, patches_diff: str, model: str):
+        """
+        Self-reflects on the suggestions of `data`, scoring them in place. Without a reflection, the suggestions get
+        a default score of 7.
+        """
+        response_reflect = await self.self_reflect_on_suggestions(data["code_suggestions"], patches_diff, model=model)
+        if response_reflect:
+            await self.analyze_self_reflection_response(data, response_reflect)
+        else:
+            # get_logger().error(f"Could not self-reflect on suggestions. using default score 7")
+            for i, suggestion in enumerate(data["code_suggestions"]):
+                suggestion["score"] = 7
+                suggestion["score_why"] = ""
+
     async def analyze_self_reflection_response(self, data, response_reflect):
         response_reflect_yaml = load_yaml(response_reflect)
         code_suggestions_feedback = response_reflect_yaml.get("code_suggestions", [])
@@ -109,3 +129,93 @@ class ReflectionHandler:
                             suggestion['existing_code'] = ""
                 except Exception as e:
                     get_logger().error(f"Error processing suggestion {i + 1}, error: {e}")
+
+
+def get_suggestion_key(suggestion: Dict) -> tuple:
+    """
+    Identifies a suggestion by its file, line range and (whitespace-normalized) code, to find the same suggestion
+    returned by several chunks.
+    """
+    code = "\n".join(" ".join(str(suggestion.get(key, "")).split()) for key in ("existing_code", "improved_code"))
+    return (str(suggestion.get("relevant_file", "")).strip(),
+            suggestion.get("relevant_lines_start"), suggestion.get("relevant_lines_end"),
+            hashlib.sha1(code.encode()).hexdigest())
+
+
+def filter_diff_by_files(patches_diff: str, filenames: set) -> str:
+    """
+    Keeps the sections ('## File: ...') of `patches_diff` of the given files. The full diff is returned when one of
+    the files has no section.
+    """
+    sections = {}
+    matches = list(RE_FILE_SECTION.finditer(patches_diff))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(patches_diff)
+        sections[match.group(1).strip()] = patches_diff[match.start():end].strip()
+    if not filenames or not filenames.issubset(sections):
+        return patches_diff
+    return "\n\n\n".join(section for filename, section in sections.items() if filename in filenames)
+
+
+class ReflectionBatcher:
+    """
+    Self-reflects on the suggestions of several chunks together, instead of one reflection call per chunk.
+    Chunks are added as their predictions arrive: suggestions already seen in a previous chunk are dropped, and
+    the remaining ones join the current batch, with the diff of the files they refer to. A batch is sent as soon as
+    the next chunk would exceed the token budget of the reflection model (while the other predictions are still
+    running), and the last one by `wait`.
+    """
+
+    def __init__(self, reflection_handler: ReflectionHandler, model: str):
+        self.reflection_handler = reflection_handler
+        self.model = model
+        self.token_handler = reflection_handler.core.token_handler
+        prompt = get_settings().pr_code_suggestions_reflect_prompt
+        self.max_batch_tokens = (get_max_tokens(model) - OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD -
+                                 self.token_handler.count_tokens(prompt.system + prompt.user))
+        self.seen = set()
+        self.suggestions = []
+        self.diffs = []
+        self.tokens = 0
+        self.tasks = []
+
+    def add(self, suggestions: List[Dict], patches_diff: str):
+        """
+        Adds the suggestions of a chunk, removing (in place) the ones already added by a previous chunk.
+        """
+        unique_suggestions = []
+        for suggestion in suggestions:
+            key = get_suggestion_key(suggestion)
+            if key in self.seen:
+                get_logger().debug(f"Skipping a duplicate suggestion", artifact={"suggestion": suggestion})
+                continue
+            self.seen.add(key)
+            unique_suggestions.append(suggestion)
+        suggestions[:] = unique_suggestions
+        if not unique_suggestions:
+            return
+
+        diff = filter_diff_by_files(patches_diff, {str(s["relevant_file"]).strip() for s in unique_suggestions})
+        tokens = self.token_handler.count_tokens(diff) + \
+            self.token_handler.count_tokens("\n\n".join(str(s) for s in unique_suggestions))
+        if self.suggestions and self.tokens + tokens > self.max_batch_tokens:
+            self._send()
+        self.suggestions.extend(unique_suggestions)
+        self.diffs.append(diff)
+        self.tokens += tokens
+
+    def _send(self):
+        if self.suggestions:
+            data = {"code_suggestions": self.suggestions}
+            self.tasks.append(asyncio.ensure_future(
+                self.reflection_handler.score_suggestions(data, "\n\n\n".join(self.diffs), self.model)))
+        self.suggestions, self.diffs, self.tokens = [], [], 0
+
+    async def wait(self):
+        self._send()
+        get_logger().info(f"Self-reflected on the suggestions in {len(self.tasks)} calls")
+        await asyncio.gather(*self.tasks)
+
+    def cancel(self):
+        for task in self.tasks:
+            task.cancel()
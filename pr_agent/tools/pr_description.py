@@ -3,7 +3,7 @@ import copy
 import re
 import traceback
 from functools import partial
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 import yaml
 from jinja2 import Environment, StrictUndefined
@@ -14,6 +14,7 @@ from pr_agent.algo.pr_processing import (OUTPUT_BUFFER_TOKENS_HARD_THRESHOLD,
                                          get_pr_diff,
                                          get_pr_diff_multiple_patchs,
                                          retry_with_fallback_models)
+from pr_agent.algo.review_cache import FileResultCache, get_prompt_version
 from pr_agent.algo.token_handler import TokenHandler
 from pr_agent.algo.utils import (ModelType, PRDescriptionHeader, clip_tokens,
                                  get_max_tokens, get_user_labels, load_yaml,
@@ -91,6 +92,7 @@ class PRDescription:
         self.patches_diff = None
         self.prediction = None
         self.file_label_dict = None
+        self._parsed_predictions = {}  # prediction string -> load_yaml result, see `_load_yaml`
 
     async def run(self):
         try:
@@ -240,29 +242,15 @@ class PRDescription:
                 self.git_provider, token_handler_only_files_prompt, model)
 
             # get the files prediction for each patch
-            if not get_settings().pr_description.async_ai_calls:
-                results = []
-                for i, patches in enumerate(patches_compressed_list):  # sync calls
-                    patches_diff = "\n".join(patches)
-                    get_logger().debug(f"PR diff number {i + 1} for describe files")
-                    prediction_files = await self._get_prediction(model, patches_diff,
-                                                                  prompt="pr_description_only_files_prompts")
-                    results.append(prediction_files)
-            else:  # async calls
-                tasks = []
-                for i, patches in enumerate(patches_compressed_list):
-                    if patches:
-                        patches_diff = "\n".join(patches)
-                        get_logger().debug(f"PR diff number {i + 1} for describe files")
-                        task = asyncio.create_task(
-                            self._get_prediction(model, patches_diff, prompt="pr_description_only_files_prompts"))
-                        tasks.append(task)
-                # Wait for all tasks to complete
-                results = await asyncio.gather(*tasks)
+            results = await self._get_files_predictions(model, patches_compressed_list, files_in_patches_list)
             file_description_str_list = []
+            pr_files = []  # the merged file table, kept parsed until the final prediction
             for i, result in enumerate(results):
                 prediction_files = result.strip().removeprefix('```yaml').strip('`').strip()
-                if load_yaml(prediction_files, keys_fix_yaml=self.keys_fix) and prediction_files.startswith('pr_files'):
+                prediction_files_loaded = self._load_yaml(prediction_files)
+                if (isinstance(prediction_files_loaded, dict) and prediction_files.startswith('pr_files') and
+                        isinstance(prediction_files_loaded.get('pr_files'), list)):
+                    pr_files.extend(file for file in prediction_files_loaded['pr_files'] if isinstance(file, dict))
                     prediction_files = prediction_files.removeprefix('pr_files:').strip()
                     file_description_str_list.append(prediction_files)
                 else:
@@ -310,112 +298,152 @@ class PRDescription:
             prediction_headers = prediction_headers.strip().removeprefix('```yaml').strip('`').strip()
 
             # extend the tables with the files not shown
-            files_walkthrough_extended = await self.extend_uncovered_files(files_walkthrough)
+            pr_files.extend(self._get_uncovered_files(pr_files))
 
             # final processing
-            self.prediction = prediction_headers + "\n" + "pr_files:\n" + files_walkthrough_extended
-            if not load_yaml(self.prediction, keys_fix_yaml=self.keys_fix):
+            prediction_headers_loaded = self._load_yaml(prediction_headers)
+            if isinstance(prediction_headers_loaded, dict):
+                prediction_headers_loaded['pr_files'] = pr_files
+                self.prediction = self._dump_yaml(prediction_headers_loaded, sort_keys=False)
+            else:
                 get_logger().error(f"Error getting valid YAML in large PR handling for describe {self.pr_id}")
-                if load_yaml(prediction_headers, keys_fix_yaml=self.keys_fix):
-                    get_logger().debug(f"Using only headers for describe {self.pr_id}")
-                    self.prediction = prediction_headers
+                self.prediction = prediction_headers
 
-    async def extend_uncovered_files(self, original_prediction: str) -> str:
+    async def _get_files_predictions(self, model: str, patches_compressed_list: List[List[str]],
+                                     files_in_patches_list: List[List[str]]) -> List[str]:
+        """
+        Gets the files prediction for each patch (large PR handling).
+        With `pr_description.reuse_unchanged_file_summaries`, the summary of each file is cached by the file version,
+        and only the patches with a changed file are sent to the model again; the others are assembled from the cache.
+        """
+        file_cache = self._get_file_summaries_cache(model)
+        diff_files = {file.filename: file for file in self.git_provider.get_diff_files()} if file_cache else {}
+        results = [None] * len(patches_compressed_list)
+        patches_to_predict = []
+        for i, patches in enumerate(patches_compressed_list):
+            if not patches and get_settings().pr_description.async_ai_calls:
+                continue
+            if file_cache:
+                cached_files = [file_cache.get(diff_files[filename]) if filename in diff_files else None
+                                for filename in files_in_patches_list[i]]
+                if cached_files and all(cached_files):
+                    get_logger().debug(f"Reusing the cached summaries of the files of PR diff number {i + 1}")
+                    results[i] = yaml.dump({'pr_files': cached_files}, sort_keys=False)
+                    continue
+            patches_to_predict.append(i)
+
+        async def predict(i: int) -> str:
+            get_logger().debug(f"PR diff number {i + 1} for describe files")
+            return await self._get_prediction(model, "\n".join(patches_compressed_list[i]),
+                                              prompt="pr_description_only_files_prompts")
+
+        if not get_settings().pr_description.async_ai_calls:
+            for i in patches_to_predict:  # sync calls
+                results[i] = await predict(i)
+        else:  # async calls
+            for i, prediction_files in zip(patches_to_predict, await asyncio.gather(*[predict(i) for i in patches_to_predict])):
+                results[i] = prediction_files
+
+        if file_cache:
+            for i in patches_to_predict:
+                self._cache_file_summaries(file_cache, results[i],
+                                           [diff_files[filename] for filename in files_in_patches_list[i] if filename in diff_files])
+        return [result for result in results if result is not None]
+
+    def _get_file_summaries_cache(self, model: str) -> Optional[FileResultCache]:
+        if not get_settings().pr_description.get("reuse_unchanged_file_summaries", False):
+            return None
+        repo = str(getattr(self.git_provider, "repo", "") or self.pr_id)
+        prompt_version = get_prompt_version(model, ["pr_description_only_files_prompts"],
+                                            ["pr_description", "custom_labels"])
+        return FileResultCache("describe_files", repo, prompt_version)
+
+    def _cache_file_summaries(self, file_cache: FileResultCache, prediction_files: str, files: list):
         try:
-            prediction = original_prediction
+            prediction_files = prediction_files.strip().removeprefix('```yaml').strip('`').strip()
+            prediction = load_yaml(prediction_files, keys_fix_yaml=self.keys_fix)
+            if not isinstance(prediction, dict) or not isinstance(prediction.get('pr_files'), list):
+                return
+            summaries = {str(file_summary.get('filename', '')).strip(): file_summary
+                         for file_summary in prediction['pr_files'] if isinstance(file_summary, dict)}
+            for file in files:
+                if file.filename.strip() in summaries:
+                    file_cache.set(file, summaries[file.filename.strip()])
+        except Exception as e:
+            get_logger().warning(f"Failed to cache the file summaries of {self.pr_id}, error: {e}")
 
-            # get the original prediction filenames
-            original_prediction_loaded = load_yaml(original_prediction, keys_fix_yaml=self.keys_fix)
+    def _load_yaml(self, prediction: str):
+        """
+        `load_yaml` memoized per prediction string, as the same prediction is parsed by several steps (merging the
+        file tables, validation, `_prepare_data`). Returns a copy, so callers can modify it.
+        """
+        if prediction not in self._parsed_predictions:
+            self._parsed_predictions[prediction] = load_yaml(prediction, keys_fix_yaml=self.keys_fix)
+        return copy.deepcopy(self._parsed_predictions[prediction])
+
+    def _dump_yaml(self, data, sort_keys: bool = True) -> str:
+        """
+        Serializes a merged prediction, keeping its parsed form for `_load_yaml`.
+        """
+        prediction = yaml.dump(data, sort_keys=sort_keys)
+        self._parsed_predictions[prediction.strip()] = copy.deepcopy(data)  # as loaded by `_prepare_data`
+        return prediction
+
+    def _get_uncovered_files(self, pr_files: list) -> list:
+        """
+        The file table entries of the PR files that are not in `pr_files`, up to MAX_EXTRA_FILES_TO_OUTPUT files.
+        """
+        filenames_predicted = {str(file.get('filename', '')).strip() for file in pr_files if isinstance(file, dict)}
+        MAX_EXTRA_FILES_TO_OUTPUT = 100
+        extra_files = []
+        for file in self.git_provider.get_diff_files():
+            if file.filename in filenames_predicted:
+                continue
+
+            # add up to MAX_EXTRA_FILES_TO_OUTPUT files
+            if len(extra_files) >= MAX_EXTRA_FILES_TO_OUTPUT:
+                extra_files.append({'filename': "Additional files not shown\n", 'changes_title': "...\n",
+                                    'label': "additional files\n"})
+                get_logger().debug(f"Too many remaining files, clipping to {MAX_EXTRA_FILES_TO_OUTPUT}")
+                break
+            extra_files.append({'filename': f"{file.filename}\n", 'changes_title': "...\n",
+                                'label': "additional files\n"})
+        if extra_files:
+            get_logger().info(f"Adding {len(extra_files)} unprocessed extra files to table prediction")
+        return extra_files
+
+    async def extend_uncovered_files(self, original_prediction: str) -> str:
+        try:
+            # get the original prediction files
+            original_prediction_loaded = self._load_yaml(original_prediction)
             if isinstance(original_prediction_loaded, list):
                 original_prediction_dict = {"pr_files": original_prediction_loaded}
             else:
                 original_prediction_dict = original_prediction_loaded
-            if original_prediction_dict:
-                files = original_prediction_dict.get('pr_files', [])
-                filenames_predicted = [file.get('filename', '').strip() for file in files if isinstance(file, dict)]
-            else:
-                filenames_predicted = []
+            if not original_prediction_dict or not isinstance(original_prediction_dict, dict):
+                return original_prediction
 
             # extend the prediction with additional files not included in the original prediction
-            pr_files = self.git_provider.get_diff_files()
-            prediction_extra = "pr_files:"
-            MAX_EXTRA_FILES_TO_OUTPUT = 100
-            counter_extra_files = 0
-            for file in pr_files:
-                if file.filename in filenames_predicted:
-                    continue
-
-                # add up to MAX_EXTRA_FILES_TO_OUTPUT files
-                counter_extra_files += 1
-                if counter_extra_files > MAX_EXTRA_FILES_TO_OUTPUT:
-                    extra_file_yaml = f"""\
-- filename: |
-    Additional files not shown
-  changes_title: |
-    ...
-  label: |
-    additional files
-"""
-                    prediction_extra = prediction_extra + "\n" + extra_file_yaml.strip()
-                    get_logger().debug(f"Too many remaining files, clipping to {MAX_EXTRA_FILES_TO_OUTPUT}")
-                    break
-
-                extra_file_yaml = f"""\
-- filename: |
-    {file.filename}
-  changes_title: |
-    ...
-  label: |
-    additional files
-"""
-                prediction_extra = prediction_extra + "\n" + extra_file_yaml.strip()
-
-            # merge the two dictionaries
-            if counter_extra_files > 0:
-                get_logger().info(f"Adding {counter_extra_files} unprocessed extra files to table prediction")
-                prediction_extra_dict = load_yaml(prediction_extra, keys_fix_yaml=self.keys_fix)
-                if original_prediction_dict and isinstance(original_prediction_dict, dict) and \
-                        isinstance(prediction_extra_dict, dict) and "pr_files" in prediction_extra_dict:
-                    if "pr_files" in original_prediction_dict:
-                        original_prediction_dict["pr_files"].extend(prediction_extra_dict["pr_files"])
-                    else:
-                        original_prediction_dict["pr_files"] = prediction_extra_dict["pr_files"]
-                    new_yaml = yaml.dump(original_prediction_dict)
-                    if load_yaml(new_yaml, keys_fix_yaml=self.keys_fix):
-                        prediction = new_yaml
-                if isinstance(original_prediction, list):
-                    prediction = yaml.dump(original_prediction_dict["pr_files"])
-
-            return prediction
+            files = original_prediction_dict.get('pr_files') or []
+            extra_files = self._get_uncovered_files(files)
+            if not extra_files:
+                return original_prediction
+            original_prediction_dict["pr_files"] = files + extra_files
+            return self._dump_yaml(original_prediction_dict)
         except Exception as e:
             get_logger().exception(f"Error extending uncovered files {self.pr_id}", artifact={"error": e})
             return original_prediction
 
-
     async def extend_additional_files(self, remaining_files_list) -> str:
         prediction = self.prediction
         try:
-            original_prediction_dict = load_yaml(self.prediction, keys_fix_yaml=self.keys_fix)
-            prediction_extra = "pr_files:"
-            for file in remaining_files_list:
-                extra_file_yaml = f"""\
-- filename: |
-    {file}
-  changes_summary: |
-    ...
-  changes_title: |
-    ...
-  label: |
-    additional files (token-limit)
-"""
-                prediction_extra = prediction_extra + "\n" + extra_file_yaml.strip()
-            prediction_extra_dict = load_yaml(prediction_extra, keys_fix_yaml=self.keys_fix)
+            original_prediction_dict = self._load_yaml(self.prediction)
             # merge the two dictionaries
-            if isinstance(original_prediction_dict, dict) and isinstance(prediction_extra_dict, dict):
-                original_prediction_dict["pr_files"].extend(prediction_extra_dict["pr_files"])
-                new_yaml = yaml.dump(original_prediction_dict)
-                if load_yaml(new_yaml, keys_fix_yaml=self.keys_fix):
-                    prediction = new_yaml
+            if isinstance(original_prediction_dict, dict):
+                original_prediction_dict["pr_files"].extend(
+                    {'filename': f"{file}\n", 'changes_summary': "...\n", 'changes_title': "...\n",
+                     'label': "additional files (token-limit)\n"} for file in remaining_files_list)
+                prediction = self._dump_yaml(original_prediction_dict)
             return prediction
         except Exception as e:
             get_logger().error(f"Error extending additional files {self.pr_id}: {e}")
@@ -443,7 +471,7 @@ class PRDescription:
 
     def _prepare_data(self):
         # Load the AI prediction data into a dictionary
-        self.data = load_yaml(self.prediction.strip(), keys_fix_yaml=self.keys_fix)
+        self.data = self._load_yaml(self.prediction.strip())
 
         if get_settings().pr_description.add_original_user_description and self.user_description:
             self.data["User Description"] = self.user_description
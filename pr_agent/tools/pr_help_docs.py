@@ -10,6 +10,9 @@ from jinja2 import Environment, StrictUndefined
 from pr_agent.algo import MAX_TOKENS
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
 from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
+from pr_agent.algo.docs_index import (DEFAULT_INDEX_DIR, DocsIndex,
+                                      get_file_blob_shas, get_head_commit,
+                                      split_into_sections)
 from pr_agent.algo.pr_processing import retry_with_fallback_models
 from pr_agent.algo.token_handler import TokenHandler
 from pr_agent.algo.utils import (ModelType, clip_tokens, get_max_tokens,
@@ -147,7 +150,7 @@ def map_documentation_files_to_contents(base_path: str, doc_files: list[str], ma
 # as to help the LLM to give a better answer.
 def aggregate_documentation_files_for_prompt_contents(file_path_to_contents: dict[str, str], return_just_headings=False) -> str:
     try:
-        docs_prompt = ""
+        docs_prompt_parts = []
         for idx, file_path in enumerate(file_path_to_contents):
             file_contents = file_path_to_contents[file_path].strip()
             if not file_contents:
@@ -156,13 +159,13 @@ def aggregate_documentation_files_for_prompt_contents(file_path_to_contents: dic
             if return_just_headings:
                 file_headings = return_document_headings(file_contents, os.path.splitext(file_path)[-1]).strip()
                 if file_headings:
-                    docs_prompt += f"\n==file name==\n\n{file_path}\n\n==index==\n\n{idx}\n\n==file headings==\n\n{file_headings}\n=========\n\n"
+                    docs_prompt_parts.append(f"\n==file name==\n\n{file_path}\n\n==index==\n\n{idx}\n\n==file headings==\n\n{file_headings}\n=========\n\n")
                 else:
                     get_logger().warning(f"No headers for: {file_path}. Will only use filename")
-                    docs_prompt += f"\n==file name==\n\n{file_path}\n\n==index==\n\n{idx}\n\n"
+                    docs_prompt_parts.append(f"\n==file name==\n\n{file_path}\n\n==index==\n\n{idx}\n\n")
             else:
-                docs_prompt += f"\n==file name==\n\n{file_path}\n\n==file content==\n\n{file_contents}\n=========\n\n"
-        return docs_prompt
+                docs_prompt_parts.append(f"\n==file name==\n\n{file_path}\n\n==file content==\n\n{file_contents}\n=========\n\n")
+        return "".join(docs_prompt_parts)
     except Exception as e:
         get_logger().exception(f"Unexpected exception thrown. Returning empty result.")
         return ""
@@ -333,28 +336,12 @@ class PRHelpDocs(object):
             return None
 
         try:
-            # Clone the repository and gather relevant documentation files.
-            docs_filepath_to_contents = self._gen_filenames_to_contents_map_from_repo()
-
-            #Generate prompt for the AI model. This will be the full text of all the documentation files combined.
-            docs_prompt = aggregate_documentation_files_for_prompt_contents(docs_filepath_to_contents)
-            if not docs_filepath_to_contents or not docs_prompt:
-                get_logger().warning(f"Could not find any usable documentation. Returning with no result...")
-                return None
-            docs_prompt_to_send_to_model = docs_prompt
-
-            # Estimate how many tokens will be needed.
-            # In case the expected number of tokens exceeds LLM limits, retry with just headings, asking the LLM to rank according to relevance to the question.
-            # Based on returned ranking, rerun but sort the documents accordingly, this time, trim in case of exceeding limit.
-
-            #First, check if the text is not too long to even query the LLM provider:
             max_allowed_txt_input = get_maximal_text_input_length_for_token_count_estimation()
-            invoke_llm_just_with_headings = self._trim_docs_input(docs_prompt_to_send_to_model, max_allowed_txt_input,
-                                                                  only_return_if_trim_needed=True)
-            if invoke_llm_just_with_headings:
-                #Entire docs is too long. Rank and return according to relevance.
-                docs_prompt_to_send_to_model = await self._rank_docs_and_return_them_as_prompt(docs_filepath_to_contents,
-                                                                                         max_allowed_txt_input)
+            if get_settings().get('PR_HELP_DOCS.USE_DOCS_INDEX', False):
+                # Pre-select the sections most relevant to the question with the local docs index
+                docs_prompt_to_send_to_model = self._gen_docs_prompt_from_index(max_allowed_txt_input)
+            else:
+                docs_prompt_to_send_to_model = await self._gen_docs_prompt_from_all_files(max_allowed_txt_input)
 
             if not docs_prompt_to_send_to_model:
                 get_logger().error("Failed to generate docs prompt for model. Returning with no result...")
@@ -394,6 +381,34 @@ class PRHelpDocs(object):
         except Exception as e:
             get_logger().exception('failed to provide answer to given user question as a result of a thrown exception (see above)')
 
+    async def _gen_docs_prompt_from_all_files(self, max_allowed_txt_input: int) -> str:
+        try:
+            # Clone the repository and gather relevant documentation files.
+            docs_filepath_to_contents = self._gen_filenames_to_contents_map_from_repo()
+
+            #Generate prompt for the AI model. This will be the full text of all the documentation files combined.
+            docs_prompt = aggregate_documentation_files_for_prompt_contents(docs_filepath_to_contents)
+            if not docs_filepath_to_contents or not docs_prompt:
+                get_logger().warning(f"Could not find any usable documentation. Returning with no result...")
+                return ""
+            docs_prompt_to_send_to_model = docs_prompt
+
+            # Estimate how many tokens will be needed.
+            # In case the expected number of tokens exceeds LLM limits, retry with just headings, asking the LLM to rank according to relevance to the question.
+            # Based on returned ranking, rerun but sort the documents accordingly, this time, trim in case of exceeding limit.
+
+            #First, check if the text is not too long to even query the LLM provider:
+            invoke_llm_just_with_headings = self._trim_docs_input(docs_prompt_to_send_to_model, max_allowed_txt_input,
+                                                                  only_return_if_trim_needed=True)
+            if invoke_llm_just_with_headings:
+                #Entire docs is too long. Rank and return according to relevance.
+                docs_prompt_to_send_to_model = await self._rank_docs_and_return_them_as_prompt(docs_filepath_to_contents,
+                                                                                         max_allowed_txt_input)
+            return docs_prompt_to_send_to_model
+        except Exception as e:
+            get_logger().exception(f"Unexpected exception thrown. Returning empty result.")
+            return ""
+
     def _find_all_document_files_matching_exts(self, abs_docs_path: str, ignore_readme=False, max_allowed_files=5000) -> list[str]:
         try:
             matching_files = []
@@ -419,6 +434,26 @@ class PRHelpDocs(object):
             get_logger().exception(f"Unexpected exception thrown. Returning empty list.")
             return []
 
+    def _find_doc_files(self, repo_root: str) -> list[str]:
+        get_logger().debug(f"About to gather relevant documentation files...")
+        doc_files = []
+        if self.include_root_readme_file:
+            for root, _, files in os.walk(repo_root):
+                # Only look at files in the root directory, not subdirectories
+                if root == repo_root:
+                    for file in files:
+                        if file.lower().startswith("readme."):
+                            doc_files.append(os.path.join(root, file))
+        abs_docs_path = os.path.join(repo_root, self.docs_path)
+        if os.path.exists(abs_docs_path):
+            doc_files.extend(self._find_all_document_files_matching_exts(abs_docs_path,
+                                                                         ignore_readme=(self.docs_path=='.')))
+            if not doc_files:
+                get_logger().warning(f"No documentation files found matching file extensions: "
+                                     f"{self.supported_doc_exts} under repo: {self.repo_url} "
+                                     f"path: {self.docs_path}. Returning empty list.")
+        return doc_files
+
     def _gen_filenames_to_contents_map_from_repo(self) -> dict[str, str]:
         try:
             with TemporaryDirectory() as tmp_dir:
@@ -427,24 +462,9 @@ class PRHelpDocs(object):
                 if not returned_cloned_repo_root:
                     raise Exception(f"Failed to clone {self.repo_url} to {tmp_dir}")
 
-                get_logger().debug(f"About to gather relevant documentation files...")
-                doc_files = []
-                if self.include_root_readme_file:
-                    for root, _, files in os.walk(returned_cloned_repo_root.path):
-                        # Only look at files in the root directory, not subdirectories
-                        if root == returned_cloned_repo_root.path:
-                            for file in files:
-                                if file.lower().startswith("readme."):
-                                    doc_files.append(os.path.join(root, file))
-                abs_docs_path = os.path.join(returned_cloned_repo_root.path, self.docs_path)
-                if os.path.exists(abs_docs_path):
-                    doc_files.extend(self._find_all_document_files_matching_exts(abs_docs_path,
-                                                                                 ignore_readme=(self.docs_path=='.')))
-                    if not doc_files:
-                        get_logger().warning(f"No documentation files found matching file extensions: "
-                                             f"{self.supported_doc_exts} under repo: {self.repo_url} "
-                                             f"path: {self.docs_path}. Returning empty dict.")
-                        return {}
+                doc_files = self._find_doc_files(returned_cloned_repo_root.path)
+                if not doc_files:
+                    return {}
 
                 get_logger().info(f'For context {self.ctx_url} and repo: {self.repo_url}'
                                   f' will be using the following documentation files: ',
@@ -455,6 +475,77 @@ class PRHelpDocs(object):
             get_logger().exception(f"Unexpected exception thrown. Returning empty dict.")
             return {}
 
+    def _update_docs_index(self) -> DocsIndex | None:
+        """
+        Brings the local docs index of the repo to the cloned commit, loading only the files changed since the
+        indexed commit. When the remote head is still the indexed commit, the repo is not cloned at all.
+        """
+        try:
+            index_dir = get_settings().get('PR_HELP_DOCS.DOCS_INDEX_PATH', DEFAULT_INDEX_DIR) or DEFAULT_INDEX_DIR
+            docs_settings = {'docs_path': self.docs_path, 'supported_doc_exts': list(self.supported_doc_exts),
+                             'include_root_readme_file': self.include_root_readme_file,
+                             'branch': self.repo_desired_branch}
+            index = DocsIndex.load(DocsIndex.get_index_path(os.path.expanduser(index_dir), self.repo_url, docs_settings))
+            if index.commit and self.git_provider.get_remote_commit(self.repo_url) == index.commit:
+                get_logger().debug(f"Docs index of {self.repo_url} is up to date with remote commit {index.commit}")
+                return index
+            with TemporaryDirectory() as tmp_dir:
+                get_logger().debug(f"About to clone repository: {self.repo_url} to temporary directory: {tmp_dir}...")
+                returned_cloned_repo_root = self.git_provider.clone(self.repo_url, tmp_dir, remove_dest_folder=False)
+                if not returned_cloned_repo_root:
+                    raise Exception(f"Failed to clone {self.repo_url} to {tmp_dir}")
+                repo_root = returned_cloned_repo_root.path
+                commit = get_head_commit(repo_root)
+                if commit and commit == index.commit:
+                    get_logger().debug(f"Docs index of {self.repo_url} is up to date with commit {commit}")
+                    return index
+
+                doc_files = self._find_doc_files(repo_root)
+                # the index is keyed by the file path as given in the prompt
+                file_shas = {str(file).replace(str(repo_root), ''): sha
+                             for file, sha in get_file_blob_shas(repo_root, doc_files).items()}
+
+                def load_sections(file_path: str) -> list[dict]:
+                    with open(str(repo_root) + file_path, 'r', encoding='utf-8') as f:
+                        content = f.read()
+                    if not re.search(r'[a-zA-Z]', content):
+                        return []
+                    return split_into_sections(clean_markdown_content(content), os.path.splitext(file_path)[-1])
+
+                num_loaded = index.update(commit, file_shas, load_sections)
+                get_logger().info(f"Updated the docs index of {self.repo_url} to commit {commit}",
+                                  artifact={'num_files': len(file_shas), 'num_loaded_files': num_loaded})
+            if commit:
+                index.save()
+            return index
+        except Exception as e:
+            get_logger().exception(f"Unexpected exception thrown. Returning no index.")
+            return None
+
+    def _gen_docs_prompt_from_index(self, max_allowed_txt_input: int) -> str:
+        try:
+            index = self._update_docs_index()
+            if not index or not index.sections:
+                get_logger().warning(f"Could not find any usable documentation. Returning with no result...")
+                return ""
+            top_k = get_settings().get('PR_HELP_DOCS.DOCS_INDEX_TOP_K', 30)
+            sections = index.search(self.question, top_k=top_k)
+            if not sections:
+                get_logger().warning(f"No documentation section matches the question. Returning with no result...")
+                return ""
+            # group the selected sections by file, most relevant file first
+            selected_docs_dict = {}
+            for section in sections:
+                selected_docs_dict.setdefault(section['file'], []).append(section['text'])
+            get_logger().debug(f"Pre-selected {len(sections)} documentation sections",
+                               artifact={'sections': [(section['file'], section['heading']) for section in sections]})
+            docs_prompt = aggregate_documentation_files_for_prompt_contents(
+                {file_path: "\n\n".join(texts) for file_path, texts in selected_docs_dict.items()})
+            return self._trim_docs_input(docs_prompt, max_allowed_txt_input, only_return_if_trim_needed=False)
+        except Exception as e:
+            get_logger().exception(f"Unexpected exception thrown. Returning empty result.")
+            return ""
+
     def _trim_docs_input(self, docs_input: str, max_allowed_txt_input: int, only_return_if_trim_needed=False) -> bool|str:
         try:
             if len(docs_input) >= max_allowed_txt_input:
@@ -5,6 +5,7 @@ from collections import OrderedDict
 from functools import partial
 from typing import List, Tuple
 
+import yaml
 from jinja2 import Environment, StrictUndefined
 
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
@@ -12,6 +13,8 @@ from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
 from pr_agent.algo.pr_processing import (add_ai_metadata_to_diff_files,
                                          get_pr_diff,
                                          retry_with_fallback_models)
+from pr_agent.algo.review_cache import (ReviewFileCache,
+                                        get_review_prompt_version)
 from pr_agent.algo.token_handler import TokenHandler
 from pr_agent.algo.utils import (ModelType, PRReviewHeader,
                                  convert_to_markdown_v2, github_action_output,
@@ -63,6 +66,9 @@ class PRReviewer:
         self.ai_handler.main_pr_language = self.main_language
         self.patches_diff = None
         self.prediction = None
+        self.review_file_cache = None
+        self.reviewed_files = None
+        self.cached_findings = {}
         answer_str, question_str = self._get_user_answers()
         self.pr_description, self.pr_description_files = (
             self.git_provider.get_pr_description(split_changes_walkthrough=True))
@@ -187,11 +193,20 @@ class PRReviewer:
         return get_settings().pr_reviewer.get('publish_output_no_suggestions', True) or "No major issues detected" not in pr_review
 
     async def _prepare_prediction(self, model: str) -> None:
+        files_to_review = self._get_files_to_review(model)
+        if files_to_review == []:
+            # no file changed since the cached review
+            get_logger().info(f"All the files of {self.pr_url} were reviewed already, reusing the cached review")
+            self.patches_diff = None
+            self.prediction = yaml.dump({'review': self.review_file_cache.get_review()}, sort_keys=False)
+            return
+
         self.patches_diff = get_pr_diff(self.git_provider,
                                         self.token_handler,
                                         model,
                                         add_line_numbers_to_hunks=True,
-                                        disable_extra_lines=False,)
+                                        disable_extra_lines=False,
+                                        files=files_to_review)
 
         if self.patches_diff:
             get_logger().debug(f"PR diff", diff=self.patches_diff)
@@ -200,6 +215,85 @@ class PRReviewer:
             get_logger().warning(f"Empty diff for PR: {self.pr_url}")
             self.prediction = None
 
+    def _get_files_to_review(self, model: str):
+        """
+        With `pr_reviewer.reuse_unchanged_file_findings`, returns the files that changed since they were last reviewed
+        (the findings of the other files are kept in `self.cached_findings`), or None to review all the files.
+        """
+        self.review_file_cache, self.reviewed_files, self.cached_findings = None, None, {}
+        if not get_settings().pr_reviewer.get("reuse_unchanged_file_findings", False) or self.incremental.is_incremental:
+            return None
+        try:
+            repo = str(getattr(self.git_provider, "repo", "") or self.pr_url)
+            self.review_file_cache = ReviewFileCache(repo, self.pr_url, get_review_prompt_version(model))
+            diff_files = self.git_provider.get_diff_files()
+            changed_files, cached_findings = self.review_file_cache.split_files(diff_files)
+            if not cached_findings or (not changed_files and self.review_file_cache.get_review() is None):
+                self.reviewed_files = diff_files
+                return None
+            get_logger().info(f"Reviewing {len(changed_files)} changed files out of {len(diff_files)}, "
+                              f"reusing the findings of the others")
+            self.reviewed_files, self.cached_findings = changed_files, cached_findings
+            return changed_files
+        except Exception as e:
+            get_logger().error(f"Failed to get the cached review findings, error: {e}")
+            self.review_file_cache, self.reviewed_files, self.cached_findings = None, None, {}
+            return None
+
+    def _merge_cached_findings(self, review: dict):
+        """
+        Caches the findings of the reviewed files and the review, and adds the cached findings of the other files.
+        """
+        try:
+            key_issues = review.get('key_issues_to_review') or []
+            if not isinstance(key_issues, list):
+                return
+            if self.patches_diff:
+                # files pruned from a large diff were not reviewed
+                reviewed_files = [file for file in self.reviewed_files if f"## File: '{file.filename.strip()}'" in self.patches_diff]
+                self.review_file_cache.store_findings(reviewed_files, key_issues)
+                if self.cached_findings:
+                    self._merge_cached_review(review)
+                self.review_file_cache.store_review(review)
+            for findings in self.cached_findings.values():
+                key_issues.extend(findings)
+            if key_issues or 'key_issues_to_review' in review:
+                review['key_issues_to_review'] = key_issues
+        except Exception as e:
+            get_logger().error(f"Failed to merge the cached review findings, error: {e}")
+
+    def _merge_cached_review(self, review: dict):
+        """
+        The effort, score and security concerns of a partial re-review only cover the changed files: keeps the highest
+        effort and the lowest score of the cached review of the PR and the new one, and the security concerns of both.
+        """
+        cached_review = self.review_file_cache.get_review()
+        if not cached_review:
+            return
+
+        def leading_int(value):
+            try:
+                return int(str(value).split(',')[0].strip())
+            except ValueError:
+                return None
+
+        def has_concerns(value):
+            return bool(value) and not str(value).strip().lower().startswith('no')
+
+        effort_key = 'estimated_effort_to_review_[1-5]'
+        cached_effort, effort = leading_int(cached_review.get(effort_key)), leading_int(review.get(effort_key))
+        if cached_effort is not None and (effort is None or cached_effort > effort):
+            review[effort_key] = cached_review[effort_key]
+        cached_score, score = leading_int(cached_review.get('score')), leading_int(review.get('score'))
+        if cached_score is not None and score is not None and cached_score < score:
+            review['score'] = cached_review['score']
+        cached_concerns, concerns = cached_review.get('security_concerns'), review.get('security_concerns')
+        if has_concerns(cached_concerns) and str(cached_concerns).strip() not in str(concerns):
+            if has_concerns(concerns) and str(concerns).strip() not in str(cached_concerns):
+                review['security_concerns'] = f"{str(concerns).strip()}\n\n{str(cached_concerns).strip()}"
+            else:
+                review['security_concerns'] = cached_concerns
+
     async def _get_prediction(self, model: str) -> str:
         """
         Generate an AI prediction for the pull request review.
@@ -243,6 +337,9 @@ class PRReviewer:
             get_logger().exception("Failed to parse review data", artifact={"data": data})
             return ""
 
+        if self.review_file_cache:
+            self._merge_cached_findings(data['review'])
+
         # move data['review'] 'key_issues_to_review' key to the end of the dictionary
         if 'key_issues_to_review' in data['review']:
             key_issues_to_review = data['review'].pop('key_issues_to_review')
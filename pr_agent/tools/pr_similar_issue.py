@@ -1,18 +1,21 @@
+import hashlib
+import os
 import time
+from datetime import datetime
 from enum import Enum
 from typing import List
 
-import openai
 from pydantic import BaseModel, Field
 
 from pr_agent.algo import MAX_TOKENS
+from pr_agent.algo.embeddings import get_embedding_service
 from pr_agent.algo.token_handler import TokenHandler
 from pr_agent.algo.utils import get_max_tokens
 from pr_agent.config_loader import get_settings
 from pr_agent.git_providers import get_git_provider
 from pr_agent.log import get_logger
 
-MODEL = "text-embedding-ada-002"
+MODEL = "text-embedding-ada-002"  # for the token limit of the embedded texts
 
 
 class PRSimilarIssue:
@@ -32,6 +35,7 @@ class PRSimilarIssue:
         repo_obj = self.git_provider.repo_obj
         repo_name_for_index = self.repo_name_for_index = repo_obj.full_name.lower().replace('/', '-').replace('_/', '-')
         index_name = self.index_name = "codium-ai-pr-agent-issues"
+        self.embedding_service = get_embedding_service()
 
         if get_settings().pr_similar_issue.vectordb == "pinecone":
             try:
@@ -82,33 +86,8 @@ class PRSimilarIssue:
                 get_logger().info('Done')
                 self._update_index_with_issues(issues, repo_name_for_index, upsert=upsert)
             else:  # update index if needed
-                pinecone_index = pinecone.Index(index_name=index_name)
-                issues_to_update = []
-                issues_paginated_list = repo_obj.get_issues(state='all')
-                counter = 1
-                for issue in issues_paginated_list:
-                    if issue.pull_request:
-                        continue
-                    issue_str, comments, number = self._process_issue(issue)
-                    issue_key = f"issue_{number}"
-                    id = issue_key + "." + "issue"
-                    res = pinecone_index.fetch([id]).to_dict()
-                    is_new_issue = True
-                    for vector in res["vectors"].values():
-                        if vector['metadata']['repo'] == repo_name_for_index:
-                            is_new_issue = False
-                            break
-                    if is_new_issue:
-                        counter += 1
-                        issues_to_update.append(issue)
-                    else:
-                        break
-
-                if issues_to_update:
-                    get_logger().info(f'Updating index with {counter} new issues...')
-                    self._update_index_with_issues(issues_to_update, repo_name_for_index, upsert=True)
-                else:
-                    get_logger().info('No new issues to update')
+                store = PineconeIssueIndexStore(pinecone.Index(index_name=index_name), repo_name_for_index)
+                self._sync_index_with_updated_issues(repo_obj, repo_name_for_index, store)
 
         elif get_settings().pr_similar_issue.vectordb == "lancedb":
             try:
@@ -148,32 +127,8 @@ class PRSimilarIssue:
 
                 self._update_table_with_issues(issues, repo_name_for_index, ingest=ingest)
             else:  # update table if needed
-                issues_to_update = []
-                issues_paginated_list = repo_obj.get_issues(state='all')
-                counter = 1
-                for issue in issues_paginated_list:
-                    if issue.pull_request:
-                        continue
-                    issue_str, comments, number = self._process_issue(issue)
-                    issue_key = f"issue_{number}"
-                    issue_id = issue_key + "." + "issue"
-                    res = self.table.search().limit(len(self.table)).where(f"id='{issue_id}'").to_list()
-                    is_new_issue = True
-                    for r in res:
-                        if r['metadata']['repo'] == repo_name_for_index:
-                            is_new_issue = False
-                            break
-                    if is_new_issue:
-                        counter += 1
-                        issues_to_update.append(issue)
-                    else:
-                        break
-
-                if issues_to_update:
-                    get_logger().info(f'Updating index with {counter} new issues...')
-                    self._update_table_with_issues(issues_to_update, repo_name_for_index, ingest=True)
-                else:
-                    get_logger().info('No new issues to update')
+                store = LanceDBIssueIndexStore(self.table, repo_name_for_index)
+                self._sync_index_with_updated_issues(repo_obj, repo_name_for_index, store)
 
         elif get_settings().pr_similar_issue.vectordb == "qdrant":
             try:
@@ -206,7 +161,7 @@ class PRSimilarIssue:
                 ingest = False
                 self.qdrant.create_collection(
                     collection_name=self.index_name,
-                    vectors_config=VectorParams(size=1536, distance=Distance.COSINE),
+                    vectors_config=VectorParams(size=self.embedding_service.dimension, distance=Distance.COSINE),
                 )
             else:
                 if get_settings().pr_similar_issue.force_update_dataset:
@@ -228,34 +183,23 @@ class PRSimilarIssue:
                 get_logger().info('Done')
                 self._update_qdrant_with_issues(issues, repo_name_for_index, ingest=ingest)
             else:
-                issues_to_update = []
-                issues_paginated_list = repo_obj.get_issues(state='all')
-                counter = 1
-                for issue in issues_paginated_list:
-                    if issue.pull_request:
-                        continue
-                    issue_str, comments, number = self._process_issue(issue)
-                    issue_key = f"issue_{number}"
-                    point_id = issue_key + "." + "issue"
-                    response = self.qdrant.count(
-                        collection_name=self.index_name,
-                        count_filter=Filter(must=[
-                            FieldCondition(key="id", match=MatchValue(value=point_id)),
-                            FieldCondition(key="metadata.repo", match=MatchValue(value=repo_name_for_index)),
-                        ]),
-                    )
-                    if response.count == 0:
-                        counter += 1
-                        issues_to_update.append(issue)
-                    else:
-                        break
-
-                if issues_to_update:
-                    get_logger().info(f'Updating index with {counter} new issues...')
-                    self._update_qdrant_with_issues(issues_to_update, repo_name_for_index, ingest=True)
-                else:
-                    get_logger().info('No new issues to update')
+                store = QdrantIssueIndexStore(self.qdrant, self.index_name, repo_name_for_index)
+                self._sync_index_with_updated_issues(repo_obj, repo_name_for_index, store)
+
+        elif get_settings().pr_similar_issue.vectordb == "local":
+            try:
+                from pr_agent.algo.local_vector_index import (
+                    DEFAULT_INDEX_DIR, LocalVectorIndex)
+            except Exception:
+                raise Exception("Please install numpy to use local as vectordb")
+            index_dir = get_settings().get("LOCAL_VECTORDB.PATH", DEFAULT_INDEX_DIR) or DEFAULT_INDEX_DIR
+            self.local_index = LocalVectorIndex(
+                os.path.join(index_dir, repo_name_for_index),
+                ann_threshold=get_settings().get("LOCAL_VECTORDB.ANN_THRESHOLD", 100_000))
 
+            if get_settings().pr_similar_issue.force_update_dataset:
+                self.local_index.clear()
+            self._sync_index_with_updated_issues(repo_obj, repo_name_for_index, LocalIssueIndexStore(self.local_index))
 
     async def run(self):
         if not self.supported:
@@ -276,12 +220,10 @@ class PRSimilarIssue:
         repo_name, original_issue_number = self.git_provider._parse_issue_url(self.issue_url.split('=')[-1])
         issue_main = self.git_provider.repo_obj.get_issue(original_issue_number)
         issue_str, comments, number = self._process_issue(issue_main)
-        openai.api_key = get_settings().openai.key
         get_logger().info('Done')
 
         get_logger().info('Querying...')
-        res = openai.Embedding.create(input=[issue_str], engine=MODEL)
-        embeds = [record['embedding'] for record in res['data']]
+        embeds = self._embed_texts([issue_str])
 
         relevant_issues_number_list = []
         relevant_comment_number_list = []
@@ -372,6 +314,26 @@ class PRSimilarIssue:
                 score_list.append(str("{:.2f}".format(r.score)))
             get_logger().info('Done')
 
+        elif get_settings().pr_similar_issue.vectordb == "local":
+            res = self.local_index.search(embeds[0], top_k=5)
+
+            for r in res:
+                try:
+                    issue_number = int(r["id"].split('.')[0].split('_')[-1])
+                except Exception:
+                    get_logger().debug(f"Failed to parse issue number from {r['id']}")
+                    continue
+                if original_issue_number == issue_number:
+                    continue
+                if issue_number not in relevant_issues_number_list:
+                    relevant_issues_number_list.append(issue_number)
+                if 'comment' in r["id"]:
+                    relevant_comment_number_list.append(int(r["id"].split('.')[1].split('_')[-1]))
+                else:
+                    relevant_comment_number_list.append(-1)
+                score_list.append(str("{:.2f}".format(r['score'])))
+            get_logger().info('Done')
+
         get_logger().info('Publishing response...')
         similar_issues_str = "### Similar Issues\n___\n\n"
 
@@ -457,20 +419,7 @@ class PRSimilarIssue:
         get_logger().info('Done')
 
         get_logger().info('Embedding...')
-        openai.api_key = get_settings().openai.key
-        list_to_encode = list(df["text"].values)
-        try:
-            res = openai.Embedding.create(input=list_to_encode, engine=MODEL)
-            embeds = [record['embedding'] for record in res['data']]
-        except:
-            embeds = []
-            get_logger().error('Failed to embed entire list, embedding one by one...')
-            for i, text in enumerate(list_to_encode):
-                try:
-                    res = openai.Embedding.create(input=[text], engine=MODEL)
-                    embeds.append(res['data'][0]['embedding'])
-                except:
-                    embeds.append([0] * 1536)
+        embeds = self._embed_texts(list(df["text"].values))
         df["values"] = embeds
         meta = DatasetMetadata.empty()
         meta.dense_model.dimension = len(embeds[0])
@@ -553,20 +502,7 @@ class PRSimilarIssue:
         get_logger().info('Done')
 
         get_logger().info('Embedding...')
-        openai.api_key = get_settings().openai.key
-        list_to_encode = list(df["text"].values)
-        try:
-            res = openai.Embedding.create(input=list_to_encode, engine=MODEL)
-            embeds = [record['embedding'] for record in res['data']]
-        except:
-            embeds = []
-            get_logger().error('Failed to embed entire list, embedding one by one...')
-            for i, text in enumerate(list_to_encode):
-                try:
-                    res = openai.Embedding.create(input=[text], engine=MODEL)
-                    embeds.append(res['data'][0]['embedding'])
-                except:
-                    embeds.append([0] * 1536)
+        embeds = self._embed_texts(list(df["text"].values))
         df["vector"] = embeds
         get_logger().info('Done')
 
@@ -652,20 +588,7 @@ class PRSimilarIssue:
         get_logger().info('Done')
 
         get_logger().info('Embedding...')
-        openai.api_key = get_settings().openai.key
-        list_to_encode = list(df["text"].values)
-        try:
-            res = openai.Embedding.create(input=list_to_encode, engine=MODEL)
-            embeds = [record['embedding'] for record in res['data']]
-        except Exception:
-            embeds = []
-            get_logger().error('Failed to embed entire list, embedding one by one...')
-            for i, text in enumerate(list_to_encode):
-                try:
-                    res = openai.Embedding.create(input=[text], engine=MODEL)
-                    embeds.append(res['data'][0]['embedding'])
-                except Exception:
-                    embeds.append([0] * 1536)
+        embeds = self._embed_texts(list(df["text"].values))
         df["vector"] = embeds
         get_logger().info('Done')
 
@@ -678,6 +601,257 @@ class PRSimilarIssue:
         self.qdrant.upsert(collection_name=self.index_name, points=points)
         get_logger().info('Done')
 
+    def _get_issues_corpus(self, issues_list, repo_name_for_index) -> "Corpus":
+        corpus = Corpus()
+        counter = 0
+        for issue in issues_list:
+            if issue.pull_request:
+                continue
+
+            counter += 1
+            if counter % 100 == 0:
+                get_logger().info(f"Scanned {counter} issues")
+
+            issue_str, comments, number = self._process_issue(issue)
+            issue_key = f"issue_{number}"
+            username = issue.user.login
+            created_at = str(issue.created_at)
+            if len(issue_str) < 8000 or \
+                    self.token_handler.count_tokens(issue_str) < get_max_tokens(MODEL):  # fast reject first
+                corpus.append(Record(id=issue_key + "." + "issue", text=issue_str,
+                                     metadata=Metadata(repo=repo_name_for_index, username=username,
+                                                       created_at=created_at, level=IssueLevel.ISSUE)))
+                for j, comment in enumerate(comments or []):
+                    comment_body = comment.body
+                    if not isinstance(comment_body, str) or len(comment_body.split()) < 10:
+                        continue
+                    if len(comment_body) < 8000 or \
+                            self.token_handler.count_tokens(comment_body) < MAX_TOKENS[MODEL]:
+                        corpus.append(Record(id=issue_key + ".comment_" + str(j + 1), text=comment_body,
+                                             metadata=Metadata(repo=repo_name_for_index,
+                                                               username=username,  # use issue username for all comments
+                                                               created_at=created_at, level=IssueLevel.COMMENT)))
+        return corpus
+
+    def _embed_texts(self, list_to_encode: List[str]) -> List[List[float]]:
+        return self.embedding_service.embed(list_to_encode)
+
+    def _sync_index_with_updated_issues(self, repo_obj, repo_name_for_index, store) -> int:
+        """
+        Brings the index of the repo up to date: only the issues updated since the watermark of the index (the latest
+        `updated_at` indexed) are listed, their records are checked against the index with batched lookups, and only
+        the records whose content changed are embedded and upserted. On the first run (no watermark), the whole repo is
+        listed, and the records indexed before content hashes were kept count as up to date.
+        Returns the number of records embedded.
+
+        `store` is the index of the repo, with `get_watermark()`, `set_watermark(watermark)`,
+        `get_content_hashes(ids)` (the content hash of each of `ids` in the index, by id - None when it was not kept)
+        and `upsert(records, vectors, content_hashes)` - see `LocalIssueIndexStore`.
+        """
+        watermark = store.get_watermark()
+        # oldest update first, so that a scan stopped at `max_issues_to_scan` resumes from its watermark
+        if watermark:
+            get_logger().info(f'Getting the issues updated since {watermark}...')
+            # 'since' is inclusive: the issues updated at the watermark are listed again, and skipped by their hash
+            issues = repo_obj.get_issues(state='all', sort='updated', direction='asc',
+                                         since=datetime.fromisoformat(watermark))
+        else:
+            get_logger().info('Indexing the entire repo...')
+            issues = repo_obj.get_issues(state='all', sort='updated', direction='asc')
+
+        issues_to_index = []
+        latest_update = None
+        for issue in issues:
+            if len(issues_to_index) >= self.max_issues_to_scan:
+                get_logger().info(f"Scanned {self.max_issues_to_scan} issues, stopping")
+                break
+            # pull requests are listed as issues, and only move the watermark
+            if latest_update is None or issue.updated_at > latest_update:
+                latest_update = issue.updated_at
+            if not issue.pull_request:
+                issues_to_index.append(issue)
+
+        documents = self._get_issues_corpus(issues_to_index, repo_name_for_index).documents
+        content_hashes = [hashlib.sha256(record.text.encode("utf-8")).hexdigest() for record in documents]
+        indexed_hashes = store.get_content_hashes([record.id for record in documents]) if documents else {}
+
+        def is_indexed(record, content_hash):
+            if record.id not in indexed_hashes:
+                return False
+            return indexed_hashes[record.id] == content_hash or (indexed_hashes[record.id] is None and not watermark)
+
+        changed = [(record, content_hash) for record, content_hash in zip(documents, content_hashes)
+                   if not is_indexed(record, content_hash)]
+        if changed:
+            get_logger().info(f'Embedding {len(changed)} new or changed records of {len(issues_to_index)} '
+                              f'updated issues...')
+            embeds = self._embed_texts([record.text for record, _ in changed])
+            store.upsert([record for record, _ in changed], embeds, [content_hash for _, content_hash in changed])
+            get_logger().info('Done')
+        else:
+            get_logger().info('No new issues to update')
+        if latest_update is not None and latest_update.isoformat() != watermark:
+            store.set_watermark(latest_update.isoformat())
+        return len(changed)
+
+
+def _batches(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _sql_string(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+class LocalIssueIndexStore:
+    """
+    The issues of a repo in a `LocalVectorIndex`: the content hash of each record is in its metadata, and the
+    watermark is a property of the index.
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def get_watermark(self):
+        return self.index.get_property("watermark")
+
+    def set_watermark(self, watermark: str):
+        self.index.set_properties(watermark=watermark)
+
+    def get_content_hashes(self, ids: List[str]) -> dict:
+        return {row_id: metadata.get("content_hash") for row_id, metadata in self.index.get_metadata(ids).items()}
+
+    def upsert(self, records: List["Record"], vectors, content_hashes: List[str]):
+        self.index.add([record.id for record in records], vectors,
+                       [dict(record.metadata.model_dump(), content_hash=content_hash)
+                        for record, content_hash in zip(records, content_hashes)], upsert=True)
+
+
+class PineconeIssueIndexStore:
+    """
+    The issues of a repo in the Pinecone index shared by the repos: the content hash of each record is in its
+    metadata, and the watermark in the metadata of the example record of the repo.
+    """
+    BATCH_SIZE = 100  # ids per fetch, vectors per upsert
+
+    def __init__(self, index, repo_name_for_index: str):
+        self.index = index
+        self.repo = repo_name_for_index
+        self.example_id = f"example_issue_{repo_name_for_index}"
+
+    def get_watermark(self):
+        vector = self.index.fetch([self.example_id]).to_dict()["vectors"].get(self.example_id) or {}
+        return (vector.get("metadata") or {}).get("watermark")
+
+    def set_watermark(self, watermark: str):
+        self.index.update(id=self.example_id, set_metadata={"watermark": watermark})
+
+    def get_content_hashes(self, ids: List[str]) -> dict:
+        hashes = {}
+        for batch in _batches(ids, self.BATCH_SIZE):
+            for row_id, vector in self.index.fetch(batch).to_dict()["vectors"].items():
+                metadata = vector.get("metadata") or {}
+                if metadata.get("repo") == self.repo:
+                    hashes[row_id] = metadata.get("content_hash")
+        return hashes
+
+    def upsert(self, records: List["Record"], vectors, content_hashes: List[str]):
+        items = [(record.id, vector, dict(record.metadata.model_dump(), content_hash=content_hash))
+                 for record, vector, content_hash in zip(records, vectors, content_hashes)]
+        for batch in _batches(items, self.BATCH_SIZE):
+            self.index.upsert(vectors=batch)
+
+
+class LanceDBIssueIndexStore:
+    """
+    The issues of a repo in the LanceDB table shared by the repos. The table schema has no room for a content hash,
+    so it is computed from the indexed text. The watermark is the text of a record next to the example record of
+    the repo (with the same vector), which search skips like the example record.
+    """
+    BATCH_SIZE = 500  # ids per query
+
+    def __init__(self, table, repo_name_for_index: str):
+        self.table = table
+        self.repo = repo_name_for_index
+        self.example_id = f"example_issue_{repo_name_for_index}"
+        self.watermark_id = f"{self.example_id}.watermark"
+
+    def _rows(self, ids: List[str]) -> list:
+        rows = []
+        for batch in _batches(ids, self.BATCH_SIZE):
+            rows += (self.table.search().limit(len(batch))
+                     .where(f"id IN ({', '.join(map(_sql_string, batch))}) "
+                            f"AND metadata.repo = {_sql_string(self.repo)}").to_list())
+        return rows
+
+    def get_watermark(self):
+        rows = self._rows([self.watermark_id])
+        return rows[0]["text"] if rows else None
+
+    def set_watermark(self, watermark: str):
+        example = self._rows([self.example_id])[0]
+        self.table.delete(f"id = {_sql_string(self.watermark_id)}")
+        self.table.add([{"id": self.watermark_id, "text": watermark, "metadata": example["metadata"],
+                         "vector": example["vector"]}])
+
+    def get_content_hashes(self, ids: List[str]) -> dict:
+        return {row["id"]: hashlib.sha256(row["text"].encode("utf-8")).hexdigest() for row in self._rows(ids)}
+
+    def upsert(self, records: List["Record"], vectors, content_hashes: List[str]):
+        for batch in _batches([record.id for record in records], self.BATCH_SIZE):
+            self.table.delete(f"id IN ({', '.join(map(_sql_string, batch))}) "
+                              f"AND metadata.repo = {_sql_string(self.repo)}")
+        self.table.add([{"id": record.id, "text": record.text, "metadata": record.metadata.model_dump(),
+                         "vector": vector} for record, vector in zip(records, vectors)])
+
+
+class QdrantIssueIndexStore:
+    """
+    The issues of a repo in the Qdrant collection shared by the repos: the content hash of each record is in its
+    payload, and the watermark in the payload of the example record of the repo.
+    """
+    BATCH_SIZE = 100  # points per request
+
+    def __init__(self, client, collection_name: str, repo_name_for_index: str):
+        self.client = client
+        self.collection_name = collection_name
+        self.repo = repo_name_for_index
+        self.example_id = f"example_issue_{repo_name_for_index}"
+
+    @staticmethod
+    def _point_id(record_id: str) -> str:
+        import uuid
+        return uuid.uuid5(uuid.NAMESPACE_DNS, record_id).hex  # as in `_update_qdrant_with_issues`
+
+    def _retrieve(self, ids: List[str]) -> list:
+        points = []
+        for batch in _batches(ids, self.BATCH_SIZE):
+            points += self.client.retrieve(collection_name=self.collection_name,
+                                           ids=[self._point_id(record_id) for record_id in batch],
+                                           with_payload=True, with_vectors=False)
+        return [point for point in points if (point.payload.get("metadata") or {}).get("repo") == self.repo]
+
+    def get_watermark(self):
+        points = self._retrieve([self.example_id])
+        return points[0].payload.get("watermark") if points else None
+
+    def set_watermark(self, watermark: str):
+        self.client.set_payload(collection_name=self.collection_name, payload={"watermark": watermark},
+                                points=[self._point_id(self.example_id)])
+
+    def get_content_hashes(self, ids: List[str]) -> dict:
+        return {point.payload["id"]: point.payload.get("content_hash") for point in self._retrieve(ids)}
+
+    def upsert(self, records: List["Record"], vectors, content_hashes: List[str]):
+        from qdrant_client.models import PointStruct
+        points = [PointStruct(id=self._point_id(record.id), vector=vector,
+                              payload={"id": record.id, "text": record.text, "metadata": record.metadata.model_dump(),
+                                       "content_hash": content_hash})
+                  for record, vector, content_hash in zip(records, vectors, content_hashes)]
+        for batch in _batches(points, self.BATCH_SIZE):
+            self.client.upsert(collection_name=self.collection_name, points=batch)
+
 
 class IssueLevel(str, Enum):
     ISSUE = "issue"
@@ -1,6 +1,8 @@
 import re
 import traceback
+from functools import partial
 
+from pr_agent.algo.pr_analysis_session import get_analysis_session
 from pr_agent.config_loader import get_settings
 from pr_agent.git_providers import AzureDevopsProvider, GithubProvider
 from pr_agent.log import get_logger
@@ -63,6 +65,42 @@ def extract_ticket_links_from_pr_description(pr_description, repo_path, base_url
     return list(github_tickets)
 
 
+def _truncate_ticket_body(body: str, max_characters: int) -> str:
+    body = body or ""
+    return body[:max_characters] + "..." if len(body) > max_characters else body
+
+
+def _extract_github_tickets_batched(git_provider, tickets, max_characters):
+    """
+    Builds the tickets content from one batched GraphQL query (see `GithubGraphQLHandler.fetch_issues`).
+    Returns None when the batched query is not available, so the caller can fall back to per-issue requests.
+    """
+    try:
+        issues = git_provider.fetch_issues(tickets)
+    except Exception as e:
+        get_logger().warning(f"Failed to fetch tickets in a batch, falling back to per-issue requests: {e}")
+        return None
+    if issues is None:
+        return None
+    tickets_content = []
+    for ticket in tickets:
+        issue = issues.get(ticket)
+        if not issue:
+            continue
+        tickets_content.append({
+            'ticket_id': issue['number'],
+            'ticket_url': ticket,
+            'title': issue['title'],
+            'body': _truncate_ticket_body(issue.get('body'), max_characters),
+            'labels': ", ".join(label['name'] for label in (issue.get('labels') or {}).get('nodes', [])),
+            'sub_issues': [{'ticket_url': sub_issue['url'],
+                            'title': sub_issue['title'],
+                            'body': _truncate_ticket_body(sub_issue.get('body'), max_characters)}
+                           for sub_issue in issue.get('sub_issues', [])]
+        })
+    return tickets_content
+
+
 async def extract_tickets(git_provider):
     MAX_TICKET_CHARACTERS = 10000
     try:
@@ -72,6 +110,9 @@ async def extract_tickets(git_provider):
             tickets_content = []
 
             if tickets:
+                batched_content = _extract_github_tickets_batched(git_provider, tickets, MAX_TICKET_CHARACTERS)
+                if batched_content is not None:
+                    return batched_content
 
                 for ticket in tickets:
                     repo_name, original_issue_number = git_provider._parse_issue_url(ticket)
@@ -83,9 +124,7 @@ async def extract_tickets(git_provider):
                                            artifact={"traceback": traceback.format_exc()})
                         continue
 
-                    issue_body_str = issue_main.body or ""
-                    if len(issue_body_str) > MAX_TICKET_CHARACTERS:
-                        issue_body_str = issue_body_str[:MAX_TICKET_CHARACTERS] + "..."
+                    issue_body_str = _truncate_ticket_body(issue_main.body, MAX_TICKET_CHARACTERS)
 
                     # Extract sub-issues
                     sub_issues_content = []
@@ -96,14 +135,10 @@ async def extract_tickets(git_provider):
                                 sub_repo, sub_issue_number = git_provider._parse_issue_url(sub_issue_url)
                                 sub_issue = git_provider.repo_obj.get_issue(sub_issue_number)
 
-                                sub_body = sub_issue.body or ""
-                                if len(sub_body) > MAX_TICKET_CHARACTERS:
-                                    sub_body = sub_body[:MAX_TICKET_CHARACTERS] + "..."
-
                                 sub_issues_content.append({
                                     'ticket_url': sub_issue_url,
                                     'title': sub_issue.title,
-                                    'body': sub_body
+                                    'body': _truncate_ticket_body(sub_issue.body, MAX_TICKET_CHARACTERS)
                                 })
                             except Exception as e:
                                 get_logger().warning(f"Failed to fetch sub-issue content for {sub_issue_url}: {e}")
@@ -169,7 +204,11 @@ async def extract_and_cache_pr_tickets(git_provider, vars):
     related_tickets = get_settings().get('related_tickets', [])
 
     if not related_tickets:
-        tickets_content = await extract_tickets(git_provider)
+        session = get_analysis_session(git_provider)
+        if session:
+            tickets_content = await session.get_async("tickets", partial(extract_tickets, git_provider))
+        else:
+            tickets_content = await extract_tickets(git_provider)
 
         if tickets_content:
             # Store sub-issues along with main issues
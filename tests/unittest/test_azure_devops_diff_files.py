@@ -0,0 +1,171 @@
+import json
+import threading
+import time
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from pr_agent.algo.types import EDIT_TYPE
+from pr_agent.git_providers import AzureDevopsProvider
+
+BASE_SHA = "base000"
+HEAD_SHA = "head111"
+LATENCY_SECONDS = 0.002
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    request_queue_size = 64
+    daemon_threads = True
+
+
+class FakeAzureDevopsServer:
+    """
+    Minimal local stand-in for the Azure DevOps `items` REST endpoint.
+    Counts requests and the requests in flight, and adds a fixed latency per request.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.in_flight = self.max_in_flight = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with server._lock:
+                    server.calls += 1
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                time.sleep(LATENCY_SECONDS)
+                with server._lock:
+                    server.in_flight -= 1
+                query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+                path, version = query["path"][0], query["version"][0]
+                body = json.dumps({"content": f"{path}\nline at {version}\n"}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = _HTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FakeGitClient:
+    def __init__(self, server_url, changes):
+        self.server_url = server_url
+        self.changes = changes
+
+    def get_pull_request_iterations(self, **kwargs):
+        return [SimpleNamespace(id=1)]
+
+    def get_pull_request_iteration_changes(self, **kwargs):
+        entries = [SimpleNamespace(additional_properties={"item": {"path": path}, "changeType": change_type})
+                   for path, change_type in self.changes]
+        return SimpleNamespace(change_entries=entries)
+
+    def get_item(self, repository_id, path, project, version_descriptor, download, include_content):
+        query = urllib.parse.urlencode({"path": path, "version": version_descriptor.version})
+        url = f"{self.server_url}/{project}/_apis/git/repositories/{repository_id}/items?{query}"
+        with urllib.request.urlopen(url) as response:
+            return SimpleNamespace(**json.loads(response.read()))
+
+
+def _make_changes(num_files):
+    changes = []
+    for i in range(num_files):
+        if i % 10 == 0:
+            changes.append((f"/src/new_{i}.py", "add"))
+        elif i % 10 == 1:
+            changes.append((f"/assets/image_{i}.png", "edit"))  # dropped by is_valid_file
+        elif i % 10 == 2:
+            changes.append((f"/vendor/lib_{i}.py", "edit"))  # dropped by filter_ignored
+        else:
+            changes.append((f"/src/module_{i}.py", "edit"))
+    return changes
+
+
+def _make_provider(client, max_concurrent_item_fetches):
+    settings = MagicMock()
+    settings.azure_devops.get.side_effect = lambda key, default=None: {
+        "max_concurrent_item_fetches": max_concurrent_item_fetches}.get(key, default)
+    with patch.object(AzureDevopsProvider, "_get_azure_devops_client", return_value=(client, MagicMock())):
+        provider = AzureDevopsProvider()
+    provider.workspace_slug = "ws"
+    provider.repo_slug = "repo"
+    provider.pr_num = 1
+    provider.pr = SimpleNamespace(last_merge_target_commit=SimpleNamespace(commit_id=BASE_SHA),
+                                  last_merge_commit=SimpleNamespace(commit_id=HEAD_SHA))
+    return provider, settings
+
+
+def _get_diff_files(num_files, max_concurrent_item_fetches):
+    changes = _make_changes(num_files)
+    with FakeAzureDevopsServer() as server, \
+            patch("pr_agent.git_providers.azuredevops_provider.AZURE_DEVOPS_AVAILABLE", True), \
+            patch("pr_agent.git_providers.azuredevops_provider.GitVersionDescriptor", SimpleNamespace), \
+            patch("pr_agent.git_providers.azuredevops_provider.filter_ignored",
+                  lambda files, platform: [f for f in files if not f.startswith("/vendor/")]), \
+            patch("pr_agent.git_providers.azuredevops_provider.is_valid_file",
+                  lambda filename: not filename.endswith(".png")):
+        provider, settings = _make_provider(FakeGitClient(server.url, changes), max_concurrent_item_fetches)
+        with patch("pr_agent.git_providers.azuredevops_provider.get_settings", return_value=settings):
+            diff_files = provider.get_diff_files()
+        return changes, diff_files, server.calls, server.max_in_flight
+
+
+def _expected_calls(changes):
+    kept = [(path, change_type) for path, change_type in changes
+            if not path.endswith(".png") and not path.startswith("/vendor/")]
+    return sum(1 if change_type == "add" else 2 for _, change_type in kept), len(kept)
+
+
+@pytest.mark.parametrize("num_files", [50, 200, 500])
+def test_get_diff_files_concurrent_fetch(num_files):
+    changes, diff_files, calls, max_in_flight = _get_diff_files(num_files, max_concurrent_item_fetches=8)
+
+    expected_calls, expected_files = _expected_calls(changes)
+    # ignored and invalid files are never downloaded, added files skip the base version
+    assert calls == expected_calls
+    assert max_in_flight <= 8
+    assert len(diff_files) == expected_files
+    # output keeps the order of the PR changes
+    assert [f.filename for f in diff_files] == [path for path, _ in changes
+                                               if not path.endswith(".png") and not path.startswith("/vendor/")]
+
+    added = next(f for f in diff_files if f.edit_type == EDIT_TYPE.ADDED)
+    assert added.base_file == ""
+    assert added.head_file == f"{added.filename}\nline at {HEAD_SHA}\n"
+    modified = next(f for f in diff_files if f.edit_type == EDIT_TYPE.MODIFIED)
+    assert modified.base_file == f"{modified.filename}\nline at {BASE_SHA}\n"
+    assert f"+line at {HEAD_SHA}" in modified.patch
+    assert f"-line at {BASE_SHA}" in modified.patch
+
+
+def test_get_diff_files_concurrent_fetch_matches_serial():
+    _, serial_files, serial_calls, serial_in_flight = _get_diff_files(200, max_concurrent_item_fetches=1)
+    _, concurrent_files, concurrent_calls, concurrent_in_flight = _get_diff_files(200, max_concurrent_item_fetches=8)
+
+    assert serial_calls == concurrent_calls
+    assert [f.patch for f in serial_files] == [f.patch for f in concurrent_files]
+    assert serial_in_flight == 1
+    assert 1 < concurrent_in_flight <= 8
@@ -0,0 +1,102 @@
+import random
+
+import pytest
+
+from pr_agent.algo.diff_processing import OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD
+from pr_agent.algo.pr_processing import (balance_patches_across_chunks,
+                                         get_pr_multi_diffs)
+from pr_agent.algo.token_handler import TokenHandler
+from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
+from pr_agent.config_loader import get_settings
+
+MAX_CHUNK_TOKENS = 3000
+
+
+def _greedy_chunks(tokens, capacity, max_calls):
+    """
+    The chunks filled one after the other, as `get_pr_multi_diffs` does.
+    """
+    chunks, chunk, load = [], [], 0
+    for i, size in enumerate(tokens):
+        if chunk and load + size > capacity:
+            chunks.append(chunk)
+            if len(chunks) == max_calls:
+                return chunks
+            chunk, load = [], 0
+        chunk.append((f"patch {i}", size))
+        load += size
+    return chunks + [chunk] if chunk else chunks
+
+
+def _loads(chunks):
+    return [sum(tokens for _, tokens in chunk) for chunk in chunks]
+
+
+def test_balanced_chunks_properties():
+    rng = random.Random(1234)
+    improved = 0
+    for _ in range(500):
+        sizes = sorted((rng.randint(1, MAX_CHUNK_TOKENS) if rng.random() < 0.1 else rng.randint(1, 800)
+                        for _ in range(rng.randint(1, 40))), reverse=True)
+        chunks = _greedy_chunks(sizes, MAX_CHUNK_TOKENS, max_calls=rng.randint(1, 5))
+
+        balanced = balance_patches_across_chunks(chunks, MAX_CHUNK_TOKENS)
+
+        # every patch of the original chunks exactly once, none split, none added
+        assert sorted(patch for chunk in balanced for patch in chunk) == sorted(patch for chunk in chunks for patch in chunk)
+        assert len(balanced) == len(chunks)
+        assert all(balanced)
+        assert max(_loads(balanced)) <= MAX_CHUNK_TOKENS
+        assert max(_loads(balanced)) <= max(_loads(chunks))
+        # patches keep their priority order inside each chunk
+        for chunk in balanced:
+            indices = [int(patch.split()[1]) for patch, _ in chunk]
+            assert indices == sorted(indices)
+        improved += max(_loads(balanced)) < max(_loads(chunks))
+    assert improved > 100
+
+
+def test_unbalanced_chunks_that_cannot_be_improved_are_kept():
+    chunks = [[("a", 2000)], [("b", 2000)], [("c", 100)]]
+    assert balance_patches_across_chunks(chunks, MAX_CHUNK_TOKENS) is chunks
+
+
+class StubProvider:
+    def __init__(self, sizes):
+        self.diff_files = [self._diff_file(i, size) for i, size in enumerate(sizes)]
+
+    @staticmethod
+    def _diff_file(i, size):
+        patch = "@@ -1,{0} +1,{0} @@\n".format(size) + "\n".join(f"+line {j} of file {i}" for j in range(size))
+        return FilePatchInfo("", "", patch, f"src/module_{i}.py", edit_type=EDIT_TYPE.ADDED)
+
+    def get_languages(self):
+        return {"Python": 1000}
+
+    def get_diff_files(self):
+        return self.diff_files
+
+
+@pytest.fixture
+def max_model_tokens():
+    original = get_settings().get("CONFIG.MAX_MODEL_TOKENS")
+    yield lambda tokens: get_settings().set("CONFIG.MAX_MODEL_TOKENS", tokens)
+    get_settings().set("CONFIG.MAX_MODEL_TOKENS", original)
+
+
+def test_balanced_chunks_shrink_the_largest_prompt(max_model_tokens):
+    rng = random.Random(7)
+    provider = StubProvider([rng.randint(20, 120) for _ in range(20)])
+    token_handler = TokenHandler(provider, {}, "system prompt", "user prompt")
+    max_model_tokens(token_handler.prompt_tokens + OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD + MAX_CHUNK_TOKENS)
+
+    greedy = get_pr_multi_diffs(provider, token_handler, "gpt-4o", max_calls=4, add_line_numbers=False)
+    balanced = get_pr_multi_diffs(provider, token_handler, "gpt-4o", max_calls=4, add_line_numbers=False,
+                                  balance_chunks=True)
+    greedy_tokens = [token_handler.count_tokens(chunk) for chunk in greedy]
+    balanced_tokens = [token_handler.count_tokens(chunk) for chunk in balanced]
+    assert len(balanced) == len(greedy) > 1
+    for i in range(len(provider.diff_files)):
+        assert sum(f"src/module_{i}.py'" in chunk for chunk in balanced) == sum(f"src/module_{i}.py'" in chunk for chunk in greedy)
+    # the parallel calls wait for the largest prompt
+    assert max(balanced_tokens) < max(greedy_tokens)
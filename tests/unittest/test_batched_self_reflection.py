@@ -0,0 +1,159 @@
+import asyncio
+import re
+
+import pytest
+import yaml
+
+from pr_agent.algo.token_handler import TokenHandler
+from pr_agent.config_loader import get_settings
+from pr_agent.tools.pr_code_suggestions import PRCodeSuggestions
+from pr_agent.tools.pr_code_suggestions_utils.prediction_handler import \
+    PredictionHandler
+from pr_agent.tools.pr_code_suggestions_utils.reflection_handler import (
+    ReflectionHandler, filter_diff_by_files, get_suggestion_key)
+
+NUM_CHUNKS = 4
+LLM_LATENCY = 0.05
+PREDICTION_PROMPT = "Suggest improvements for the PR diff"
+
+
+def _chunk_diff(chunk):
+    return "\n".join(f"\n\n## File: 'src/chunk_{chunk}/module_{i}.py'\n\n@@ -1,2 +1,2 @@ def f():\n__new hunk__\n"
+                     f"1  def f():\n2 +    return {i}\n__old hunk__\n def f():\n-    return None" for i in range(3))
+
+
+def _suggestion(filename, value):
+    return {"relevant_file": filename, "language": "python", "existing_code": f"    return {value}",
+            "suggestion_content": f"Return a named constant instead of {value}", "improved_code": "    return VALUE",
+            "one_sentence_summary": f"Name the constant {value} of {filename}", "label": "maintainability"}
+
+
+class StubLLM:
+    """
+    Answers the prediction prompt with two suggestions per chunk (one of them shared by all the chunks) and the
+    reflection prompt with a score per suggestion, after `LLM_LATENCY`.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.events = []  # ("start" | "end", call), in order
+
+    async def chat_completion(self, model, system, user, temperature=0.2, img_path=None):
+        call = "prediction" if system == PREDICTION_PROMPT else "reflection"
+        self.events.append(("start", call))
+        await asyncio.sleep(LLM_LATENCY)
+        self.events.append(("end", call))
+        if system == PREDICTION_PROMPT:
+            self.calls.append("prediction")
+            chunk = re.search(r"src/chunk_(\d+)/", user).group(1)
+            suggestions = [_suggestion(f"src/chunk_{chunk}/module_1.py", 1), _suggestion("src/shared.py", 0)]
+            return yaml.dump({"code_suggestions": suggestions}), "stop"
+        self.calls.append("reflection")
+        feedback = [{"suggestion_summary": "", "relevant_file": "", "relevant_lines_start": 2, "relevant_lines_end": 2,
+                     "suggestion_score": 8, "why": "good"} for _ in re.findall(r"^suggestion \d+:", user, re.MULTILINE)]
+        return yaml.dump({"code_suggestions": feedback}), "stop"
+
+
+class StubProvider:
+    def get_diff_files(self):
+        return []
+
+
+def _make_tool():
+    tool = object.__new__(PRCodeSuggestions)  # without a PR to fetch
+    tool.git_provider = StubProvider()
+    tool.ai_handler = StubLLM()
+    tool.vars = {"title": "", "branch": "", "description": "", "language": "python", "diff": "",
+                 "diff_no_line_numbers": "", "num_code_suggestions": 2, "extra_instructions": "",
+                 "commit_messages_str": "", "relevant_best_practices": "", "is_ai_metadata": False,
+                 "focus_only_on_problems": False, "date": "2024-01-01", "duplicate_prompt_examples": False}
+    tool.pr_code_suggestions_prompt_system = PREDICTION_PROMPT
+    tool.token_handler = TokenHandler(None, {}, "system", "user")
+    tool.prediction_handler = PredictionHandler(tool)
+    tool.reflection_handler = ReflectionHandler(tool)
+    tool.patches_diff_list = [_chunk_diff(chunk) for chunk in range(NUM_CHUNKS)]
+    tool.patches_diff_list_no_line_numbers = tool.patches_diff_list
+    return tool
+
+
+@pytest.fixture
+def suggestion_settings():
+    keys = ("PR_CODE_SUGGESTIONS.BATCH_SELF_REFLECTION", "PR_CODE_SUGGESTIONS.PARALLEL_CALLS", "CONFIG.PUBLISH_OUTPUT")
+    original = {key: get_settings().get(key) for key in keys}
+    get_settings().set("CONFIG.PUBLISH_OUTPUT", False)
+    yield get_settings()
+    for key, value in original.items():
+        get_settings().set(key, value)
+
+
+async def _run_predictions(batched, parallel):
+    get_settings().set("PR_CODE_SUGGESTIONS.BATCH_SELF_REFLECTION", batched)
+    get_settings().set("PR_CODE_SUGGESTIONS.PARALLEL_CALLS", parallel)
+    tool = _make_tool()
+    prediction_handler = tool.prediction_handler
+    if batched:
+        prediction_list = await prediction_handler.get_predictions_with_batched_reflection("gpt-4o")
+    elif parallel:
+        prediction_list = await asyncio.gather(*[prediction_handler.get_prediction("gpt-4o", diff, diff)
+                                                 for diff in tool.patches_diff_list])
+    else:
+        prediction_list = [await prediction_handler.get_prediction("gpt-4o", diff, diff)
+                           for diff in tool.patches_diff_list]
+    return tool.ai_handler.calls, prediction_list
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("parallel", [False, True])
+async def test_batched_self_reflection_makes_one_reflection_call(suggestion_settings, parallel):
+    per_chunk_calls, per_chunk_predictions = await _run_predictions(batched=False, parallel=parallel)
+    batched_calls, batched_predictions = await _run_predictions(batched=True, parallel=parallel)
+
+    assert sorted(per_chunk_calls) == ["prediction"] * NUM_CHUNKS + ["reflection"] * NUM_CHUNKS
+    if not parallel:
+        assert per_chunk_calls == ["prediction", "reflection"] * NUM_CHUNKS
+    # a single reflection call, on the suggestions of all the chunks
+    assert batched_calls == ["prediction"] * NUM_CHUNKS + ["reflection"]
+
+    suggestions = [suggestion for data in batched_predictions for suggestion in data["code_suggestions"]]
+    # the suggestion returned by every chunk is kept once
+    assert len(suggestions) == NUM_CHUNKS + 1
+    assert sum(len(data["code_suggestions"]) for data in per_chunk_predictions) == 2 * NUM_CHUNKS
+    assert all(suggestion["score"] == 8 and suggestion["relevant_lines_start"] == 2 for suggestion in suggestions)
+
+
+@pytest.mark.asyncio
+async def test_reflection_batches_follow_the_token_budget(suggestion_settings):
+    get_settings().set("PR_CODE_SUGGESTIONS.PARALLEL_CALLS", False)
+    tool = _make_tool()
+    chunk_tokens = tool.token_handler.count_tokens(tool.patches_diff_list[0])
+    original_max_tokens = get_settings().get("CONFIG.MAX_MODEL_TOKENS")
+    try:
+        # the reflection prompt and about two chunks
+        prompt = get_settings().pr_code_suggestions_reflect_prompt
+        get_settings().set("CONFIG.MAX_MODEL_TOKENS", 1500 + tool.token_handler.count_tokens(prompt.system + prompt.user)
+                           + 2 * chunk_tokens + 100)
+        await tool.prediction_handler.get_predictions_with_batched_reflection("gpt-4o")
+    finally:
+        get_settings().set("CONFIG.MAX_MODEL_TOKENS", original_max_tokens)
+
+    assert tool.ai_handler.calls.count("reflection") == 2
+    # the first batch is reflected on while the last prediction is running
+    events = tool.ai_handler.events
+    first_reflection_start = events.index(("start", "reflection"))
+    last_prediction_end = len(events) - 1 - events[::-1].index(("end", "prediction"))
+    assert first_reflection_start < last_prediction_end
+
+
+def test_suggestion_key_ignores_whitespace():
+    suggestion = _suggestion("src/a.py", 1)
+    reformatted = dict(suggestion, relevant_file=" src/a.py\n", improved_code="  return   VALUE\n")
+    assert get_suggestion_key(suggestion) == get_suggestion_key(reformatted)
+    assert get_suggestion_key(suggestion) != get_suggestion_key(_suggestion("src/b.py", 1))
+
+
+def test_filter_diff_by_files():
+    diff = _chunk_diff(0)
+    filtered = filter_diff_by_files(diff, {"src/chunk_0/module_1.py"})
+    assert filtered.startswith("## File: 'src/chunk_0/module_1.py'") and "module_0" not in filtered
+    assert "module_2" not in filtered
+    assert filter_diff_by_files(diff, {"src/unknown.py"}) == diff
@@ -0,0 +1,249 @@
+import hashlib
+from collections import Counter
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from github import UnknownObjectException
+
+from pr_agent.git_providers.github_provider import GithubProvider
+from pr_agent.git_providers.github_utils.file_handler import GithubFileHandler
+from pr_agent.git_providers.github_utils.pr_interaction import \
+    GithubPRInteraction
+from pr_agent.jules.agent import JulesAgent
+from pr_agent.jules.git.github.files import GitHubFileHandler
+from pr_agent.jules.git.github.provider import GitHubProvider
+from pr_agent.jules.planner import Plan, Step
+from pr_agent.jules.tools import JulesTools
+from pr_agent.tools.code_agent.tools import AgentTools
+
+BRANCH = "feature"
+NUM_EDITS = 15
+
+
+def _sha(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+class StubRef:
+    def __init__(self, repo):
+        self.repo = repo
+        self.object = SimpleNamespace(sha=repo.head)
+
+    def edit(self, sha):
+        self.repo.requests["update_ref"] += 1
+        assert self.object.sha == self.repo.head, "not a fast-forward"
+        self.repo.head = sha
+
+
+class StubRepo:
+    """
+    A GitHub repository with a single branch, serving the contents and the Git data APIs. Counts the requests and
+    the commits.
+    """
+
+    def __init__(self, files):
+        self.full_name = "org/repo"
+        self.requests = Counter()
+        self.trees = {}  # sha -> {path: (content, mode)}
+        self.commits = {}  # sha -> (tree sha, message)
+        self.head = self._commit(self._tree(files), "initial commit")
+        self.commits_made = 0
+
+    def _tree(self, files):
+        sha = _sha(sorted(files.items()))
+        self.trees[sha] = dict(files)
+        return sha
+
+    def _commit(self, tree_sha, message):
+        sha = _sha(tree_sha, message, len(self.commits))
+        self.commits[sha] = (tree_sha, message)
+        return sha
+
+    @property
+    def files(self):
+        return self.trees[self.commits[self.head][0]]
+
+    def _push(self, files, message):
+        self.head = self._commit(self._tree(files), message)
+        self.commits_made += 1
+
+    # contents API
+    def get_contents(self, path, ref=None):
+        self.requests["get_contents"] += 1
+        if path not in self.files:
+            raise UnknownObjectException(404, {"message": "Not Found"}, None)
+        return SimpleNamespace(sha=_sha(self.files[path]), decoded_content=self.files[path][0].encode())
+
+    def update_file(self, path, message, content, sha, branch):
+        self.requests["update_file"] += 1
+        mode = self.files.get(path, (None, "100644"))[1]
+        self._push({**self.files, path: (content, mode)}, message)
+
+    def delete_file(self, path, message, sha, branch):
+        self.requests["delete_file"] += 1
+        self._push({p: f for p, f in self.files.items() if p != path}, message)
+
+    # Git data API
+    def get_git_ref(self, name):
+        self.requests["get_ref"] += 1
+        assert name == f"heads/{BRANCH}"
+        return StubRef(self)
+
+    def get_git_commit(self, sha):
+        self.requests["get_commit"] += 1
+        return SimpleNamespace(sha=sha, tree=SimpleNamespace(sha=self.commits[sha][0]))
+
+    def get_git_tree(self, sha, recursive=False):
+        self.requests["get_tree"] += 1
+        return SimpleNamespace(sha=sha, raw_data={"truncated": False},
+                               tree=[SimpleNamespace(path=path, mode=mode, type="blob")
+                                     for path, (_, mode) in self.trees[sha].items()])
+
+    def create_git_tree(self, elements, base_tree):
+        self.requests["create_tree"] += 1
+        files = dict(self.trees[base_tree.sha])
+        for element in (element._identity for element in elements):
+            if "sha" in element:
+                assert element["sha"] is None and element["path"] in files, "deleting a missing file"
+                del files[element["path"]]
+            else:
+                files[element["path"]] = (element["content"], element["mode"])
+        return SimpleNamespace(sha=self._tree(files))
+
+    def create_git_commit(self, message, tree, parents):
+        self.requests["create_commit"] += 1
+        assert [parent.sha for parent in parents] == [self.head]
+        self.commits_made += 1
+        return SimpleNamespace(sha=self._commit(tree.sha, message))
+
+
+def _initial_files():
+    files = {f"src/module_{i}.py": (f"# module {i}\n", "100644") for i in range(NUM_EDITS)}
+    files["scripts/run.sh"] = ("#!/bin/sh\n", "100755")
+    files["obsolete.py"] = ("# to delete\n", "100644")
+    return files
+
+
+def _provider(repo):
+    provider = object.__new__(GithubProvider)  # without a GitHub client
+    provider.repo, provider.repo_obj = repo.full_name, repo
+    provider.pr = SimpleNamespace(head=SimpleNamespace(ref=BRANCH))
+    provider.file_handler = GithubFileHandler(provider)
+    provider.pr_interaction = GithubPRInteraction(provider)
+    return provider
+
+
+async def _agent_run(tools):
+    """The edits of a 15-step agent run: every step edits a file, and reads back the ones it edited before."""
+    for i in range(NUM_EDITS):
+        path = f"src/module_{i % 10}.py"
+        content = await tools.read_file(path)
+        await tools.edit_file(path, content + f"step {i}\n")
+    await tools.edit_file("scripts/run.sh", "#!/bin/sh\necho run\n")
+    await tools.rename_file("src/module_14.py", "src/renamed.py")
+    await tools.delete_file("obsolete.py")
+    await tools.edit_file("scratch.py", "# a temporary file\n")
+    await tools.delete_file("scratch.py")
+
+
+@pytest.mark.asyncio
+async def test_staged_edits_are_pushed_as_one_commit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # no local checkout to sync
+
+    unstaged_repo = StubRepo(_initial_files())
+    await _agent_run(AgentTools(_provider(unstaged_repo)))
+
+    repo = StubRepo(_initial_files())
+    tools = AgentTools(_provider(repo), stage_edits=True)
+    await _agent_run(tools)
+    assert repo.commits_made == 0 and sum(repo.requests.values()) == 11  # the reads of files not edited yet
+    assert await tools.read_file("src/module_3.py") == "# module 3\nstep 3\nstep 13\n"
+    assert await tools.read_file("obsolete.py") == ""
+    requests_before_commit = sum(repo.requests.values())
+
+    assert tools.commit_staged_edits() == 15  # 12 files edited, 3 deleted
+    commit_requests = sum(repo.requests.values()) - requests_before_commit
+    print(f"\n{NUM_EDITS}-step agent run: {unstaged_repo.commits_made} commits and "
+          f"{sum(unstaged_repo.requests.values())} requests pushing every edit, {repo.commits_made} commit and "
+          f"{commit_requests} requests with staged edits")
+    assert repo.commits_made == 1 and commit_requests == 6
+    assert unstaged_repo.commits_made == NUM_EDITS + 6
+    assert repo.files == unstaged_repo.files
+    assert repo.files["scripts/run.sh"] == ("#!/bin/sh\necho run\n", "100755")  # the file mode is kept
+    assert "scratch.py" not in repo.files and "src/module_14.py" not in repo.files
+    assert tools.commit_staged_edits() == 0 and repo.commits_made == 1
+
+
+def _jules_provider(repo):
+    provider = object.__new__(GitHubProvider)  # without a GitHub client
+    provider.file_handler = GitHubFileHandler(None)
+    provider.pr_handler = SimpleNamespace(get_repo=lambda: repo, pr=SimpleNamespace(head=SimpleNamespace(ref=BRANCH)))
+    return provider
+
+
+@pytest.mark.asyncio
+async def test_jules_edits_are_pushed_as_one_commit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    repo = StubRepo(_initial_files())
+    tools = JulesTools(_jules_provider(repo))
+    for i in range(NUM_EDITS):
+        assert (await tools.edit_file(f"src/module_{i}.py", f"# jules {i}\n")).startswith("Successfully")
+    await tools.delete_file("obsolete.py")
+    assert repo.commits_made == 0 and sum(repo.requests.values()) == 0
+
+    assert tools.commit_staged("Jules: a task") == NUM_EDITS + 1
+    assert repo.commits_made == 1 and repo.commits[repo.head][1] == "Jules: a task"
+    assert repo.files["src/module_7.py"] == ("# jules 7\n", "100644") and "obsolete.py" not in repo.files
+
+
+@pytest.mark.asyncio
+async def test_jules_edits_stay_staged_when_the_commit_fails(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    repo = StubRepo(_initial_files())
+    tools = JulesTools(_jules_provider(repo))
+    for i in range(NUM_EDITS):
+        await tools.edit_file(f"src/module_{i}.py", f"# jules {i}\n")
+
+    monkeypatch.setattr(repo, "create_git_commit", MagicMock(side_effect=RuntimeError("push rejected")))
+    with pytest.raises(RuntimeError):
+        tools.commit_staged("Jules: a task")
+    assert len(tools.staged) == NUM_EDITS and repo.commits_made == 0
+
+    monkeypatch.undo()
+    assert tools.commit_staged("Jules: a task") == NUM_EDITS
+    assert repo.commits_made == 1 and len(tools.staged) == 0
+
+
+@pytest.mark.asyncio
+async def test_jules_edits_are_pushed_one_by_one_without_staging(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    repo = StubRepo(_initial_files())
+    tools = JulesTools(_jules_provider(repo), stage_edits=False)
+    await tools.edit_file("src/module_1.py", "# jules 1\n")
+    await tools.delete_file("obsolete.py")
+    assert repo.commits_made == 2 and tools.commit_staged("Jules: a task") == 0
+    assert repo.files["src/module_1.py"] == ("# jules 1\n", "100644") and "obsolete.py" not in repo.files
+
+
+@pytest.mark.asyncio
+async def test_jules_run_commits_the_staged_edits_when_a_step_fails(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    repo = StubRepo(_initial_files())
+    agent = JulesAgent(_jules_provider(repo))
+    agent.tools.list_files = AsyncMock(return_value="")
+    agent.tools.shell = MagicMock()
+    agent.planner.create_plan = AsyncMock(return_value=Plan(goal="edit", steps=[
+        Step(description="edit", command="edit_file"), Step(description="crash", command="run_command")]))
+
+    async def execute_step(step, state):
+        if step.description == "crash":
+            raise RuntimeError("the model call failed")
+        return await agent.tools.edit_file("src/module_1.py", "# jules 1\n")
+
+    agent._execute_step = execute_step
+    with pytest.raises(RuntimeError):
+        await agent.run("a task")
+    agent.tools.shell.close.assert_called_once()
+    assert repo.commits_made == 1 and repo.commits[repo.head][1] == "Jules: a task"
+    assert repo.files["src/module_1.py"] == ("# jules 1\n", "100644")
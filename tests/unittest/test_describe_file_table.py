@@ -0,0 +1,98 @@
+import os
+
+import pytest
+import yaml
+
+from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
+from pr_agent.algo.utils import load_yaml
+from pr_agent.tools.pr_description import PRDescription
+
+# the large file tables take seconds to load as YAML, and only run on demand
+LARGE_BENCHMARK = pytest.mark.skipif(not os.environ.get("PR_AGENT_LARGE_BENCHMARKS"),
+                                     reason="set PR_AGENT_LARGE_BENCHMARKS=1 to run")
+
+
+class StubProvider:
+    def __init__(self, num_files):
+        self.diff_files = [FilePatchInfo("", "", "", f"src/package_{i % 30}/module_{i}.py", edit_type=EDIT_TYPE.MODIFIED)
+                           for i in range(num_files)]
+
+    def get_diff_files(self):
+        return self.diff_files
+
+
+def _make_description_tool(num_files):
+    tool = object.__new__(PRDescription)  # without a PR to fetch
+    tool.git_provider = StubProvider(num_files)
+    tool.pr_id = 1
+    tool.keys_fix = ["filename:", "language:", "changes_summary:", "changes_title:", "description:", "title:"]
+    tool.user_description = ""
+    tool._parsed_predictions = {}
+    return tool
+
+
+def _prediction(num_predicted_files):
+    prediction = "type:\n- Enhancement\ndescription: |\n  Refactors the modules\ntitle: |\n  Refactor modules\npr_files:"
+    for i in range(num_predicted_files):
+        prediction += (f"\n- filename: |\n    src/package_{i % 30}/module_{i}.py\n  changes_summary: |\n"
+                       f"    Renames the functions of module {i}\n  changes_title: |\n    Rename functions\n"
+                       f"  label: |\n    refactoring")
+    return prediction
+
+
+def _extend_with_yaml_round_trips(tool, original_prediction):
+    """
+    The file table merge as done with YAML strings: a list lookup per file, and the table loaded again after each step.
+    """
+    original_prediction_dict = load_yaml(original_prediction, keys_fix_yaml=tool.keys_fix)
+    filenames_predicted = [file.get('filename', '').strip() for file in original_prediction_dict['pr_files']]
+    prediction_extra = "pr_files:"
+    for file in tool.git_provider.get_diff_files()[:len(filenames_predicted) + 100]:
+        if file.filename in filenames_predicted:
+            continue
+        prediction_extra += f"\n- filename: |\n    {file.filename}\n  changes_title: |\n    ...\n  label: |\n    additional files"
+    prediction_extra_dict = load_yaml(prediction_extra, keys_fix_yaml=tool.keys_fix)
+    original_prediction_dict["pr_files"].extend(prediction_extra_dict["pr_files"])
+    new_yaml = yaml.dump(original_prediction_dict)
+    assert load_yaml(new_yaml, keys_fix_yaml=tool.keys_fix)
+    return load_yaml(new_yaml.strip(), keys_fix_yaml=tool.keys_fix)  # as loaded by _prepare_data
+
+
+def _stripped(pr_files):
+    return [{key: value.strip() for key, value in file.items()} for file in pr_files]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("num_files, num_predicted_files", [
+    (300, 250),
+    pytest.param(3000, 2950, marks=LARGE_BENCHMARK),
+])
+async def test_file_table_merge_matches_the_yaml_round_trips(num_files, num_predicted_files):
+    prediction = _prediction(num_predicted_files)
+    expected = _extend_with_yaml_round_trips(_make_description_tool(num_files), prediction)
+
+    tool = _make_description_tool(num_files)
+    tool.prediction = await tool.extend_uncovered_files(prediction)
+    tool._prepare_data()
+
+    assert _stripped(tool.data["pr_files"]) == _stripped(expected["pr_files"])
+    assert len(tool.data["pr_files"]) == num_files
+    assert tool.data["pr_files"][-1] == {"filename": f"src/package_{(num_files - 1) % 30}/module_{num_files - 1}.py\n",
+                                         "changes_title": "...\n", "label": "additional files\n"}
+
+
+@pytest.mark.asyncio
+async def test_uncovered_files_are_clipped():
+    tool = _make_description_tool(150)
+    prediction = yaml.safe_load(await tool.extend_uncovered_files(_prediction(10)))
+    labels = [file["label"].strip() for file in prediction["pr_files"]]
+    assert labels == ["refactoring"] * 10 + ["additional files"] * 101
+    assert prediction["pr_files"][-1]["filename"].strip() == "Additional files not shown"
+    assert prediction["title"].strip() == "Refactor modules"
+
+
+@pytest.mark.asyncio
+async def test_fully_covered_prediction_is_kept():
+    tool = _make_description_tool(10)
+    prediction = _prediction(10)
+    assert await tool.extend_uncovered_files(prediction) is prediction
@@ -0,0 +1,230 @@
+import os
+import random
+import subprocess
+import time
+
+import pytest
+
+from pr_agent.algo import docs_index
+from pr_agent.algo.docs_index import DocsIndex, split_into_sections
+from pr_agent.algo.token_handler import TokenHandler
+from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.git_provider import GitProvider
+from pr_agent.tools import pr_help_docs
+from pr_agent.tools.pr_help_docs import PRHelpDocs
+
+NUM_FILES = 200
+BENCHMARK_NUM_FILES = 5000
+SECTIONS_PER_FILE = 3
+TOP_K = 10
+SYLLABLES = ["ka", "lo", "mi", "nu", "re", "sa", "ti", "vo", "ze", "qu", "ph", "dr"]
+FILLER = "the option is used when you want to change how the tool works for your project".split()
+# the large docs tree takes half a minute to build and index, and only runs on demand
+LARGE_BENCHMARK = pytest.mark.skipif(not os.environ.get("PR_AGENT_LARGE_BENCHMARKS"),
+                                     reason="set PR_AGENT_LARGE_BENCHMARKS=1 to run")
+
+
+def _git(*args, cwd=None):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def _commit(repo, message):
+    _git("add", "-A", cwd=repo)
+    _git("-c", "user.name=test", "-c", "user.email=test@example.com", "commit", "-q", "-m", message, cwd=repo)
+
+
+def _vocabulary(rng, size):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(3, 4))))
+    return sorted(words)
+
+
+def _write_docs_tree(repo, rng, num_files):
+    """
+    Writes `num_files` markdown files and returns, per section, the file path (as given in the prompt), the section
+    heading and a question about it.
+    """
+    vocabulary = _vocabulary(rng, 3000)
+    questions = []
+    for i in range(num_files):
+        file_path = f"/docs/area_{i % 50}/page_{i}.md"
+        content = f"# {' '.join(rng.sample(vocabulary, 2)).title()}\n\nOverview of page {i}.\n"
+        for j in range(SECTIONS_PER_FILE):
+            heading = f"Configure {rng.choice(vocabulary)}"
+            words = rng.sample(vocabulary, 25) + FILLER
+            rng.shuffle(words)
+            content += f"\n## {heading}\n\n{' '.join(words)}.\n\n```toml\n# not a heading\nkey = 1\n```\n"
+            topic = " ".join(rng.sample(words[:25], 2))
+            questions.append((file_path, heading, f"How do I {heading.lower()} with {topic}?"))
+        os.makedirs(os.path.dirname(repo + file_path), exist_ok=True)
+        with open(repo + file_path, "w") as f:
+            f.write(content)
+    return questions
+
+
+class StubProvider:
+    get_remote_commit = GitProvider.get_remote_commit
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.clones = 0
+
+    def _prepare_clone_url_with_token(self, repo_url):
+        return self.repo
+
+    def clone(self, repo_url, dest_folder, remove_dest_folder=True):
+        self.clones += 1
+        _git("clone", "-q", self.repo, dest_folder)
+        return GitProvider.ScopedClonedRepo(dest_folder)
+
+
+def _make_help_docs_tool(repo, question):
+    tool = object.__new__(PRHelpDocs)  # without a PR context
+    tool.ctx_url = ""
+    tool.question = question
+    tool.repo_url = f"file://{repo}"
+    tool.repo_desired_branch = None
+    tool.include_root_readme_file = False
+    tool.supported_doc_exts = [".md", ".mdx", ".rst"]
+    tool.docs_path = "docs"
+    tool.git_provider = StubProvider(repo)
+    tool.vars = {"docs_url": tool.repo_url, "question": question, "snippets": ""}
+    tool.token_handler = TokenHandler(None, tool.vars, "system", "user")
+    return tool
+
+
+@pytest.fixture
+def docs_repo(request, tmp_path, monkeypatch):
+    repo = str(tmp_path / "docs_repo")
+    os.makedirs(repo)
+    _git("init", "-q", repo)
+    questions = _write_docs_tree(repo, random.Random(43), getattr(request, "param", NUM_FILES))
+    _commit(repo, "docs")
+    original = get_settings().get("PR_HELP_DOCS.DOCS_INDEX_PATH")
+    get_settings().set("PR_HELP_DOCS.DOCS_INDEX_PATH", str(tmp_path / "index"))
+    # count the files loaded into the index
+    loaded_files = []
+    original_split_into_sections = pr_help_docs.split_into_sections
+
+    def counting_split_into_sections(text, ext):
+        loaded_files.append(text)
+        return original_split_into_sections(text, ext)
+
+    monkeypatch.setattr(pr_help_docs, "split_into_sections", counting_split_into_sections)
+    monkeypatch.setattr(docs_index, "_loaded_indexes", {})
+    yield repo, questions, loaded_files
+    get_settings().set("PR_HELP_DOCS.DOCS_INDEX_PATH", original)
+
+
+def test_docs_index_is_reused_on_the_same_commit(docs_repo):
+    repo, questions, loaded_files = docs_repo
+    index = _make_help_docs_tool(repo, questions[0][2])._update_docs_index()
+    assert len(loaded_files) == NUM_FILES and len(index.files) == NUM_FILES
+
+    # a new question on the same commit clones nothing and loads no file
+    tool = _make_help_docs_tool(repo, questions[1][2])
+    assert tool._update_docs_index() is index
+    assert len(loaded_files) == NUM_FILES and tool.git_provider.clones == 0
+    # in a new process, the index is loaded from its file
+    docs_index._loaded_indexes.clear()
+    assert DocsIndex.load(index.path).commit == index.commit
+
+    results = [index.search(question, top_k=TOP_K) for _, _, question in questions]
+    hits = sum(any(section["file"] == file_path and section["heading"] == heading for section in sections)
+               for (file_path, heading, _), sections in zip(questions, results))
+    assert hits / len(questions) >= 0.9
+
+
+@LARGE_BENCHMARK
+@pytest.mark.parametrize("docs_repo", [BENCHMARK_NUM_FILES], indirect=True)
+def test_docs_index_benchmark(docs_repo):
+    repo, questions, loaded_files = docs_repo
+    tool = _make_help_docs_tool(repo, questions[0][2])
+
+    start = time.perf_counter()
+    docs = tool._gen_filenames_to_contents_map_from_repo()
+    all_docs_prompt = pr_help_docs.aggregate_documentation_files_for_prompt_contents(docs)
+    all_files_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = tool._update_docs_index()
+    build_time = time.perf_counter() - start
+    assert len(loaded_files) == BENCHMARK_NUM_FILES and len(index.files) == BENCHMARK_NUM_FILES
+
+    # a new question on the same commit clones nothing and loads no file
+    tool = _make_help_docs_tool(repo, questions[1][2])
+    start = time.perf_counter()
+    index = tool._update_docs_index()
+    up_to_date_time = time.perf_counter() - start
+    assert len(loaded_files) == BENCHMARK_NUM_FILES and tool.git_provider.clones == 0
+    # in a new process, the index is loaded from its file
+    docs_index._loaded_indexes.clear()
+    start = time.perf_counter()
+    assert DocsIndex.load(index.path).commit == index.commit
+    load_time = time.perf_counter() - start
+
+    sample = random.Random(5).sample(questions, 300)
+    start = time.perf_counter()
+    results = [index.search(question, top_k=TOP_K) for _, _, question in sample]
+    search_time = (time.perf_counter() - start) / len(sample)
+    hits = sum(any(section["file"] == file_path and section["heading"] == heading for section in sections)
+               for (file_path, heading, _), sections in zip(sample, results))
+    recall = hits / len(sample)
+
+    print(f"\ndocs of {BENCHMARK_NUM_FILES} files: reading all files {all_files_time:.3f}s "
+          f"({len(all_docs_prompt)} chars), building the index {build_time:.3f}s, reusing it {up_to_date_time:.3f}s "
+          f"(loading it {load_time:.3f}s), "
+          f"search {search_time * 1000:.2f}ms per question, recall@{TOP_K} {recall:.3f}")
+    assert recall >= 0.9
+
+
+def test_docs_index_is_updated_incrementally(docs_repo):
+    repo, questions, loaded_files = docs_repo
+    _make_help_docs_tool(repo, questions[0][2])._update_docs_index()
+    loaded_files.clear()
+
+    with open(f"{repo}/docs/area_7/page_7.md", "a") as f:
+        f.write("\n## Rotate the frobnicator keys\n\nRun the frobnicator rotation command weekly.\n")
+    os.remove(f"{repo}/docs/area_8/page_8.md")
+    with open(f"{repo}/docs/new_page.md", "w") as f:
+        f.write("# Quuxify\n\nThe quuxify command rebuilds the caches.\n")
+    _commit(repo, "update docs")
+
+    tool = _make_help_docs_tool(repo, "How often should I rotate the frobnicator keys?")
+    index = tool._update_docs_index()
+    assert len(loaded_files) == 2 and tool.git_provider.clones == 1
+    assert DocsIndex.load(index.path) is index
+    assert len(index.files) == NUM_FILES
+    assert index.search(tool.question, top_k=1)[0]["headings"].endswith("> Rotate the frobnicator keys")
+    assert not any(section and section["file"] == "/docs/area_8/page_8.md" for section in index.sections)
+    assert index.search("quuxify", top_k=1)[0]["file"] == "/docs/new_page.md"
+
+    # the index finds the same sections as one built from scratch
+    rebuilt = DocsIndex()
+    rebuilt.update(index.commit, {file_path: file["sha"] for file_path, file in index.files.items()},
+                   lambda file_path: pr_help_docs.split_into_sections(
+                       pr_help_docs.clean_markdown_content(open(repo + file_path).read()), ".md"))
+    assert rebuilt.num_sections == index.num_sections and rebuilt.total_length == index.total_length
+    for _, _, question in questions[:50]:
+        assert ([(section["file"], section["heading"]) for section in rebuilt.search(question)] ==
+                [(section["file"], section["heading"]) for section in index.search(question)])
+    index._compact()
+    assert index.sections == rebuilt.sections or sorted(map(str, index.sections)) == sorted(map(str, rebuilt.sections))
+
+    docs_prompt = tool._gen_docs_prompt_from_index(max_allowed_txt_input=100000)
+    assert docs_prompt.startswith("\n==file name==\n\n/docs/area_7/page_7.md\n\n==file content==\n\n")
+    assert "Run the frobnicator rotation command weekly." in docs_prompt
+
+
+def test_split_into_sections():
+    markdown = "Intro text\n# Guide\nabout\n## Install\nsteps\n```bash\n# comment\n```\n### Linux\napt\n## Usage\nrun"
+    sections = split_into_sections(markdown, ".md")
+    assert [(section["heading"], section["headings"]) for section in sections] == [
+        ("", ""), ("Guide", "Guide"), ("Install", "Guide > Install"), ("Linux", "Guide > Install > Linux"),
+        ("Usage", "Guide > Usage")]
+    assert sections[2]["text"] == "## Install\nsteps\n```bash\n# comment\n```"
+
+    rst = "Guide\n=====\n\nabout\n\nInstall\n-------\n\nsteps\n\nUsage\n-----\n\nrun"
+    sections = split_into_sections(rst, ".rst")
+    assert [section["headings"] for section in sections] == ["Guide", "Guide > Install", "Guide > Usage"]
@@ -0,0 +1,171 @@
+import math
+import os
+import threading
+import time
+from array import array
+
+import pytest
+
+from pr_agent.algo import embeddings
+from pr_agent.algo.embeddings import (EmbeddingService, HashingEmbedder,
+                                      OpenAIEmbedder, get_embedder,
+                                      get_embedding_service)
+from pr_agent.config_loader import get_settings
+
+NUM_TEXTS = 2000
+BENCHMARK_NUM_TEXTS = 20_000
+# the benchmark makes a thousand slow requests, and only runs on demand
+LARGE_BENCHMARK = pytest.mark.skipif(not os.environ.get("PR_AGENT_LARGE_BENCHMARKS"),
+                                     reason="set PR_AGENT_LARGE_BENCHMARKS=1 to run")
+
+
+class CountingEmbedder(HashingEmbedder):
+    """
+    A slow embedder counting its requests, the texts it embeds and the requests in flight.
+    """
+
+    max_batch_size = 100
+
+    def __init__(self, delay=0.0, failing_texts=()):
+        super().__init__(dimension=32)
+        self.delay = delay
+        self.failing_texts = set(failing_texts)
+        self.batches = []
+        self.in_flight = self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def embed_batch(self, texts):
+        with self.lock:
+            self.batches.append(list(texts))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            if self.failing_texts & set(texts):
+                raise RuntimeError("rejected input")
+            return super().embed_batch(texts)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def _texts(count):
+    return [f"Issue {i}: the {['parser', 'cache', 'webhook', 'review'][i % 4]} fails on input {i % 97}"
+            for i in range(count)]
+
+
+def _float32(vector):
+    return array("f", vector).tolist()
+
+
+def _cosine(a, b):
+    return sum(x * y for x, y in zip(a, b)) / (math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b)))
+
+
+def test_hashing_embedder():
+    embedder = get_embedder("hashing-256")
+    assert isinstance(embedder, HashingEmbedder) and embedder.dimension == 256 and embedder.model == "hashing-256"
+    assert get_embedder("hashing").dimension == embeddings.DEFAULT_HASHING_DIMENSION
+    crash, crash_again, docs = embedder.embed_batch(["The parser crashes on empty files",
+                                                     "parser crashes with empty files",
+                                                     "Update the installation docs"])
+    assert crash == HashingEmbedder(256).embed_batch(["The parser crashes on empty files"])[0]  # deterministic
+    assert math.isclose(_cosine(crash, crash), 1.0)
+    assert _cosine(crash, crash_again) > 0.5 > abs(_cosine(crash, docs))
+    assert embedder.embed_batch([""])[0] == [0.0] * 256
+
+
+def test_embedding_dimension_is_derived_from_the_model():
+    assert OpenAIEmbedder("text-embedding-3-large").dimension == 3072
+    assert OpenAIEmbedder().dimension == 1536
+
+
+def test_batches_are_limited_and_concurrent(tmp_path):
+    embedder = CountingEmbedder(delay=0.05)
+    service = EmbeddingService(embedder, cache_dir=str(tmp_path), max_batch_size=250, max_concurrency=3)
+    texts = _texts(1000)
+    vectors = service.embed(texts + texts[:10])  # repeated texts are embedded once
+    assert len(vectors) == 1010 and vectors[1000] == vectors[0] == _float32(embedder._embed(texts[0]))
+    assert sorted(len(batch) for batch in embedder.batches) == [100] * 10  # the embedder's limit
+    assert embedder.max_in_flight == 3
+
+    token_limited = EmbeddingService(CountingEmbedder(), max_batch_tokens=200)
+    token_limited.embed(texts[:100])
+    assert len(token_limited.embedder.batches) > 1
+    assert all(len(batch) <= 20 for batch in token_limited.embedder.batches)
+
+
+def test_failed_texts_get_zero_vectors_and_are_not_cached(tmp_path):
+    texts = _texts(10)
+    embedder = CountingEmbedder(failing_texts=[texts[3]])
+    service = EmbeddingService(embedder, cache_dir=str(tmp_path))
+    vectors = service.embed(texts)
+    assert vectors[3] == [0.0] * 32 and vectors[4] == _float32(embedder._embed(texts[4]))
+    assert len(embedder.batches) == 1 + len(texts)  # the batch, then text by text
+
+    embedder = CountingEmbedder()
+    vectors = EmbeddingService(embedder, cache_dir=str(tmp_path)).embed(texts)
+    assert vectors == [_float32(embedder._embed(text)) for text in texts]
+    assert embedder.batches == [[texts[3]]]
+
+
+def test_embedding_cache_is_shared_across_services(tmp_path):
+    texts = _texts(NUM_TEXTS)
+    embedder = CountingEmbedder()
+    vectors = EmbeddingService(embedder, cache_dir=str(tmp_path), max_concurrency=1).embed(texts)
+    assert len(embedder.batches) == NUM_TEXTS // CountingEmbedder.max_batch_size and embedder.max_in_flight == 1
+
+    concurrent_embedder = CountingEmbedder(delay=0.05)
+    assert EmbeddingService(concurrent_embedder, cache_dir=str(tmp_path / "concurrent"),
+                            max_concurrency=8).embed(texts) == vectors
+    assert len(concurrent_embedder.batches) == len(embedder.batches) and concurrent_embedder.max_in_flight == 8
+
+    # a new process finds the vectors in the cache, and only embeds the new texts
+    cached_embedder = CountingEmbedder()
+    assert EmbeddingService(cached_embedder, cache_dir=str(tmp_path)).embed(texts) == vectors
+    assert cached_embedder.batches == []
+    more_texts = _texts(NUM_TEXTS + 50)
+    assert EmbeddingService(cached_embedder, cache_dir=str(tmp_path)).embed(more_texts)[:NUM_TEXTS] == vectors
+    assert cached_embedder.batches == [more_texts[NUM_TEXTS:]]
+
+
+@LARGE_BENCHMARK
+def test_embedding_cache_benchmark(tmp_path):
+    texts = _texts(BENCHMARK_NUM_TEXTS)
+    embedder = CountingEmbedder(delay=0.02)  # a round trip per request
+    start = time.perf_counter()
+    vectors = EmbeddingService(embedder, cache_dir=str(tmp_path), max_concurrency=1).embed(texts)
+    sequential_time = time.perf_counter() - start
+
+    concurrent_embedder = CountingEmbedder(delay=0.02)
+    start = time.perf_counter()
+    assert EmbeddingService(concurrent_embedder, cache_dir=str(tmp_path / "concurrent"),
+                            max_concurrency=8).embed(texts) == vectors
+    concurrent_time = time.perf_counter() - start
+
+    # a new process finds the vectors in the cache
+    cached_embedder = CountingEmbedder(delay=0.02)
+    start = time.perf_counter()
+    assert EmbeddingService(cached_embedder, cache_dir=str(tmp_path)).embed(texts) == vectors
+    cached_time = time.perf_counter() - start
+    print(f"\nembedding {BENCHMARK_NUM_TEXTS} texts in {len(embedder.batches)} requests: sequential {sequential_time:.2f}s, "
+          f"8 concurrent requests {concurrent_time:.2f}s, from the cache {cached_time:.2f}s")
+    assert cached_embedder.batches == []
+    assert concurrent_time < sequential_time
+    assert cached_time < sequential_time
+
+
+def test_get_embedding_service(tmp_path, monkeypatch):
+    monkeypatch.setattr(embeddings, "_embedding_services", {})
+    settings = get_settings()
+    keys = ("PR_SIMILAR_ISSUE.EMBEDDING_MODEL", "PR_SIMILAR_ISSUE.EMBEDDING_CACHE_PATH")
+    original = {key: settings.get(key) for key in keys}
+    settings.set("PR_SIMILAR_ISSUE.EMBEDDING_MODEL", "hashing-64")
+    settings.set("PR_SIMILAR_ISSUE.EMBEDDING_CACHE_PATH", str(tmp_path))
+    try:
+        service = get_embedding_service()
+        assert service is get_embedding_service() and service.dimension == 64
+        assert service.cache.path.startswith(str(tmp_path))
+    finally:
+        for key, value in original.items():
+            settings.set(key, value)
@@ -0,0 +1,203 @@
+import re
+from collections import Counter
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from github import UnknownObjectException
+from github.IssueComment import IssueComment
+
+from pr_agent.algo.types import PRReviewHeader
+from pr_agent.git_providers.github_provider import GithubProvider
+from pr_agent.git_providers.github_utils import comment_index
+from pr_agent.git_providers.github_utils.comment_index import \
+    GithubCommentIndex
+from pr_agent.servers.github_webhook_handler import update_comment_index
+
+API = "https://api.github.com"
+PR_URL = "https://github.com/org/repo/pull/7"
+PERSISTENT_HEADER = "## PR Description"
+NUM_COMMENTS = 500
+
+
+class StubRequester:
+    """
+    Serves the issue comments of a PR (oldest first, paginated with Link headers like GitHub),
+    single comments, and comment edits. Counts list pages and other requests.
+    """
+
+    def __init__(self, bodies):
+        self.comments = {1000 + i: body for i, body in enumerate(bodies)}
+        self.requests = Counter()
+        self.review_comments = []
+
+    def _comment(self, comment_id):
+        return {"id": comment_id, "body": self.comments[comment_id],
+                "url": f"{API}/repos/org/repo/issues/comments/{comment_id}",
+                "html_url": f"{PR_URL}#issuecomment-{comment_id}"}
+
+    def _list(self, url, items, parameters):
+        self.requests["list_page"] += 1
+        per_page, page = parameters.get("per_page", 30), parameters.get("page", 1)
+        last_page = max(1, -(-len(items) // per_page))
+        headers = {}
+        if last_page > 1:
+            headers["link"] = f'<{url}?per_page={per_page}&page={last_page}>; rel="last"'
+        return headers, items[(page - 1) * per_page:page * per_page]
+
+    def requestJsonAndCheck(self, verb, url, parameters=None, headers=None, input=None):
+        if verb == "GET" and url.endswith("/issues/7/comments"):
+            return self._list(url, [self._comment(i) for i in sorted(self.comments)], parameters or {})
+        if verb == "GET" and url.endswith("/pulls/7/comments"):
+            return self._list(url, self.review_comments, parameters or {})
+        match = re.search(r"/issues/comments/(\d+)$", url)
+        if match:
+            comment_id = int(match.group(1))
+            self.requests[f"{verb} comment"] += 1
+            if comment_id not in self.comments:
+                raise UnknownObjectException(404, {"message": "Not Found"}, {})
+            if verb == "PATCH":
+                self.comments[comment_id] = input["body"]
+            return {}, self._comment(comment_id)
+        self.requests[f"{verb} other"] += 1
+        if verb == "POST" and url.endswith("/pulls/7/comments"):
+            comment_id = 900_000 + len(self.review_comments)
+            self.review_comments.append({**input, "id": comment_id, "subject_type": "file", "user": {"login": "bot"}})
+            return {}, {"id": comment_id}
+        if verb == "PATCH":
+            return {}, {}
+        return {}, {"sha": "head", "html_url": f"{PR_URL}/commits/head"}
+
+    def create_comment(self, body):
+        comment_id = max(self.comments) + 1
+        self.comments[comment_id] = body
+        self.requests["POST comment"] += 1
+        return IssueComment(self, {}, self._comment(comment_id), completed=True)
+
+
+def _bodies(persistent_at=None, reviews=()):
+    bodies = [f"human comment {i}" for i in range(NUM_COMMENTS)]
+    if persistent_at is not None:
+        bodies[persistent_at] = f"{PERSISTENT_HEADER}\n\nold description"
+    for position, header in reviews:
+        bodies[position] = f"{header}\n\nreview at {position}"
+    return bodies
+
+
+@pytest.fixture(autouse=True)
+def fresh_index(monkeypatch):
+    monkeypatch.setattr(comment_index, "_comment_index", GithubCommentIndex())
+
+
+def _provider(requester):
+    pr = SimpleNamespace(html_url=PR_URL, url=f"{API}/repos/org/repo/pulls/7", _requester=requester,
+                         head=SimpleNamespace(sha="head", ref="feature"),
+                         get_issue_comment=lambda comment_id: IssueComment(
+                             requester, *requester.requestJsonAndCheck(
+                                 "GET", f"{API}/repos/org/repo/issues/comments/{comment_id}"), completed=True),
+                         create_issue_comment=requester.create_comment)
+    repo = SimpleNamespace(full_name="org/repo", url=f"{API}/repos/org/repo", get_pull=lambda number: pr)
+    with patch("pr_agent.git_providers.github_provider.get_settings") as mock_settings, \
+            patch("pr_agent.git_providers.github_provider.Github",
+                  return_value=SimpleNamespace(get_repo=lambda name: repo)):
+        mock_settings.return_value.get.side_effect = lambda key, default=None: default
+        mock_settings.return_value.github.user_token = "fake_token"
+        provider = GithubProvider(PR_URL)
+    provider.github_user_id = "bot"
+    return provider
+
+
+def _publish_persistent(provider):
+    with patch("pr_agent.git_providers.github_utils.comment_handler.get_settings") as mock_settings:
+        mock_settings.return_value.config.publish_output_progress = True
+        provider.publish_persistent_comment(f"{PERSISTENT_HEADER}\n\nnew description", PERSISTENT_HEADER,
+                                            name="describe", final_update_message=False)
+
+
+def test_persistent_comment_found_newest_first_then_indexed():
+    requester = StubRequester(_bodies(persistent_at=480))
+
+    _publish_persistent(_provider(requester))
+    # first page (to learn the page count) + the last page, instead of all 5 pages
+    assert requester.requests["list_page"] == 2
+    assert requester.comments[1480].startswith(f"{PERSISTENT_HEADER}\n\n#### (Describe updated until commit")
+
+    requester.requests.clear()
+    _publish_persistent(_provider(requester))  # e.g. the next webhook delivery
+    assert requester.requests["list_page"] == 0
+    assert requester.requests["GET comment"] == 1
+    assert requester.requests["PATCH comment"] == 1
+
+
+def test_new_persistent_comment_is_recorded():
+    requester = StubRequester(_bodies())
+    _publish_persistent(_provider(requester))
+    assert requester.requests["POST comment"] == 1
+    assert requester.requests["list_page"] == 5  # nothing to find: every page is scanned once
+
+    requester.requests.clear()
+    _publish_persistent(_provider(requester))
+    assert requester.requests["list_page"] == 0
+    assert requester.requests["PATCH comment"] == 1
+    assert requester.requests["POST comment"] == 0
+
+
+def test_deleted_comment_webhook_invalidates_index():
+    requester = StubRequester(_bodies(persistent_at=480))
+    _publish_persistent(_provider(requester))
+
+    del requester.comments[1480]
+    update_comment_index({"repository": {"full_name": "org/repo"}, "issue": {"number": 7},
+                          "comment": {"id": 1480, "body": ""}}, "issue_comment", "deleted")
+    requester.requests.clear()
+    _publish_persistent(_provider(requester))
+
+    assert requester.requests["GET comment"] == 0
+    assert requester.requests["list_page"] == 5
+    assert requester.requests["POST comment"] == 1
+
+
+def test_stale_index_entry_falls_back_to_pagination():
+    requester = StubRequester(_bodies(persistent_at=480))
+    _publish_persistent(_provider(requester))
+    requester.comments[1480] = "edited by a human"  # no webhook seen for the edit
+    requester.comments[1490] = f"{PERSISTENT_HEADER}\n\nposted by another worker"
+
+    requester.requests.clear()
+    _publish_persistent(_provider(requester))
+
+    assert requester.requests["GET comment"] == 1
+    assert requester.requests["list_page"] == 2
+    assert requester.comments[1490].endswith("new description")
+
+
+def test_previous_review_is_the_newest_matching_comment():
+    requester = StubRequester(_bodies(reviews=[(100, PRReviewHeader.REGULAR.value),
+                                               (350, PRReviewHeader.INCREMENTAL.value)]))
+    provider = _provider(requester)
+
+    assert provider.get_previous_review(full=True, incremental=True).id == 1350
+    assert requester.requests["list_page"] == 3  # page 1, then pages 5 and 4
+    assert provider.get_previous_review(full=True, incremental=False).id == 1100
+    # a review published by the bot is recorded for both lookups
+    provider.publish_comment(f"{PRReviewHeader.REGULAR.value}\n\nnew review")
+    requester.requests.clear()
+    assert provider.get_previous_review(full=True, incremental=True).id == 1500
+    assert provider.get_previous_review(full=True, incremental=False).id == 1500
+    assert requester.requests["list_page"] == 0
+
+
+def test_file_comments_are_indexed():
+    requester = StubRequester(_bodies())
+    provider = _provider(requester)
+    provider.deployment_type = "user"
+    file_comments = [{"path": f"src/file_{i}.py", "body": f"comment {i}", "subject_type": "file"} for i in range(3)]
+
+    assert provider.publish_file_comments([dict(c) for c in file_comments])
+    assert requester.requests["POST other"] == 3
+
+    requester.requests.clear()
+    assert provider.publish_file_comments([dict(c) for c in file_comments])
+    assert requester.requests["list_page"] == 0
+    assert requester.requests["POST other"] == 0
+    assert requester.requests["PATCH other"] == 3
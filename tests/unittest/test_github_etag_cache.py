@@ -0,0 +1,155 @@
+import hashlib
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from github import Github
+
+from pr_agent.git_providers.github_utils.etag_cache import GithubETagCache
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    request_queue_size = 64
+    daemon_threads = True
+
+
+class FakeGithubServer:
+    """
+    Minimal local stand-in for the GitHub REST API: serves JSON documents with ETags and answers
+    `If-None-Match` with 304. Counts full (200) and conditional (304) responses per path.
+    """
+
+    def __init__(self):
+        self.documents = {}
+        self.responses = Counter()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                document = server.documents.get(path)
+                if document is None:
+                    self._send(404, b'{"message": "Not Found"}')
+                    return
+                body = json.dumps(document).encode()
+                etag = f'"{hashlib.sha1(body).hexdigest()}"'
+                if self.headers.get("If-None-Match") == etag:
+                    server.responses[(path, 304)] += 1
+                    self._send(304, b"", etag)
+                else:
+                    server.responses[(path, 200)] += 1
+                    self._send(200, body, etag)
+
+            def _send(self, status, body, etag=None):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("X-RateLimit-Remaining", "4999")
+                self.send_header("X-RateLimit-Limit", "5000")
+                self.send_header("X-RateLimit-Reset", "1700000000")
+                if etag:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = _HTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    with FakeGithubServer() as server:
+        server.documents["/repos/org/repo"] = {"full_name": "org/repo", "url": f"{server.url}/repos/org/repo",
+                                               "default_branch": "main"}
+        server.documents["/repos/org/repo/languages"] = {"Python": 1000, "Shell": 20}
+        yield server
+
+
+def _client(server, cache, scope="installation:1"):
+    client = Github(base_url=server.url, retry=None)
+    cache.install(client, scope)
+    return client
+
+
+def test_unchanged_resources_are_revalidated(server):
+    cache = GithubETagCache()
+    client = _client(server, cache)
+
+    for _ in range(3):
+        repo = client.get_repo("org/repo")
+        assert repo.full_name == "org/repo"
+        assert repo.get_languages() == {"Python": 1000, "Shell": 20}
+
+    assert server.responses[("/repos/org/repo", 200)] == 1
+    assert server.responses[("/repos/org/repo", 304)] == 2
+    assert server.responses[("/repos/org/repo/languages", 304)] == 2
+    assert cache.stats == {"hits": 4, "not_modified": 4, "misses": 2, "entries": 2}
+
+
+def test_changed_resource_is_refetched(server):
+    cache = GithubETagCache()
+    client = _client(server, cache)
+    assert client.get_repo("org/repo").default_branch == "main"
+
+    server.documents["/repos/org/repo"]["default_branch"] = "develop"
+
+    assert client.get_repo("org/repo").default_branch == "develop"
+    assert server.responses[("/repos/org/repo", 200)] == 2
+    assert cache.not_modified == 0
+    # the new version is cached in place of the old one
+    assert client.get_repo("org/repo").default_branch == "develop"
+    assert cache.not_modified == 1
+
+
+def test_entries_are_scoped(server):
+    cache = GithubETagCache()
+    _client(server, cache, scope="installation:1").get_repo("org/repo")
+    _client(server, cache, scope="installation:2").get_repo("org/repo")
+
+    assert server.responses[("/repos/org/repo", 200)] == 2
+    assert cache.misses == 2
+
+
+def test_lru_is_bounded(server):
+    for i in range(5):
+        server.documents[f"/repos/org/repo{i}"] = {"full_name": f"org/repo{i}"}
+    cache = GithubETagCache(max_entries=3)
+    client = _client(server, cache)
+
+    for i in range(5):
+        client.get_repo(f"org/repo{i}")
+    client.get_repo("org/repo4")  # still cached
+    client.get_repo("org/repo0")  # evicted
+
+    assert cache.stats["entries"] == 3
+    assert server.responses[("/repos/org/repo4", 304)] == 1
+    assert server.responses[("/repos/org/repo0", 200)] == 2
+
+
+def test_sqlite_tier_survives_a_new_cache(server, tmp_path):
+    sqlite_path = str(tmp_path / "etag_cache.sqlite")
+    _client(server, GithubETagCache(sqlite_path=sqlite_path)).get_repo("org/repo")
+
+    # e.g. another worker process, or a restart: the memory tier is empty
+    cache = GithubETagCache(sqlite_path=sqlite_path)
+    assert _client(server, cache).get_repo("org/repo").full_name == "org/repo"
+
+    assert server.responses[("/repos/org/repo", 200)] == 1
+    assert server.responses[("/repos/org/repo", 304)] == 1
+    assert cache.stats == {"hits": 1, "not_modified": 1, "misses": 0, "entries": 1}
@@ -0,0 +1,153 @@
+from collections import Counter
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from github import GithubException
+
+from pr_agent.algo.types import EDIT_TYPE
+from pr_agent.git_providers.git_provider import FilePatchInfo
+from pr_agent.git_providers.github_utils.comment_handler import (
+    GithubCommentHandler, get_commentable_lines, is_comment_inside_diff)
+
+PR_API_URL = "https://api.github.com/repos/org/repo/pulls/1"
+
+# two hunks: new-file lines 10-14 and 40-43
+PATCH = """@@ -10,4 +10,5 @@ def foo():
+ a = 1
+-b = 2
++b = 3
++c = 4
+ d = 5
+ e = 6
+@@ -40,3 +41,3 @@ def bar():
+ x = 1
+-y = 2
++y = 3
+ z = 4"""
+
+
+class StubRequester:
+    """
+    Stands in for the PyGithub requester: a draft review is rejected with 422 when any of its comments is
+    in `rejected`, mimicking GitHub validating the whole review at once.
+    """
+
+    def __init__(self, rejected=()):
+        self.calls = Counter()
+        self.rejected = set(rejected)
+        self.next_review_id = 0
+
+    def requestJsonAndCheck(self, verb, url, input=None):
+        self.calls[verb] += 1
+        if verb == "POST":
+            if any((c["path"], c.get("line")) in self.rejected for c in input["comments"]):
+                raise GithubException(422, {"message": "Unprocessable Entity"}, {})
+            self.next_review_id += 1
+            return {}, {"id": self.next_review_id}
+        return {}, {}
+
+
+def _handler(requester, close_to_rate_limit=False):
+    diff_files = [FilePatchInfo("", "", PATCH, "src/app.py", edit_type=EDIT_TYPE.MODIFIED),
+                  FilePatchInfo("", "", "", "src/huge.py", edit_type=EDIT_TYPE.MODIFIED)]
+    provider = SimpleNamespace(pr=SimpleNamespace(_requester=requester, url=PR_API_URL),
+                               last_commit_id=SimpleNamespace(sha="head"), diff_files=diff_files,
+                               is_close_to_rate_limit=lambda: close_to_rate_limit)
+    return GithubCommentHandler(provider)
+
+
+def _comment(path, line, start_line=None, side="RIGHT"):
+    comment = {"body": f"comment on {path}:{line}", "path": path, "line": line, "side": side}
+    if start_line is not None:
+        comment["start_line"], comment["start_side"] = start_line, side
+    return comment
+
+
+def test_commentable_lines():
+    lines = get_commentable_lines(PATCH)
+    assert sorted(lines["RIGHT"]) == [10, 11, 12, 13, 14, 41, 42, 43]
+    assert sorted(lines["LEFT"]) == [10, 11, 12, 13, 40, 41, 42]
+    assert lines["RIGHT"][14] == 0 and lines["RIGHT"][41] == 1
+    assert lines["num_positions"] == 11
+
+
+@pytest.mark.parametrize("comment, expected", [
+    (_comment("src/app.py", 12), True),
+    (_comment("src/app.py", 12, start_line=10), True),
+    (_comment("src/app.py", 42, start_line=12), False),  # spans two hunks
+    (_comment("src/app.py", 20), False),
+    (_comment("src/app.py", 40, side="LEFT"), True),
+    (_comment("src/app.py", 43, side="LEFT"), False),
+    (_comment("src/other.py", 12), False),  # not part of the PR
+    (_comment("src/huge.py", 12), None),  # no patch, cannot be decided locally
+    ({"body": "b", "path": "src/app.py", "position": 11}, True),
+    ({"body": "b", "path": "src/app.py", "position": 12}, False),
+])
+def test_is_comment_inside_diff(comment, expected):
+    lines_by_file = {"src/app.py": get_commentable_lines(PATCH), "src/huge.py": None}
+    assert is_comment_inside_diff(comment, lines_by_file) is expected
+
+
+def test_verification_batches_and_bisects():
+    valid_lines = [10, 11, 12, 13, 14, 41, 42, 43]
+    comments = [_comment("src/app.py", valid_lines[i % len(valid_lines)]) for i in range(30)]
+    comments += [_comment("src/app.py", 100 + i) for i in range(6)]  # outside the hunks
+    comments += [_comment("src/huge.py", 1), _comment("src/huge.py", 2), _comment("src/huge.py", 3),
+                 _comment("src/huge.py", 4)]
+    requester = StubRequester(rejected={("src/huge.py", 2)})
+
+    with patch("pr_agent.git_providers.github_utils.comment_handler.time.sleep") as sleep:
+        verified, invalid = _handler(requester)._verify_code_comments(comments)
+    sleep.assert_not_called()
+
+    assert len(verified) == 33
+    assert sorted(c["line"] for c, _ in invalid) == [2] + [100 + i for i in range(6)]
+    assert all(isinstance(e, ValueError) for c, e in invalid if c["path"] == "src/app.py")
+    # 34 comments were sent to the API; isolating the single bad one takes a handful of draft reviews,
+    # instead of one draft review (POST + DELETE) per comment
+    print(f"verification calls: {dict(requester.calls)}")
+    assert requester.calls["POST"] <= 2 * 6 + 1
+    assert requester.calls["DELETE"] == requester.next_review_id
+
+
+def test_all_valid_after_local_filtering_takes_one_round_trip():
+    comments = [_comment("src/app.py", 12), _comment("src/app.py", 99), _comment("src/app.py", 42, start_line=41)]
+    requester = StubRequester()
+
+    verified, invalid = _handler(requester)._verify_code_comments(comments)
+
+    assert verified == [comments[0], comments[2]]
+    assert [c for c, _ in invalid] == [comments[1]]
+    assert requester.calls == Counter({"POST": 1, "DELETE": 1})
+
+
+def test_pacing_when_close_to_rate_limit():
+    requester = StubRequester(rejected={("src/app.py", 12)})
+    comments = [_comment("src/app.py", 12), _comment("src/app.py", 13)]
+
+    with patch("pr_agent.git_providers.github_utils.comment_handler.time.sleep") as sleep:
+        _handler(requester, close_to_rate_limit=True)._verify_code_comments(comments)
+
+    assert sleep.call_count == requester.calls["POST"] == 3
+
+
+def test_fallback_publishes_verified_comments_in_one_review():
+    created_reviews = []
+
+    def create_review(commit, comments):
+        created_reviews.append(comments)
+        if len(created_reviews) == 1:
+            raise GithubException(422, {"message": "Unprocessable Entity"}, {})
+
+    requester = StubRequester()
+    handler = _handler(requester)
+    handler.provider.pr.create_review = create_review
+    comments = [_comment("src/app.py", 12), _comment("src/app.py", 99)]
+
+    with patch("pr_agent.git_providers.github_utils.comment_handler.get_settings") as mock_settings:
+        mock_settings.return_value.github.try_fix_invalid_inline_comments = False
+        handler.publish_inline_comments(comments)
+
+    assert created_reviews == [comments, [comments[0]]]
+    assert requester.calls == Counter({"POST": 1, "DELETE": 1})
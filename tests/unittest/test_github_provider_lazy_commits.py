@@ -0,0 +1,90 @@
+from collections import Counter
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from pr_agent.git_providers.github_provider import GithubProvider
+
+PR_URL = "https://github.com/org/repo/pull/7"
+HEAD_SHA = "abc123"
+
+
+class StubGithub:
+    """
+    Stands in for `github.Github`, counting every call that would issue a REST request.
+    """
+
+    def __init__(self, num_commits=300, **kwargs):
+        self.requests = Counter()
+        commits = [SimpleNamespace(sha=f"sha{i}", commit=SimpleNamespace(message=f"commit {i}"))
+                   for i in range(num_commits - 1)]
+        commits.append(SimpleNamespace(sha=HEAD_SHA, commit=SimpleNamespace(message="head commit")))
+
+        def get_commits():
+            self.requests["get_commits"] += 1
+            return iter(commits)
+
+        pr = SimpleNamespace(html_url=PR_URL, head=SimpleNamespace(sha=HEAD_SHA, ref="feature"),
+                             get_commits=get_commits, _requester=MagicMock())
+
+        def get_pull(number):
+            self.requests["get_pull"] += 1
+            return pr
+
+        self.repo = SimpleNamespace(full_name="org/repo", url="https://api.github.com/repos/org/repo",
+                                    get_pull=get_pull)
+
+    def get_repo(self, name):
+        self.requests["get_repo"] += 1
+        return self.repo
+
+
+@pytest.fixture
+def stub_github():
+    stub = StubGithub()
+    with patch("pr_agent.git_providers.github_provider.get_settings") as mock_settings, \
+            patch("pr_agent.git_providers.github_provider.Github", return_value=stub):
+        mock_settings.return_value.get.side_effect = lambda key, default=None: {
+            "GITHUB.BASE_URL": "https://api.github.com",
+            "GITHUB.DEPLOYMENT_TYPE": "user"
+        }.get(key, default)
+        mock_settings.return_value.github.user_token = "fake_token"
+        yield stub
+
+
+def test_construction_does_not_list_commits(stub_github):
+    provider = GithubProvider(PR_URL)
+
+    assert stub_github.requests == Counter({"get_repo": 1, "get_pull": 1})
+    assert provider.pr_url == PR_URL
+
+
+def test_last_commit_id_is_built_from_head_sha(stub_github):
+    provider = GithubProvider(PR_URL)
+
+    assert provider.last_commit_id.sha == HEAD_SHA
+    assert provider.last_commit_id is provider.last_commit_id
+    assert stub_github.requests["get_commits"] == 0
+    # a lazy Commit is a real PyGithub object, so it can be passed to e.g. create_review(commit=...)
+    assert type(provider.last_commit_id).__name__ == "Commit"
+
+
+def test_commits_are_listed_once_on_demand(stub_github):
+    provider = GithubProvider(PR_URL)
+
+    assert len(provider.pr_commits) == 300
+    assert provider.get_commit_messages().startswith("1. commit 0")
+    assert provider.pr_commits[-1].sha == HEAD_SHA
+    assert stub_github.requests["get_commits"] == 1
+
+
+def test_no_pr_url():
+    with patch("pr_agent.git_providers.github_provider.get_settings") as mock_settings, \
+            patch("pr_agent.git_providers.github_provider.Github"):
+        mock_settings.return_value.get.side_effect = lambda key, default=None: default
+        mock_settings.return_value.github.user_token = "fake_token"
+        provider = GithubProvider()
+
+    assert provider.pr_commits is None
+    assert provider.last_commit_id is None
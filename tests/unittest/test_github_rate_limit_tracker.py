@@ -0,0 +1,140 @@
+import asyncio
+import time
+from collections import Counter
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from github import Github
+
+from pr_agent.git_providers.github_provider import GithubProvider
+from pr_agent.git_providers.github_utils.rate_limit_tracker import (
+    GithubRateLimitTracker, get_rate_limit_tracker)
+
+NOW = 1_700_000_000.0
+PR_URL = "https://github.com/org/repo/pull/7"
+
+
+class FakeClock:
+    def __init__(self, now=NOW):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _headers(remaining, limit=5000, reset=NOW + 600, resource=None):
+    headers = {"X-RateLimit-Remaining": str(remaining), "X-RateLimit-Limit": str(limit),
+               "X-RateLimit-Reset": str(int(reset))}
+    if resource:
+        headers["X-RateLimit-Resource"] = resource
+    return headers
+
+
+def test_budget_is_tracked_from_headers():
+    tracker = GithubRateLimitTracker(clock=FakeClock())
+    key = tracker.get_key(installation_id=42)
+
+    assert not tracker.is_low(key)  # nothing seen yet
+    tracker.update(key, _headers(remaining=4000))
+    assert not tracker.is_low(key, threshold=0.1)
+    tracker.update(key, _headers(remaining=499))
+    assert tracker.is_low(key, threshold=0.1)
+    assert tracker.seconds_until_reset(key) == 600
+    # responses without rate limit headers are ignored
+    tracker.update(key, {"Content-Type": "application/json"})
+    assert tracker.get_state(key).remaining == 499
+
+
+def test_budget_is_restored_after_reset():
+    clock = FakeClock()
+    tracker = GithubRateLimitTracker(clock=clock)
+    key = tracker.get_key(installation_id=42)
+    tracker.update(key, _headers(remaining=0))
+    assert tracker.is_low(key, threshold=0.1)
+
+    clock.now += 601
+    assert not tracker.is_low(key, threshold=0.1)
+    assert tracker.seconds_until_reset(key) == 0
+
+
+def test_budgets_are_kept_per_key_and_resource():
+    tracker = GithubRateLimitTracker(clock=FakeClock())
+    installation_a, installation_b = tracker.get_key(installation_id=1), tracker.get_key(installation_id=2)
+    token_key = tracker.get_key(token="ghp_secret")
+    assert "ghp_secret" not in token_key
+
+    tracker.update(installation_a, _headers(remaining=10))
+    tracker.update(installation_a, _headers(remaining=4999, resource="graphql"))
+
+    assert tracker.is_low(installation_a, threshold=0.1)
+    assert not tracker.is_low(installation_a, resource="graphql", threshold=0.1)
+    assert not tracker.is_low(installation_b, threshold=0.1)
+    assert not tracker.is_low(token_key, threshold=0.1)
+
+
+def test_wait_for_budget_defers_until_reset():
+    tracker = GithubRateLimitTracker(clock=FakeClock())
+    key = tracker.get_key(installation_id=42)
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+
+    assert asyncio.run(tracker.wait_for_budget(key, max_wait=300, sleep=fake_sleep))
+    assert sleeps == []
+
+    with patch("pr_agent.git_providers.github_utils.rate_limit_tracker.get_settings") as mock_settings:
+        mock_settings.return_value.get.side_effect = lambda key, default=None: default
+        tracker.update(key, _headers(remaining=5, reset=NOW + 120))
+        assert asyncio.run(tracker.wait_for_budget(key, max_wait=300, sleep=fake_sleep))
+        assert sleeps == [121]
+
+        tracker.update(key, _headers(remaining=5, reset=NOW + 3600))
+        assert not asyncio.run(tracker.wait_for_budget(key, max_wait=300, sleep=fake_sleep))
+        assert sleeps == [121]
+
+
+def test_requester_hook_feeds_the_tracker():
+    tracker = GithubRateLimitTracker(clock=FakeClock())
+    client = Github(base_url="https://api.github.com")
+    tracker.install(client, "token:abc")
+
+    # PyGithub calls DEBUG_ON_RESPONSE with the lower-cased headers of every response
+    requester = client._Github__requester
+    requester.DEBUG_ON_RESPONSE(200, {k.lower(): v for k, v in _headers(remaining=123).items()}, "{}")
+
+    assert tracker.get_state("token:abc").remaining == 123
+
+
+def test_diff_files_skip_full_content_when_budget_is_low():
+    num_files = 20
+    requests = Counter()
+    files = [SimpleNamespace(filename=f"src/module_{i}.py", status="modified", patch="@@ -1 +1 @@\n-a\n+b\n",
+                             additions=1, deletions=1) for i in range(num_files)]
+    pr = SimpleNamespace(html_url=PR_URL, base=SimpleNamespace(sha="base"), head=SimpleNamespace(sha="head", ref="f"),
+                         get_files=lambda: files)
+    tracker = get_rate_limit_tracker()
+
+    def get_contents(path, ref):
+        requests["get_contents"] += 1
+        # each response reports a shrinking budget: 1000 requests, 10% threshold
+        tracker.update(provider.rate_limit_key, _headers(remaining=109 - requests["get_contents"], limit=1000,
+                                                         reset=time.time() + 600))
+        return SimpleNamespace(decoded_content=b"content\n")
+
+    repo = SimpleNamespace(full_name="org/repo", get_pull=lambda number: pr, get_contents=get_contents,
+                           compare=lambda base, head: SimpleNamespace(merge_base_commit=SimpleNamespace(sha="base")))
+    with patch("pr_agent.git_providers.github_provider.get_settings") as mock_settings, \
+            patch("pr_agent.git_providers.github_provider.Github",
+                  return_value=SimpleNamespace(get_repo=lambda name: repo)):
+        mock_settings.return_value.get.side_effect = lambda key, default=None: default
+        mock_settings.return_value.github.user_token = "token-for-diff-files-test"
+        provider = GithubProvider(PR_URL)
+
+    diff_files = provider.get_diff_files()
+
+    # the budget drops below 100 (10%) after the 10th request - 5 files with 2 versions each
+    assert requests["get_contents"] == 10
+    assert len(diff_files) == num_files
+    assert all(f.head_file == "" for f in diff_files[5:])
+    assert all(f.patch for f in diff_files)
@@ -0,0 +1,215 @@
+import random
+from collections import Counter
+from email.utils import formatdate
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from github import GithubException, UnknownObjectException
+
+from pr_agent.algo.types import EDIT_TYPE
+from pr_agent.git_providers.github_provider import GithubProvider
+from pr_agent.git_providers.retry_policy import RetryPolicy
+
+PR_URL = "https://github.com/org/repo/pull/7"
+BASE_SHA = "base000"
+HEAD_SHA = "head111"
+NOW = 1_700_000_000.0
+
+
+class FaultInjectingGithub:
+    """
+    Stands in for `github.Github`. Every call that would issue a REST request is counted,
+    and fails with a 503 at the given rate (deterministically, via a seeded random generator).
+    """
+
+    def __init__(self, num_files, failure_rate=0.05, seed=1234, always_fail=None):
+        self.requests = Counter()
+        self.failures = Counter()
+        self.rng = random.Random(seed)
+        self.failure_rate = failure_rate
+        self.always_fail = always_fail or {}  # (path, ref) -> number of initial requests that fail
+        self.files = [SimpleNamespace(filename=f"src/module_{i}.py", status="modified", patch="",
+                                      additions=1, deletions=1) for i in range(num_files)]
+        pr = SimpleNamespace(html_url=PR_URL, base=SimpleNamespace(sha=BASE_SHA),
+                             head=SimpleNamespace(sha=HEAD_SHA, ref="feature"),
+                             get_files=lambda: self._request("get_files", lambda: list(self.files)))
+
+        def get_contents(path, ref):
+            key = (path, ref)
+            if self.always_fail.get(key, 0) > 0:
+                self.always_fail[key] -= 1
+                self.requests["get_contents"] += 1
+                self.failures["get_contents"] += 1
+                raise GithubException(503, {"message": "Service Unavailable"}, {})
+            if path == "missing.py":
+                return self._request("get_contents", lambda: (_ for _ in ()).throw(
+                    UnknownObjectException(404, {"message": "Not Found"}, {})))
+            return self._request("get_contents", lambda: SimpleNamespace(
+                decoded_content=f"{path} at {ref}\n".encode()))
+
+        self.repo = SimpleNamespace(
+            full_name="org/repo", url="https://api.github.com/repos/org/repo",
+            get_pull=lambda number: self._request("get_pull", lambda: pr),
+            compare=lambda base, head: self._request("compare", lambda: SimpleNamespace(
+                merge_base_commit=SimpleNamespace(sha=BASE_SHA))),
+            get_contents=get_contents)
+
+    def _request(self, name, make_response):
+        self.requests[name] += 1
+        if self.rng.random() < self.failure_rate:
+            self.failures[name] += 1
+            raise GithubException(503, {"message": "Service Unavailable"}, {})
+        return make_response()
+
+    def get_repo(self, name):
+        return self.repo
+
+
+def _get_diff_files(stub, **policy_kwargs):
+    sleeps = []
+    with patch("pr_agent.git_providers.github_provider.get_settings") as mock_settings, \
+            patch("pr_agent.git_providers.github_provider.Github", return_value=stub):
+        mock_settings.return_value.get.side_effect = lambda key, default=None: default
+        mock_settings.return_value.github.user_token = "fake_token"
+        stub.failure_rate, failure_rate = 0, stub.failure_rate
+        provider = GithubProvider(PR_URL)
+        stub.failure_rate = failure_rate
+    provider._retry_policy = RetryPolicy(max_attempts=5, sleep=sleeps.append, rng=random.Random(0), **policy_kwargs)
+    return provider, provider.get_diff_files(), sleeps
+
+
+def _fail_every_get_contents(stub, error):
+    def get_contents(path, ref):
+        stub.requests["get_contents"] += 1
+        raise error
+    stub.repo.get_contents = get_contents
+
+
+def test_flaky_requests_only_refetch_failed_items():
+    num_files = 200
+    stub = FaultInjectingGithub(num_files, failure_rate=0.05)
+
+    provider, diff_files, sleeps = _get_diff_files(stub)
+    print(f"requests: {dict(stub.requests)}, injected failures: {dict(stub.failures)}")
+
+    assert stub.failures["get_contents"] > 0
+    # every file version is fetched successfully exactly once: the only extra requests are the failed ones
+    assert stub.requests["get_contents"] == 2 * num_files + stub.failures["get_contents"]
+    assert len(sleeps) == sum(stub.failures.values())
+    # a failure restarts the listing (a single retry level), the file versions come from the checkpoint
+    assert stub.requests["get_files"] == 1 + len(sleeps)
+    assert stub.requests["compare"] == stub.requests["get_files"] - stub.failures["get_files"]
+    assert len(diff_files) == num_files
+    assert all(f.head_file == f"{f.filename} at {HEAD_SHA}\n" for f in diff_files)
+    assert all(f.base_file == f"{f.filename} at {BASE_SHA}\n" for f in diff_files)
+    assert provider.file_content_checkpoint == {}
+
+
+def test_listing_retry_resumes_from_checkpoint():
+    num_files = 100
+    # one file version fails 4 times: the listing is retried, and the versions fetched before are not requested again
+    stub = FaultInjectingGithub(num_files, failure_rate=0,
+                                always_fail={("src/module_60.py", HEAD_SHA): 4})
+
+    _, diff_files, _ = _get_diff_files(stub)
+
+    assert stub.requests["get_files"] == 5
+    assert stub.requests["compare"] == 5
+    assert stub.requests["get_contents"] == 2 * num_files + 4
+    assert next(f for f in diff_files if f.filename == "src/module_60.py").head_file == \
+        f"src/module_60.py at {HEAD_SHA}\n"
+
+
+def test_listing_retry_gives_up_without_progress():
+    # the attempts count from the last one that fetched new file versions
+    stub = FaultInjectingGithub(100, failure_rate=0, always_fail={("src/module_60.py", HEAD_SHA): 5})
+    with pytest.raises(GithubException):
+        _get_diff_files(stub)
+    assert stub.requests["get_contents"] == 2 * 60 + 5
+    assert stub.requests["get_files"] == 5
+
+
+def test_persistent_server_error_is_retried_at_a_single_level():
+    stub = FaultInjectingGithub(10, failure_rate=0)
+    _fail_every_get_contents(stub, GithubException(502, {"message": "Bad Gateway"}, {}))
+
+    with pytest.raises(GithubException) as error:
+        _get_diff_files(stub)
+
+    assert error.value.status == 502  # the original error, not a wrapper
+    assert stub.requests["get_contents"] == 5
+    assert stub.requests["get_files"] == 5
+    assert stub.requests["compare"] == 5
+
+
+def test_exhausted_rate_limit_is_not_retried():
+    stub = FaultInjectingGithub(10, failure_rate=0)
+    _fail_every_get_contents(stub, GithubException(
+        403, {"message": "API rate limit exceeded"},
+        {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(NOW + 3600))}))
+
+    with pytest.raises(GithubException) as error:
+        _get_diff_files(stub, max_delay=60, clock=lambda: NOW)
+
+    assert error.value.status == 403 and error.value.headers["X-RateLimit-Reset"] == str(int(NOW + 3600))
+    assert stub.requests["get_contents"] == 1
+    assert stub.requests["get_files"] == 1
+    assert stub.requests["compare"] == 1
+
+
+def test_missing_file_is_not_retried():
+    stub = FaultInjectingGithub(1, failure_rate=0)
+    stub.files = [SimpleNamespace(filename="missing.py", status="added", patch="+a\n", additions=1, deletions=0)]
+
+    _, diff_files, sleeps = _get_diff_files(stub)
+
+    assert stub.requests["get_contents"] == 2
+    assert sleeps == []
+    assert diff_files[0].head_file == "" and diff_files[0].edit_type == EDIT_TYPE.ADDED
+
+
+def test_jittered_backoff_is_bounded():
+    policy = RetryPolicy(base_delay=2, max_delay=60, rng=random.Random(0))
+    for attempt in range(1, 10):
+        delay = policy.get_delay(attempt)
+        cap = min(60, 2 * 2 ** (attempt - 1))
+        assert cap / 2 <= delay <= cap
+
+
+def test_retry_after_header_is_honoured():
+    policy = RetryPolicy(clock=lambda: NOW)
+    assert policy.get_delay(1, GithubException(403, {}, {"Retry-After": "7"})) == 7
+    http_date = formatdate(NOW + 30, usegmt=True)
+    assert policy.get_delay(1, GithubException(429, {}, {"retry-after": http_date})) == pytest.approx(30)
+
+
+def test_rate_limit_reset_header_is_honoured():
+    policy = RetryPolicy(clock=lambda: NOW)
+    exhausted = GithubException(403, {}, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(NOW + 12))})
+    assert policy.is_retryable(exhausted)
+    assert policy.get_delay(1, exhausted) == 12
+    # a plain 403 (e.g. missing permissions) is not a rate limit
+    assert not policy.is_retryable(GithubException(403, {}, {"X-RateLimit-Remaining": "4000"}))
+
+
+def test_gives_up_when_reset_is_too_far():
+    sleeps = []
+    policy = RetryPolicy(max_delay=60, sleep=sleeps.append, clock=lambda: NOW)
+    calls = []
+
+    def rate_limited():
+        calls.append(1)
+        raise GithubException(403, {}, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(NOW + 3600))})
+
+    with pytest.raises(GithubException):
+        policy.call(rate_limited)
+    assert len(calls) == 1 and sleeps == []
+
+
+def test_non_retryable_error_is_raised_immediately():
+    sleeps = []
+    policy = RetryPolicy(sleep=sleeps.append)
+    with pytest.raises(ValueError):
+        policy.call(lambda: (_ for _ in ()).throw(ValueError("bad input")))
+    assert sleeps == []
@@ -0,0 +1,144 @@
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+
+from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.github_provider import GithubProvider
+from pr_agent.git_providers.github_utils import comment_index
+from pr_agent.git_providers.github_utils.comment_handler import \
+    GithubCommentHandler
+from pr_agent.git_providers.github_utils.comment_index import \
+    GithubReviewThreadIndex
+from pr_agent.servers.github_webhook_handler import update_comment_index
+from pr_agent.tools.pr_line_questions import PR_LineQuestions
+
+API = "https://api.github.com"
+NUM_THREADS = 250
+COMMENTS_PER_THREAD = 4  # 1,000 review comments
+
+
+class StubRequester:
+    """
+    Serves the review comments of a PR like GitHub: filtered by `since`, sorted by update, paginated with Link
+    headers. Counts the requests.
+    """
+
+    def __init__(self):
+        self.comments = {}
+        self.requests = Counter()
+        self.clock = 0
+        for thread in range(NUM_THREADS):
+            root_id = self.add_comment(f"thread {thread}: is this right?", "author")
+            for reply in range(1, COMMENTS_PER_THREAD):
+                self.add_comment(f"reply {reply} in thread {thread}", "reviewer", in_reply_to_id=root_id)
+
+    def add_comment(self, body, login, in_reply_to_id=None):
+        self.clock += 1
+        comment_id = 5000 + len(self.comments)
+        self.comments[comment_id] = {"id": comment_id, "body": body, "user": {"login": login},
+                                     "updated_at": f"2024-01-01T00:{self.clock // 60:02d}:{self.clock % 60:02d}Z",
+                                     "url": f"{API}/repos/org/repo/pulls/comments/{comment_id}"}
+        if in_reply_to_id:
+            self.comments[comment_id]["in_reply_to_id"] = in_reply_to_id
+        return comment_id
+
+    def requestJsonAndCheck(self, verb, url, parameters=None, headers=None, input=None):
+        assert verb == "GET" and url == f"{API}/repos/org/repo/pulls/7/comments"
+        self.requests["list_page"] += 1
+        since = parameters.get("since")
+        comments = sorted((comment for comment in self.comments.values()
+                           if since is None or comment["updated_at"] >= since),
+                          key=lambda comment: (comment["updated_at"], comment["id"]))
+        per_page, page = parameters["per_page"], parameters["page"]
+        headers = {}
+        if page * per_page < len(comments):
+            headers["link"] = f'<{url}?per_page={per_page}&page={page + 1}>; rel="next"'
+        return headers, comments[(page - 1) * per_page:page * per_page]
+
+
+@pytest.fixture(autouse=True)
+def fresh_index(monkeypatch):
+    monkeypatch.setattr(comment_index, "_review_thread_index", GithubReviewThreadIndex())
+
+
+def _provider(requester):
+    provider = object.__new__(GithubProvider)  # without a GitHub client
+    provider.repo, provider.pr_num = "org/repo", 7
+    provider.pr = SimpleNamespace(url=f"{API}/repos/org/repo/pulls/7", _requester=requester)
+    provider.comment_handler = GithubCommentHandler(provider)
+    return provider
+
+
+def _conversation(provider, comment_id):
+    tool = object.__new__(PR_LineQuestions)  # without a PR to fetch
+    tool.git_provider = provider
+    settings = get_settings()
+    original = {key: settings.get(key) for key in ("comment_id", "file_name", "line_end")}
+    settings.set("comment_id", comment_id)
+    settings.set("file_name", "src/app.py")
+    settings.set("line_end", 10)
+    try:
+        return tool._load_conversation_history()
+    finally:
+        for key, value in original.items():
+            settings.set(key, value)
+
+
+def test_thread_lookup_lists_only_updated_comments():
+    requester = StubRequester()
+    provider = _provider(requester)
+    thread_root = 5000 + 17 * COMMENTS_PER_THREAD
+
+    # the first question of the process lists every review comment once
+    question_id = requester.add_comment("/ask what about null inputs?", "author", in_reply_to_id=thread_root)
+    history = _conversation(provider, question_id)
+    assert history.splitlines() == ["1. author: thread 17: is this right?"] + [
+        f"{reply + 1}. reviewer: reply {reply} in thread 17" for reply in range(1, COMMENTS_PER_THREAD)]
+    assert requester.requests["list_page"] == 11  # 1,001 comments, 100 per page
+    first_requests = requester.requests["list_page"]
+
+    # the next questions only list the comments updated since the last lookup
+    for thread in (17, 42, 249):
+        requester.requests.clear()
+        question_id = requester.add_comment(f"/ask question about thread {thread}", "author",
+                                            in_reply_to_id=5000 + thread * COMMENTS_PER_THREAD)
+        history = _conversation(provider, question_id)
+        assert history.startswith(f"1. author: thread {thread}: is this right?")
+        assert requester.requests["list_page"] == 1
+    print(f"\nask_line conversation history on a PR with {len(requester.comments)} review comments: "
+          f"{first_requests} requests for the first question, 1 for the next ones")
+    # the question about thread 17 asked before is part of its history now
+    assert "author: /ask what about null inputs?" in _conversation(provider, question_id - 2)
+
+
+def test_edited_and_deleted_comments():
+    requester = StubRequester()
+    provider = _provider(requester)
+    root_id = 5000
+    assert len(provider.get_review_thread_comments(root_id)) == COMMENTS_PER_THREAD
+
+    requester.clock += 1
+    reply = requester.comments[root_id + 1]
+    reply.update(body="an edited reply", updated_at=f"2024-01-02T00:00:{requester.clock % 60:02d}Z")
+    del requester.comments[root_id + 2]
+    update_comment_index({"repository": {"full_name": "org/repo"}, "pull_request": {"number": 7},
+                          "comment": {"id": root_id + 2}}, "pull_request_review_comment", "deleted")
+    thread = provider.get_review_thread_comments(root_id + 3)
+    assert [comment.id for comment in thread] == [root_id, root_id + 1, root_id + 3]
+    assert thread[1].body == "an edited reply" and thread[0].user.login == "author"
+    assert provider.get_review_thread_comments(1) == []
+
+
+def test_expired_prs_are_evicted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("pr_agent.servers.utils.time.monotonic", lambda: now[0])
+    index = GithubReviewThreadIndex(ttl=60)
+    comment = {"id": 1, "updated_at": "2024-01-01T00:00:01Z"}
+    for pr in range(100):
+        index.get_thread(f"org/repo#{pr}", 1, lambda since: [comment])
+    now[0] += 120
+    calls = []
+    assert index.get_thread("org/repo#0", 1, lambda since: calls.append(since) or [comment]) == [comment]
+    assert calls == [None]  # listed from scratch
+    assert list(index._index) == ["org/repo#0"]
@@ -0,0 +1,171 @@
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+from github import Github
+
+from pr_agent.git_providers.github_utils import graphql_handler
+from pr_agent.git_providers.github_utils.graphql_handler import \
+    GithubGraphQLHandler
+from pr_agent.servers.utils import DefaultDictWithTimeout
+from pr_agent.tools.ticket_pr_compliance_check import \
+    _extract_github_tickets_batched
+
+RE_ISSUE_LOOKUP = re.compile(r'(i\d+): repository\(owner: "([^"]+)", name: "([^"]+)"\) \{ issue\(number: (\d+)\)')
+NUM_ISSUES = 10
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    request_queue_size = 64
+    daemon_threads = True
+
+
+class FakeGraphQLServer:
+    """
+    Minimal local stand-in for the GitHub GraphQL API: resolves the aliased `repository.issue` lookups of a query
+    against `issues` ({(repo, number): issue}), returning the sub-issues listed in each issue's `sub_issues`.
+    Records every query it receives.
+    """
+
+    def __init__(self):
+        self.issues = {}
+        self.queries = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                query = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["query"]
+                server.queries.append(query)
+                body = json.dumps({"data": server.resolve(query)}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = _HTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def _node(self, issue, full):
+        if not full:
+            return {"updatedAt": issue["updatedAt"]}
+        return {key: issue[key] for key in ("number", "title", "body", "url", "updatedAt")} | \
+            {"labels": {"nodes": [{"name": label} for label in issue["labels"]]}}
+
+    def resolve(self, query):
+        full = "title" in query
+        data = {}
+        for alias, owner, name, number in RE_ISSUE_LOOKUP.findall(query):
+            issue = self.issues.get((f"{owner}/{name}", int(number)))
+            if issue is None:
+                data[alias] = {"issue": None}
+                continue
+            sub_issues = [self._node(self.issues[key], full) for key in issue["sub_issues"]]
+            data[alias] = {"issue": self._node(issue, full) | {"subIssues": {"nodes": sub_issues}}}
+        return data
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _issue(number, sub_issues=()):
+    return {"number": number, "title": f"Issue {number}", "body": f"body of issue {number}",
+            "url": f"https://github.com/org/repo/issues/{number}", "updatedAt": "2024-01-01T00:00:00Z",
+            "labels": ["bug"], "sub_issues": [("org/repo", n) for n in sub_issues]}
+
+
+@pytest.fixture
+def server():
+    with FakeGraphQLServer() as server:
+        for number in range(1, NUM_ISSUES + 1):
+            # every issue has two sub-issues
+            server.issues[("org/repo", number)] = _issue(number, sub_issues=(100 + 2 * number, 101 + 2 * number))
+            for sub_number in (100 + 2 * number, 101 + 2 * number):
+                server.issues[("org/repo", sub_number)] = _issue(sub_number)
+        yield server
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(graphql_handler, "_issue_cache", DefaultDictWithTimeout(ttl=60))
+
+
+def _handler(server, scope="installation:1"):
+    provider = SimpleNamespace(github_client=Github(base_url=server.url, retry=None), rate_limit_key=scope)
+    return GithubGraphQLHandler(provider)
+
+
+def _urls(count=NUM_ISSUES):
+    return [f"https://github.com/org/repo/issues/{number}" for number in range(1, count + 1)]
+
+
+def test_issues_and_sub_issues_in_one_round_trip(server):
+    issues = _handler(server).fetch_issues(_urls())
+
+    # previously: 2 queries per issue for its sub-issues, plus one REST request per issue and sub-issue
+    assert len(server.queries) == 1
+    assert list(issues) == _urls()
+    assert issues[_urls()[2]]["title"] == "Issue 3"
+    assert [sub["number"] for sub in issues[_urls()[2]]["sub_issues"]] == [106, 107]
+
+
+def test_unchanged_issues_are_served_from_cache(server):
+    _handler(server).fetch_issues(_urls())
+    server.queries.clear()
+
+    issues = _handler(server).fetch_issues(_urls())  # e.g. the next webhook delivery
+
+    assert len(server.queries) == 1  # a single `updatedAt` check
+    assert "title" not in server.queries[0]
+    assert issues[_urls()[0]]["body"] == "body of issue 1"
+
+
+def test_only_changed_issues_are_refetched(server):
+    _handler(server).fetch_issues(_urls())
+    server.queries.clear()
+    server.issues[("org/repo", 4)].update(title="Issue 4, edited", updatedAt="2024-02-01T00:00:00Z")
+    server.issues[("org/repo", 115)].update(body="sub-issue edited", updatedAt="2024-02-01T00:00:00Z")
+
+    issues = _handler(server).fetch_issues(_urls())
+
+    assert len(server.queries) == 2
+    assert len(RE_ISSUE_LOOKUP.findall(server.queries[1])) == 2  # issue 4, and issue 7 (parent of 115)
+    assert issues[_urls()[3]]["title"] == "Issue 4, edited"
+    assert issues[_urls()[6]]["sub_issues"][1]["body"] == "sub-issue edited"
+
+
+def test_cache_is_scoped(server):
+    _handler(server, scope="installation:1").fetch_issues(_urls())
+    _handler(server, scope="installation:2").fetch_issues(_urls())
+
+    assert len(server.queries) == 2
+    assert all("title" in query for query in server.queries)
+
+
+def test_tickets_content(server):
+    del server.issues[("org/repo", 2)]
+    provider = SimpleNamespace(fetch_issues=_handler(server).fetch_issues)
+
+    tickets = _extract_github_tickets_batched(provider, _urls(3), max_characters=10)
+
+    assert [ticket["ticket_id"] for ticket in tickets] == [1, 3]
+    assert tickets[0] == {
+        "ticket_id": 1, "ticket_url": _urls()[0], "title": "Issue 1", "body": "body of is...", "labels": "bug",
+        "sub_issues": [{"ticket_url": "https://github.com/org/repo/issues/102", "title": "Issue 102",
+                        "body": "body of is..."},
+                       {"ticket_url": "https://github.com/org/repo/issues/103", "title": "Issue 103",
+                        "body": "body of is..."}]}
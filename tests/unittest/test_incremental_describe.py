@@ -0,0 +1,140 @@
+import re
+
+import pytest
+
+from pr_agent.algo import review_cache
+from pr_agent.algo.diff_processing import OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD
+from pr_agent.algo.token_handler import TokenHandler
+from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
+from pr_agent.algo.utils import load_yaml
+from pr_agent.config_loader import get_settings
+from pr_agent.servers.utils import DefaultDictWithTimeout
+from pr_agent.tools.pr_description import PRDescription
+
+NUM_FILES = 12
+FILES_PROMPT = "Summarize the changes of each file"
+DESCRIPTION_PROMPT = "Describe the PR"
+RE_FILE = re.compile(r"^## File: '(.+?)'", re.MULTILINE)
+RE_VERSION = re.compile(r"^\+    return value \+ (\d+)", re.MULTILINE)
+
+
+def _diff_file(i, version):
+    base_file = "\n".join(f"def function_{j}(value):\n    return value" for j in range(30))
+    head_file = base_file.replace("return value", f"return value + {version}")
+    patch = "\n".join(f"@@ -{2 * j + 1},2 +{2 * j + 1},2 @@\n def function_{j}(value):\n-    return value\n"
+                      f"+    return value + {version}" for j in range(30))
+    return FilePatchInfo(base_file, head_file, patch, f"src/module_{i}.py", edit_type=EDIT_TYPE.MODIFIED)
+
+
+class StubProvider:
+    def __init__(self, versions):
+        self.repo = "org/repo"
+        self.pr = object()
+        self.diff_files = [_diff_file(i, version) for i, version in sorted(versions.items())]
+
+    def get_diff_files(self):
+        return self.diff_files
+
+    def get_languages(self):
+        return {"Python": 100}
+
+
+class StubLLM:
+    """
+    Summarizes each file of the diff with its version, and counts the calls.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    async def chat_completion(self, model, system, user, temperature=0.2, img_path=None):
+        if system == DESCRIPTION_PROMPT:
+            self.calls.append("description")
+            return "type:\n- Enhancement\ndescription: |\n  Updates the modules\ntitle: |\n  Update modules\n", "stop"
+        files = RE_FILE.findall(user)
+        self.calls.append(files)
+        sections = re.split(r"^## File: ", user, flags=re.MULTILINE)[1:]
+        prediction = "pr_files:"
+        for file, section in zip(files, sections):
+            version = RE_VERSION.search(section).group(1)
+            prediction += (f"\n- filename: |\n    {file}\n  changes_summary: |\n    Adds {version} to the values\n"
+                           f"  changes_title: |\n    Version {version}\n  label: |\n    enhancement")
+        return prediction, "stop"
+
+
+def _make_description_tool(provider):
+    tool = object.__new__(PRDescription)  # without a PR to fetch
+    tool.git_provider = provider
+    tool.pr_id = 1
+    tool.keys_fix = ["filename:", "language:", "changes_summary:", "changes_title:", "description:", "title:"]
+    tool.user_description = ""
+    tool.vars = {"title": "", "branch": "", "description": "", "language": "Python", "diff": "",
+                 "extra_instructions": "", "commit_messages_str": "", "enable_custom_labels": False,
+                 "custom_labels_class": "", "enable_semantic_files_types": True, "related_tickets": "",
+                 "include_file_summary_changes": False, "duplicate_prompt_examples": False,
+                 "enable_pr_diagram": False}
+    tool.token_handler = TokenHandler(provider, tool.vars, get_settings().pr_description_prompt.system,
+                                      get_settings().pr_description_prompt.user)
+    tool.patches_diff = tool.prediction = None
+    tool._parsed_predictions = {}
+    tool.ai_handler = StubLLM()
+    return tool
+
+
+@pytest.fixture
+def large_pr_settings(monkeypatch):
+    monkeypatch.setattr(review_cache, "_review_cache", DefaultDictWithTimeout(ttl=60))
+    settings = get_settings()
+    keys = ("PR_DESCRIPTION.REUSE_UNCHANGED_FILE_SUMMARIES", "PR_DESCRIPTION.ENABLE_LARGE_PR_HANDLING",
+            "PR_DESCRIPTION.MAX_AI_CALLS", "PR_DESCRIPTION.ASYNC_AI_CALLS", "PR_DESCRIPTION.USE_DESCRIPTION_MARKERS",
+            "CONFIG.MAX_MODEL_TOKENS", "CONFIG.ENABLE_CUSTOM_LABELS")
+    original = {key: settings.get(key) for key in keys}
+    settings.set("PR_DESCRIPTION.ENABLE_LARGE_PR_HANDLING", True)
+    settings.set("PR_DESCRIPTION.MAX_AI_CALLS", 6)
+    settings.set("PR_DESCRIPTION.USE_DESCRIPTION_MARKERS", False)
+    settings.set("CONFIG.ENABLE_CUSTOM_LABELS", False)
+    # the prompts of large PR handling
+    settings.set("PR_DESCRIPTION_ONLY_FILES_PROMPTS", {"system": FILES_PROMPT, "user": "{{ diff }}"})
+    settings.set("PR_DESCRIPTION_ONLY_DESCRIPTION_PROMPTS", {"system": DESCRIPTION_PROMPT, "user": "{{ diff }}"})
+    # about three files per call
+    file_tokens = TokenHandler().count_tokens(f"\n\n## File: 'src/module_0.py'\n\n{_diff_file(0, 1).patch}\n")
+    settings.set("CONFIG.MAX_MODEL_TOKENS", OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD + 3 * file_tokens + 50)
+    yield settings
+    for key, value in original.items():
+        settings.set(key, value)
+    for key in ("PR_DESCRIPTION_ONLY_FILES_PROMPTS", "PR_DESCRIPTION_ONLY_DESCRIPTION_PROMPTS"):
+        settings.unset(key)
+
+
+async def _describe(versions):
+    tool = _make_description_tool(StubProvider(versions))
+    await tool._prepare_prediction("gpt-4o")
+    pr_files = load_yaml(tool.prediction, keys_fix_yaml=tool.keys_fix)["pr_files"]
+    table = {file["filename"].strip(): file["changes_title"].strip() for file in pr_files}
+    return tool.ai_handler.calls, table
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("async_ai_calls", [True, False])
+async def test_follow_up_push_reruns_only_the_changed_chunk(large_pr_settings, async_ai_calls):
+    large_pr_settings.set("PR_DESCRIPTION.ASYNC_AI_CALLS", async_ai_calls)
+    large_pr_settings.set("PR_DESCRIPTION.REUSE_UNCHANGED_FILE_SUMMARIES", True)
+    first_calls, first_table = await _describe({i: 1 for i in range(NUM_FILES)})
+    follow_up_calls, follow_up_table = await _describe({i: 2 if i == 7 else 1 for i in range(NUM_FILES)})
+
+    print(f"\ndescribe LLM calls: first push {len(first_calls)}, one-file follow-up push {len(follow_up_calls)}")
+    file_calls = [call for call in first_calls if call != "description"]
+    assert len(file_calls) == 4 and sum(file_calls, []) == [f"src/module_{i}.py" for i in range(NUM_FILES)]
+    chunk_of_changed_file = next(call for call in file_calls if "src/module_7.py" in call)
+    assert follow_up_calls == [chunk_of_changed_file, "description"]
+    # the file table has all the files, with the new summary of the changed one
+    assert list(follow_up_table) == list(first_table)
+    assert follow_up_table == {**first_table, "src/module_7.py": "Version 2"}
+
+
+@pytest.mark.asyncio
+async def test_every_chunk_is_predicted_without_the_cache(large_pr_settings):
+    large_pr_settings.set("PR_DESCRIPTION.REUSE_UNCHANGED_FILE_SUMMARIES", False)
+    first_calls, _ = await _describe({i: 1 for i in range(NUM_FILES)})
+    follow_up_calls, _ = await _describe({i: 2 if i == 7 else 1 for i in range(NUM_FILES)})
+    assert len(first_calls) == len(follow_up_calls) == 5
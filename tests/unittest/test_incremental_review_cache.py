@@ -0,0 +1,196 @@
+import re
+
+import pytest
+import yaml
+
+from pr_agent.algo import review_cache
+from pr_agent.algo.review_cache import git_blob_sha
+from pr_agent.algo.token_handler import TokenHandler
+from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
+from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.git_provider import IncrementalPR
+from pr_agent.servers.utils import DefaultDictWithTimeout
+from pr_agent.tools.pr_reviewer import PRReviewer
+
+PR_URL = "https://github.com/org/repo/pull/1"
+NUM_FILES = 6
+RE_FILE = re.compile(r"^## File: '(.+?)'", re.MULTILINE)
+
+
+def _diff_file(i, version):
+    base_file = "\n".join(f"def function_{j}():\n    return {j}" for j in range(40))
+    head_file = base_file.replace("return 3\n", f"return 3 + {version}\n")
+    patch = f"@@ -7,3 +7,3 @@\n def function_3():\n-    return 3\n+    return 3 + {version}\n def function_4():"
+    return FilePatchInfo(base_file, head_file, patch, f"src/module_{i}.py", edit_type=EDIT_TYPE.MODIFIED)
+
+
+class StubProvider:
+    """
+    A PR whose files are at the versions of `versions` ({file index: version}), i.e. the PR after a push.
+    """
+
+    def __init__(self, versions):
+        self.repo = "org/repo"
+        self.diff_files = [_diff_file(i, version) for i, version in sorted(versions.items())]
+
+    def get_diff_files(self):
+        return self.diff_files
+
+    def get_languages(self):
+        return {"Python": 100}
+
+    def is_supported(self, capability):
+        return False
+
+    def get_line_link(self, relevant_file, relevant_line_start, relevant_line_end=None):
+        return ""
+
+
+class StubLLM:
+    """
+    Reviews the files of the prompt with one finding each, and counts the prompt tokens.
+    """
+
+    def __init__(self, token_handler, effort=2, security_concerns="No"):
+        self.token_handler = token_handler
+        self.prompt_tokens = 0
+        self.reviewed_files = []
+        self.effort, self.security_concerns = effort, security_concerns
+
+    async def chat_completion(self, model, system, user, temperature=0.2, img_path=None):
+        self.prompt_tokens += self.token_handler.count_tokens(system + user)
+        files = RE_FILE.findall(user)
+        self.reviewed_files.append(files)
+        issues = [{"relevant_file": file, "issue_header": "Possible Bug",
+                   "issue_content": f"The value returned in {file} changed", "start_line": 7, "end_line": 7}
+                  for file in files]
+        return yaml.dump({"review": {"estimated_effort_to_review_[1-5]": self.effort, "relevant_tests": "No",
+                                     "key_issues_to_review": issues,
+                                     "security_concerns": self.security_concerns}}), "stop"
+
+
+def _make_reviewer(provider):
+    reviewer = object.__new__(PRReviewer)  # without a PR to fetch
+    reviewer.git_provider = provider
+    reviewer.pr_url = PR_URL
+    reviewer.incremental = IncrementalPR(False)
+    reviewer.patches_diff = reviewer.prediction = None
+    reviewer.vars = {"title": "", "branch": "", "description": "", "language": "Python", "diff": "",
+                     "num_pr_files": len(provider.diff_files), "num_max_findings": NUM_FILES,
+                     "require_score": False, "require_tests": True, "require_estimate_effort_to_review": True,
+                     "require_estimate_contribution_time_cost": False, "require_can_be_split_review": False,
+                     "require_security_review": True, "require_todo_scan": False, "question_str": "",
+                     "answer_str": "", "extra_instructions": "", "commit_messages_str": "", "custom_labels": "",
+                     "enable_custom_labels": False, "is_ai_metadata": False, "related_tickets": [],
+                     "duplicate_prompt_examples": False, "date": "2024-01-01"}
+    reviewer.token_handler = TokenHandler(provider, reviewer.vars, get_settings().pr_review_prompt.system,
+                                          get_settings().pr_review_prompt.user)
+    return reviewer
+
+
+@pytest.fixture
+def review_settings(monkeypatch):
+    monkeypatch.setattr(review_cache, "_review_cache", DefaultDictWithTimeout(ttl=60))
+    keys = ("PR_REVIEWER.REUSE_UNCHANGED_FILE_FINDINGS", "CONFIG.PUBLISH_OUTPUT", "PR_REVIEWER.ENABLE_HELP_TEXT")
+    original = {key: get_settings().get(key) for key in keys}
+    get_settings().set("CONFIG.PUBLISH_OUTPUT", False)
+    get_settings().set("PR_REVIEWER.ENABLE_HELP_TEXT", False)
+    yield lambda enabled: get_settings().set("PR_REVIEWER.REUSE_UNCHANGED_FILE_FINDINGS", enabled)
+    for key, value in original.items():
+        get_settings().set(key, value)
+
+
+# push 1 opens the PR, push 2 changes one file, push 3 only rewrites the commits (same content)
+PUSHES = [{i: 1 for i in range(NUM_FILES)},
+          {i: 2 if i == 4 else 1 for i in range(NUM_FILES)},
+          {i: 2 if i == 4 else 1 for i in range(NUM_FILES)}]
+
+
+async def _review_pushes():
+    """
+    Reviews the PR after each push, returning the prompt tokens, the files sent to the LLM and the published
+    findings of each review.
+    """
+    results = []
+    for versions in PUSHES:
+        reviewer = _make_reviewer(StubProvider(versions))
+        reviewer.ai_handler = llm = StubLLM(reviewer.token_handler)
+        await reviewer._prepare_prediction("gpt-4o")
+        review_markdown = reviewer._prepare_pr_review()
+        findings = sorted(re.findall(r"The value returned in (\S+) changed", review_markdown))
+        results.append((llm.prompt_tokens, sum(llm.reviewed_files, []), findings))
+    return results
+
+
+@pytest.mark.asyncio
+async def test_incremental_review_benchmark(review_settings):
+    review_settings(False)
+    full = await _review_pushes()
+    review_settings(True)
+    incremental = await _review_pushes()
+
+    print(f"\nprompt tokens of 3 pushes: full reviews {[tokens for tokens, _, _ in full]}, "
+          f"reusing file findings {[tokens for tokens, _, _ in incremental]}")
+    all_files = [f"src/module_{i}.py" for i in range(NUM_FILES)]
+    assert [files for _, files, _ in full] == [all_files] * 3
+    assert [files for _, files, _ in incremental] == [all_files, ["src/module_4.py"], []]
+    assert incremental[0][0] == full[0][0]
+    assert incremental[1][0] < full[1][0]
+    assert incremental[2][0] == 0
+    # the published reviews have the findings of all the files
+    for (_, _, full_findings), (_, _, incremental_findings) in zip(full, incremental):
+        assert incremental_findings == full_findings == all_files
+
+
+@pytest.mark.asyncio
+async def test_findings_are_not_reused_across_prompt_versions(review_settings):
+    review_settings(True)
+    await _review_pushes()
+    original = get_settings().get("PR_REVIEWER.NUM_MAX_FINDINGS")
+    try:
+        get_settings().set("PR_REVIEWER.NUM_MAX_FINDINGS", 5)
+        reviewer = _make_reviewer(StubProvider(PUSHES[-1]))
+        reviewer.ai_handler = llm = StubLLM(reviewer.token_handler)
+        await reviewer._prepare_prediction("gpt-4o")
+    finally:
+        get_settings().set("PR_REVIEWER.NUM_MAX_FINDINGS", original)
+    assert len(llm.reviewed_files[0]) == NUM_FILES
+
+
+@pytest.mark.asyncio
+async def test_partial_review_keeps_the_review_level_fields_of_the_unchanged_files(review_settings):
+    review_settings(True)
+    reviews = []
+    sql_injection = "SQL injection: the query of src/module_0.py is built with string formatting"
+    for versions, effort, security_concerns in [(PUSHES[0], 4, sql_injection), (PUSHES[1], 1, "No")]:
+        reviewer = _make_reviewer(StubProvider(versions))
+        reviewer.ai_handler = StubLLM(reviewer.token_handler, effort=effort, security_concerns=security_concerns)
+        await reviewer._prepare_prediction("gpt-4o")
+        reviews.append(reviewer._prepare_pr_review())
+    # only src/module_4.py was reviewed again, the effort and security concerns of the PR are those of the first review
+    assert "4 🔵🔵🔵🔵⚪" in reviews[1] and "the query of src/module_0.py is built with string formatting" in reviews[1]
+    assert reviewer.review_file_cache.get_review()["security_concerns"] == sql_injection
+
+
+def test_git_blob_sha():
+    # git hash-object of a file with "hello\n"
+    assert git_blob_sha("hello\n") == "ce013625030ba8dba906f756967f9e9ca394464a"
+
+
+def test_cache_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("pr_agent.servers.utils.time.monotonic", lambda: now[0])
+    cache = DefaultDictWithTimeout(ttl=60, refresh_interval=10)
+    cache["old"] = 1
+    now[0] += 30
+    cache["recent"] = 2
+    now[0] += 40  # "old" is past its TTL, "recent" is not
+    cache["new"] = 3
+    assert "old" not in cache and cache["recent"] == 2 and cache["new"] == 3
+
+    now[0] += 5  # within the refresh interval: no sweep
+    cache["newer"] = 4
+    assert set(cache) == {"recent", "new", "newer"}
+    now[0] += 200
+    cache["newest"] = 5
+    assert set(cache) == {"newest"}
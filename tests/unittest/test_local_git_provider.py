@@ -0,0 +1,182 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import time
+from unittest.mock import patch
+
+import pytest
+
+from pr_agent.algo.types import EDIT_TYPE
+from pr_agent.git_providers.local_git_provider import (GitCatFileBatch,
+                                                       LocalGitProvider)
+
+NUM_CHANGED_FILES = 200
+BENCHMARK_NUM_CHANGED_FILES = 2000
+# the benchmark builds a large repo and runs in two subprocesses, and only runs on demand
+LARGE_BENCHMARK = pytest.mark.skipif(not os.environ.get("PR_AGENT_LARGE_BENCHMARKS"),
+                                     reason="set PR_AGENT_LARGE_BENCHMARKS=1 to run")
+
+
+def _git(*args, cwd):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+def _create_repo(repo_dir, num_files):
+    """
+    Creates a repo with a `main` branch, and a checked out `feature` branch that modifies `num_files` files,
+    adds one file and deletes one file.
+    """
+    os.makedirs(repo_dir)
+    _git("init", "-q", "--initial-branch=main", cwd=repo_dir)
+    _git("config", "user.name", "test", cwd=repo_dir)
+    _git("config", "user.email", "test@example.com", cwd=repo_dir)
+    for i in range(num_files):
+        os.makedirs(os.path.join(repo_dir, f"pkg{i % 20}"), exist_ok=True)
+        with open(os.path.join(repo_dir, f"pkg{i % 20}", f"module_{i}.py"), "w") as f:
+            f.write("".join(f"value_{j} = {j}\n" for j in range(50)))
+    with open(os.path.join(repo_dir, "deleted.py"), "w") as f:
+        f.write("to_be_deleted = True\n")
+    _git("add", "-A", cwd=repo_dir)
+    _git("commit", "-q", "-m", "base", cwd=repo_dir)
+    _git("checkout", "-q", "-b", "feature", cwd=repo_dir)
+    for i in range(num_files):
+        with open(os.path.join(repo_dir, f"pkg{i % 20}", f"module_{i}.py"), "a") as f:
+            f.write(f"changed_{i} = True\n")
+    with open(os.path.join(repo_dir, "added.py"), "w") as f:
+        f.write("added = True\n")
+    os.remove(os.path.join(repo_dir, "deleted.py"))
+    _git("add", "-A", cwd=repo_dir)
+    _git("commit", "-q", "-m", "feature", cwd=repo_dir)
+
+
+@pytest.fixture(scope="module")
+def repo_dir(tmp_path_factory):
+    repo_dir = str(tmp_path_factory.mktemp("local_git") / "repo")
+    _create_repo(repo_dir, NUM_CHANGED_FILES)
+    return repo_dir
+
+
+@pytest.fixture
+def provider(repo_dir, monkeypatch):
+    monkeypatch.chdir(repo_dir)
+    return LocalGitProvider("main")
+
+
+def test_diff_files(provider):
+    diff_files = {f.filename: f for f in provider.get_diff_files()}
+
+    assert len(diff_files) == NUM_CHANGED_FILES + 2
+    modified = diff_files["pkg3/module_3.py"]
+    assert modified.edit_type == EDIT_TYPE.MODIFIED
+    assert modified.head_file == modified.base_file + "changed_3 = True\n"
+    assert "+changed_3 = True" in modified.patch
+    assert diff_files["added.py"].edit_type == EDIT_TYPE.ADDED
+    assert diff_files["added.py"].base_file == ""
+    deleted = next(f for f in diff_files.values() if f.old_filename == "deleted.py")
+    assert deleted.edit_type == EDIT_TYPE.DELETED
+    assert deleted.head_file == ""
+
+
+def test_diff_index_and_merge_base_are_cached(provider):
+    with patch.object(provider.repo, "merge_base", wraps=provider.repo.merge_base) as merge_base:
+        diff_files = provider.get_diff_files()
+        files = provider.get_files()
+        assert provider.get_diff_files() is diff_files
+        assert merge_base.call_count == 1
+    assert len(files) == len(diff_files)
+
+
+def test_diff_files_are_recomputed_after_a_new_commit(repo_dir, tmp_path, monkeypatch):
+    clone_dir = str(tmp_path / "clone")
+    subprocess.run(["git", "clone", "-q", "--branch", "feature", repo_dir, clone_dir], check=True)
+    _git("branch", "-q", "main", "origin/main", cwd=clone_dir)
+    monkeypatch.chdir(clone_dir)
+    provider = LocalGitProvider("main")
+    num_files = len(provider.get_diff_files())
+
+    provider.create_or_update_pr_file("brand_new.py", "feature", "new = True\n", "add a file")
+
+    assert len(provider.get_diff_files()) == num_files + 1
+
+
+def test_iter_diff_files_is_lazy(provider):
+    with patch.object(provider._blob_reader, "read", wraps=provider._blob_reader.read) as read:
+        first = next(provider.iter_diff_files())
+        assert first.filename
+        assert read.call_count <= 2
+
+
+def test_cat_file_batch_reads_blobs(provider):
+    blob = provider.repo.head.commit.tree / "added.py"
+    reader = GitCatFileBatch(provider.repo_path)
+    assert reader.read(blob.hexsha) == b"added = True\n"
+    assert reader.read(blob.hexsha) == b"added = True\n"  # same process serves further requests
+    with pytest.raises(KeyError):
+        reader.read("0" * 40)
+    reader.close()
+
+
+_BENCHMARK_SCRIPT = textwrap.dedent("""
+    import json, resource, sys, time
+    from git import Repo
+
+    def peak_rss_kb():
+        # VmHWM starts over on exec, unlike ru_maxrss which is inherited from the (large) pytest parent process
+        try:
+            with open("/proc/self/status") as f:
+                return next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+        except OSError:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    mode = sys.argv[1]
+    if mode == "streaming":
+        from pr_agent.git_providers.local_git_provider import LocalGitProvider
+    peak_before = peak_rss_kb()
+    start_time = time.perf_counter()
+    total_size = 0
+    if mode == "legacy":
+        # the previous implementation: one GitPython data stream per blob, all results kept in a list
+        repo = Repo(".")
+        diffs = repo.head.commit.diff(repo.merge_base(repo.head, repo.branches["main"]), create_patch=True, R=True)
+        results = []
+        for diff_item in diffs:
+            base = diff_item.a_blob.data_stream.read().decode("utf-8") if diff_item.a_blob else ""
+            head = diff_item.b_blob.data_stream.read().decode("utf-8") if diff_item.b_blob else ""
+            results.append((base, head, diff_item.diff.decode("utf-8")))
+        files = [item.a_path for item in repo.head.commit.diff(repo.merge_base(repo.head, repo.branches["main"]), R=True)]
+        total_size = sum(len(b) + len(h) + len(p) for b, h, p in results)
+    else:
+        provider = LocalGitProvider("main")
+        for file in provider.iter_diff_files():
+            total_size += len(file.base_file) + len(file.head_file) + len(file.patch)
+        files = provider.get_files()
+    duration = time.perf_counter() - start_time
+    peak_after = peak_rss_kb()
+    print(json.dumps({"duration": duration, "rss_delta_kb": peak_after - peak_before,
+                      "files": len(files), "total_size": total_size}))
+""")
+
+
+def _run_benchmark(repo_dir, mode):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    res = subprocess.run([sys.executable, "-c", _BENCHMARK_SCRIPT, mode], cwd=repo_dir, env=env,
+                         check=True, capture_output=True, text=True)
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+
+@LARGE_BENCHMARK
+def test_streaming_diff_files_benchmark(tmp_path):
+    repo_dir = str(tmp_path / "repo")
+    _create_repo(repo_dir, BENCHMARK_NUM_CHANGED_FILES)
+    start_time = time.perf_counter()
+    legacy = _run_benchmark(repo_dir, "legacy")
+    streaming = _run_benchmark(repo_dir, "streaming")
+    print(f"legacy: {legacy['duration']:.3f}s, peak RSS +{legacy['rss_delta_kb']} KB | "
+          f"streaming: {streaming['duration']:.3f}s, peak RSS +{streaming['rss_delta_kb']} KB "
+          f"({time.perf_counter() - start_time:.1f}s total)")
+
+    assert legacy["files"] == streaming["files"] == BENCHMARK_NUM_CHANGED_FILES + 2
+    assert legacy["total_size"] == streaming["total_size"]
+    assert streaming["duration"] < legacy["duration"] * 2
@@ -0,0 +1,175 @@
+import os
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from pr_agent.algo.local_vector_index import LocalVectorIndex
+from pr_agent.algo.token_handler import TokenHandler
+from pr_agent.config_loader import get_settings
+from pr_agent.tools.pr_similar_issue import (LocalIssueIndexStore,
+                                             PRSimilarIssue)
+
+DIM = 64
+TOP_K = 10
+NUM_QUERIES = 100
+# the large benchmarks take a minute and hundreds of MB, and only run on demand
+LARGE_BENCHMARK = pytest.mark.skipif(not os.environ.get("PR_AGENT_LARGE_BENCHMARKS"),
+                                     reason="set PR_AGENT_LARGE_BENCHMARKS=1 to run")
+
+
+def _clustered_vectors(rng, count, num_clusters=200):
+    centers = rng.standard_normal((num_clusters, DIM)).astype(np.float32)
+    return (centers[rng.integers(num_clusters, size=count)]
+            + 0.5 * rng.standard_normal((count, DIM)).astype(np.float32))
+
+
+def _build(path, vectors, ann_threshold, batch_size=250_000):
+    index = LocalVectorIndex(str(path), ann_threshold=ann_threshold)
+    for start in range(0, len(vectors), batch_size):
+        batch = vectors[start:start + batch_size]
+        index.add([f"issue_{start + i}.issue" for i in range(len(batch))], batch,
+                  [{"repo": "org-repo"}] * len(batch))
+    return index
+
+
+@pytest.mark.parametrize("count, ann_threshold", [
+    (20_000, 5_000),
+    pytest.param(100_000, 100_000, marks=LARGE_BENCHMARK),
+    pytest.param(1_000_000, 100_000, marks=LARGE_BENCHMARK),
+])
+def test_local_vector_index_benchmark(tmp_path, count, ann_threshold):
+    rng = np.random.default_rng(count)
+    vectors = _clustered_vectors(rng, count)
+    queries = vectors[rng.choice(count, size=NUM_QUERIES, replace=False)] + 0.1 * rng.standard_normal(
+        (NUM_QUERIES, DIM)).astype(np.float32)
+
+    start = time.perf_counter()
+    index = _build(tmp_path / "index", vectors, ann_threshold=ann_threshold)
+    build_time = time.perf_counter() - start
+    assert len(index) == count
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = [set(np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:TOP_K]) for query in queries]
+
+    def run(**kwargs):
+        start = time.perf_counter()
+        results = [index.search(query, top_k=TOP_K, **kwargs) for query in queries]
+        latency = (time.perf_counter() - start) / NUM_QUERIES
+        recall = np.mean([len({int(r["id"].split('.')[0].split('_')[-1]) for r in result} & expected_rows) / TOP_K
+                          for result, expected_rows in zip(results, expected)])
+        return latency, recall
+
+    exact_latency, exact_recall = run(exact=True)
+    message = (f"\nlocal vector index of {count} vectors: build {build_time:.2f}s, "
+               f"exact {exact_latency * 1000:.2f}ms recall@{TOP_K} {exact_recall:.3f}")
+    assert exact_recall > 0.99
+    ann_latency, ann_recall = run()
+    message += f", approximate {ann_latency * 1000:.2f}ms recall@{TOP_K} {ann_recall:.3f}"
+    print(message)
+    assert index.manifest["ivf"] and ann_recall > 0.9
+    if count >= 100_000:  # too close to call on a small index
+        assert ann_latency < exact_latency
+
+
+def test_append_only_updates(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = _clustered_vectors(rng, 3000)
+    index = _build(tmp_path / "index", vectors[:2000], ann_threshold=1000)
+    ivf = index.manifest["ivf"]
+    assert ivf and index.manifest["ivf_count"] == 2000
+
+    # a crashed writer left uncommitted bytes past the committed rows
+    with open(os.path.join(index.path, index.manifest["vectors"]), "ab") as f:
+        f.write(b"\0" * 1000)
+    reader = LocalVectorIndex(index.path)
+    assert index.add(["issue_0.issue", "issue_2000.issue"], vectors[[0, 2000]]) == 1  # existing ids are skipped
+    assert len(index) == 2001 and index.manifest["ivf"] == ivf
+    # rows appended after the approximate index was built are found, by other readers too
+    assert reader.search(vectors[2000], top_k=1)[0]["id"] == "issue_2000.issue"
+    assert "issue_2000.issue" in reader and "issue_2001.issue" not in reader
+
+    index.add([f"issue_{i}.issue" for i in range(2001, 3000)], vectors[2001:])
+    assert index.manifest["ivf"] != ivf and index.manifest["ivf_count"] == 3000  # rebuilt
+    assert not os.path.exists(os.path.join(index.path, ivf))
+    assert os.path.getsize(os.path.join(index.path, index.manifest["vectors"])) == 3000 * DIM * 4
+    for i in rng.choice(3000, size=20, replace=False):
+        assert index.search(vectors[i], top_k=1)[0]["id"] == f"issue_{i}.issue"
+
+    # overwriting swaps in new files
+    old_files = {index.manifest[name] for name in ("vectors", "offsets", "metadata", "ivf")}
+    assert index.add(["issue_1.issue"], vectors[:1], [{"repo": "org-repo"}], overwrite=True) == 1
+    assert len(reader.search(vectors[0], top_k=5)) == 1
+    assert reader.search(vectors[0])[0] == {"id": "issue_1.issue", "score": pytest.approx(1.0, abs=1e-5),
+                                            "metadata": {"repo": "org-repo"}}
+    assert not old_files & set(os.listdir(index.path))
+
+
+def test_upserts_and_properties(tmp_path):
+    rng = np.random.default_rng(1)
+    vectors = _clustered_vectors(rng, 1500)
+    index = _build(tmp_path / "index", vectors[:1200], ann_threshold=1000)
+    index.set_properties(watermark="2024-01-01T00:00:00+00:00")
+    reader = LocalVectorIndex(index.path)
+
+    # issue_3 is replaced by the vector of issue_1400
+    assert index.add(["issue_3.issue", "issue_1200.issue"], vectors[[1400, 1200]],
+                     [{"version": 2}, {"version": 1}], upsert=True) == 2
+    assert len(index) == 1202 and index.manifest["superseded_count"] == 1
+    assert index.get_metadata(["issue_3.issue", "issue_1200.issue", "issue_9999.issue"]) == {
+        "issue_3.issue": {"version": 2}, "issue_1200.issue": {"version": 1}}
+    for exact in (True, False):
+        assert [row["id"] for row in reader.search(vectors[3], top_k=1200, exact=exact)].count("issue_3.issue") <= 1
+        top = reader.search(vectors[1400], top_k=1, exact=exact)[0]
+        assert top["id"] == "issue_3.issue" and top["metadata"] == {"version": 2}
+    assert len(reader.search(vectors[0], top_k=5000, exact=True)) == 1201  # one row per id
+    # the properties are kept by appends and reset by an overwrite
+    assert reader.get_property("watermark") == "2024-01-01T00:00:00+00:00"
+    index.add(["issue_0.issue"], vectors[:1], overwrite=True)
+    assert reader.get_property("watermark") is None and len(reader.search(vectors[0], top_k=5)) == 1
+    index.clear()
+    assert reader.search(vectors[0]) == [] and len(reader) == 0 and "issue_0.issue" not in reader
+
+
+class StubRepo:
+    def __init__(self, issues):
+        self.issues = issues
+
+    def get_issues(self, state="open", sort="created", direction="desc", since=None):
+        return [issue for issue in self.issues if since is None or issue.updated_at >= since]
+
+
+class StubIssue:
+    def __init__(self, number, title):
+        self.number = number
+        self.title = title
+        self.body = f"The body of {title}"
+        self.pull_request = None
+        self.user = SimpleNamespace(login="user")
+        self.created_at = "2024-01-01"
+        self.updated_at = datetime(2024, 1, 1, number, tzinfo=timezone.utc)
+
+
+def test_similar_issue_local_index(tmp_path, monkeypatch):
+    tool = object.__new__(PRSimilarIssue)  # without an issue to fetch
+    tool.max_issues_to_scan = 100
+    tool.token_handler = TokenHandler()
+    tool.local_index = LocalVectorIndex(str(tmp_path / "org-repo"))
+    store = LocalIssueIndexStore(tool.local_index)
+    monkeypatch.setattr(tool, "_embed_texts", lambda texts: [[float(len(text)), 1.0, 0.5] for text in texts])
+    original = get_settings().get("PR_SIMILAR_ISSUE.SKIP_COMMENTS")
+    get_settings().set("PR_SIMILAR_ISSUE.SKIP_COMMENTS", True)
+    try:
+        issues = [StubIssue(i, f"issue {'x' * i}") for i in range(1, 4)]
+        assert tool._sync_index_with_updated_issues(StubRepo(issues), "org-repo", store) == 3
+        issues[1].body = "An edited body"
+        issues[1].updated_at = datetime(2024, 2, 1, tzinfo=timezone.utc)
+        assert tool._sync_index_with_updated_issues(StubRepo(issues), "org-repo", store) == 1
+    finally:
+        get_settings().set("PR_SIMILAR_ISSUE.SKIP_COMMENTS", original)
+    assert len(tool.local_index) == 4 and "issue_2.issue" in tool.local_index
+    assert store.get_watermark() == "2024-02-01T00:00:00+00:00"
+    assert tool.local_index.search([1.0, 0.0, 0.0], top_k=1)[0]["metadata"]["level"] == "issue"
+    assert len(tool.local_index.search([1.0, 0.0, 0.0], top_k=10)) == 3
@@ -0,0 +1,119 @@
+import time
+
+import pytest
+
+from pr_agent.algo.language_handler import (LanguageSorter,
+                                            sort_files_by_main_languages)
+from pr_agent.algo.pr_processing import get_pr_diff
+from pr_agent.algo.token_handler import TokenHandler
+from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
+from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.retry_policy import RetryPolicy
+
+NUM_FILES = 300
+FETCH_LATENCY = 0.004  # per file: its base and head contents
+
+
+def _diff_file(i):
+    extension = ("py", "js", "md", "h")[i % 4]
+    base_file = "\n".join(f"def function_{j}(value):  # file {i}\n    return value + {j}" for j in range(150))
+    patch = "\n".join(f"@@ -{k},3 +{k},3 @@\n context {k}\n-return value + {k}\n+return value * {k}\n context"
+                      for k in range(10, 280, 30))
+    return FilePatchInfo(base_file, base_file, patch, f"src/pkg_{i % 7}/module_{i}.{extension}",
+                         edit_type=EDIT_TYPE.MODIFIED)
+
+
+class LatencyInjectedProvider:
+    """
+    A git provider that takes `FETCH_LATENCY` to fetch the contents of each file, like the GitHub provider does
+    (file by file), and counts the fetches.
+    """
+
+    def __init__(self):
+        self.diff_files = None
+        self.fetched = 0
+
+    def get_languages(self):
+        return {"Python": 5000, "JavaScript": 2000, "C": 100}
+
+    def iter_diff_files(self):
+        for i in range(NUM_FILES):
+            time.sleep(FETCH_LATENCY)
+            self.fetched += 1
+            yield _diff_file(i)
+
+    def get_diff_files(self):
+        if not self.diff_files:
+            self.diff_files = list(self.iter_diff_files())
+        return self.diff_files
+
+
+@pytest.fixture
+def pipeline_setting():
+    original = get_settings().get("CONFIG.PIPELINE_DIFF_FILES")
+    yield lambda enabled: get_settings().set("CONFIG.PIPELINE_DIFF_FILES", enabled)
+    get_settings().set("CONFIG.PIPELINE_DIFF_FILES", original)
+
+
+def _time_to_llm_call(provider, add_line_numbers_to_hunks):
+    token_handler = TokenHandler(provider, {}, "system prompt", "user prompt")
+    start = time.perf_counter()
+    diff = get_pr_diff(provider, token_handler, "gpt-4o", add_line_numbers_to_hunks=add_line_numbers_to_hunks)
+    return time.perf_counter() - start, diff
+
+
+@pytest.mark.parametrize("add_line_numbers_to_hunks", [False, True])
+def test_pipelined_diff_benchmark(pipeline_setting, add_line_numbers_to_hunks):
+    pipeline_setting(False)
+    sequential_provider = LatencyInjectedProvider()
+    sequential, sequential_diff = _time_to_llm_call(sequential_provider, add_line_numbers_to_hunks)
+    pipeline_setting(True)
+    pipelined_provider = LatencyInjectedProvider()
+    pipelined, pipelined_diff = _time_to_llm_call(pipelined_provider, add_line_numbers_to_hunks)
+
+    print(f"\ntime to first LLM call, {NUM_FILES} files: fetch then process {sequential:.3f}s, "
+          f"pipelined {pipelined:.3f}s (fetching alone: {NUM_FILES * FETCH_LATENCY:.3f}s)")
+    assert pipelined_diff == sequential_diff
+    assert pipelined_provider.fetched == sequential_provider.fetched == NUM_FILES
+    assert pipelined < sequential
+
+
+def test_pipelined_diff_errors_reach_the_caller(pipeline_setting):
+    class FailingProvider(LatencyInjectedProvider):
+        def iter_diff_files(self):
+            yield _diff_file(0)
+            raise ConnectionError("connection reset")
+
+    pipeline_setting(True)
+    with pytest.raises(ConnectionError):
+        _time_to_llm_call(FailingProvider(), False)
+
+
+def test_language_sorter_matches_sort_files_by_main_languages():
+    files = [_diff_file(i) for i in range(40)]
+    files.append(FilePatchInfo("", "", "@@ -1 +1 @@\n-a\n+b", "assets/logo.png"))  # bad extension
+    languages = {"Python": 5000, "JavaScript": 2000, "C": 100}
+
+    sorter = LanguageSorter(languages)
+    kept = [sorter.add(file) for file in files]
+
+    assert kept.count(False) == 1
+    assert sorter.get_sorted_files() == sort_files_by_main_languages(languages, files)
+    assert [lang["language"] for lang in sorter.get_sorted_files()] == ["Python", "JavaScript", "C", "Other"]
+    assert [file.filename for file in sorter.get_sorted_files()[-1]["files"]][:2] == ["src/pkg_2/module_2.md",
+                                                                                   "src/pkg_6/module_6.md"]
+
+
+def test_retried_iteration_skips_yielded_items():
+    attempts = []
+
+    def numbers():
+        attempts.append(1)
+        for i in range(5):
+            if i == 3 and len(attempts) == 1:
+                raise ConnectionError("connection reset")
+            yield i
+
+    policy = RetryPolicy(max_attempts=3, sleep=lambda delay: None)
+    assert list(policy.iterate(numbers)) == [0, 1, 2, 3, 4]
+    assert len(attempts) == 2
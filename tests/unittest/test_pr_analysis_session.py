@@ -0,0 +1,190 @@
+import asyncio
+import time
+from collections import Counter
+
+import pytest
+
+from pr_agent.agent import pr_agent
+from pr_agent.agent.pr_agent import PRAgent
+from pr_agent.algo.ai_handlers.base_ai_handler import get_llm_limiter
+from pr_agent.algo.language_handler import get_main_pr_language
+from pr_agent.algo.pr_analysis_session import (PRAnalysisSession,
+                                               pr_analysis_session)
+from pr_agent.algo.pr_processing import get_pr_diff
+from pr_agent.algo.token_handler import TokenHandler
+from pr_agent.algo.types import EDIT_TYPE
+from pr_agent.config_loader import get_settings
+from pr_agent.git_providers import (_GIT_PROVIDERS,
+                                    get_git_provider_with_context)
+from pr_agent.git_providers.git_provider import FilePatchInfo, IncrementalPR
+from pr_agent.servers import github_webhook_handler
+
+PR_URL = "https://github.com/org/repo/pull/1"
+AUTO_COMMANDS = ["/describe", "/review", "/improve"]
+PROVIDER_LATENCY = 0.02
+LLM_LATENCY = 0.1
+
+
+class StubProvider:
+    """
+    Stands in for a git provider: each read costs `PROVIDER_LATENCY`, and is counted (per class, as each tool
+    creates its own provider).
+    """
+    calls = Counter()
+
+    def __init__(self, pr_url):
+        self.pr_url = pr_url
+        self.diff_files = None
+        self.incremental = IncrementalPR(False)
+        self.calls["init"] += 1
+
+    def _call(self, name):
+        self.calls[name] += 1
+        time.sleep(PROVIDER_LATENCY)
+
+    def get_languages(self):
+        self._call("get_languages")
+        return {"Python": 1000, "Shell": 10}
+
+    def get_files(self):
+        self._call("get_files")
+        return [f"src/module_{i}.py" for i in range(20)]
+
+    def get_diff_files(self):
+        self._call("get_diff_files")
+        base_file = "\n".join(f"line {j}" for j in range(60))
+        patch = "@@ -20,3 +20,4 @@\n line 19\n-line 20\n+line 20 changed\n+line 20 added\n line 21"
+        self.diff_files = [FilePatchInfo(base_file, base_file, patch, f"src/module_{i}.py", edit_type=EDIT_TYPE.MODIFIED)
+                           for i in range(20)]
+        return self.diff_files
+
+
+class StubLLM:
+    in_flight = 0
+    max_in_flight = 0
+    calls = 0
+
+    async def chat_completion(self, model, system, user, temperature=0.2, img_path=None):
+        async with get_llm_limiter():
+            StubLLM.calls += 1
+            StubLLM.in_flight += 1
+            StubLLM.max_in_flight = max(StubLLM.max_in_flight, StubLLM.in_flight)
+            await asyncio.sleep(LLM_LATENCY)
+            StubLLM.in_flight -= 1
+        return "response", "stop"
+
+
+class StubTool:
+    """
+    The provider and diff usage of `/describe`, `/review` and `/improve`: the main language at construction,
+    then the PR diff, then one LLM call.
+    """
+    add_line_numbers_to_hunks = False
+
+    def __init__(self, pr_url, ai_handler=None, args=None):
+        self.git_provider = get_git_provider_with_context(pr_url)
+        self.main_language = get_main_pr_language(self.git_provider.get_languages(), self.git_provider.get_files())
+        self.ai_handler = ai_handler()
+        self.token_handler = TokenHandler(self.git_provider, {}, f"system prompt of {type(self).__name__}", "")
+
+    async def run(self):
+        diff = get_pr_diff(self.git_provider, self.token_handler, "gpt-4o",
+                           add_line_numbers_to_hunks=self.add_line_numbers_to_hunks)
+        assert "src/module_19.py" in diff
+        await self.ai_handler.chat_completion("gpt-4o", system="", user=diff)
+
+
+class StubReviewer(StubTool):
+    add_line_numbers_to_hunks = True
+
+
+class StubCodeSuggestions(StubTool):
+    add_line_numbers_to_hunks = True
+
+
+@pytest.fixture
+def stub_environment(monkeypatch):
+    monkeypatch.setitem(_GIT_PROVIDERS, "stub", StubProvider)
+    monkeypatch.setattr(pr_agent, "apply_repo_settings", lambda pr_url: None)
+    for command, tool in (("describe", StubTool), ("review", StubReviewer), ("improve", StubCodeSuggestions)):
+        monkeypatch.setitem(pr_agent.command2class, command, tool)
+    settings = get_settings()
+    original = {key: settings.get(key) for key in ("CONFIG.GIT_PROVIDER", "GITHUB_APP.RUN_AUTO_COMMANDS_CONCURRENTLY",
+                                                    "CONFIG.MAX_CONCURRENT_LLM_CALLS")}
+    settings.set("CONFIG.GIT_PROVIDER", "stub")
+    StubProvider.calls.clear()
+    StubLLM.calls = StubLLM.max_in_flight = 0
+    yield settings
+    for key, value in original.items():
+        settings.set(key, value)
+
+
+async def _run(concurrently, session=True):
+    get_settings().set("GITHUB_APP.RUN_AUTO_COMMANDS_CONCURRENTLY", concurrently)
+    StubProvider.calls.clear()
+    agent = PRAgent(ai_handler=StubLLM)
+    start = time.perf_counter()
+    if session:
+        await github_webhook_handler._run_auto_commands_github("pr_commands", AUTO_COMMANDS, agent, PR_URL, "head")
+    else:  # before: one command after the other, each tool on its own
+        for command in AUTO_COMMANDS:
+            assert await agent.handle_request(PR_URL, command)
+    return time.perf_counter() - start, Counter(StubProvider.calls)
+
+
+@pytest.mark.asyncio
+async def test_auto_commands_share_the_analysis(stub_environment):
+    before, before_calls = await _run(concurrently=False, session=False)
+    shared, shared_calls = await _run(concurrently=False)
+    concurrent, concurrent_calls = await _run(concurrently=True)
+
+    print(f"\nauto commands end-to-end: sequential {before:.3f}s {dict(before_calls)}, "
+          f"shared analysis {shared:.3f}s {dict(shared_calls)}, concurrent {concurrent:.3f}s {dict(concurrent_calls)}")
+    assert before_calls == Counter(init=3, get_languages=6, get_files=3, get_diff_files=3)
+    for calls in (shared_calls, concurrent_calls):
+        assert calls == Counter(init=3, get_languages=1, get_files=1, get_diff_files=1)
+    assert StubLLM.calls == 9
+    # the LLM calls of the three tools overlap
+    assert concurrent < before - LLM_LATENCY
+
+
+@pytest.mark.asyncio
+async def test_llm_calls_are_bounded(stub_environment):
+    stub_environment.set("CONFIG.MAX_CONCURRENT_LLM_CALLS", 2)  # read when the loop's limiter is created
+    await _run(concurrently=True)
+    assert StubLLM.calls == 3
+    assert StubLLM.max_in_flight == 2
+
+
+def test_session_is_bypassed_for_incremental_providers(stub_environment):
+    with pr_analysis_session(PR_URL, "head") as session:
+        provider = get_git_provider_with_context(PR_URL)
+        incremental_provider = get_git_provider_with_context(PR_URL)
+        incremental_provider.incremental = IncrementalPR(True)
+        other_provider = get_git_provider_with_context("https://github.com/org/repo/pull/2")
+
+    assert provider.analysis_session is session
+    assert provider.get_diff_files() is not incremental_provider.get_diff_files()
+    assert StubProvider.calls["get_diff_files"] == 2
+    assert not hasattr(other_provider, "analysis_session")
+    assert other_provider.get_diff_files() is not provider.get_diff_files()
+
+
+@pytest.mark.asyncio
+async def test_failed_async_artifact_is_computed_again():
+    session = PRAnalysisSession(PR_URL)
+    attempts = []
+
+    async def fetch_tickets():
+        attempts.append(1)
+        await asyncio.sleep(0)
+        if len(attempts) == 1:
+            raise ConnectionError("boom")
+        return ["ticket"]
+
+    results = await asyncio.gather(session.get_async("tickets", fetch_tickets),
+                                   session.get_async("tickets", fetch_tickets), return_exceptions=True)
+    assert [type(result) for result in results] == [ConnectionError, ConnectionError]
+    assert await session.get_async("tickets", fetch_tickets) == ["ticket"]
+    assert await session.get_async("tickets", fetch_tickets) == ["ticket"]
+    assert len(attempts) == 2
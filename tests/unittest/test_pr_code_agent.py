@@ -47,8 +47,8 @@ class TestPRCodeAgent(unittest.IsolatedAsyncioTestCase):
 
         # 2. Check if git provider methods were called
         mock_git_provider.get_pr_file_content.assert_called_with("file1.py", "feature-branch")
-        mock_git_provider.create_or_update_pr_file.assert_called_with(
-            "file1.py", "feature-branch", "new content", "Agent edit"
+        mock_git_provider.commit_files.assert_called_once_with(
+            "feature-branch", {"file1.py": "new content"}, "Agent edit"
         )
         mock_git_provider.publish_comment.assert_called_with("Task Done: Done")
 
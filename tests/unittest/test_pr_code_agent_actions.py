@@ -32,7 +32,7 @@ async def test_pr_code_agent_delete_file():
              await agent.run()
 
     # Assertions
-    mock_provider.delete_file.assert_called_with("to_delete.py", "feature-branch", "Agent deleted file")
+    mock_provider.commit_files.assert_called_once_with("feature-branch", {"to_delete.py": None}, "Agent edit")
     mock_os_remove.assert_called_with("to_delete.py")
     mock_provider.publish_comment.assert_called_with("Task Done: Done")
 
@@ -66,10 +66,12 @@ async def test_pr_code_agent_rename_file():
              await agent.run()
 
     # Assertions
-    # Rename involves: Read -> Edit (Create new) -> Delete old
+    # Rename involves: Read -> Edit (Create new) -> Delete old, committed together
     mock_provider.get_pr_file_content.assert_called_with("old.py", "feature-branch")
-    mock_provider.create_or_update_pr_file.assert_called_with("new.py", "feature-branch", "Content of old file", "Agent edit")
-    mock_provider.delete_file.assert_called_with("old.py", "feature-branch", "Agent deleted file")
+    mock_provider.commit_files.assert_called_once_with(
+        "feature-branch", {"new.py": "Content of old file", "old.py": None}, "Agent edit")
+    mock_provider.create_or_update_pr_file.assert_not_called()
+    mock_provider.delete_file.assert_not_called()
     mock_provider.publish_comment.assert_called_with("Task Done: Done")
 
 
@@ -116,30 +118,8 @@ async def test_pr_code_agent_enforce_limit():
              await agent.run()
 
     # Assertions
-    # Verify large file creation was attempted (and warned)
-    # Verify smaller files were created
-    assert mock_provider.create_or_update_pr_file.call_count >= 3
-    calls = mock_provider.create_or_update_pr_file.call_args_list
-
-    # Check for large content attempt
-    found_large = False
-    for call in calls:
-        if call.args[0] == "large.py" and call.args[2] == large_content:
-            found_large = True
-            break
-    assert found_large, "Did not find call creating large.py with large content"
-
-    # Check for split content
-    found_part1 = False
-    found_part2 = False
-    for call in calls:
-        if call.args[0] == "part1.py" and call.args[2] == small_content_1:
-            found_part1 = True
-        if call.args[0] == "part2.py" and call.args[2] == small_content_2:
-            found_part2 = True
-
-    assert found_part1, "Did not find call creating part1.py"
-    assert found_part2, "Did not find call creating part2.py"
-
-    # Check for delete of large file
-    mock_provider.delete_file.assert_called_with("large.py", "feature-branch", "Agent deleted file")
+    # The edits are committed together at the end: the smaller files, and the large file
+    # created then deleted in the same run is only a delete (skipped if it never existed)
+    mock_provider.commit_files.assert_called_once_with(
+        "feature-branch", {"large.py": None, "part1.py": small_content_1, "part2.py": small_content_2}, "Agent edit")
+    mock_provider.create_or_update_pr_file.assert_not_called()
@@ -30,8 +30,8 @@ async def test_pr_code_agent_delete_file_flow():
 
     # Assertions
     assert mock_ai_handler.chat_completion.call_count == 3
-    # Verify provider delete_file was called
-    mock_provider.delete_file.assert_called_with("deleteme.txt", "feature-branch", "Agent deleted file")
+    # Verify the delete was committed at the end of the run
+    mock_provider.commit_files.assert_called_once_with("feature-branch", {"deleteme.txt": None}, "Agent edit")
     # Verify local remove was called
     mock_remove.assert_called_with("deleteme.txt")
 
@@ -32,7 +32,7 @@ async def test_pr_code_agent_jules_persona_flow():
 
     # Assertions
     assert mock_ai_handler.chat_completion.call_count == 6
-    mock_provider.create_or_update_pr_file.assert_called_with("README.md", "feature-branch", "New content", "Agent edit")
+    mock_provider.commit_files.assert_called_once_with("feature-branch", {"README.md": "New content"}, "Agent edit")
     mock_provider.publish_comment.assert_called_with("Task Done: Done")
 
     # Verify tool definitions include args
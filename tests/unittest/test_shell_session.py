@@ -0,0 +1,101 @@
+import subprocess
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from pr_agent.algo.shell_session import ShellSession
+from pr_agent.jules.tools import JulesTools
+from pr_agent.tools.code_agent.tools import AgentTools
+
+NUM_COMMANDS = 100
+
+
+def _is_running(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"  # a zombie is not reaped yet
+    except FileNotFoundError:
+        return False
+
+
+@pytest.fixture
+def shell(tmp_path):
+    with ShellSession(cwd=str(tmp_path), timeout=5, max_output_bytes=1000) as shell:
+        yield shell
+
+
+def test_state_persists_between_commands(shell, tmp_path):
+    (tmp_path / "sub").mkdir()
+    shell.run("cd sub && export GREETING=hello && greet() { echo \"$GREETING $1\"; }")
+    shell.run("mkdir -p venv/bin && echo 'export VIRTUAL_ENV=active' > venv/bin/activate && . venv/bin/activate")
+    result = shell.run("pwd; greet world; echo $VIRTUAL_ENV")
+    assert result.stdout.splitlines() == [str(tmp_path / "sub"), "hello world", "active"]
+    assert result.returncode == 0 and result.stderr == ""
+
+
+def test_exit_codes_and_streams(shell):
+    result = shell.run("echo out; echo err >&2; exit_code() { return 3; }; exit_code")
+    assert (result.stdout, result.stderr, result.returncode) == ("out\n", "err\n", 3)
+    assert shell.run("printf 'no newline'").stdout == "no newline"
+    assert shell.run("echo 'unterminated").returncode == 2  # a syntax error does not break the session
+    assert shell.run("cat").stdout == ""  # the commands get no stdin
+    assert shell.run("echo still here").stdout == "still here\n"
+
+
+def test_output_is_capped(shell):
+    result = shell.run("head -c 5000 /dev/zero | tr '\\0' x; echo; echo done")
+    assert result.truncated and result.stdout.startswith("x" * 1000)
+    assert "output truncated, 5006 bytes > 1000 bytes" in result.stdout
+    assert shell.run("echo next").stdout == "next\n"
+
+
+def test_timeout_and_exit_restart_the_shell(shell, tmp_path):
+    shell.run("cd / && sleep 30 & echo started")
+    start = time.perf_counter()
+    with pytest.raises(subprocess.TimeoutExpired):
+        shell.run("echo partial; sleep 30", timeout=0.5)
+    assert time.perf_counter() - start < 5
+    assert shell.run("pwd").stdout == f"{tmp_path}\n"  # a new shell
+    assert shell.run("exit 4").returncode == 4
+    assert shell.run("echo again").stdout == "again\n"
+
+
+def test_close_ends_the_shell_and_its_processes(tmp_path):
+    shell = ShellSession(cwd=str(tmp_path))
+    pid = int(shell.run("sleep 30 >/dev/null 2>&1 & echo $!").stdout)
+    shell.close()
+    time.sleep(0.1)
+    assert not shell.is_alive() and not _is_running(pid)
+
+
+def test_secrets_are_not_passed_to_the_shell(shell, monkeypatch):
+    shell.close()
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-secret")
+    monkeypatch.setenv("GITHUB_TOKEN", "ghp-secret")
+    monkeypatch.setenv("PR_AGENT_DEBUG", "visible")
+    assert shell.run("echo \"$OPENAI_API_KEY|$GITHUB_TOKEN|$PR_AGENT_DEBUG\"").stdout == "||visible\n"
+
+
+@pytest.mark.asyncio
+async def test_agent_tools_run_in_one_shell(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    tools = AgentTools(MagicMock())
+    await tools.run_in_bash_session("mkdir -p build && cd build && export MODE=release")
+    assert await tools.run_in_bash_session("pwd; echo $MODE") == f"Stdout: {tmp_path / 'build'}\nrelease\n\nStderr: "
+    tools.shell.close()
+
+    jules_tools = JulesTools(MagicMock())
+    await jules_tools.run_command("cd build")
+    assert await jules_tools.run_command("basename $(pwd)") == "Stdout: build\n\nStderr: "
+    jules_tools.shell.close()
+
+
+def test_commands_share_one_shell(tmp_path, monkeypatch):
+    popen = MagicMock(wraps=subprocess.Popen)
+    monkeypatch.setattr("pr_agent.algo.shell_session.subprocess.Popen", popen)
+    commands = [f"echo step {i} && test -d ." for i in range(NUM_COMMANDS)]
+    with ShellSession(cwd=str(tmp_path)) as shell:
+        outputs = [shell.run(command).stdout for command in commands]
+    assert outputs == [f"step {i}\n" for i in range(NUM_COMMANDS)]
+    assert popen.call_count == 1
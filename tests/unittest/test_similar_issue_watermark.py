@@ -0,0 +1,344 @@
+import re
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from pr_agent.algo.token_handler import TokenHandler
+from pr_agent.config_loader import get_settings
+from pr_agent.tools.pr_similar_issue import (LanceDBIssueIndexStore,
+                                             PineconeIssueIndexStore,
+                                             PRSimilarIssue,
+                                             QdrantIssueIndexStore)
+
+NUM_ISSUES = 300
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeIssue:
+    def __init__(self, number, updated_at, comments=(), pull_request=None):
+        self.number = number
+        self.title = f"Issue {number}"
+        self.body = f"The body of issue {number}"
+        self.user = SimpleNamespace(login="user")
+        self.created_at = START + timedelta(minutes=number)
+        self.updated_at = updated_at
+        self.pull_request = pull_request
+        self.comments = [SimpleNamespace(body=body) for body in comments]
+
+    def get_comments(self):
+        return self.comments
+
+
+class FakeRepo:
+    """
+    An issue source like the GitHub issues API, counting the listed issues.
+    """
+
+    def __init__(self, issues):
+        self.issues = {issue.number: issue for issue in issues}
+        self.calls = []
+        self.listed = 0
+
+    def get_issues(self, state="open", sort="created", direction="desc", since=None):
+        self.calls.append({"sort": sort, "direction": direction, "since": since})
+        issues = [issue for issue in self.issues.values() if since is None or issue.updated_at >= since]
+        if sort == "updated":
+            issues.sort(key=lambda issue: (issue.updated_at, issue.number), reverse=direction == "desc")
+        else:
+            issues.sort(key=lambda issue: issue.number, reverse=direction == "desc")
+        for issue in issues:
+            self.listed += 1
+            yield issue
+
+    def update(self, number, body=None, comments=None, at=None):
+        issue = self.issues.get(number) or FakeIssue(number, at)
+        if body is not None:
+            issue.body = body
+        if comments is not None:
+            issue.comments = [SimpleNamespace(body=comment) for comment in comments]
+        issue.updated_at = at
+        self.issues[number] = issue
+
+
+class FakeStore:
+    """
+    A vector store counting its operations.
+    """
+
+    def __init__(self):
+        self.records = {}
+        self.watermark = None
+        self.lookups = []
+        self.upserts = []
+
+    def get_watermark(self):
+        return self.watermark
+
+    def set_watermark(self, watermark):
+        self.watermark = watermark
+
+    def get_content_hashes(self, ids):
+        self.lookups.append(len(ids))
+        return {row_id: self.records[row_id][1]["content_hash"] for row_id in ids if row_id in self.records}
+
+    def upsert(self, records, vectors, content_hashes):
+        self.upserts.append(len(records))
+        for record, vector, content_hash in zip(records, vectors, content_hashes):
+            self.records[record.id] = (vector, {"content_hash": content_hash})
+
+
+def _comment(number, version=1):
+    return f"A comment of at least ten words about issue {number}, version {version} of it"
+
+
+@pytest.fixture
+def tool(monkeypatch):
+    tool = object.__new__(PRSimilarIssue)  # without an issue to fetch
+    tool.max_issues_to_scan = 2000  # more than the issues of any repo below
+    tool.token_handler = TokenHandler()
+    tool.embedded = []
+    monkeypatch.setattr(tool, "_embed_texts", lambda texts: tool.embedded.extend(texts) or [[1.0, 0.0]] * len(texts))
+    original = get_settings().get("PR_SIMILAR_ISSUE.SKIP_COMMENTS")
+    get_settings().set("PR_SIMILAR_ISSUE.SKIP_COMMENTS", False)
+    yield tool
+    get_settings().set("PR_SIMILAR_ISSUE.SKIP_COMMENTS", original)
+
+
+def _repo():
+    issues = [FakeIssue(n, START + timedelta(minutes=n), comments=[_comment(n)] if n % 10 == 0 else ())
+              for n in range(1, NUM_ISSUES + 1)]
+    issues += [FakeIssue(n, START + timedelta(minutes=n), pull_request=object())
+               for n in range(NUM_ISSUES + 1, NUM_ISSUES + 100)]
+    return FakeRepo(issues)
+
+
+def test_incremental_sync_embeds_only_changed_records(tool):
+    repo, store = _repo(), FakeStore()
+    assert tool._sync_index_with_updated_issues(repo, "org-repo", store) == NUM_ISSUES + NUM_ISSUES // 10
+    assert repo.calls[0] == {"sort": "updated", "direction": "asc", "since": None}
+    assert repo.listed == NUM_ISSUES + 99 and store.lookups == [NUM_ISSUES + NUM_ISSUES // 10]
+    assert store.upserts == [NUM_ISSUES + NUM_ISSUES // 10]
+    assert store.watermark == (START + timedelta(minutes=NUM_ISSUES + 99)).isoformat()  # pull requests included
+    assert "issue_10.comment_1" in store.records and "issue_11.comment_1" not in store.records
+
+    # nothing changed: only the issues at the watermark are listed, and nothing is embedded
+    repo.listed, store.lookups, store.upserts, tool.embedded = 0, [], [], []
+    assert tool._sync_index_with_updated_issues(repo, "org-repo", store) == 0
+    assert repo.calls[-1] == {"sort": "updated", "direction": "asc",
+                              "since": START + timedelta(minutes=NUM_ISSUES + 99)}
+    assert repo.listed == 1 and store.lookups == [] and store.upserts == []
+
+    # an edited body, a new comment, an update that changes no indexed text (a label), and a new issue
+    now = START + timedelta(days=60)
+    repo.update(5, body="The new body of issue 5", at=now)
+    repo.update(20, comments=[_comment(20), _comment(20, version=2)], at=now + timedelta(seconds=1))
+    repo.update(30, at=now + timedelta(seconds=2))
+    repo.update(NUM_ISSUES + 500, at=now + timedelta(seconds=3))
+    repo.listed, store.lookups, store.upserts, tool.embedded = 0, [], [], []
+    assert tool._sync_index_with_updated_issues(repo, "org-repo", store) == 3
+    assert repo.listed == 5 and store.lookups == [7] and store.upserts == [3]
+    assert tool.embedded == ['Issue Header: "Issue 5"\n\nIssue Body:\nThe new body of issue 5',
+                             _comment(20, version=2),
+                             f'Issue Header: "Issue {NUM_ISSUES + 500}"\n\nIssue Body:\n'
+                             f'The body of issue {NUM_ISSUES + 500}']
+    assert store.watermark == (now + timedelta(seconds=3)).isoformat()
+
+
+def test_capped_first_sync_indexes_the_rest_of_the_repo_on_the_next_syncs(tool):
+    repo, store = _repo(), FakeStore()
+    tool.max_issues_to_scan = 100
+    assert tool._sync_index_with_updated_issues(repo, "org-repo", store) == 100 + 10
+    assert store.watermark == (START + timedelta(minutes=100)).isoformat()
+
+    # each sync resumes from the watermark, the issue at the watermark is listed again but not embedded
+    embedded = [len(tool.embedded)]
+    while tool._sync_index_with_updated_issues(repo, "org-repo", store):
+        embedded.append(len(tool.embedded))
+    assert embedded == [110, 218, 327, 330]
+    assert all(f"issue_{number}.issue" in store.records for number in range(1, NUM_ISSUES + 1))
+    assert len(tool.embedded) == len(store.records) == NUM_ISSUES + NUM_ISSUES // 10
+    assert store.watermark == (START + timedelta(minutes=NUM_ISSUES + 99)).isoformat()
+
+
+def test_sync_resumes_from_the_watermark_when_the_scan_is_capped(tool):
+    repo, store = _repo(), FakeStore()
+    tool._sync_index_with_updated_issues(repo, "org-repo", store)
+    now = START + timedelta(days=60)
+    for i, number in enumerate(range(100, 150)):
+        repo.update(number, body=f"Edited issue {number}", at=now + timedelta(seconds=i))
+
+    tool.max_issues_to_scan = 20
+    tool.embedded = []
+    tool._sync_index_with_updated_issues(repo, "org-repo", store)
+    tool.max_issues_to_scan = NUM_ISSUES
+    tool._sync_index_with_updated_issues(repo, "org-repo", store)
+    # every edited issue is embedded once, the one at the watermark of the capped run is not embedded again
+    assert sorted(text.split()[-1] for text in tool.embedded) == [str(number) for number in range(100, 150)]
+    assert store.watermark == (now + timedelta(seconds=49)).isoformat()
+
+
+class FakePineconeIndex:
+    """
+    A Pinecone index (fetch, update, upsert), counting the fetches.
+    """
+
+    def __init__(self):
+        self.vectors = {}
+        self.fetches = 0
+
+    def fetch(self, ids):
+        self.fetches += 1
+        vectors = {row_id: self.vectors[row_id] for row_id in ids if row_id in self.vectors}
+        return SimpleNamespace(to_dict=lambda: {"vectors": vectors})
+
+    def update(self, id, set_metadata):
+        self.vectors[id]["metadata"].update(set_metadata)
+
+    def upsert(self, vectors):
+        for row_id, values, metadata in vectors:
+            self.vectors[row_id] = {"id": row_id, "values": values, "metadata": metadata}
+
+    def seed(self, record, vector):
+        self.vectors[record.id] = {"id": record.id, "values": vector, "metadata": record.metadata.model_dump()}
+
+    def records(self, repo):
+        return {row_id: vector for row_id, vector in self.vectors.items() if vector["metadata"]["repo"] == repo}
+
+
+class FakeLanceTable:
+    """
+    A LanceDB table (search with an `id IN (...) AND metadata.repo = ...` filter, delete, add), counting the queries.
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.fetches = 0
+
+    @staticmethod
+    def _filter(where):
+        def values(clause):
+            return [value.replace("''", "'") for value in re.findall(r"'((?:[^']|'')*)'", clause)]
+        id_clause, _, repo_clause = where.partition(" AND ")
+        ids, repos = values(id_clause), values(repo_clause)
+        return lambda row: row["id"] in ids and (not repos or row["metadata"]["repo"] in repos)
+
+    def search(self):
+        query = SimpleNamespace(where=None)
+        query.limit = lambda limit: query
+
+        def where(clause):
+            query.where = clause
+            return query
+
+        def to_list():
+            self.fetches += 1
+            return [dict(row) for row in self.rows if self._filter(query.where)(row)]
+
+        query.where, query.to_list = where, to_list
+        return query
+
+    def delete(self, where):
+        matches = self._filter(where)
+        self.rows = [row for row in self.rows if not matches(row)]
+
+    def add(self, rows):
+        self.rows += [dict(row) for row in rows]
+
+    def seed(self, record, vector):
+        self.add([{"id": record.id, "text": record.text, "metadata": record.metadata.model_dump(), "vector": vector}])
+
+    def records(self, repo):
+        return {row["id"]: row for row in self.rows if row["metadata"]["repo"] == repo}
+
+
+def _legacy_index(tool, fake_index, issues, repo_name):
+    """An index built by the full indexing path: the example record, and records without content hash."""
+    from pr_agent.tools.pr_similar_issue import Metadata, Record
+    fake_index.seed(Record(id=f"example_issue_{repo_name}", text="example_issue", metadata=Metadata(repo=repo_name)),
+                    [0.0, 1.0])
+    for record in tool._get_issues_corpus(issues, repo_name).documents:
+        fake_index.seed(record, [1.0, 0.0])
+
+
+class FakeQdrantClient:
+    """
+    A Qdrant client (retrieve, set_payload, upsert) on a single collection, counting the retrievals.
+    """
+
+    def __init__(self):
+        self.points = {}
+        self.fetches = 0
+
+    def retrieve(self, collection_name, ids, with_payload, with_vectors):
+        self.fetches += 1
+        return [SimpleNamespace(id=point_id, payload=dict(self.points[point_id]["payload"]))
+                for point_id in ids if point_id in self.points]
+
+    def set_payload(self, collection_name, payload, points):
+        for point_id in points:
+            self.points[point_id]["payload"].update(payload)
+
+    def upsert(self, collection_name, points):
+        for point in points:
+            self.points[point.id] = {"vector": point.vector, "payload": point.payload}
+
+    def seed(self, record, vector):
+        payload = {"id": record.id, "text": record.text, "metadata": record.metadata.model_dump()}
+        self.points[QdrantIssueIndexStore._point_id(record.id)] = {"vector": vector, "payload": payload}
+
+    def records(self, repo):
+        return {point["payload"]["id"]: point for point in self.points.values()
+                if point["payload"]["metadata"]["repo"] == repo}
+
+
+def _pinecone():
+    fake_index = FakePineconeIndex()
+    return fake_index, PineconeIssueIndexStore(fake_index, "org-repo")
+
+
+def _lancedb():
+    fake_index = FakeLanceTable()
+    return fake_index, LanceDBIssueIndexStore(fake_index, "org-repo")
+
+
+def _qdrant():
+    pytest.importorskip("qdrant_client")
+    fake_index = FakeQdrantClient()
+    return fake_index, QdrantIssueIndexStore(fake_index, "codium-ai-pr-agent-issues", "org-repo")
+
+
+# backend: (fetches of the first sync, embedded records of the second sync, records of the repo in the end)
+# the records indexed without a content hash (pinecone, qdrant) are embedded again once their issue is updated,
+# lancedb hashes the indexed text, and keeps the watermark in a record of its own
+@pytest.mark.parametrize("make_store, first_sync_fetches, second_sync_embedded, num_records", [
+    (_pinecone, 1 + 12, 2, 1102),
+    (_lancedb, 1 + 3 + 1, 1, 1103),
+    (_qdrant, 1 + 12, 2, 1102),
+], ids=["pinecone", "lancedb", "qdrant"])
+def test_vector_store_sync_from_an_existing_index(tool, make_store, first_sync_fetches, second_sync_embedded,
+                                                  num_records):
+    fake_index, store = make_store()
+    repo = FakeRepo([FakeIssue(n, START + timedelta(minutes=n), comments=[_comment(n)] if n % 10 == 0 else ())
+                     for n in range(1, 1001)])
+    _legacy_index(tool, fake_index, list(repo.issues.values()), "org-repo")  # 1100 records
+    _legacy_index(tool, fake_index, [FakeIssue(5000, START)], "other-repo")
+    other_repo_records = fake_index.records("other-repo")
+
+    # the first sync checks the existing records in batches, and embeds only the new issue
+    repo.update(1001, at=START + timedelta(days=30))
+    fake_index.fetches = 0
+    assert tool._sync_index_with_updated_issues(repo, "org-repo", store) == 1
+    assert fake_index.fetches == first_sync_fetches
+    assert store.get_watermark() == (START + timedelta(days=30)).isoformat()
+
+    # then only the issues updated since the watermark are listed, and only the changed records embedded
+    repo.update(2, body="The new body of issue 2", at=START + timedelta(days=31))
+    repo.update(3, at=START + timedelta(days=31))  # e.g. a label: no indexed text changed
+    repo.listed, tool.embedded = 0, []
+    assert tool._sync_index_with_updated_issues(repo, "org-repo", store) == second_sync_embedded
+    assert repo.listed == 3 and tool.embedded[0].endswith("The new body of issue 2")
+    assert tool._sync_index_with_updated_issues(repo, "org-repo", store) == 0
+
+    assert len(fake_index.records("org-repo")) == num_records
+    assert fake_index.records("other-repo") == other_repo_records
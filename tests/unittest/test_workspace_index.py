@@ -0,0 +1,177 @@
+import os
+import re
+import shutil
+import subprocess
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from pr_agent.algo.workspace_index import WorkspaceIndex, required_literals
+from pr_agent.jules.tools import JulesTools
+from pr_agent.tools.code_agent.tools import AgentTools
+
+NUM_FILES = 20_000
+# the large benchmarks write and time a large tree, and only run on demand
+LARGE_BENCHMARK = pytest.mark.skipif(not os.environ.get("PR_AGENT_LARGE_BENCHMARKS"),
+                                     reason="set PR_AGENT_LARGE_BENCHMARKS=1 to run")
+WORDS = ["parser", "cache", "webhook", "review", "token", "handler", "provider", "diff", "comment", "label"]
+
+
+def _write_tree(root, num_files):
+    for i in range(num_files):
+        directory = os.path.join(root, f"pkg_{i % 50}", f"mod_{i % 7}")
+        os.makedirs(directory, exist_ok=True)
+        a, b = WORDS[i % 10], WORDS[i * 7 % 10]
+        with open(os.path.join(directory, f"file_{i}.py"), "w") as f:
+            f.write(f"import os\n\n\nclass {a.title()}{b.title()}{i}:\n"
+                    f"    def get_{a}_{b}(self, value):\n        return value + {i}\n\n"
+                    f"    def update_{b}(self, {a}):\n        self.{a} = {a}\n"
+                    + "".join(f"        # {WORDS[(i + j) % 10]} step {j}\n" for j in range(10)))
+    os.makedirs(os.path.join(root, ".git"), exist_ok=True)
+    with open(os.path.join(root, ".git", "HEAD"), "w") as f:
+        f.write("def get_cache_diff(self): not a working tree file\n")
+    with open(os.path.join(root, "image.bin"), "wb") as f:
+        f.write(b"\0def get_cache_diff\0")
+
+
+def _scan(root, pattern, flags=0):
+    """The matching lines, by reading every file."""
+    compiled = re.compile(pattern, flags)
+    results = []
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names[:] = [name for name in dir_names if not name.startswith(".")]
+        for file_name in file_names:
+            full_path = os.path.join(dir_path, file_name)
+            with open(full_path, "rb") as f:
+                data = f.read()
+            if b"\0" in data:
+                continue
+            for line_number, line in enumerate(data.decode().split("\n"), 1):
+                if compiled.search(line):
+                    results.append((os.path.relpath(full_path, root), line_number, line))
+    return sorted(results)
+
+
+def test_required_literals():
+    assert required_literals(r"def get_parser\(") == ["def get_parser("]
+    assert required_literals(r"class \w+Handler\d+:") == ["class ", "Handler", ":"]
+    assert required_literals(r"^import (os|sys)$") == ["import "]
+    assert required_literals(r"x(abc)+y?") == ["x", "abc"]
+    assert required_literals("parser|cache") == []
+    assert required_literals("(?i)Parser") == [] and required_literals("ab(?i:cd)ef") == ["ab", "ef"]
+
+
+@pytest.mark.parametrize("pattern, flags", [
+    (r"def get_cache_diff", 0),
+    (r"class \w+Handler\d+:", 0),
+    (r"^    def update_(diff|label)\(", 0),
+    (r"value \+ 12\d$", 0),
+    (r"token|webhook step 3", 0),
+    (r"CACHE_DIFF", re.IGNORECASE),
+    (r"zz", 0),
+])
+def test_search_matches_a_full_scan(tmp_path, pattern, flags):
+    _write_tree(str(tmp_path), 300)
+    index = WorkspaceIndex(str(tmp_path))
+    assert index.search(pattern, flags=flags, max_results=10_000) == _scan(str(tmp_path), pattern, flags)
+
+
+def test_search_follows_edits(tmp_path):
+    _write_tree(str(tmp_path), 100)
+    index = WorkspaceIndex(str(tmp_path))
+    assert len(index.search("get_cache_diff")) == 10
+    index.write("./pkg_1/mod_1/file_1.py", "def get_cache_diff_v2(): pass\n")
+    index.write("new/module.py", "class CacheDiff:\n    def get_cache_diff(self): pass\n")
+    index.delete("pkg_11/mod_4/file_11.py")
+    unchanged = [f"pkg_{i % 50}/mod_{i % 7}/file_{i}.py" for i in range(21, 100, 10)]
+    assert [path for path, _, _ in index.search("get_cache_diff")] == sorted(
+        ["new/module.py", "pkg_1/mod_1/file_1.py"] + unchanged)
+    assert index.search("get_cache_diff(", regex=True) == index.search("get_cache_diff(", regex=False)  # invalid
+    index.invalidate_local()  # rebuilt from the files on disk
+    assert len(index.search("get_cache_diff")) == 10
+
+
+def test_edits_update_the_listings_they_belong_to():
+    index = WorkspaceIndex()
+    listings = {key: ["src/a.py", "src/lib/b.py", "docs/index.md"] if key == "." else
+                [path for path in ["src/a.py", "src/lib/b.py"] if path.startswith(key.strip("./") + "/")]
+                for key in (".", "src", "./src/lib/", "docs")}
+    for key, listing in listings.items():
+        index.list_files(key, lambda listing=listing: listing)
+    index.write("./src/lib/c.py", "")
+    index.write("src/a.py", "")  # already listed
+    index.write("tests/test_a.py", "")
+    index.delete("docs/index.md")
+    assert index.list_files(".", list) == ["src/a.py", "src/lib/b.py", "src/lib/c.py", "tests/test_a.py"]
+    assert index.list_files("src", list) == ["src/a.py", "src/lib/b.py", "src/lib/c.py"]
+    assert index.list_files("./src/lib/", list) == ["src/lib/b.py", "src/lib/c.py"]
+    assert index.list_files("docs", list) == []
+
+
+@pytest.mark.asyncio
+async def test_agent_tools_cache_reads_and_listings(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("pr_agent.tools.code_agent.tools.list_local_files", lambda path: None)  # no local checkout
+    provider = MagicMock()
+    provider.get_pr_branch.return_value = "feature"
+    provider.get_pr_file_content.side_effect = lambda path, branch: f"content of {path}"
+    provider.get_files.return_value = ["a.py", "b.py"]
+    tools = AgentTools(provider)
+    for _ in range(5):
+        assert await tools.read_file("a.py") == "content of a.py"
+        assert await tools.list_files() == "a.py\nb.py"
+    assert provider.get_pr_file_content.call_count == 1 and provider.get_files.call_count == 1
+
+    await tools.edit_file("c.py", "new file")
+    assert await tools.read_file("c.py") == "new file" and await tools.list_files() == "a.py\nb.py\nc.py"
+    await tools.delete_file("a.py")
+    assert await tools.list_files() == "b.py\nc.py"
+    await tools.read_file("a.py")
+    assert provider.get_pr_file_content.call_count == 2 and provider.get_files.call_count == 1
+
+    await tools.run_in_bash_session("true")  # may change the working tree
+    assert await tools.list_files() == "a.py\nb.py" and provider.get_files.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_jules_search_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write_tree(str(tmp_path), 50)
+    tools = JulesTools(MagicMock())
+    assert (await tools.search_files("def get_cache_diff")).splitlines() == [
+        "./pkg_1/mod_1/file_1.py:    def get_cache_diff(self, value):",
+        "./pkg_11/mod_4/file_11.py:    def get_cache_diff(self, value):",
+        "./pkg_21/mod_0/file_21.py:    def get_cache_diff(self, value):",
+        "./pkg_31/mod_3/file_31.py:    def get_cache_diff(self, value):",
+        "./pkg_41/mod_6/file_41.py:    def get_cache_diff(self, value):"]
+    await tools.edit_file("pkg_1/mod_1/file_1.py", "nothing to see\n")
+    assert "file_1.py" not in await tools.search_files("def get_cache_diff")
+    assert await tools.search_files("no such text") == "No matches found."
+
+
+@LARGE_BENCHMARK
+def test_workspace_search_benchmark(tmp_path):
+    root = str(tmp_path)
+    _write_tree(root, NUM_FILES)
+    queries = [r"def get_webhook_token", r"class Review\w+\d+:", r"value \+ 1999\d$", "self.label = label",
+               r"# cache step [0-4]"]
+    index = WorkspaceIndex(root)
+    start = time.perf_counter()
+    index.search("warm up")
+    build_time = time.perf_counter() - start
+    start = time.perf_counter()
+    results = [index.search(query, max_results=10_000) for query in queries]
+    index_time = (time.perf_counter() - start) / len(queries)
+    assert results[1] == _scan(root, queries[1]) and results[2] == _scan(root, queries[2])
+
+    message = (f"\nsearching {NUM_FILES} files: index built in {build_time:.2f}s, "
+               f"then {index_time * 1000:.1f}ms per query")
+    if shutil.which("grep"):
+        start = time.perf_counter()
+        for query in queries:
+            subprocess.run(["grep", "-rE", query, ".", "--exclude-dir=.git"], cwd=root, capture_output=True, text=True)
+        grep_time = (time.perf_counter() - start) / len(queries)
+        message += f", grep -r {grep_time * 1000:.1f}ms per query"
+        assert index_time < grep_time
+    print(message)